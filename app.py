@@ -1,18 +1,35 @@
+import threading
+
 from flask import Flask, render_template
-from extensions import db, migrate, login_manager, csrf, limiter
+from extensions import db, login_manager, csrf, limiter, configure_route_limits
 from config import Config
 from blueprints import register_blueprints
+from commands import register_commands
+from services.db_router import configure_replica
+from services.hashing import configure as configure_hashing
+from services.print_spooler import PrintSpooler
+from services.course_scheduler import CourseScheduler
+from services.housekeeping import Housekeeping
+from services.invoices import InvoiceArchiver
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
     # Init extensions
+    configure_replica(app)
     db.init_app(app)
-    migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
     limiter.init_app(app)
+    configure_hashing(app)
+    print_spooler = PrintSpooler(app)
+    course_scheduler = CourseScheduler(app)
+    housekeeping = Housekeeping(app)
+    InvoiceArchiver(app)
+    if app.config.get('ENABLE_REQUEST_PROFILING'):
+        from services.profiling import RequestProfiler
+        RequestProfiler(app)
     # Ensure templates can call `csrf_token()` even if Flask-WTF doesn't auto-register it
     try:
         from flask_wtf.csrf import generate_csrf
@@ -39,18 +56,40 @@ def create_app():
 
     # Register blueprints
     register_blueprints(app)
+    register_commands(app)
+    configure_route_limits(app)
 
-    # Start exchange rate updater if enabled
-    try:
-        if app.config.get('ENABLE_EXCHANGE_UPDATER', True):
-            from extensions import schedule_exchange_rate_updater, update_exchange_rates
-            # perform a first-time immediate update
-            with app.app_context():
-                update_exchange_rates(app)
-            # schedule background updates
-            schedule_exchange_rate_updater(app, interval_seconds=app.config.get('EXCHANGE_UPDATE_INTERVAL', 60*60*6))
-    except Exception:
-        pass
+    def start_background_threads():
+        # Start exchange rate updater if enabled
+        try:
+            if app.config.get('ENABLE_EXCHANGE_UPDATER', True):
+                from extensions import schedule_exchange_rate_updater
+                # The updater fetches immediately on its first iteration, so startup never
+                # waits on the exchange API; Config.EXCHANGE_RATES serve until it returns.
+                schedule_exchange_rate_updater(app, interval_seconds=app.config.get('EXCHANGE_UPDATE_INTERVAL', 60*60*6))
+        except Exception:
+            pass
+
+        # Release delayed courses to the kitchen (only the lease holder fires them)
+        if app.config.get('ENABLE_COURSE_SCHEDULER', True):
+            course_scheduler.start()
+        # Event pruning, ledger/prep-time rollups, tier expiry, stock snapshots (a lease per job)
+        if app.config.get('ENABLE_HOUSEKEEPING', True):
+            housekeeping.start()
+        # Print workers and the scan for jobs orphaned by dead workers, even before this
+        # worker queues a job of its own
+        if app.config.get('ENABLE_PRINT_SPOOLER', True):
+            print_spooler.start()
+
+    # Background threads start with the first request a worker serves, so CLI commands
+    # (flask db upgrade, datagen, profile-startup) never run them, e.g. against tables
+    # a pending migration has yet to create
+    started = threading.Lock()
+
+    @app.before_request
+    def _start_background_threads():
+        if started.acquire(blocking=False):  # held for good: runs once per app
+            start_background_threads()
 
     # Root route
     @app.route("/")
@@ -59,7 +98,14 @@ def create_app():
 
     return app
 
-app = create_app()
+def __getattr__(name):
+    # `from app import app` (wsgi.py, `flask --app app`) builds the application on first
+    # access, so modules that only need create_app() don't pay for a second app.
+    if name == "app":
+        instance = globals()["app"] = create_app()
+        return instance
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
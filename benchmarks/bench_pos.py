@@ -0,0 +1,235 @@
+"""Benchmark POS hot paths against a freshly seeded database.
+
+Seeds a throw-away SQLite database (or ``--database-url``) with the bulk generator
+(``services.datagen.generate``), then drives the hot endpoints through the Flask test
+client, logged in as the first generated restaurant's manager, and prints throughput and
+latency percentiles as JSON. Requests are issued back to back by one client, so
+``throughput_rps`` is serial throughput over the measured phase's wall-clock time.
+Numbers include the full Flask/SQLAlchemy stack but no network, so they are comparable
+across commits on the same machine.
+
+Usage:
+    python benchmarks/bench_pos.py --restaurants 2 --products 200 --years 1 -o bench.json
+    python benchmarks/bench_pos.py --baseline bench.json   # compare against a previous run
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("create_order", "get_order", "checkout", "barcode_scan", "kds_orders", "menu_items", "analytics_sales")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples, errors, wall_seconds):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / wall_seconds, 2) if wall_seconds else 0.0,
+        "mean_ms": round(total / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def git_metadata():
+    def _git(*args):
+        try:
+            return subprocess.check_output(("git",) + args, cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+        except Exception:
+            return None
+    return {"commit": _git("rev-parse", "HEAD"), "dirty": bool(_git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def timed(fn, iterations, warmup, expect):
+    """Call ``fn(i)`` ``warmup + iterations`` times and time the measured calls."""
+    samples, errors = [], 0
+    measured_from = None
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        if i == warmup:
+            measured_from = start
+        res = fn(i)
+        elapsed = time.perf_counter() - start
+        if res.status_code not in expect:
+            errors += 1
+        if i >= warmup:
+            samples.append(elapsed)
+    wall = time.perf_counter() - measured_from if measured_from is not None else 0.0
+    return summarize(samples, errors, wall)
+
+
+def bench_tenant():
+    """Login, payment method, products and barcodes of the first generated restaurant."""
+    from models import Restaurant, User, PaymentMethod, Product, BarcodeMapping
+    from extensions import db
+    restaurant_id = db.session.query(db.func.min(Restaurant.id)) \
+        .filter(Restaurant.email.like("%@datagen.test")).scalar()
+    manager = User.query.filter_by(restaurant_id=restaurant_id, role="manager").order_by(User.id).first()
+    cash = PaymentMethod.query.filter_by(restaurant_id=restaurant_id, payment_type="cash").first()
+    products = db.session.query(Product.id, BarcodeMapping.barcode) \
+        .join(BarcodeMapping, BarcodeMapping.product_id == Product.id) \
+        .filter(Product.restaurant_id == restaurant_id).order_by(Product.id).all()
+    return {
+        "username": manager.username,
+        "payment_method_id": cash.id,
+        "product_ids": [product_id for product_id, _ in products],
+        "barcodes": [barcode for _, barcode in products],
+    }
+
+
+def run(args):
+    # Configure before config.py is imported: it reads the environment at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, ROOT)
+    from config import Config
+    Config.SQLALCHEMY_DATABASE_URI = args.database_url
+    Config.ENABLE_EXCHANGE_UPDATER = False
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+
+    from app import create_app
+    from extensions import db
+    from seed import seed_defaults
+    from services.datagen import generate, PASSWORD
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed_start = time.perf_counter()
+        seed_defaults()
+        generate(restaurants=args.restaurants, products=args.products, days=max(1, int(365 * args.years)),
+                 orders_per_day=args.orders_per_day, seed=args.seed)
+        seed_seconds = time.perf_counter() - seed_start
+        tenant = bench_tenant()
+
+    client = app.test_client()
+    res = client.post("/auth/login", data={"username": tenant["username"], "password": PASSWORD})
+    if res.status_code not in (200, 302):
+        raise SystemExit(f"login failed: {res.status_code}")
+
+    product_ids = tenant["product_ids"]
+    barcodes = tenant["barcodes"]
+    order_ids = []
+
+    def create_order(i):
+        res = client.post("/pos/orders", json={"items": [
+            {"product_id": product_ids[i % len(product_ids)], "quantity": 2},
+            {"product_id": product_ids[(i * 7) % len(product_ids)], "quantity": 1},
+        ]})
+        if res.status_code == 201:
+            order_ids.append(res.get_json()["id"])
+        return res
+
+    results = {}
+    n, w = args.iterations, args.warmup
+    results["create_order"] = timed(create_order, n, w, (201,))
+    results["get_order"] = timed(lambda i: client.get(f"/pos/orders/{order_ids[i % len(order_ids)]}"), n, w, (200,))
+    results["barcode_scan"] = timed(lambda i: client.get(f"/pos/products/by-barcode/{barcodes[i % len(barcodes)]}"),
+                                    n, w, (200,))
+    results["kds_orders"] = timed(lambda i: client.get("/kds/orders"), n, w, (200,))
+    results["menu_items"] = timed(lambda i: client.get("/menu/api/items"), n, w, (200,))
+    results["analytics_sales"] = timed(lambda i: client.get("/analytics/sales"), n, w, (200,))
+    # Checkout last: it completes the orders the read scenarios above were using
+    checkout_targets = list(order_ids)
+    results["checkout"] = timed(
+        lambda i: client.post(f"/pos/orders/{checkout_targets[i % len(checkout_targets)]}/checkout",
+                              json={"payment_method_id": tenant["payment_method_id"], "amount": 10.0}),
+        min(n, max(0, len(checkout_targets) - w)), w, (200,))
+
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git": git_metadata(),
+        "python": platform.python_version(),
+        "database": args.database_url.split(":", 1)[0],
+        "dataset": {
+            "restaurants": args.restaurants,
+            "products": args.products,
+            "years": args.years,
+            "orders_per_day": args.orders_per_day,
+            "seed": args.seed,
+            "seed_seconds": round(seed_seconds, 2),
+        },
+        "iterations": n,
+        "warmup": w,
+        "scenarios": {name: results[name] for name in SCENARIOS},
+    }
+
+
+def compare(report, baseline, threshold):
+    """Annotate ``report`` with p95 deltas against ``baseline``; return regressed scenario names."""
+    regressions = []
+    for name, current in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before or not before.get("p95_ms"):
+            continue
+        change = (current["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        current["p95_change_pct"] = round(change * 100, 1)
+        if change > threshold:
+            regressions.append(name)
+    report["baseline_commit"] = baseline.get("git", {}).get("commit")
+    report["regressions"] = regressions
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ServeoPOS hot paths")
+    parser.add_argument("--restaurants", type=int, default=2)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--years", type=float, default=0.25)
+    parser.add_argument("--orders-per-day", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("-o", "--output", help="write the JSON report here as well as stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare p95 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fail when a scenario's p95 regresses by more than this fraction")
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    if not args.database_url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.database_url = "sqlite:///" + os.path.join(tmpdir.name, "bench.db")
+
+    try:
+        report = run(args)
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(report, json.load(fh), args.threshold)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
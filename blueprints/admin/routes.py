@@ -1,14 +1,17 @@
 from flask import render_template, request, jsonify, send_file, current_app
 from flask_login import login_required, current_user
 from . import admin_bp
-from decorators import admin_required, permission_required
+from decorators import admin_required, permission_required, use_replica
 from extensions import db, convert_currency
 from models import MenuItem, InventoryItem, PriceHistory, AuditLog, RolePermission, Transaction, Collection, Payment
-from models import Invoice, Restaurant, StoreSettings
+from models import Invoice, Restaurant, StoreSettings, Product, PriceList, PriceListItem
 import csv, io
 from datetime import datetime
 from models import User
-from werkzeug.security import generate_password_hash
+from services.hashing import hash_password, HashingBusy
+from services.sequences import next_value, format_number, gap_report
+from services.invoices import render_invoice, pdf_available
+from services import inventory
 from flask import current_app
 
 
@@ -23,6 +26,7 @@ def dashboard():
 @admin_bp.route("/api/menu", methods=["GET"])
 @login_required
 @permission_required('manage_menu')
+@use_replica
 def api_get_menu():
     try:
         items = MenuItem.query.order_by(MenuItem.id.desc()).all()
@@ -64,13 +68,15 @@ def api_create_user():
             return jsonify({'error':'username and password required'}), 400
         if User.query.filter_by(username=username).first():
             return jsonify({'error':'username exists'}), 400
-        u = User(username=username, password_hash=generate_password_hash(password), role=role)
+        u = User(username=username, password_hash=hash_password(password), role=role)
         db.session.add(u)
         db.session.commit()
         log = AuditLog(user_id=getattr(current_user,'id',None), username=getattr(current_user,'username',None), action='create', object_type='user', object_id=u.id, details=f'created user {username} role={role}')
         db.session.add(log)
         db.session.commit()
         return jsonify({'id': u.id}), 201
+    except HashingBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -335,11 +341,13 @@ def api_create_invoice():
         phone = data.get('phone')
         items = data.get('items') or ''
         total = float(data.get('total', 0))
-        # generate invoice number - more unique (include milliseconds)
-        import time
-        ms = int((time.time() % 1) * 10000)
-        num = f"INV-{int(datetime.utcnow().timestamp())}-{ms}"
-        inv = Invoice(invoice_number=num, order_id=order_id, collection_id=collection_id, customer_name=customer, customer_phone=phone, items=items, total=total, status='issued', issued_at=datetime.utcnow())
+        # number from the restaurant's invoice sequence, using its configured prefix
+        restaurant_id = getattr(current_user, 'restaurant_id', None)
+        prefix = None
+        if restaurant_id:
+            prefix = db.session.query(StoreSettings.invoice_prefix).filter_by(restaurant_id=restaurant_id).scalar()
+        num = format_number(prefix or 'INV', next_value('invoice', restaurant_id), restaurant_id)
+        inv = Invoice(invoice_number=num, restaurant_id=restaurant_id, order_id=order_id, collection_id=collection_id, customer_name=customer, customer_phone=phone, items=items, total=total, status='issued', issued_at=datetime.utcnow())
         db.session.add(inv)
         db.session.commit()
         log = AuditLog(user_id=getattr(current_user,'id',None), username=getattr(current_user,'username',None), action='create', object_type='invoice', object_id=inv.id, details=f'created invoice {inv.invoice_number}')
@@ -398,80 +406,84 @@ def api_delete_invoice(inv_id):
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/api/sequences/audit', methods=['GET'])
+@login_required
+@permission_required('view_accounting')
+@use_replica
+def api_sequence_audit():
+    """Gaps and duplicates in receipt/invoice numbering (?doc_type=invoice|receipt; super admins: &restaurant_id=)"""
+    try:
+        doc_type = request.args.get('doc_type', 'invoice')
+        if doc_type not in ('invoice', 'receipt'):
+            return jsonify({'error': 'doc_type must be invoice or receipt'}), 400
+        restaurant_id = getattr(current_user, 'restaurant_id', None)
+        if current_user.is_super_admin:
+            restaurant_id = request.args.get('restaurant_id', type=int) or restaurant_id
+        return jsonify(gap_report(doc_type, restaurant_id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @admin_bp.route('/invoices/<int:inv_id>/print', methods=['GET'])
 @login_required
 @permission_required('view_accounting')
 def print_invoice(inv_id):
+    """Printable invoice (?format=html|pdf); issued invoices are served from the render cache"""
     try:
         i = Invoice.query.get_or_404(inv_id)
-        html = f"""<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="utf-8">
-  <title>Invoice {i.invoice_number}</title>
-  <style>
-    body {{ font-family: Arial, sans-serif; margin: 20px; }}
-    .header {{ text-align: center; margin-bottom: 30px; }}
-    .logo {{ font-size: 24px; font-weight: bold; color: #d32f2f; }}
-    .invoice-number {{ font-size: 14px; margin-top: 10px; }}
-    .details {{ margin: 20px 0; }}
-    .details-row {{ display: flex; justify-content: space-between; margin: 8px 0; }}
-    .label {{ font-weight: bold; }}
-    table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-    th, td {{ padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }}
-    th {{ background-color: #f5f5f5; font-weight: bold; }}
-    .total-row {{ font-weight: bold; font-size: 16px; background-color: #f5f5f5; }}
-    .footer {{ text-align: center; margin-top: 30px; font-size: 12px; color: #666; }}
-    .status {{ display: inline-block; padding: 5px 10px; border-radius: 3px; font-weight: bold; }}
-    .status-paid {{ background-color: #4caf50; color: white; }}
-    .status-issued {{ background-color: #ff9800; color: white; }}
-    .status-draft {{ background-color: #ccc; color: #333; }}
-  </style>
-</head>
-<body>
-  <div class="header">
-    <div class="logo">ServeoPOS</div>
-    <div class="invoice-number">Invoice: {i.invoice_number}</div>
-    <div class="status status-{i.status}">{i.status.upper()}</div>
-  </div>
-
-  <div class="details">
-    <div class="details-row">
-      <div><span class="label">Customer:</span> {i.customer_name or 'N/A'}</div>
-      <div><span class="label">Phone:</span> {i.customer_phone or 'N/A'}</div>
-    </div>
-    <div class="details-row">
-      <div><span class="label">Issued:</span> {i.issued_at.strftime('%Y-%m-%d %H:%M') if i.issued_at else 'N/A'}</div>
-      <div><span class="label">Paid:</span> {i.paid_at.strftime('%Y-%m-%d %H:%M') if i.paid_at else 'Pending'}</div>
-    </div>
-  </div>
-
-  <table>
-    <thead>
-      <tr>
-        <th>Description</th>
-        <th>Amount</th>
-      </tr>
-    </thead>
-    <tbody>
-      <tr>
-        <td>{i.items or 'Services'}</td>
-        <td>{i.total:.2f}</td>
-      </tr>
-      <tr class="total-row">
-        <td>TOTAL</td>
-        <td>{i.total:.2f}</td>
-      </tr>
-    </tbody>
-  </table>
-
-  <div class="footer">
-    <p>Thank you for your business!</p>
-    <p>Generated on {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}</p>
-  </div>
-</body>
-</html>"""
-        return html, 200, {'Content-Type': 'text/html; charset=utf-8'}
+        fmt = request.args.get('format', 'html')
+        if fmt not in ('html', 'pdf'):
+            return jsonify({'error': 'format must be html or pdf'}), 400
+        if fmt == 'pdf' and not pdf_available():
+            return jsonify({'error': 'PDF rendering requires WeasyPrint'}), 501
+        body, etag = render_invoice(i, fmt)
+        response = current_app.make_response(body)
+        response.content_type = 'application/pdf' if fmt == 'pdf' else 'text/html; charset=utf-8'
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/invoices/archive', methods=['POST'])
+@login_required
+@permission_required('view_accounting')
+def api_archive_invoices():
+    """Start building a zip of one month's invoices: {"month": "YYYY-MM", "format": "html|pdf"}"""
+    data = request.get_json() or {}
+    try:
+        try:
+            year, month = (int(part) for part in str(data.get('month', '')).split('-'))
+            datetime(year, month, 1)
+        except ValueError:
+            return jsonify({'error': 'month must be YYYY-MM'}), 400
+        fmt = data.get('format', 'html')
+        if fmt not in ('html', 'pdf'):
+            return jsonify({'error': 'format must be html or pdf'}), 400
+        if fmt == 'pdf' and not pdf_available():
+            return jsonify({'error': 'PDF rendering requires WeasyPrint'}), 501
+        restaurant_id = getattr(current_user, 'restaurant_id', None)
+        job_id = current_app.extensions['invoice_archiver'].submit(restaurant_id, year, month, fmt)
+        return jsonify({'id': job_id, 'status': 'queued'}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/invoices/archive/<job_id>', methods=['GET'])
+@login_required
+@permission_required('view_accounting')
+def api_invoice_archive(job_id):
+    """Archive job status; ?download=1 returns the zip once it is done"""
+    try:
+        job = current_app.extensions['invoice_archiver'].get(job_id)
+        if not job or job['restaurant_id'] != getattr(current_user, 'restaurant_id', None):
+            return jsonify({'error': 'Archive not found'}), 404
+        if request.args.get('download'):
+            if job['status'] != 'done':
+                return jsonify({'error': f"Archive is {job['status']}"}), 409
+            return send_file(job['path'], mimetype='application/zip', as_attachment=True,
+                             download_name=f"invoices-{job['month']}.zip")
+        return jsonify({k: v for k, v in job.items() if k != 'path'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -487,12 +499,14 @@ def api_reset_password(user_id):
         if not newpw:
             return jsonify({'error':'password required'}), 400
         u = User.query.get_or_404(user_id)
-        u.password_hash = generate_password_hash(newpw)
+        u.password_hash = hash_password(newpw)
         db.session.commit()
         log = AuditLog(user_id=getattr(current_user,'id',None), username=getattr(current_user,'username',None), action='reset_password', object_type='user', object_id=u.id, details='password reset')
         db.session.add(log)
         db.session.commit()
         return jsonify({'status':'ok'})
+    except HashingBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -690,6 +704,7 @@ def api_menu_import():
 @admin_bp.route('/api/menu/export', methods=['GET'])
 @login_required
 @permission_required('manage_menu')
+@use_replica
 def api_menu_export():
     try:
         items = MenuItem.query.all()
@@ -730,6 +745,8 @@ def api_get_inventory():
             "name": i.name,
             "quantity": i.quantity,
             "unit": i.unit,
+            "low_stock_threshold": i.low_stock_threshold,
+            "barcode": i.barcode,
             "updated_at": i.updated_at.isoformat() if i.updated_at else None
         } for i in items])
     except Exception as e:
@@ -743,12 +760,18 @@ def api_create_inventory():
     data = request.get_json() or {}
     try:
         name = data.get("name")
-        quantity = int(data.get("quantity", 0))
+        quantity = float(data.get("quantity", 0))
         unit = data.get("unit", "unit")
+        threshold = data.get("low_stock_threshold")
         if not name:
             return jsonify({"error": "name is required"}), 400
-        item = InventoryItem(name=name, quantity=quantity, unit=unit)
+        item = InventoryItem(name=name, quantity=0, unit=unit, barcode=data.get("barcode") or None,
+                             low_stock_threshold=float(threshold) if threshold is not None else None)
         db.session.add(item)
+        db.session.flush()
+        if quantity:
+            inventory.record(item.id, 'count', quantity, note='opening balance',
+                             user_id=getattr(current_user, 'id', None))
         db.session.commit()
         log = AuditLog(user_id=getattr(current_user,'id',None), username=getattr(current_user,'username',None), action='create', object_type='inventory_item', object_id=item.id, details=f'created {item.name}')
         db.session.add(log)
@@ -770,12 +793,22 @@ def api_update_inventory(item_id):
         if "name" in data and data.get("name")!=item.name:
             changes.append(f'name: {item.name} -> {data.get("name")}')
             item.name = data.get("name")
-        if "quantity" in data and int(data.get("quantity"))!=item.quantity:
+        if "quantity" in data and float(data.get("quantity"))!=item.quantity:
             changes.append(f'quantity: {item.quantity} -> {data.get("quantity")}')
-            item.quantity = int(data.get("quantity"))
+            # Recorded as a count so the stock ledger keeps the correction
+            inventory.count(item.id, float(data.get("quantity")), user_id=getattr(current_user, 'id', None))
         if "unit" in data and data.get("unit")!=item.unit:
             changes.append(f'unit: {item.unit} -> {data.get("unit")}')
             item.unit = data.get("unit")
+        if "barcode" in data and (data.get("barcode") or None)!=item.barcode:
+            changes.append(f'barcode: {item.barcode} -> {data.get("barcode")}')
+            item.barcode = data.get("barcode") or None
+        if "low_stock_threshold" in data:
+            threshold = data.get("low_stock_threshold")
+            threshold = float(threshold) if threshold is not None else None
+            if threshold != item.low_stock_threshold:
+                changes.append(f'low_stock_threshold: {item.low_stock_threshold} -> {threshold}')
+                item.low_stock_threshold = threshold
         db.session.commit()
         if changes:
             log = AuditLog(user_id=getattr(current_user,'id',None), username=getattr(current_user,'username',None), action='update', object_type='inventory_item', object_id=item.id, details='; '.join(changes))
@@ -825,15 +858,19 @@ def api_inventory_import():
                 results.append({'row': row_no, 'status': 'skipped', 'reason': 'missing name'})
                 continue
             try:
-                quantity = int(float(row.get('quantity') or row.get('Quantity') or 0))
+                quantity = float(row.get('quantity') or row.get('Quantity') or 0)
             except Exception:
                 results.append({'row': row_no, 'status': 'error', 'reason': 'invalid quantity'})
                 continue
             unit = row.get('unit') or row.get('Unit') or 'unit'
             try:
-                item = InventoryItem(name=name, quantity=quantity, unit=unit)
+                item = InventoryItem(name=name, quantity=0, unit=unit,
+                                     barcode=row.get('barcode') or row.get('Barcode') or None)
                 db.session.add(item)
                 db.session.flush()
+                if quantity:
+                    inventory.record(item.id, 'count', quantity, note='opening balance (import)',
+                                     user_id=getattr(current_user, 'id', None))
                 created.append(item.id)
                 results.append({'row': row_no, 'status': 'created', 'id': item.id})
             except Exception as e:
@@ -852,6 +889,7 @@ def api_inventory_import():
 @admin_bp.route('/api/inventory/export', methods=['GET'])
 @login_required
 @permission_required('manage_inventory')
+@use_replica
 def api_inventory_export():
     try:
         items = InventoryItem.query.all()
@@ -883,6 +921,7 @@ def api_inventory_template():
 @admin_bp.route('/api/logs', methods=['GET'])
 @login_required
 @admin_required
+@use_replica
 def api_get_logs():
     try:
         # allow optional filtering: user, action, object_type
@@ -902,6 +941,70 @@ def api_get_logs():
         return jsonify({"error": str(e)}), 500
 
 
+### Request profiling (enabled with ENABLE_REQUEST_PROFILING)
+@admin_bp.route('/api/profiling', methods=['GET'])
+@login_required
+@admin_required
+def api_profiling_stats():
+    profiler = current_app.extensions.get('request_profiler')
+    if profiler is None:
+        return jsonify({'error': 'request profiling disabled'}), 404
+    stats = {'routes': profiler.snapshot()}
+    memory = profiler.process_memory()
+    if memory is not None:
+        stats['process_memory'] = memory
+    return jsonify(stats)
+
+
+@admin_bp.route('/api/profiling/metrics', methods=['GET'])
+@login_required
+@admin_required
+def api_profiling_metrics():
+    profiler = current_app.extensions.get('request_profiler')
+    if profiler is None:
+        return jsonify({'error': 'request profiling disabled'}), 404
+    return profiler.prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@admin_bp.route('/api/profiling/reset', methods=['POST'])
+@login_required
+@admin_required
+def api_profiling_reset():
+    profiler = current_app.extensions.get('request_profiler')
+    if profiler is None:
+        return jsonify({'error': 'request profiling disabled'}), 404
+    profiler.reset()
+    return jsonify({'status': 'ok'})
+
+
+### Rate limiting (services/rate_limit.py); rejection counts are per worker process
+@admin_bp.route('/api/rate-limits', methods=['GET'])
+@login_required
+@admin_required
+def api_rate_limits():
+    from services import rate_limit
+    return jsonify({
+        'storage': current_app.config.get('RATELIMIT_STORAGE_URI', 'memory://').split('://', 1)[0],
+        'strategy': current_app.config.get('RATELIMIT_STRATEGY'),
+        'budgets': {
+            'anonymous': current_app.config.get('RATELIMIT_ANONYMOUS_DEFAULT'),
+            'terminal': current_app.config.get('RATELIMIT_TERMINAL_DEFAULT'),
+            'tenant': current_app.config.get('RATELIMIT_TENANT_LIMIT'),
+            'routes': current_app.config.get('RATELIMIT_ROUTE_LIMITS') or {},
+        },
+        'rejections': rate_limit.rejections(),
+    })
+
+
+@admin_bp.route('/api/rate-limits/reset', methods=['POST'])
+@login_required
+@admin_required
+def api_rate_limits_reset():
+    from services import rate_limit
+    rate_limit.reset_rejections()
+    return jsonify({'status': 'ok'})
+
+
 ### Role permissions
 @admin_bp.route('/api/roles', methods=['GET'])
 @login_required
@@ -1345,3 +1448,129 @@ def api_update_store_settings(restaurant_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+
+
+def _pricelist_json(pl):
+    return {
+        'id': pl.id,
+        'name': pl.name,
+        'pricelist_type': pl.pricelist_type,
+        'valid_from': pl.valid_from.isoformat() if pl.valid_from else None,
+        'valid_until': pl.valid_until.isoformat() if pl.valid_until else None,
+        'active': pl.active,
+        'items': [{'product_id': i.product_id, 'price': i.price} for i in pl.prices],
+    }
+
+
+def _apply_pricelist(pl, data):
+    """Copy editable fields and items from request data; raises ValueError on bad input"""
+    for field in ('name', 'pricelist_type'):
+        if field in data:
+            setattr(pl, field, data[field])
+    for field in ('valid_from', 'valid_until'):
+        if field in data:
+            setattr(pl, field, datetime.fromisoformat(data[field]) if data[field] else None)
+    if 'active' in data:
+        pl.active = bool(data['active'])
+    if pl.valid_from and pl.valid_until and pl.valid_until <= pl.valid_from:
+        raise ValueError('valid_until must be after valid_from')
+    if 'items' in data:
+        prices = {int(i['product_id']): float(i['price']) for i in data['items']}
+        known = {pid for (pid,) in db.session.query(Product.id).filter(
+            Product.id.in_(list(prices)), Product.restaurant_id == pl.restaurant_id)}
+        if known != set(prices):
+            raise ValueError(f'Unknown products: {sorted(set(prices) - known)}')
+        existing = {i.product_id: i for i in pl.prices}
+        for product_id, item in existing.items():
+            if product_id not in prices:
+                pl.prices.remove(item)
+        for product_id, price in prices.items():
+            if product_id in existing:
+                existing[product_id].price = price
+            else:
+                pl.prices.append(PriceListItem(product_id=product_id, price=price))
+
+
+@admin_bp.route('/api/pricelists', methods=['GET'])
+@login_required
+@permission_required('manage_menu')
+def api_get_pricelists():
+    try:
+        restaurant_id = getattr(current_user, 'restaurant_id', None)
+        lists = PriceList.query.filter_by(restaurant_id=restaurant_id).order_by(PriceList.id).all()
+        return jsonify([_pricelist_json(pl) for pl in lists])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/pricelists', methods=['POST'])
+@login_required
+@permission_required('manage_menu')
+def api_create_pricelist():
+    """Create a price list: {"name", "pricelist_type", "valid_from", "valid_until", "items": [{product_id, price}]}"""
+    data = request.get_json() or {}
+    try:
+        restaurant_id = getattr(current_user, 'restaurant_id', None)
+        if not restaurant_id:
+            return jsonify({'error': 'User is not assigned to a restaurant'}), 400
+        if not data.get('name') or not data.get('pricelist_type'):
+            return jsonify({'error': 'name and pricelist_type are required'}), 400
+        pl = PriceList(restaurant_id=restaurant_id)
+        try:
+            _apply_pricelist(pl, data)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        db.session.add(pl)
+        db.session.commit()
+        log = AuditLog(user_id=getattr(current_user, 'id', None), username=getattr(current_user, 'username', None), action='create', object_type='price_list', object_id=pl.id, details=f'created price list {pl.name}')
+        db.session.add(log)
+        db.session.commit()
+        return jsonify(_pricelist_json(pl)), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/pricelists/<int:pricelist_id>', methods=['PUT'])
+@login_required
+@permission_required('manage_menu')
+def api_update_pricelist(pricelist_id):
+    """Update fields; "items", when given, replaces the list's prices"""
+    data = request.get_json() or {}
+    try:
+        pl = PriceList.query.filter_by(id=pricelist_id, restaurant_id=getattr(current_user, 'restaurant_id', None)).first()
+        if not pl:
+            return jsonify({'error': 'Price list not found'}), 404
+        try:
+            _apply_pricelist(pl, data)
+        except (KeyError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        db.session.commit()
+        log = AuditLog(user_id=getattr(current_user, 'id', None), username=getattr(current_user, 'username', None), action='update', object_type='price_list', object_id=pl.id, details=f'updated price list {pl.name}')
+        db.session.add(log)
+        db.session.commit()
+        return jsonify(_pricelist_json(pl))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/pricelists/<int:pricelist_id>', methods=['DELETE'])
+@login_required
+@permission_required('manage_menu')
+def api_delete_pricelist(pricelist_id):
+    try:
+        pl = PriceList.query.filter_by(id=pricelist_id, restaurant_id=getattr(current_user, 'restaurant_id', None)).first()
+        if not pl:
+            return jsonify({'error': 'Price list not found'}), 404
+        name = pl.name
+        db.session.delete(pl)
+        db.session.commit()
+        log = AuditLog(user_id=getattr(current_user, 'id', None), username=getattr(current_user, 'username', None), action='delete', object_type='price_list', object_id=pricelist_id, details=f'deleted price list {name}')
+        db.session.add(log)
+        db.session.commit()
+        return jsonify({'status': 'deleted'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
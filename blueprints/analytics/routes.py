@@ -1,13 +1,16 @@
-from flask import jsonify
+from datetime import datetime, timedelta
+from flask import jsonify, request, current_app
 from flask_login import login_required
-from decorators import permission_required
+from decorators import permission_required, use_replica
 from extensions import db
 from models import Order, OrderItem, MenuItem
+from services import kitchen_analytics, order_lifecycle
 from . import analytics_bp
 
 @analytics_bp.route("/sales")
 @login_required
 @permission_required('view_analytics')
+@use_replica
 def sales_summary():
     try:
         total_orders = Order.query.count()
@@ -21,3 +24,41 @@ def sales_summary():
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/prep-times")
+@login_required
+@permission_required('view_analytics')
+@use_replica
+def prep_times():
+    """Kitchen prep times from the hourly rollup: ?start=&end= (ISO, default last 7 days), ?group=day|hour"""
+    try:
+        try:
+            end = datetime.fromisoformat(request.args["end"]) if request.args.get("end") else datetime.utcnow()
+            start = datetime.fromisoformat(request.args["start"]) if request.args.get("start") \
+                else end - timedelta(days=7)
+            rows = order_lifecycle.prep_times(start, end, request.args.get("group", "day"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"start": start.isoformat(), "end": end.isoformat(), "periods": rows})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/kitchen")
+@login_required
+@permission_required('view_analytics')
+@use_replica
+def kitchen_prep_times():
+    """Prep-time distribution (count, mean, p50/p90/p95 seconds) per item and per station"""
+    try:
+        summary = kitchen_analytics.stats().summary()
+        product_names = kitchen_analytics.names(summary["items"])
+        return jsonify({
+            "window_days": current_app.config.get("KDS_STATS_WINDOW_DAYS", 14),
+            "items": [{"product_id": product_id, "name": product_names.get(product_id), **row}
+                      for product_id, row in sorted(summary["items"].items())],
+            "stations": [{"station": station, **row} for station, row in sorted(summary["stations"].items())],
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,8 +1,10 @@
 from flask import jsonify
 from models import MenuItem
+from decorators import use_replica
 from . import api_bp
 
 @api_bp.route("/menu")
+@use_replica
 def menu_json():
     try:
         items = MenuItem.query.all()
@@ -14,6 +16,7 @@ def menu_json():
         return jsonify({"error": str(e)}), 500
 
 @api_bp.route("/menu-items")
+@use_replica
 def get_menu_items():
     """Fetch available menu items for POS"""
     try:
@@ -1,24 +1,38 @@
 from flask import render_template, redirect, url_for, request, flash, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash
-from extensions import db, login_manager, limiter
+from extensions import db, login_manager, account_limit
 from models import User
 from services.totp import generate_totp_secret, verify_totp_token, use_backup_code
+from services.user_cache import load_user_cached
+from services.hashing import verify_password, hash_password, needs_rehash, HashingBusy
 from . import auth_bp
 from flask import current_app
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_user_cached(int(user_id), current_app.config.get('USER_CACHE_TTL', 0))
 
 @auth_bp.route("/login", methods=["GET", "POST"])
-@limiter.limit("100 per minute")  # Brute force protection
+@account_limit("100 per minute")  # Brute force protection
 def login():
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid = bool(user) and verify_password(user.password_hash, password)
+        except HashingBusy:
+            flash("The server is busy, please try again in a moment", "warning")
+            return render_template("login.html"), 503, {"Retry-After": "1"}
+        if valid and needs_rehash(user.password_hash):
+            # Transparently upgrade legacy Werkzeug hashes to Argon2; a busy pool just
+            # leaves the upgrade for the next login
+            try:
+                user.password_hash = hash_password(password)
+                db.session.commit()
+            except HashingBusy:
+                pass
+        if valid:
             # If 2FA is enabled, don't log in yet - store temp session and redirect to 2FA verification
             if user.totp_enabled:
                 session['pending_user_id'] = user.id
@@ -40,7 +54,7 @@ def login():
     return render_template("login.html")
 
 @auth_bp.route("/verify-2fa", methods=["GET", "POST"])
-@limiter.limit("10 per minute")  # Strict limit for 2FA attempts
+@account_limit("10 per minute")  # Strict limit for 2FA attempts
 def verify_2fa():
     """Verify TOTP token or backup code after successful password authentication"""
     if 'pending_user_id' not in session or not session.get('pending_2fa'):
@@ -60,7 +74,11 @@ def verify_2fa():
         # Check if it's a backup code (longer, alphanumeric) or a TOTP token (6 digits)
         if len(token) == 8 and token.isalnum():
             # Try backup code
-            result = use_backup_code(user.backup_codes, token)
+            try:
+                result = use_backup_code(user.backup_codes, token)
+            except HashingBusy:
+                flash("The server is busy, please try again in a moment", "warning")
+                return render_template("verify_2fa.html", username=user.username), 503, {"Retry-After": "1"}
             if result['valid']:
                 user.backup_codes = result['remaining_codes_json']
                 db.session.commit()
@@ -91,13 +109,17 @@ def verify_2fa():
 
 @auth_bp.route("/api/2fa-setup", methods=["POST"])
 @login_required
-@limiter.limit("10 per minute")
+@account_limit("10 per minute")
 def api_2fa_setup():
     """Initialize 2FA setup for current user. Returns QR code and backup codes."""
     if current_user.totp_enabled:
         return jsonify({'error': '2FA already enabled. Disable first.'}), 400
     
-    result = generate_totp_secret(current_user.username, issuer='ServeoPOS')
+    try:
+        qr_format = 'svg' if request.args.get('format') == 'svg' else 'png'
+        result = generate_totp_secret(current_user.username, issuer='ServeoPOS', qr_format=qr_format)
+    except HashingBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503
     
     # Store secret temporarily in session (not confirmed yet)
     session['pending_totp_secret'] = result['secret']
@@ -112,7 +134,7 @@ def api_2fa_setup():
 
 @auth_bp.route("/api/2fa-confirm", methods=["POST"])
 @login_required
-@limiter.limit("10 per minute")
+@account_limit("10 per minute")
 def api_2fa_confirm():
     """Confirm 2FA setup by verifying a TOTP token"""
     if current_user.totp_enabled:
@@ -145,7 +167,7 @@ def api_2fa_confirm():
 
 @auth_bp.route("/api/2fa-disable", methods=["POST"])
 @login_required
-@limiter.limit("10 per minute")
+@account_limit("10 per minute")
 def api_2fa_disable():
     """Disable 2FA for current user (requires password confirmation)"""
     if not current_user.totp_enabled:
@@ -153,7 +175,11 @@ def api_2fa_disable():
     
     password = request.json.get('password', '')
     
-    if not check_password_hash(current_user.password_hash, password):
+    try:
+        valid = verify_password(current_user.password_hash, password)
+    except HashingBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503
+    if not valid:
         return jsonify({'error': 'Invalid password'}), 401
     
     current_user.totp_secret = None
@@ -1,5 +1,12 @@
-from flask import jsonify
-from flask_login import login_required
+from calendar import monthrange
+from datetime import datetime
+from flask import jsonify, request, current_app, Response, stream_with_context
+from flask_login import login_required, current_user
+from decorators import permission_required, use_replica
+from extensions import db
+from models import InventoryItem, RecipeIngredient, StockMovement, StockTake, AuditLog
+from services import inventory, stock_take
+from services.events import parse_last_id, stream
 from . import inventory_bp
 
 @inventory_bp.route("/")
@@ -9,3 +16,349 @@ def inventory_home():
         return jsonify({"message": "Inventory system placeholder"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+# ============================================================================
+# RECIPES
+# ============================================================================
+def _recipe_json(product_id):
+    rows = db.session.query(RecipeIngredient, InventoryItem) \
+        .join(InventoryItem, InventoryItem.id == RecipeIngredient.inventory_item_id) \
+        .filter(RecipeIngredient.product_id == product_id).order_by(InventoryItem.name)
+    return {
+        "product_id": product_id,
+        "ingredients": [{
+            "inventory_item_id": item.id,
+            "name": item.name,
+            "quantity": ingredient.quantity,
+            "unit": item.unit,
+        } for ingredient, item in rows]
+    }
+
+
+@inventory_bp.route("/recipes/<int:product_id>", methods=["GET"])
+@login_required
+@permission_required('manage_inventory')
+def get_recipe(product_id):
+    """Ingredients used by one unit of a product (MenuItem or Product id)"""
+    try:
+        return jsonify(_recipe_json(product_id))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/recipes/<int:product_id>", methods=["PUT"])
+@login_required
+@permission_required('manage_inventory')
+def set_recipe(product_id):
+    """Replace a product's recipe: {"ingredients": [{"inventory_item_id", "quantity"}]}"""
+    try:
+        data = request.get_json() or {}
+        ingredients = {}
+        for line in data.get("ingredients", []):
+            item_id, quantity = int(line["inventory_item_id"]), float(line["quantity"])
+            if quantity <= 0:
+                return jsonify({"error": "Ingredient quantity must be positive"}), 400
+            ingredients[item_id] = ingredients.get(item_id, 0) + quantity
+        if ingredients:
+            known = {row[0] for row in db.session.query(InventoryItem.id).filter(InventoryItem.id.in_(ingredients))}
+            missing = sorted(set(ingredients) - known)
+            if missing:
+                return jsonify({"error": f"Unknown inventory items {missing}"}), 400
+
+        RecipeIngredient.query.filter_by(product_id=product_id).delete(synchronize_session=False)
+        db.session.add_all([RecipeIngredient(product_id=product_id, inventory_item_id=item_id, quantity=quantity)
+                            for item_id, quantity in ingredients.items()])
+        db.session.add(AuditLog(user_id=getattr(current_user, 'id', None),
+                                username=getattr(current_user, 'username', None), action='update',
+                                object_type='recipe', object_id=product_id,
+                                details=f'{len(ingredients)} ingredient(s)'))
+        db.session.commit()
+        return jsonify(_recipe_json(product_id))
+    except (KeyError, TypeError, ValueError):
+        db.session.rollback()
+        return jsonify({"error": "Each ingredient needs inventory_item_id and quantity"}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+# ============================================================================
+# STOCK LEVELS
+# ============================================================================
+@inventory_bp.route("/low-stock", methods=["GET"])
+@login_required
+@permission_required('manage_inventory')
+def low_stock():
+    """Items at or below their low-stock threshold"""
+    try:
+        items = InventoryItem.query.filter(
+            InventoryItem.low_stock_threshold.isnot(None),
+            InventoryItem.quantity <= InventoryItem.low_stock_threshold
+        ).order_by(InventoryItem.name).all()
+        return jsonify([{
+            "id": i.id,
+            "name": i.name,
+            "quantity": i.quantity,
+            "unit": i.unit,
+            "low_stock_threshold": i.low_stock_threshold,
+        } for i in items])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/movements", methods=["POST"])
+@login_required
+@permission_required('manage_inventory')
+def create_movement():
+    """Record a stock movement.
+
+    {"inventory_item_id", "movement_type": receipt|waste|adjustment|count, "quantity", "note"?, "reference"?}
+    Receipts add and waste removes ``quantity``; an adjustment is signed; a count sets the
+    counted level and records the difference.
+    """
+    try:
+        data = request.get_json() or {}
+        movement_type = data.get("movement_type")
+        if movement_type not in ("receipt", "waste", "adjustment", "count"):
+            return jsonify({"error": "movement_type must be receipt, waste, adjustment or count"}), 400
+        try:
+            item_id, quantity = int(data["inventory_item_id"]), float(data["quantity"])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "inventory_item_id and quantity are required"}), 400
+        if movement_type in ("receipt", "waste") and quantity <= 0:
+            return jsonify({"error": "quantity must be positive"}), 400
+
+        user_id = getattr(current_user, 'id', None)
+        if movement_type == "count":
+            level = inventory.count(item_id, quantity, reference=data.get("reference"),
+                                    note=data.get("note"), user_id=user_id)
+        else:
+            change = -quantity if movement_type == "waste" else quantity
+            level = inventory.record(item_id, movement_type, change, reference=data.get("reference"),
+                                     note=data.get("note"), user_id=user_id)
+        db.session.commit()
+        return jsonify({"inventory_item_id": item_id, "quantity": level}), 201
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+def _parse_time(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an ISO date/time")
+
+
+@inventory_bp.route("/movements", methods=["GET"])
+@login_required
+@permission_required('manage_inventory')
+@use_replica
+def list_movements():
+    """Movements, newest first; filter by inventory_item_id, since, until; limit (max 1000)"""
+    try:
+        query = StockMovement.query
+        if request.args.get("inventory_item_id"):
+            query = query.filter(StockMovement.inventory_item_id == int(request.args["inventory_item_id"]))
+        if request.args.get("since"):
+            query = query.filter(StockMovement.created_at > _parse_time(request.args["since"], "since"))
+        if request.args.get("until"):
+            query = query.filter(StockMovement.created_at <= _parse_time(request.args["until"], "until"))
+        limit = min(int(request.args.get("limit", 100)), 1000)
+        rows = query.order_by(StockMovement.created_at.desc(), StockMovement.id.desc()).limit(limit).all()
+        return jsonify([{
+            "id": m.id,
+            "inventory_item_id": m.inventory_item_id,
+            "movement_type": m.movement_type,
+            "quantity": m.quantity,
+            "reference": m.reference,
+            "note": m.note,
+            "user_id": m.user_id,
+            "created_at": m.created_at.isoformat(),
+        } for m in rows])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/stock", methods=["GET"])
+@login_required
+@permission_required('manage_inventory')
+@use_replica
+def stock_on_hand():
+    """Stock on hand of every item, now or at ?at=<ISO date/time>"""
+    try:
+        at = _parse_time(request.args["at"], "at") if request.args.get("at") else datetime.utcnow()
+        levels = inventory.on_hand_at(at)
+        items = db.session.query(InventoryItem.id, InventoryItem.name, InventoryItem.unit).order_by(InventoryItem.name)
+        return jsonify({"at": at.isoformat(), "items": [
+            {"id": item_id, "name": name, "unit": unit, "quantity": levels.get(item_id, 0)}
+            for item_id, name, unit in items]})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/variance", methods=["GET"])
+@login_required
+@permission_required('manage_inventory')
+@use_replica
+def variance_report():
+    """Opening, movements by type, count variance and closing per item
+
+    ?month=YYYY-MM, or ?start=&end= (ISO date/times)
+    """
+    try:
+        if request.args.get("month"):
+            try:
+                year, month = (int(part) for part in request.args["month"].split("-"))
+                start = datetime(year, month, 1)
+                end = datetime(year, month, monthrange(year, month)[1])
+            except ValueError:
+                return jsonify({"error": "month must be YYYY-MM"}), 400
+            end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
+        else:
+            start = _parse_time(request.args.get("start"), "start")
+            end = _parse_time(request.args.get("end"), "end")
+        if end <= start:
+            return jsonify({"error": "end must be after start"}), 400
+        return jsonify({"start": start.isoformat(), "end": end.isoformat(),
+                        "items": inventory.variance(start, end)})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ============================================================================
+# STOCK TAKES
+# ============================================================================
+@inventory_bp.route("/stock-takes", methods=["POST"])
+@login_required
+@permission_required('manage_inventory')
+def create_stock_take():
+    """Open a physical count session"""
+    try:
+        data = request.get_json(silent=True) or {}
+        take = StockTake(name=data.get("name"), started_by=getattr(current_user, 'id', None))
+        db.session.add(take)
+        db.session.commit()
+        return jsonify({"id": take.id, "status": take.status}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/stock-takes/<int:stock_take_id>/scans", methods=["POST"])
+@login_required
+@permission_required('manage_inventory')
+def upload_scans(stock_take_id):
+    """Stage a batch of scans.
+
+    Either JSON {"scans": [{"barcode", "quantity"?}, ...]} or a text/csv body streamed
+    line by line, one ``barcode[,quantity]`` per line. A batch is staged whole or not at
+    all; quantity defaults to 1 per scan.
+    """
+    try:
+        if request.is_json:
+            scans = [(scan.get("barcode"), scan.get("quantity", 1))
+                     for scan in (request.get_json() or {}).get("scans", [])]
+        else:
+            scans = stock_take.parse_lines(request.stream)
+        accepted = stock_take.add_scans(stock_take_id, scans)
+        db.session.commit()
+        return jsonify({"stock_take_id": stock_take_id, "accepted": accepted}), 201
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 404
+    except stock_take.StockTakeClosed as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 409
+    except (AttributeError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"error": str(e) or "Invalid scan"}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/stock-takes/<int:stock_take_id>", methods=["GET"])
+@login_required
+@permission_required('manage_inventory')
+def get_stock_take(stock_take_id):
+    """Scan totals, unknown barcodes and, once reconciled, the variance lines"""
+    try:
+        return jsonify(stock_take.summary(stock_take_id))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/stock-takes/<int:stock_take_id>/reconcile", methods=["POST"])
+@login_required
+@permission_required('manage_inventory')
+def reconcile_stock_take(stock_take_id):
+    """Apply the counts to stock: {"full": bool} also zeroes barcoded items that were not scanned"""
+    try:
+        data = request.get_json(silent=True) or {}
+        lines = stock_take.reconcile(stock_take_id, full=bool(data.get("full")),
+                                     user_id=getattr(current_user, 'id', None))
+        db.session.add(AuditLog(user_id=getattr(current_user, 'id', None),
+                                username=getattr(current_user, 'username', None), action='reconcile',
+                                object_type='stock_take', object_id=stock_take_id,
+                                details=f'{lines} item(s) counted'))
+        db.session.commit()
+        return jsonify(stock_take.summary(stock_take_id))
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 404
+    except stock_take.StockTakeClosed as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/stock-takes/<int:stock_take_id>", methods=["DELETE"])
+@login_required
+@permission_required('manage_inventory')
+def cancel_stock_take(stock_take_id):
+    """Cancel an open stock take; its staged scans are discarded"""
+    try:
+        take = db.session.get(StockTake, stock_take_id)
+        if take is None:
+            return jsonify({"error": "Stock take not found"}), 404
+        if take.status != 'open':
+            return jsonify({"error": f"Stock take {stock_take_id} is {take.status}"}), 409
+        take.status = 'cancelled'
+        stock_take.discard_scans(stock_take_id)
+        db.session.commit()
+        return jsonify({"id": stock_take_id, "status": take.status})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route("/events")
+@login_required
+@permission_required('manage_inventory')
+def inventory_events():
+    """Server-sent event stream of stock events (low_stock)"""
+    try:
+        last_id = parse_last_id(request.headers.get("Last-Event-ID", request.args.get("last_id")))
+        frames = stream("inventory", last_id=last_id,
+                        poll_interval=current_app.config.get("SSE_POLL_INTERVAL", 1.0),
+                        keepalive=current_app.config.get("SSE_KEEPALIVE", 15),
+                        max_duration=current_app.config.get("SSE_MAX_STREAM_SECONDS", 300))
+        return Response(stream_with_context(frames), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,16 +1,24 @@
-from flask import jsonify
-from flask_login import login_required
+from flask import jsonify, request, current_app, Response, stream_with_context
+from flask_login import login_required, current_user
+from extensions import db
 from models import Order, OrderItem
+from services import kitchen_analytics, order_lifecycle
+from services.events import parse_last_id, stream, notify
 from decorators import permission_required
 from . import kds_bp
 from flask import render_template
 
+# The KDS views read from the primary, not the replica: a ticket must show up the moment
+# it is placed and disappear the moment it is bumped, and replica lag would break both.
 @kds_bp.route("/orders")
 @login_required
 @permission_required('manage_orders')
 def pending_orders():
+    """Open kitchen tickets; ?status=pending,cooking for more than the pending ones"""
     try:
-        orders = Order.query.filter_by(status="pending").all()
+        statuses = [status for status in request.args.get("status", "pending").split(",") if status]
+        orders = Order.query.filter(Order.status.in_(statuses)).all()
+        etas = kitchen_analytics.etas()
         order_data = []
         for o in orders:
             items = []
@@ -30,6 +38,7 @@ def pending_orders():
                 "id": o.id,
                 "status": o.status,
                 "created_at": o.created_at.isoformat(),
+                "eta": etas[o.id]["eta"].isoformat() if o.id in etas else None,
                 "items": items
             })
         return jsonify(order_data)
@@ -37,6 +46,47 @@ def pending_orders():
         return jsonify({"error": str(e)}), 500
 
 
+@kds_bp.route("/etas")
+@login_required
+@permission_required('manage_orders')
+def ticket_etas():
+    """Predicted ready time of every open ticket, from the stations' queues and prep times"""
+    try:
+        etas = kitchen_analytics.etas()
+        return jsonify([{"order_id": order_id, **eta, "eta": eta["eta"].isoformat()}
+                        for order_id, eta in sorted(etas.items(), key=lambda entry: entry[1]["eta"])])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@kds_bp.route("/orders/status", methods=["POST"])
+@login_required
+@permission_required('manage_orders')
+def bump_orders():
+    """Move many tickets at once: {"order_ids": [...], "status": "ready"}
+
+    Orders that cannot make the move are listed under "rejected"; the rest move.
+    """
+    try:
+        data = request.get_json() or {}
+        order_ids = data.get("order_ids")
+        if not isinstance(order_ids, list) or not order_ids:
+            return jsonify({"error": "order_ids must be a non-empty list"}), 400
+        if len(order_ids) > current_app.config.get("KDS_BULK_LIMIT", 500):
+            return jsonify({"error": "Too many orders in one request"}), 400
+        try:
+            moved, rejected = order_lifecycle.transition(order_ids, data.get("status"), user_id=current_user.id)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        db.session.commit()
+        if moved:
+            notify()
+        return jsonify({"status": data["status"], "moved": moved, "rejected": rejected}), 200 if moved else 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
 @kds_bp.route("/")
 @login_required
 @permission_required('manage_orders')
@@ -45,3 +95,20 @@ def kds_home():
         return render_template('kds.html')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@kds_bp.route("/events")
+@login_required
+@permission_required('manage_orders')
+def kds_events():
+    """Server-sent event stream of kitchen events (order_created, course_fired, order_status)"""
+    try:
+        last_id = parse_last_id(request.headers.get("Last-Event-ID", request.args.get("last_id")))
+        frames = stream("kds", last_id=last_id,
+                        poll_interval=current_app.config.get("SSE_POLL_INTERVAL", 1.0),
+                        keepalive=current_app.config.get("SSE_KEEPALIVE", 15),
+                        max_duration=current_app.config.get("SSE_MAX_STREAM_SECONDS", 300))
+        return Response(stream_with_context(frames), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
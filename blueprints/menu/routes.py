@@ -1,10 +1,12 @@
 from flask import render_template, jsonify
 from flask_login import login_required
 from models import MenuItem
+from decorators import use_replica
 from . import menu_bp
 
 @menu_bp.route("/")
 @login_required
+@use_replica
 def show_menu():
     try:
         items = MenuItem.query.filter_by(available=True).all()
@@ -14,6 +16,7 @@ def show_menu():
 
 @menu_bp.route("/api/items", methods=["GET"])
 @login_required
+@use_replica
 def get_menu_items_api():
     """API endpoint to fetch menu items as JSON"""
     try:
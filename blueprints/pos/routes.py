@@ -1,4 +1,4 @@
-from flask import render_template, jsonify, request
+from flask import render_template, jsonify, request, url_for, Response, current_app, stream_with_context
 from flask_login import login_required, current_user
 from decorators import permission_required
 from extensions import db
@@ -8,12 +8,21 @@ from models import (
     PaymentMethod, PaymentTransaction, Discount, BillSplit, Receipt,
     Table, TableSection, RestaurantFloorPlan, OrderNote, DelayedOrder, Kiosk,
     Customer, LoyaltyCard, LoyaltyPoints, eWallet, eWalletTransaction, PriceList, PriceListItem,
-    CashierAccount, CashRegister, CashFlow, HardwareDevice, Restaurant
+    CashierAccount, CashRegister, CashFlow, HardwareDevice, Restaurant, PrintJob, KitchenPrinter,
+    TableBooking, TableCombination, TableCombinationMember
+)
+from services import availability, floor, inventory, ledger, order_lifecycle, pricing, promotions
+from services.events import publish, notify, parse_last_id, stream, latest_id as latest_event_id
+from services.print_spooler import spool_order_tickets
+from services.qr import render_qr, MIME_TYPES
+from services.receipts import (
+    FORMATS as RECEIPT_FORMATS, MIME_TYPES as RECEIPT_MIME_TYPES,
+    ensure_content as ensure_receipt_content, render as render_receipt
 )
 from . import pos_bp
 from .services import (
     calculate_order_total, apply_discount, process_payment,
-    handle_bill_split, add_loyalty_points, topup_ewallet
+    handle_bill_split, add_loyalty_points, topup_ewallet, apply_promotions
 )
 
 # ============================================================================
@@ -112,6 +121,86 @@ def list_categories():
         return jsonify({"error": str(e)}), 500
 
 
+# ============================================================================
+# PRICING
+# ============================================================================
+def _price_basket_request(data):
+    """Validate a basket request body and price it; returns ((restaurant_id, at, quote), None) or (None, error)"""
+    items = data.get("items") or []
+    if not items or any(not isinstance(i, dict) or not i.get("product_id") for i in items):
+        return None, (jsonify({"error": "items must be a non-empty list of {product_id, quantity}"}), 400)
+    pricelist_id = data.get("pricelist_id")
+    if pricelist_id is not None:
+        try:
+            pricelist_id = int(pricelist_id)
+        except (TypeError, ValueError):
+            return None, (jsonify({"error": "pricelist_id must be an integer"}), 400)
+    at = None
+    if data.get("at"):
+        try:
+            at = datetime.fromisoformat(data["at"])
+        except ValueError:
+            return None, (jsonify({"error": "at must be an ISO date/time"}), 400)
+
+    restaurant_id = getattr(current_user, 'restaurant_id', None)
+    if not restaurant_id:
+        restaurant_id = db.session.query(Product.restaurant_id).filter_by(id=items[0]["product_id"]).scalar()
+    if not restaurant_id:
+        return None, (jsonify({"error": "Product not found"}), 404)
+
+    try:
+        quote = pricing.price_basket(restaurant_id, items, pricelist_id=pricelist_id,
+                                     pricelist_type=data.get("pricelist_type"), at=at)
+    except pricing.PricingError as e:
+        return None, (jsonify({"error": str(e)}), 404)
+    return (restaurant_id, at, quote), None
+
+
+def _customer_id(data):
+    """The optional "customer_id" of a request body as an int; returns (customer_id, None) or (None, error)"""
+    customer_id = data.get("customer_id")
+    if customer_id is None:
+        return None, None
+    try:
+        return int(customer_id), None
+    except (TypeError, ValueError):
+        return None, (jsonify({"error": "customer_id must be an integer"}), 400)
+
+
+@pos_bp.route("/pricing/quote", methods=["POST"])
+@login_required
+def quote_basket():
+    """Price a whole basket against a price list: {"items": [{"product_id", "variant_id", "quantity"}],
+    "pricelist_id" or "pricelist_type", "at" (ISO time, default now)}"""
+    try:
+        data = request.get_json() or {}
+        basket, error = _price_basket_request(data)
+        if error:
+            return error
+        return jsonify(basket[2])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/promotions/evaluate", methods=["POST"])
+@login_required
+def evaluate_promotions():
+    """Price a basket (same body as /pricing/quote, plus "customer_id") and pick the best promotions"""
+    try:
+        data = request.get_json() or {}
+        basket, error = _price_basket_request(data)
+        if error:
+            return error
+        customer_id, error = _customer_id(data)
+        if error:
+            return error
+        restaurant_id, at, quote = basket
+        result = promotions.evaluate(restaurant_id, quote["lines"], customer_id=customer_id, at=at)
+        return jsonify(dict(result, lines=quote["lines"]))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 # ============================================================================
 # ORDERS & CHECKOUT
 # ============================================================================
@@ -128,10 +217,13 @@ def create_order():
         order = Order()
         db.session.add(order)
         db.session.flush()
+        ticket_lines = []
+        restaurant_id = getattr(current_user, 'restaurant_id', None)
         
         for item in data["items"]:
             # Accept either menu_item_id (MenuItem) or product_id (Product)
             menu_item = None
+            product = None
             if item.get("menu_item_id"):
                 menu_item = MenuItem.query.get(item.get("menu_item_id"))
             elif item.get("product_id"):
@@ -172,8 +264,27 @@ def create_order():
                         content=note.get("content")
                     )
                     db.session.add(order_note)
+
+            ticket_lines.append({
+                "name": (product or menu_item).name,
+                "quantity": quantity,
+                "category_id": getattr(product, 'category_id', None),
+                "notes": item.get("notes"),
+            })
+            if product is not None:
+                restaurant_id = product.restaurant_id
         
+        publish('kds', 'order_created', {"order_id": order.id, "items": ticket_lines}, commit=False)
         db.session.commit()
+        notify()
+
+        # Kitchen tickets are delivered in the background; a printer problem must never
+        # fail the order itself
+        try:
+            spool_order_tickets(order, ticket_lines, restaurant_id, current_app.extensions['print_spooler'])
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("Could not queue kitchen tickets for order %s", order.id)
         return jsonify({"id": order.id, "status": order.status}), 201
     except Exception as e:
         db.session.rollback()
@@ -226,23 +337,21 @@ def get_order(order_id):
 @login_required
 @permission_required('manage_orders')
 def update_order_status(order_id):
-    """Update order status"""
+    """Move an order to another status (see services/order_lifecycle.TRANSITIONS)"""
     try:
-        order = Order.query.get(order_id)
-        if not order:
-            return jsonify({"error": "Order not found"}), 404
-        
-        data = request.get_json()
-        new_status = data.get("status")
-        valid_statuses = ["pending", "cooking", "ready", "served", "completed", "cancelled"]
-        
-        if new_status not in valid_statuses:
-            return jsonify({"error": f"Invalid status. Must be one of {valid_statuses}"}), 400
-        
-        order.status = new_status
+        data = request.get_json() or {}
+        try:
+            order_lifecycle.transition_one(order_id, data.get("status"), user_id=current_user.id)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except order_lifecycle.InvalidTransition as e:
+            return jsonify({"error": str(e)}), 409
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         db.session.commit()
+        notify()
         
-        return jsonify({"id": order.id, "status": order.status})
+        return jsonify({"id": order_id, "status": data["status"]})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -254,14 +363,16 @@ def update_order_status(order_id):
 def put_order_aside(order_id):
     """Put order aside and process another order (parallel orders)"""
     try:
-        order = Order.query.get(order_id)
-        if not order:
-            return jsonify({"error": "Order not found"}), 404
-        
-        order.status = "hold"
+        try:
+            order_lifecycle.transition_one(order_id, "hold", user_id=current_user.id)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except order_lifecycle.InvalidTransition as e:
+            return jsonify({"error": str(e)}), 409
         db.session.commit()
+        notify()
         
-        return jsonify({"message": "Order put aside", "id": order.id})
+        return jsonify({"message": "Order put aside", "id": order_id})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -271,13 +382,25 @@ def put_order_aside(order_id):
 @login_required
 @permission_required('manage_orders')
 def apply_order_discount(order_id):
-    """Apply discount to order"""
+    """Apply an ad-hoc discount, or with {"promotions": true, "customer_id"} preview the best matching
+    promotions; the preview is not stored on the order and nothing is committed"""
     try:
         order = Order.query.get(order_id)
         if not order:
             return jsonify({"error": "Order not found"}), 404
         
-        data = request.get_json()
+        data = request.get_json() or {}
+        if data.get("promotions"):
+            restaurant_id = getattr(current_user, 'restaurant_id', None) or data.get("restaurant_id")
+            if not restaurant_id:
+                return jsonify({"error": "restaurant_id is required"}), 400
+            customer_id, error = _customer_id(data)
+            if error:
+                return error
+            result = apply_promotions(order, restaurant_id, customer_id=customer_id,
+                                      pricelist_type=data.get("pricelist_type"))
+            return jsonify({"message": "Promotions preview (not applied to the order)", "preview": True,
+                            "promotions": result})
         discount = apply_discount(order, data)
         
         db.session.commit()
@@ -301,13 +424,21 @@ def checkout_order(order_id):
             return jsonify({"error": "Order not found"}), 404
         
         data = request.get_json()
+        # Complete the order first: a cancelled or already completed order takes no payment
+        _, rejected = order_lifecycle.transition([order.id], "completed", user_id=current_user.id)
+        if rejected:
+            db.session.rollback()
+            return jsonify({"error": rejected[0]["error"]}), 409
         payment_result = process_payment(order, data, current_user)
         
         if payment_result.get("success"):
-            order.status = "completed"
+            # Recipe usage leaves stock in the same transaction as the payment
+            inventory.deplete_order(order)
             db.session.commit()
+            notify()
             return jsonify(payment_result), 200
         else:
+            db.session.rollback()
             return jsonify(payment_result), 400
     except Exception as e:
         db.session.rollback()
@@ -358,22 +489,38 @@ def list_payment_methods():
 @pos_bp.route("/tables", methods=["GET"])
 @login_required
 def list_tables():
-    """List all tables with status"""
+    """Cached floor snapshot: {"version", "last_event_id", "tables"}
+
+    Keep it current by applying /pos/tables/events diffs newer than "version",
+    resuming the stream from "last_event_id". Honors If-None-Match.
+    """
     try:
         restaurant_id = current_user.restaurant_id
-        floor_plan = RestaurantFloorPlan.query.filter_by(restaurant_id=restaurant_id).first()
-        if not floor_plan:
-            return jsonify({"tables": []}), 200
-        
-        tables = Table.query.join(TableSection).filter(TableSection.floor_plan_id == floor_plan.id).all()
-        return jsonify({"tables": [{
-            "id": t.id,
-            "number": t.table_number,
-            "seats": t.seats,
-            "section": t.section.name,
-            "status": t.status,
-            "reserved_until": t.reserved_until.isoformat() if t.reserved_until else None
-        } for t in tables]})
+        # Read before the snapshot: a diff raced in after it is repeated, never lost
+        last_event_id = latest_event_id(floor.channel(restaurant_id))
+        state = floor.get_state(restaurant_id)
+        etag = f'"floor-{restaurant_id}-{state.version or 0}"'
+        if request.if_none_match.contains(etag.strip('"')):
+            return Response(status=304, headers={"ETag": etag})
+        response = jsonify({**state.snapshot(), "last_event_id": last_event_id})
+        response.headers["ETag"] = etag
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/tables/events")
+@login_required
+def table_events():
+    """Server-sent event stream of this restaurant's table changes (tables_changed)"""
+    try:
+        last_id = parse_last_id(request.headers.get("Last-Event-ID", request.args.get("last_id")))
+        frames = stream(floor.channel(current_user.restaurant_id), last_id=last_id,
+                        poll_interval=current_app.config.get("SSE_POLL_INTERVAL", 1.0),
+                        keepalive=current_app.config.get("SSE_KEEPALIVE", 15),
+                        max_duration=current_app.config.get("SSE_MAX_STREAM_SECONDS", 300))
+        return Response(stream_with_context(frames), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -384,21 +531,20 @@ def list_tables():
 def assign_table(table_id):
     """Assign order to table"""
     try:
-        table = Table.query.get(table_id)
-        if not table:
-            return jsonify({"error": "Table not found"}), 404
-        
-        data = request.get_json()
+        data = request.get_json() or {}
         order_id = data.get("order_id")
-        customer_name = data.get("customer_name")
         
-        order = Order.query.get(order_id)
-        if not order:
+        if not order_id or not db.session.query(Order.id).filter(Order.id == order_id).scalar():
             return jsonify({"error": "Order not found"}), 404
         
-        table.current_order_id = order_id
-        table.status = "occupied"
+        try:
+            floor.assign(table_id, order_id)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except floor.TableOccupied as e:
+            return jsonify({"error": str(e)}), 409
         db.session.commit()
+        notify()
         
         return jsonify({"message": "Table assigned", "table_id": table_id, "order_id": order_id})
     except Exception as e:
@@ -412,30 +558,184 @@ def assign_table(table_id):
 def transfer_table(table_id):
     """Transfer customers from one table to another"""
     try:
-        source_table = Table.query.get(table_id)
-        if not source_table:
-            return jsonify({"error": "Source table not found"}), 404
-        
-        data = request.get_json()
+        data = request.get_json() or {}
         dest_table_id = data.get("destination_table_id")
-        dest_table = Table.query.get(dest_table_id)
-        if not dest_table:
+        if not dest_table_id:
             return jsonify({"error": "Destination table not found"}), 404
         
-        order_id = source_table.current_order_id
-        
-        dest_table.current_order_id = order_id
-        dest_table.status = "occupied"
-        source_table.current_order_id = None
-        source_table.status = "available"
-        
+        try:
+            floor.transfer(table_id, int(dest_table_id))
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except floor.TableOccupied as e:
+            return jsonify({"error": str(e)}), 409
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         db.session.commit()
+        notify()
         return jsonify({"message": "Table transfer completed"})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
+@pos_bp.route("/tables/<int:table_id>/status", methods=["PUT"])
+@login_required
+@permission_required('manage_tables')
+def update_table_status(table_id):
+    """Free, occupy or reserve a table: {"status", "reserved_by", "reserved_until"}"""
+    try:
+        data = request.get_json() or {}
+        try:
+            reserved_until = datetime.fromisoformat(data["reserved_until"]) if data.get("reserved_until") else None
+            floor.set_status(table_id, data.get("status"), data.get("reserved_by"), reserved_until)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        db.session.commit()
+        notify()
+        return jsonify({"id": table_id, "status": data["status"]})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+# ============================================================================
+# BOOKINGS
+# ============================================================================
+def _option_json(option):
+    return {"table_ids": list(option.table_ids), "combination_id": option.combination_id, "seats": option.seats}
+
+
+def _booking_args(args):
+    """``(party_size, duration_minutes or None)`` from query args or a JSON body."""
+    party_size = int(args.get("party_size") or 0)
+    if party_size < 1:
+        raise ValueError("party_size must be at least 1")
+    duration = args.get("duration_minutes")
+    return party_size, int(duration) if duration else None
+
+
+@pos_bp.route("/tables/availability", methods=["GET"])
+@login_required
+def table_availability():
+    """Tables and combinations free for ?party_size= at ?at= (ISO) for ?duration_minutes=, best fit first"""
+    try:
+        try:
+            party_size, duration = _booking_args(request.args)
+            at = datetime.fromisoformat(request.args["at"])
+            options = availability.find_tables(current_user.restaurant_id, party_size, at, duration)
+        except KeyError:
+            return jsonify({"error": "at is required"}), 400
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"at": at.isoformat(), "options": [_option_json(option) for option in options]})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/tables/availability/slots", methods=["GET"])
+@login_required
+def table_availability_slots():
+    """Next start times with a free table for ?party_size= from ?after= (ISO, default now), ?limit="""
+    try:
+        try:
+            party_size, duration = _booking_args(request.args)
+            after = datetime.fromisoformat(request.args["after"]) if request.args.get("after") else datetime.utcnow()
+            slots = availability.next_slots(current_user.restaurant_id, party_size, after, duration,
+                                            limit=min(request.args.get("limit", 5, type=int), 50))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"slots": [{"start": start.isoformat(), "options": [_option_json(o) for o in options]}
+                                  for start, options in slots]})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/bookings", methods=["POST"])
+@login_required
+@permission_required('manage_tables')
+def create_booking():
+    """Book a table: {"party_size", "booking_date", "customer_name", optional "duration_minutes",
+    "table_id" or "combination_id" (else the best free fit), "customer_email", "customer_phone", "notes"}"""
+    try:
+        data = request.get_json() or {}
+        try:
+            party_size, duration = _booking_args(data)
+            start = datetime.fromisoformat(data["booking_date"])
+            if not data.get("customer_name"):
+                raise ValueError("customer_name is required")
+            booking = availability.book(
+                current_user.restaurant_id, party_size, start, data["customer_name"], duration,
+                table_id=data.get("table_id"), combination_id=data.get("combination_id"),
+                customer_email=data.get("customer_email"), customer_phone=data.get("customer_phone"),
+                notes=data.get("notes"))
+        except LookupError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 404
+        except availability.Unavailable as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 409
+        except (KeyError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({"error": f"Invalid booking: {e}"}), 400
+        db.session.commit()
+        return jsonify({
+            "id": booking.id,
+            "table_id": booking.table_id,
+            "combination_id": booking.combination_id,
+            "booking_date": booking.booking_date.isoformat(),
+            "ends_at": booking.ends_at.isoformat(),
+            "party_size": booking.party_size,
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/bookings/<int:booking_id>", methods=["DELETE"])
+@login_required
+@permission_required('manage_tables')
+def cancel_booking(booking_id):
+    """Cancel a booking; its time frees up for availability searches"""
+    try:
+        booking = TableBooking.query.filter_by(id=booking_id, restaurant_id=current_user.restaurant_id).first()
+        if not booking:
+            return jsonify({"error": "Booking not found"}), 404
+        booking.status = "cancelled"
+        db.session.commit()
+        return jsonify({"id": booking_id, "status": "cancelled"})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/tables/combinations", methods=["POST"])
+@login_required
+@permission_required('manage_tables')
+def create_table_combination():
+    """Tables that can be joined for larger parties: {"name", "table_ids": [...], optional "seats"}"""
+    try:
+        data = request.get_json() or {}
+        table_ids = sorted({int(table_id) for table_id in data.get("table_ids") or []})
+        if len(table_ids) < 2 or not data.get("name"):
+            return jsonify({"error": "name and at least two table_ids are required"}), 400
+        layout = availability.get_layout(current_user.restaurant_id)
+        missing = [table_id for table_id in table_ids if table_id not in layout.seats]
+        if missing:
+            return jsonify({"error": f"Tables not on this floor plan: {missing}"}), 404
+        combination = TableCombination(restaurant_id=current_user.restaurant_id, name=data["name"],
+                                       seats=data.get("seats"),
+                                       members=[TableCombinationMember(table_id=table_id) for table_id in table_ids])
+        db.session.add(combination)
+        db.session.commit()
+        return jsonify({"id": combination.id, "name": combination.name, "table_ids": table_ids}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
 @pos_bp.route("/delayed-orders", methods=["POST"])
 @login_required
 @permission_required('manage_orders')
@@ -458,6 +758,7 @@ def create_delayed_order():
         )
         db.session.add(delayed_order)
         db.session.commit()
+        current_app.extensions['course_scheduler'].schedule(delayed_order)
         
         return jsonify({"id": delayed_order.id, "course": course_number}), 201
     except Exception as e:
@@ -493,6 +794,29 @@ def kiosk_menu(kiosk_code):
         return jsonify({"error": str(e)}), 500
 
 
+@pos_bp.route("/kiosk/<kiosk_code>/qr", methods=["GET"])
+@login_required
+def kiosk_qr(kiosk_code):
+    """QR code pointing at the kiosk menu (?format=svg|png, ?size=box pixels)"""
+    try:
+        kiosk = Kiosk.query.filter_by(kiosk_code=kiosk_code).first()
+        if not kiosk:
+            return jsonify({"error": "Kiosk not found"}), 404
+        return _qr_response(url_for("pos.kiosk_menu", kiosk_code=kiosk.kiosk_code, _external=True))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _qr_response(data):
+    fmt = request.args.get("format", "svg")
+    if fmt not in MIME_TYPES:
+        return jsonify({"error": f"Unsupported format. Must be one of {sorted(MIME_TYPES)}"}), 400
+    box_size = min(max(request.args.get("size", 10, type=int), 1), 20)
+    response = Response(render_qr(data, fmt, box_size), mimetype=MIME_TYPES[fmt])
+    response.headers["Cache-Control"] = "private, max-age=86400"
+    return response
+
+
 # ============================================================================
 # CUSTOMER LOYALTY
 # ============================================================================
@@ -579,22 +903,16 @@ def redeem_loyalty_points(customer_id):
         reward_id = data.get("reward_id")
         points_to_redeem = int(data.get("points", 0))
 
-        if loyalty_card.points_balance < points_to_redeem:
-            return jsonify({"error": "Insufficient loyalty points"}), 400
-
-        loyalty_card.points_balance -= points_to_redeem
-        loyalty_card.points_redeemed_total += points_to_redeem
+        if points_to_redeem <= 0:
+            return jsonify({"error": "Points must be positive"}), 400
 
-        points_record = LoyaltyPoints(
-            loyalty_card_id=loyalty_card.id,
-            points=-points_to_redeem,
-            earn_method="redemption",
-            description=f"Redeemed {points_to_redeem} points"
-        )
-        db.session.add(points_record)
+        try:
+            remaining = ledger.redeem_points(loyalty_card.id, points_to_redeem)
+        except ledger.InsufficientBalance:
+            return jsonify({"error": "Insufficient loyalty points"}), 400
         db.session.commit()
 
-        return jsonify({"message": "Points redeemed", "remaining_points": loyalty_card.points_balance})
+        return jsonify({"message": "Points redeemed", "remaining_points": remaining})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -623,10 +941,10 @@ def topup_ewallet_endpoint(customer_id):
         if amount <= 0:
             return jsonify({"error": "Amount must be positive"}), 400
 
-        topup_ewallet(wallet, amount, payment_method_id)
+        result = topup_ewallet(wallet, amount, payment_method_id)
         db.session.commit()
 
-        return jsonify({"message": "E-wallet topped up", "new_balance": wallet.balance})
+        return jsonify({"message": "E-wallet topped up", "new_balance": result["new_balance"]})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -638,20 +956,25 @@ def topup_ewallet_endpoint(customer_id):
 @pos_bp.route("/orders/<int:order_id>/receipt", methods=["GET"])
 @login_required
 def get_receipt(order_id):
-    """Generate and return receipt"""
+    """Return the receipt as JSON, or as a document with ?format=text|html|escpos"""
     try:
-        order = Order.query.get(order_id)
-        if not order:
-            return jsonify({"error": "Order not found"}), 404
-        
-        receipt = Receipt.query.filter_by(order_id=order_id).first()
+        receipt = Receipt.query.filter_by(order_id=order_id).order_by(Receipt.id.desc()).first()
         if not receipt:
+            if not db.session.query(Order.id).filter_by(id=order_id).scalar():
+                return jsonify({"error": "Order not found"}), 404
             return jsonify({"error": "Receipt not found"}), 404
-        
+
+        fmt = request.args.get("format")
+        if fmt:
+            if fmt not in RECEIPT_FORMATS:
+                return jsonify({"error": f"Invalid format. Must be one of {list(RECEIPT_FORMATS)}"}), 400
+            body = ensure_receipt_content(receipt) if fmt == "text" else render_receipt(receipt, fmt)
+            return Response(body, content_type=RECEIPT_MIME_TYPES[fmt])
+
         return jsonify({
             "id": receipt.id,
             "receipt_number": receipt.receipt_number,
-            "content": receipt.content,
+            "content": ensure_receipt_content(receipt),
             "header": receipt.header_text,
             "footer": receipt.footer_text,
             "created_at": receipt.created_at.isoformat()
@@ -660,21 +983,99 @@ def get_receipt(order_id):
         return jsonify({"error": str(e)}), 500
 
 
+@pos_bp.route("/orders/<int:order_id>/receipt/qr", methods=["GET"])
+@login_required
+def receipt_qr(order_id):
+    """QR code linking to the digital receipt (?format=svg|png, ?size=box pixels)"""
+    try:
+        receipt = Receipt.query.filter_by(order_id=order_id).first()
+        if not receipt:
+            return jsonify({"error": "Receipt not found"}), 404
+        return _qr_response(url_for("pos.get_receipt", order_id=order_id, _external=True))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @pos_bp.route("/orders/<int:order_id>/receipt/print", methods=["POST"])
 @login_required
 @permission_required('manage_receipts')
 def print_receipt(order_id):
-    """Mark receipt as printed"""
+    """Mark receipt as printed; with {"printer_id"} also queue it on that printer"""
     try:
-        receipt = Receipt.query.filter_by(order_id=order_id).first()
+        receipt = Receipt.query.filter_by(order_id=order_id).order_by(Receipt.id.desc()).first()
         if not receipt:
             return jsonify({"error": "Receipt not found"}), 404
         
+        ensure_receipt_content(receipt)
+        job = None
+        printer_id = (request.get_json(silent=True) or {}).get("printer_id")
+        if printer_id:
+            if not db.session.query(KitchenPrinter.id).filter_by(id=printer_id).scalar():
+                return jsonify({"error": "Printer not found"}), 404
+            job = PrintJob(printer_id=printer_id, order_id=order_id, job_type="receipt",
+                           payload=render_receipt(receipt, "escpos"))
+            db.session.add(job)
         receipt.printed = True
         receipt.printed_at = datetime.utcnow()
         db.session.commit()
+        if job is not None:
+            current_app.extensions['print_spooler'].submit([job.id])
         
-        return jsonify({"message": "Receipt printed"})
+        return jsonify({"message": "Receipt printed", "print_job_id": job.id if job else None})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/print-jobs", methods=["GET"])
+@login_required
+@permission_required('manage_orders')
+def list_print_jobs():
+    """List kitchen/bar print jobs, newest first (?status=queued|printing|printed|failed)"""
+    try:
+        query = PrintJob.query
+        status = request.args.get("status")
+        if status:
+            query = query.filter_by(status=status)
+        if request.args.get("order_id", type=int):
+            query = query.filter_by(order_id=request.args.get("order_id", type=int))
+        jobs = query.order_by(PrintJob.id.desc()).limit(request.args.get("limit", 100, type=int)).all()
+        return jsonify([{
+            "id": j.id,
+            "printer_id": j.printer_id,
+            "printer": j.printer.name,
+            "order_id": j.order_id,
+            "job_type": j.job_type,
+            "status": j.status,
+            "attempts": j.attempts,
+            "last_error": j.last_error,
+            "created_at": j.created_at.isoformat(),
+            "printed_at": j.printed_at.isoformat() if j.printed_at else None
+        } for j in jobs])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@pos_bp.route("/print-jobs/<int:job_id>/reprint", methods=["POST"])
+@login_required
+@permission_required('manage_orders')
+def reprint_job(job_id):
+    """Send a print job to its printer again"""
+    try:
+        job = PrintJob.query.get(job_id)
+        if not job:
+            return jsonify({"error": "Print job not found"}), 404
+        if job.status in ("queued", "printing"):
+            return jsonify({"error": "Print job is already pending"}), 409
+
+        job.status = "queued"
+        job.attempts = 0
+        job.last_error = None
+        job.next_attempt_at = None
+        db.session.commit()
+        current_app.extensions['print_spooler'].submit([job.id])
+
+        return jsonify({"message": "Print job queued", "id": job.id})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -704,7 +1105,8 @@ def open_cash_register():
         register.current_balance = opening_balance
         register.opened_at = datetime.utcnow()
         register.status = "opened"
-        register.current_cashier_id = current_user.cashier_account.id if current_user.cashier_account else None
+        cashier_id = db.session.query(CashierAccount.id).filter_by(user_id=current_user.id, active=True).limit(1).scalar()
+        register.current_cashier_id = cashier_id
         
         db.session.commit()
         return jsonify({"message": "Cash register opened", "id": register.id}), 201
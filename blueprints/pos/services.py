@@ -1,9 +1,10 @@
 # POS helper functions and business logic
 from extensions import db
 from models import (
-    Order, OrderItem, Discount, BillSplit, PaymentTransaction,
-    Receipt, LoyaltyPoints, eWalletTransaction, Product
+    Order, OrderItem, Discount, BillSplit, PaymentTransaction, PaymentMethod
 )
+from services import ledger, pricing, promotions
+from services.receipts import create_receipt
 from datetime import datetime
 import json
 
@@ -69,6 +70,22 @@ def apply_discount(order, discount_data):
         raise Exception(f"Error applying discount: {str(e)}")
 
 
+def apply_promotions(order, restaurant_id, customer_id=None, pricelist_type=None):
+    """
+    Evaluate the restaurant's Discount rules against an order's product lines
+    (lines that are not products of the restaurant are left undiscounted).
+    This is a preview: the order is not changed and nothing is written.
+    """
+    try:
+        index = pricing.get_index(restaurant_id)
+        items = [{"product_id": item.menu_item_id, "quantity": item.quantity}
+                 for item in order.items if item.menu_item_id in index.products]
+        quote = pricing.price_basket(restaurant_id, items, pricelist_type=pricelist_type)
+        return promotions.evaluate(restaurant_id, quote["lines"], customer_id=customer_id)
+    except Exception as e:
+        raise Exception(f"Error applying promotions: {str(e)}")
+
+
 def process_payment(order, payment_data, current_user):
     """
     Process payment for an order
@@ -104,20 +121,21 @@ def process_payment(order, payment_data, current_user):
         )
         db.session.add(payment)
         
-        # Generate receipt
-        receipt = Receipt(
-            order_id=order.id,
-            receipt_number=f"REC-{order.id}-{datetime.utcnow().timestamp()}",
-            content=generate_receipt_content(order, payment),
+        # Number the receipt now; its content is rendered on first fetch/print
+        restaurant_id = db.session.query(PaymentMethod.restaurant_id).filter_by(id=payment_method_id).scalar()
+        receipt = create_receipt(
+            order,
+            restaurant_id=restaurant_id,
             header_text="Thank you for your purchase!",
             footer_text="Visit us again!"
         )
-        db.session.add(receipt)
+        db.session.flush()
         
         return {
             "success": True,
             "payment_id": payment.id,
             "receipt_id": receipt.id,
+            "receipt_number": receipt.receipt_number,
             "amount": amount,
             "tip": tip_amount,
             "total": amount + tip_amount,
@@ -127,46 +145,6 @@ def process_payment(order, payment_data, current_user):
         raise Exception(f"Error processing payment: {str(e)}")
 
 
-def generate_receipt_content(order, payment):
-    """Generate receipt content"""
-    try:
-        lines = []
-        lines.append("=" * 40)
-        lines.append("RECEIPT")
-        lines.append("=" * 40)
-        lines.append(f"Order #: {order.id}")
-        lines.append(f"Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}")
-        lines.append("")
-        lines.append("-" * 40)
-        
-        total = 0
-        from models import Product
-        for item in order.items:
-            menu = item.menu_item
-            if not menu:
-                menu = Product.query.get(item.menu_item_id)
-            name = getattr(menu, 'name', 'Item')
-            unit_price = getattr(menu, 'price', getattr(menu, 'base_price', 0))
-            subtotal = unit_price * item.quantity
-            total += subtotal
-            lines.append(f"{name}")
-            lines.append(f"  {item.quantity} x ${unit_price:.2f} = ${subtotal:.2f}")
-        
-        lines.append("-" * 40)
-        lines.append(f"Subtotal: ${total:.2f}")
-        lines.append(f"Payment Method: {payment.payment_method.name if hasattr(payment, 'payment_method') else 'N/A'}")
-        if payment.tip_amount > 0:
-            lines.append(f"Tip: ${payment.tip_amount:.2f}")
-            lines.append(f"Total: ${total + payment.tip_amount:.2f}")
-        else:
-            lines.append(f"Total: ${total:.2f}")
-        lines.append("=" * 40)
-        
-        return "\n".join(lines)
-    except Exception as e:
-        return f"Error generating receipt: {str(e)}"
-
-
 def handle_bill_split(order, split_data):
     """
     Handle bill splitting for multiple parties
@@ -209,23 +187,13 @@ def add_loyalty_points(customer, order, points_earned):
         if not customer.loyalty_card:
             return {"success": False, "error": "Customer does not have a loyalty card"}
         
-        loyalty_card = customer.loyalty_card
-        loyalty_card.points_balance += points_earned
-        loyalty_card.points_earned_total += points_earned
-        
-        points_record = LoyaltyPoints(
-            loyalty_card_id=loyalty_card.id,
-            order_id=order.id,
-            points=points_earned,
-            earn_method="purchase",
-            description=f"Points earned from order #{order.id}"
-        )
-        db.session.add(points_record)
+        balance = ledger.earn_points(customer.loyalty_card.id, points_earned, order_id=order.id,
+                                     description=f"Points earned from order #{order.id}")
         
         return {
             "success": True,
             "points_earned": points_earned,
-            "points_balance": loyalty_card.points_balance
+            "points_balance": balance
         }
     except Exception as e:
         raise Exception(f"Error adding loyalty points: {str(e)}")
@@ -236,20 +204,13 @@ def topup_ewallet(ewallet, amount, payment_method_id):
     Top-up customer e-wallet
     """
     try:
-        ewallet.balance += amount
-        
-        transaction = eWalletTransaction(
-            ewallet_id=ewallet.id,
-            amount=amount,
-            transaction_type="topup",
-            reference_id=f"TOPUP-{datetime.utcnow().timestamp()}"
-        )
-        db.session.add(transaction)
+        balance = ledger.wallet_credit(ewallet.id, amount, transaction_type="topup",
+                                       reference_id=f"TOPUP-{datetime.utcnow().timestamp()}")
         
         return {
             "success": True,
             "amount_added": amount,
-            "new_balance": ewallet.balance
+            "new_balance": balance
         }
     except Exception as e:
         raise Exception(f"Error topping up e-wallet: {str(e)}")
@@ -257,19 +218,10 @@ def topup_ewallet(ewallet, amount, payment_method_id):
 
 def calculate_price_with_pricelist(product, pricelist):
     """
-    Get product price from specific pricelist
+    Get product price from specific pricelist (base price outside its validity window)
     """
     try:
-        from models import PriceListItem
-        price_list_item = PriceListItem.query.filter_by(
-            pricelist_id=pricelist.id,
-            product_id=product.id
-        ).first()
-        
-        if price_list_item:
-            return price_list_item.price
-        else:
-            return product.base_price
+        return pricing.unit_price(product.restaurant_id, product.id, pricelist_id=pricelist.id)
     except Exception as e:
         raise Exception(f"Error calculating price from pricelist: {str(e)}")
 
@@ -0,0 +1,232 @@
+# Flask CLI commands (``flask <command>``)
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+# Runs in a fresh interpreter under -X importtime; prints a JSON line with timings
+_STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app as app_module
+import_ms = (time.perf_counter() - started) * 1000
+from config import Config
+Config.ENABLE_EXCHANGE_UPDATER = False  # network fetches are not part of startup
+Config.ENABLE_COURSE_SCHEDULER = False
+Config.ENABLE_HOUSEKEEPING = False
+runs = []
+for _ in range({runs}):
+    started = time.perf_counter()
+    app_module.create_app()
+    runs.append((time.perf_counter() - started) * 1000)
+print(json.dumps({{"import_ms": import_ms, "create_app_ms": runs}}))
+"""
+
+
+def parse_importtime(lines):
+    """Parse ``-X importtime`` output into (module, self_us, cumulative_us, depth) tuples."""
+    rows = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+class LazyMigrateGroup(click.Group):
+    """``flask db`` proxy that imports Flask-Migrate/Alembic only when invoked."""
+
+    def _load(self, ctx):
+        from flask.cli import ScriptInfo
+        from extensions import init_migrate
+        from flask_migrate.cli import db as db_group
+        init_migrate(ctx.ensure_object(ScriptInfo).load_app())
+        return db_group
+
+    def get_params(self, ctx):
+        return self._load(ctx).get_params(ctx)
+
+    def list_commands(self, ctx):
+        return self._load(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._load(ctx).get_command(ctx, name)
+
+    def invoke(self, ctx):
+        return self._load(ctx).invoke(ctx)
+
+
+def register_commands(app):
+    app.cli.add_command(LazyMigrateGroup("db", help="Perform database migrations."))
+
+    @app.cli.command("datagen")
+    @click.option("--restaurants", default=10, show_default=True, help="Number of restaurants to create.")
+    @click.option("--products", default=100, show_default=True, help="Products per restaurant.")
+    @click.option("--customers", default=200, show_default=True, help="Customers per restaurant.")
+    @click.option("--days", default=90, show_default=True, help="Days of order history.")
+    @click.option("--orders-per-day", default=40, show_default=True, help="Average orders per restaurant per day.")
+    @click.option("--seed", default=42, show_default=True, help="Random seed; same seed, same data.")
+    @click.option("--batch-size", default=5000, show_default=True, help="Rows per executemany batch.")
+    @click.option("--create-tables/--no-create-tables", default=True, show_default=True,
+                  help="Run db.create_all() first.")
+    def datagen(restaurants, products, customers, days, orders_per_day, seed, batch_size, create_tables):
+        """Bulk-generate synthetic multi-tenant data for scale testing."""
+        from extensions import db
+        from services.datagen import generate
+
+        if create_tables:
+            db.create_all()
+        started = time.perf_counter()
+        counts = generate(restaurants=restaurants, products=products, customers=customers, days=days,
+                          orders_per_day=orders_per_day, seed=seed, batch_size=batch_size,
+                          progress=click.echo)
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        for table, count in counts.items():
+            click.echo(f"  {table:<24} {count:>12,}")
+        click.echo(f"✓ {total:,} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    @app.cli.command("profile-startup")
+    @click.option("--top", default=20, show_default=True, help="Rows to show per table.")
+    @click.option("--runs", default=3, show_default=True, help="create_app() calls to time.")
+    @click.option("--json", "as_json", is_flag=True, help="Print a JSON report instead of tables.")
+    @click.option("--max-ms", type=float, default=None,
+                  help="Exit with status 1 when import + first create_app() exceeds this many ms.")
+    def profile_startup(top, runs, as_json, max_ms):
+        """Report per-module import time and create_app() cost in a fresh interpreter."""
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _STARTUP_PROBE.format(runs=max(1, runs))],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise click.ClickException(proc.stderr.strip().splitlines()[-1] if proc.stderr else "probe failed")
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(proc.stderr.splitlines())
+
+        packages = {}
+        for name, self_us, _, _ in modules:
+            root = name.split('.')[0]
+            packages[root] = packages.get(root, 0) + self_us
+        cold_ms = timings["import_ms"] + timings["create_app_ms"][0]
+        report = {
+            "import_ms": round(timings["import_ms"], 1),
+            "create_app_ms": [round(ms, 1) for ms in timings["create_app_ms"]],
+            "create_app_median_ms": round(statistics.median(timings["create_app_ms"]), 1),
+            "cold_start_ms": round(cold_ms, 1),
+            "modules_imported": len(modules),
+            "top_packages_ms": {name: round(us / 1000, 1) for name, us in
+                                sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]},
+            "top_modules_self_ms": {name: round(us / 1000, 1) for name, us, _, _ in
+                                    sorted(modules, key=lambda row: row[1], reverse=True)[:top]},
+        }
+
+        if as_json:
+            click.echo(json.dumps(report, indent=2))
+        else:
+            click.echo(f"import app:          {report['import_ms']:>8.1f} ms ({report['modules_imported']} modules)")
+            click.echo(f"create_app() runs:   {', '.join(f'{ms:.1f}' for ms in report['create_app_ms'])} ms")
+            click.echo(f"cold start:          {report['cold_start_ms']:>8.1f} ms")
+            click.echo("\nSlowest packages (self time, ms):")
+            for name, ms in report["top_packages_ms"].items():
+                click.echo(f"  {ms:>8.1f}  {name}")
+            click.echo("\nSlowest modules (self time, ms):")
+            for name, ms in report["top_modules_self_ms"].items():
+                click.echo(f"  {ms:>8.1f}  {name}")
+
+        if max_ms is not None and cold_ms > max_ms:
+            raise click.ClickException(f"cold start {cold_ms:.0f} ms exceeds budget of {max_ms:.0f} ms")
+
+    @app.cli.command("audit-sequences")
+    @click.option("--doc-type", type=click.Choice(["invoice", "receipt"]), default=None,
+                  help="Only audit one document type.")
+    @click.option("--strict", is_flag=True, help="Exit with status 1 when any gap or duplicate is found.")
+    def audit_sequences(doc_type, strict):
+        """Report gaps and duplicates in receipt/invoice numbers per restaurant."""
+        from models import DocumentSequence
+        from services.sequences import gap_report
+
+        query = DocumentSequence.query.order_by(DocumentSequence.restaurant_id, DocumentSequence.doc_type)
+        if doc_type:
+            query = query.filter_by(doc_type=doc_type)
+        problems = 0
+        for sequence in query:
+            report = gap_report(sequence.doc_type, sequence.restaurant_id)
+            click.echo(f"{sequence.doc_type:<8} restaurant {sequence.restaurant_id or '-':>5}: "
+                       f"{report['issued']:,} issued, {report['missing']:,} missing, "
+                       f"{len(report['duplicates']):,} duplicated, {report['reserved_unused']:,} reserved")
+            for gap in report["gaps"]:
+                reserved = f" (reserved by {', '.join(gap['reserved_by'])})" if gap["reserved_by"] else ""
+                click.echo(f"    missing {gap['from']}-{gap['to']}{reserved}")
+            problems += report["missing"] + len(report["duplicates"])
+        if strict and problems:
+            raise click.ClickException(f"{problems} numbering problem(s) found")
+
+    @app.cli.command("archive-invoices")
+    @click.option("--month", required=True, help="Month to archive, YYYY-MM.")
+    @click.option("--restaurant", "restaurant_id", type=int, default=None,
+                  help="Restaurant id (default: invoices without a restaurant).")
+    @click.option("--format", "fmt", type=click.Choice(["html", "pdf"]), default="html", show_default=True)
+    @click.option("--output", type=click.Path(dir_okay=False), default=None, help="Zip file to write.")
+    def archive_invoices(month, restaurant_id, fmt, output):
+        """Render one month of invoices into a single zip archive."""
+        from services.invoices import build_month_archive, pdf_available
+
+        try:
+            year, month_number = (int(part) for part in month.split("-"))
+        except ValueError:
+            raise click.BadParameter("expected YYYY-MM", param_hint="--month")
+        if fmt == "pdf" and not pdf_available():
+            raise click.ClickException("PDF rendering requires WeasyPrint")
+        output = output or f"invoices-{restaurant_id or 0}-{year}-{month_number:02d}.zip"
+        started = time.perf_counter()
+        count = build_month_archive(restaurant_id, year, month_number, output, fmt)
+        click.echo(f"✓ {count:,} invoices written to {output} in {time.perf_counter() - started:.1f}s")
+
+    @app.cli.command("ledger-rollup")
+    @click.option("--ledger", "kind", type=click.Choice(["loyalty", "ewallet"]), default=None,
+                  help="Only roll up one ledger.")
+    @click.option("--reconcile", is_flag=True, help="Also compare cached balances with the ledger.")
+    @click.option("--fix", is_flag=True, help="With --reconcile, rewrite drifted cached balances.")
+    def ledger_rollup(kind, reconcile, fix):
+        """Fold loyalty/e-wallet ledger entries into balance snapshots."""
+        from services import ledger
+
+        click.echo(f"✓ {ledger.rollup(kind):,} account snapshot(s) updated")
+        if not reconcile:
+            return
+        for name in [kind] if kind else ledger.LEDGERS:
+            drift = ledger.reconcile(name, fix=fix)
+            for row in drift:
+                click.echo(f"  {name} account {row['account_id']}: cached {row['cached']}, ledger {row['ledger']}")
+            click.echo(f"{name}: {len(drift)} drifted balance(s){' fixed' if fix and drift else ''}")
+
+    @app.cli.command("stock-snapshot")
+    def stock_snapshot():
+        """Snapshot every inventory item's stock level at the last settled midnight."""
+        from services import inventory
+
+        click.echo(f"✓ {inventory.snapshot():,} item snapshot(s) written")
+
+    @app.cli.command("prep-time-rollup")
+    @click.option("--hours", default=None, type=int, help="Recompute this many recent hours (backfill).")
+    def prep_time_rollup(hours):
+        """Recompute the hourly kitchen prep-time statistics."""
+        from services import order_lifecycle
+
+        click.echo(f"✓ {order_lifecycle.rollup(hours=hours):,} hour(s) rolled up")
+
+    @app.cli.command("loyalty-tiers")
+    @click.option("--rebuild", is_flag=True,
+                  help="Recompute every card from the window (first run, or after changing the window or thresholds).")
+    def loyalty_tiers(rebuild):
+        """Expire loyalty points that left the tier window and re-tier those cards."""
+        from services import loyalty_tiers as tiers
+
+        started = time.perf_counter()
+        count = tiers.rebuild() if rebuild else tiers.expire()
+        click.echo(f"✓ {count:,} card(s) updated in {time.perf_counter() - started:.1f}s")
@@ -6,6 +6,100 @@ class Config:
         "DATABASE_URL", f"sqlite:///{os.path.abspath('instance/app.db')}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional read replica for reporting/listing endpoints (see services/db_router.py)
+    SQLALCHEMY_REPLICA_URI = os.environ.get("DATABASE_REPLICA_URL")
+    REPLICA_MAX_LAG_SECONDS = 5  # fall back to the primary when the replica lags more than this
+    REPLICA_LAG_CHECK_INTERVAL = 10  # seconds between lag probes
+    USER_CACHE_TTL = 30  # seconds a logged-in user's row is served from memory (services/user_cache.py); 0 disables
+    # Password/backup-code hashing runs on a process pool (services/hashing.py); 0 workers = inline
+    HASHING_POOL_WORKERS = int(os.environ.get("HASHING_POOL_WORKERS", "2"))
+    HASHING_MAX_QUEUE = 32  # in-flight hash operations before login answers 503
+    HASHING_TIMEOUT = 5  # seconds
+    # Kitchen/bar ticket delivery (services/print_spooler.py)
+    PRINT_SPOOLER_WORKERS = 2
+    PRINTER_MAX_CONCURRENT_JOBS = 1  # jobs sent to the same printer at once
+    PRINT_MAX_ATTEMPTS = 5
+    PRINT_RETRY_BACKOFF = 2.0  # seconds before the first retry; doubles per attempt
+    PRINTER_TIMEOUT = 5  # seconds to connect/send to a network printer
+    PRINT_CLAIM_TIMEOUT = 60  # seconds before a job left 'printing' by a dead worker is retried
+    PRINT_RECOVERY_INTERVAL = 30  # seconds between scans for jobs orphaned by other workers
+    ENABLE_PRINT_SPOOLER = True  # start the spooler with the worker, not only on its first job
+    # Delayed course release (services/course_scheduler.py); one leader across workers
+    ENABLE_COURSE_SCHEDULER = True
+    COURSE_SCHEDULER_INTERVAL = 5  # max seconds between ticks (also bounds clock-change pickup)
+    COURSE_SCHEDULER_LEASE_TTL = 30  # seconds before another worker may take over
+    COURSE_SCHEDULER_SCAN_OVERLAP = 60  # seconds of new-course ids re-read for late commits
+    # Periodic housekeeping (services/housekeeping.py); one leader per job across workers
+    ENABLE_HOUSEKEEPING = True
+    HOUSEKEEPING_INTERVAL = 60  # seconds between passes; a failed job is retried on the next one
+    HOUSEKEEPING_LEASE_TTL = 900  # seconds; must exceed the longest run of any job
+    # Server-sent event streams (services/events.py)
+    SSE_POLL_INTERVAL = 1.0  # seconds; how quickly events from other workers reach a stream
+    SSE_KEEPALIVE = 15  # seconds between keepalive comments on idle streams
+    SSE_MAX_STREAM_SECONDS = 300  # streams end (and browsers reconnect) after this, freeing the worker
+    EVENT_RETENTION_HOURS = 24
+    # Receipt/invoice numbering (services/sequences.py): 'auto' reserves per-worker blocks
+    # on Postgres and allocates inside the checkout transaction on SQLite
+    DOCUMENT_SEQUENCE_MODE = 'auto'  # auto, block, transaction
+    DOCUMENT_SEQUENCE_BLOCK_SIZE = 20  # or a dict per doc type, e.g. {'invoice': 1, 'receipt': 50}
+    INVOICE_CACHE_SIZE = 256  # rendered issued/paid invoices kept in memory (services/invoices.py)
+    INVOICE_ARCHIVE_DIR = None  # monthly invoice zips; defaults to <instance>/invoice_archives
+    INVOICE_ARCHIVE_RETENTION = 7 * 24 * 3600  # seconds archive jobs and their zips are kept
+    # Loyalty/e-wallet ledger snapshots (services/ledger.py), rolled up by housekeeping
+    LEDGER_ROLLUP_INTERVAL_HOURS = 1
+    LEDGER_ROLLUP_LAG = 300  # seconds; entries newer than this are left for the next rollup
+    # Loyalty tiers (services/loyalty_tiers.py): points earned over a rolling window
+    LOYALTY_TIER_WINDOW_DAYS = 365
+    LOYALTY_TIER_THRESHOLDS = {'silver': 500, 'gold': 2000, 'platinum': 5000}
+    # Per-restaurant index caches (services/index_cache.py); edits in this process
+    # invalidate at once, other workers pick them up within each cache's TTL
+    PRICING_CACHE_TTL = 30  # seconds; price list indexes (services/pricing.py)
+    PRICING_CACHE_SIZE = 128  # restaurants
+    PROMOTIONS_CACHE_TTL = 30  # seconds; discount rule indexes (services/promotions.py)
+    PROMOTIONS_CACHE_SIZE = 128
+    FLOOR_CACHE_TTL = 30  # seconds; floor snapshots, also re-checked against the plan version (services/floor.py)
+    FLOOR_CACHE_SIZE = 128
+    # Daily stock snapshots (services/inventory.py), taken by housekeeping
+    STOCK_SNAPSHOT_LAG = 300  # seconds after midnight before the day is snapshotted
+    # Kitchen prep-time rollup (services/order_lifecycle.py), run hourly by housekeeping
+    PREP_TIME_ROLLUP_HOURS = 24  # recent hours recomputed each run, so late "served" bumps count
+    KDS_BULK_LIMIT = 500  # orders per bulk status change
+    # Kitchen prep-time distributions and ticket ETAs (services/kitchen_analytics.py)
+    KDS_STATS_WINDOW_DAYS = 14
+    KDS_STATS_SCAN_OVERLAP = 60  # seconds of new-sample ids re-read for late commits
+    KDS_STATION_CAPACITY = 4  # tickets a station works on at once; or {"Bar Printer": 2, "default": 4}
+    KDS_ETA_QUANTILE = 0.5  # of the item's prep-time distribution
+    KDS_MIN_SAMPLES = 5  # below this an item falls back to its station's distribution
+    KDS_DEFAULT_PREP_SECONDS = 600  # with no history at all
+    # Table bookings (services/availability.py)
+    BOOKING_DEFAULT_DURATION = 90  # minutes
+    BOOKING_MAX_DURATION = 720  # minutes; a booking runs into the next day at most
+    BOOKING_SLOT_MINUTES = 15  # start times offered by the next-slot search
+    BOOKING_INDEX_TTL = 30  # seconds a loaded day of bookings is trusted (other workers' bookings)
+    BOOKING_INDEX_DAYS = 256  # restaurant-days kept loaded
+    BOOKING_LAYOUT_CACHE_TTL = 30  # seconds a restaurant's bookable tables/combinations are cached
+    BOOKING_LAYOUT_CACHE_SIZE = 128  # restaurants
+    # Opt-in request profiling (services/profiling.py); stats at /admin/api/profiling
+    ENABLE_REQUEST_PROFILING = os.environ.get("ENABLE_REQUEST_PROFILING", "0") == "1"
+    PROFILING_TRACE_ALLOCATIONS = False  # process-level tracemalloc current/peak bytes; adds noticeable overhead
+    PROFILING_SAMPLER = False  # sample stacks and dump collapsed stacks for slow requests
+    PROFILING_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+    PROFILING_SLOW_THRESHOLD = 0.5  # seconds; slower requests get their stacks dumped
+    PROFILING_DUMP_DIR = None  # defaults to <instance>/profiles
+    # Rate limits (services/rate_limit.py): per terminal within a restaurant, a shared
+    # ceiling per restaurant, anonymous callers per address. Storage is shared by the
+    # workers: redis://... across hosts, the SQLite file on a single host.
+    RATELIMIT_STORAGE_URI = os.environ.get(
+        "RATELIMIT_STORAGE_URI", f"sqlite:///{os.path.abspath('instance/ratelimit.db')}"
+    )
+    RATELIMIT_STRATEGY = "sliding-window-counter"
+    RATELIMIT_ANONYMOUS_DEFAULT = "200 per day;50 per hour"
+    RATELIMIT_TERMINAL_DEFAULT = "300 per minute"
+    RATELIMIT_TENANT_LIMIT = "3000 per minute"
+    RATELIMIT_ROUTE_LIMITS = {  # endpoint -> budget per terminal; replaces the default there
+        "pos.create_order": "120 per minute",
+        "pos.checkout_order": "60 per minute",
+    }
     LANGUAGES = ["en", "ro"]
     # Currency support: base currency and exchange rates
     BASE_CURRENCY = "USD"
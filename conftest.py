@@ -1,9 +1,19 @@
 import pytest
 
 from app import create_app
+from config import Config
 from extensions import db
 from werkzeug.security import generate_password_hash
 
+# Tests drive the course scheduler through tick() and housekeeping through run_due()
+# instead of background threads
+Config.ENABLE_COURSE_SCHEDULER = False
+Config.ENABLE_HOUSEKEEPING = False
+# Spoolers start when a test queues a print job
+Config.ENABLE_PRINT_SPOOLER = False
+# Fresh rate-limit counters for every app instead of the shared file
+Config.RATELIMIT_STORAGE_URI = "memory://"
+
 # Create an application for the test session and ensure the DB schema exists
 app = create_app()
 app.config.setdefault("WTF_CSRF_ENABLED", False)
@@ -1,4 +1,4 @@
-from flask import abort
+from flask import abort, g
 from flask_login import current_user
 from models import RolePermission, AuditLog
 from extensions import db
@@ -64,3 +64,16 @@ def admin_required(func):
         return func(*args, **kwargs)
 
     return wrapper
+
+
+def use_replica(func):
+    """Send the view's reads to the read replica when one is configured (see services/db_router.py)."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g._use_replica = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            g._use_replica = False
+
+    return wrapper
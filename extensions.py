@@ -1,10 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 try:
-    from flask_limiter import Limiter
-    from flask_limiter.util import get_remote_address
+    from flask_limiter import Limiter, ApplicationLimit
     _limiter_available = True
 except Exception:
     # Flask-Limiter not installed in this environment; provide a noop fallback
@@ -17,21 +15,54 @@ except Exception:
                 return f
             return _decorator
     Limiter = _NoopLimiter
-    def get_remote_address():
-        from flask import request
-        return request.remote_addr or 'unknown'
+if _limiter_available:
+    # Outside the try: a broken import here must fail loudly, not switch rate limiting off
+    from services import rate_limit
 import threading
 import time
 from flask import current_app
-from services.exchange import fetch_exchange_rates, normalize_rates_dict
+from services.db_router import RoutingSession
 from flask_babel import Babel
 
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = "auth.login"
 csrf = CSRFProtect()
-limiter = Limiter(key_func=get_remote_address, default_limits=["200 per day", "50 per hour"]) if _limiter_available else Limiter()
+# Keyed per restaurant terminal (anonymous callers by address), with a shared ceiling per
+# restaurant; budgets, storage and strategy come from the RATELIMIT_* config (services/rate_limit.py)
+limiter = Limiter(
+    key_func=rate_limit.client_key,
+    default_limits=[rate_limit.default_budget],
+    application_limits=[ApplicationLimit(rate_limit.tenant_budget, key_function=rate_limit.tenant_key,
+                                         scope='tenant', exempt_when=rate_limit.is_anonymous,
+                                         deduct_when=rate_limit.was_served)],
+    on_breach=rate_limit.on_breach,
+) if _limiter_available else Limiter()
+
+
+def account_limit(value):
+    """Limit decorator for credential checks, keyed by account (or address), never by terminal."""
+    if not _limiter_available:
+        return limiter.limit(value)
+    return limiter.limit(value, key_func=rate_limit.account_key)
+
+
+def configure_route_limits(app):
+    """Apply the per-route budgets in ``RATELIMIT_ROUTE_LIMITS`` (after blueprints are registered)."""
+    if _limiter_available:
+        rate_limit.apply_route_limits(app, limiter)
+
+
+def init_migrate(app):
+    """Attach Flask-Migrate to ``app``.
+
+    Alembic is a sizeable import that only the ``flask db`` commands need, so this runs
+    on demand (see commands.py) rather than in create_app().
+    """
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    return app.extensions['migrate'].migrate
 
 
 # Currency conversion utility
@@ -47,6 +78,7 @@ def convert_currency(amount, from_currency, to_currency, rates):
 
 def update_exchange_rates(app=None, supported=None):
     """Fetch latest rates and update app config and DB (if available)."""
+    from services.exchange import fetch_exchange_rates, normalize_rates_dict
     app = app or current_app._get_current_object()
     supported = supported or list(app.config.get('EXCHANGE_RATES', {}).keys())
     try:
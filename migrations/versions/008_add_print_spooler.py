@@ -0,0 +1,69 @@
+"""Add kitchen ticket routing and print queue
+
+Revision ID: 008_add_print_spooler
+Revises: 14e61ca71ed7
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008_add_print_spooler'
+down_revision = '14e61ca71ed7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('kitchen_printer') as batch_op:
+        batch_op.add_column(sa.Column('port', sa.Integer(), nullable=True))
+
+    # Create PrinterRoute table
+    op.create_table(
+        'printer_route',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('restaurant_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('printer_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['restaurant_id'], ['restaurant.id'], ),
+        sa.ForeignKeyConstraint(['category_id'], ['product_category.id'], ),
+        sa.ForeignKeyConstraint(['printer_id'], ['kitchen_printer.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('category_id', 'printer_id', name='uix_printer_route')
+    )
+    op.create_index('ix_printer_route_restaurant_id', 'printer_route', ['restaurant_id'])
+
+    # Create PrintJob table
+    op.create_table(
+        'print_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('printer_id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=True),
+        sa.Column('job_type', sa.String(20), default='kitchen_ticket'),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('status', sa.String(20), default='queued'),
+        sa.Column('attempts', sa.Integer(), default=0),
+        sa.Column('last_error', sa.String(255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('printed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['printer_id'], ['kitchen_printer.id'], ),
+        sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_print_job_printer_id', 'print_job', ['printer_id'])
+    op.create_index('ix_print_job_order_id', 'print_job', ['order_id'])
+    op.create_index('ix_print_job_status', 'print_job', ['status'])
+
+
+def downgrade():
+    op.drop_index('ix_print_job_status', table_name='print_job')
+    op.drop_index('ix_print_job_order_id', table_name='print_job')
+    op.drop_index('ix_print_job_printer_id', table_name='print_job')
+    op.drop_table('print_job')
+    op.drop_index('ix_printer_route_restaurant_id', table_name='printer_route')
+    op.drop_table('printer_route')
+    with op.batch_alter_table('kitchen_printer') as batch_op:
+        batch_op.drop_column('port')
@@ -0,0 +1,50 @@
+"""Add event log and scheduler leases for delayed course release
+
+Revision ID: 009_add_course_scheduler
+Revises: 008_add_print_spooler
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009_add_course_scheduler'
+down_revision = '008_add_print_spooler'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_delayed_order_sent_to_kitchen', 'delayed_order', ['sent_to_kitchen'])
+
+    # Create StreamEvent table
+    op.create_table(
+        'stream_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('channel', sa.String(32), nullable=False),
+        sa.Column('event_type', sa.String(32), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stream_event_channel', 'stream_event', ['channel'])
+    op.create_index('ix_stream_event_created_at', 'stream_event', ['created_at'])
+
+    # Create SchedulerLease table
+    op.create_table(
+        'scheduler_lease',
+        sa.Column('name', sa.String(64), nullable=False),
+        sa.Column('holder', sa.String(64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('scheduler_lease')
+    op.drop_index('ix_stream_event_created_at', table_name='stream_event')
+    op.drop_index('ix_stream_event_channel', table_name='stream_event')
+    op.drop_table('stream_event')
+    op.drop_index('ix_delayed_order_sent_to_kitchen', table_name='delayed_order')
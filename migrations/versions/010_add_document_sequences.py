@@ -0,0 +1,43 @@
+"""Add document number sequences and receipt restaurant
+
+Revision ID: 010_add_document_sequences
+Revises: 009_add_course_scheduler
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010_add_document_sequences'
+down_revision = '009_add_course_scheduler'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create DocumentSequence table
+    op.create_table(
+        'document_sequence',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('restaurant_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('doc_type', sa.String(20), nullable=False),
+        sa.Column('next_value', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('restaurant_id', 'doc_type', name='uix_document_sequence')
+    )
+
+    with op.batch_alter_table('receipt') as batch_op:
+        batch_op.add_column(sa.Column('restaurant_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_receipt_restaurant_id', 'restaurant', ['restaurant_id'], ['id'])
+        batch_op.create_index('ix_receipt_restaurant_id', ['restaurant_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('receipt') as batch_op:
+        batch_op.drop_index('ix_receipt_restaurant_id')
+        batch_op.drop_constraint('fk_receipt_restaurant_id', type_='foreignkey')
+        batch_op.drop_column('restaurant_id')
+    op.drop_table('document_sequence')
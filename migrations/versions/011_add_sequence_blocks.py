@@ -0,0 +1,46 @@
+"""Add sequence block log and invoice restaurant
+
+Revision ID: 011_add_sequence_blocks
+Revises: 010_add_document_sequences
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011_add_sequence_blocks'
+down_revision = '010_add_document_sequences'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create SequenceBlock table
+    op.create_table(
+        'sequence_block',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('restaurant_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('doc_type', sa.String(20), nullable=False),
+        sa.Column('start_value', sa.Integer(), nullable=False),
+        sa.Column('end_value', sa.Integer(), nullable=False),
+        sa.Column('holder', sa.String(64), nullable=False),
+        sa.Column('reserved_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sequence_block_lookup', 'sequence_block', ['restaurant_id', 'doc_type', 'start_value'])
+
+    with op.batch_alter_table('invoice') as batch_op:
+        batch_op.add_column(sa.Column('restaurant_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_invoice_restaurant_id', 'restaurant', ['restaurant_id'], ['id'])
+        batch_op.create_index('ix_invoice_restaurant_id', ['restaurant_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('invoice') as batch_op:
+        batch_op.drop_index('ix_invoice_restaurant_id')
+        batch_op.drop_constraint('fk_invoice_restaurant_id', type_='foreignkey')
+        batch_op.drop_column('restaurant_id')
+    op.drop_index('ix_sequence_block_lookup', table_name='sequence_block')
+    op.drop_table('sequence_block')
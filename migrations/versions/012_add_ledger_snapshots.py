@@ -0,0 +1,41 @@
+"""Add ledger snapshots and ledger account indexes
+
+Revision ID: 012_add_ledger_snapshots
+Revises: 011_add_sequence_blocks
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012_add_ledger_snapshots'
+down_revision = '011_add_sequence_blocks'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create LedgerSnapshot table
+    op.create_table(
+        'ledger_snapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account_type', sa.String(20), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('balance', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('last_entry_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('account_type', 'account_id', name='uix_ledger_snapshot_account')
+    )
+
+    # Balance recomputation reads one account's entries past its snapshot
+    op.create_index('ix_loyalty_points_loyalty_card_id', 'loyalty_points', ['loyalty_card_id'])
+    op.create_index('ix_e_wallet_transaction_ewallet_id', 'e_wallet_transaction', ['ewallet_id'])
+
+
+def downgrade():
+    op.drop_index('ix_e_wallet_transaction_ewallet_id', table_name='e_wallet_transaction')
+    op.drop_index('ix_loyalty_points_loyalty_card_id', table_name='loyalty_points')
+    op.drop_table('ledger_snapshot')
@@ -0,0 +1,40 @@
+"""Add loyalty tier window points and batch watermarks
+
+Revision ID: 013_add_loyalty_tier_window
+Revises: 012_add_ledger_snapshots
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013_add_loyalty_tier_window'
+down_revision = '012_add_ledger_snapshots'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create BatchWatermark table
+    op.create_table(
+        'batch_watermark',
+        sa.Column('name', sa.String(64), nullable=False),
+        sa.Column('position', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+    # Filled by the first tier run (no watermark yet means a full rebuild)
+    with op.batch_alter_table('loyalty_card') as batch_op:
+        batch_op.add_column(sa.Column('window_points', sa.Integer(), nullable=True, server_default='0'))
+
+    op.create_index('ix_loyalty_points_created_at', 'loyalty_points', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_loyalty_points_created_at', table_name='loyalty_points')
+    with op.batch_alter_table('loyalty_card') as batch_op:
+        batch_op.drop_column('window_points')
+    op.drop_table('batch_watermark')
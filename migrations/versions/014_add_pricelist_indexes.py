@@ -0,0 +1,27 @@
+"""Add price list lookup indexes
+
+Revision ID: 014_add_pricelist_indexes
+Revises: 013_add_loyalty_tier_window
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '014_add_pricelist_indexes'
+down_revision = '013_add_loyalty_tier_window'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The pricing index loads a restaurant's lists and their items in one pass each
+    op.create_index('ix_price_list_restaurant_id', 'price_list', ['restaurant_id'])
+    op.create_index('ix_price_list_item_pricelist_id', 'price_list_item', ['pricelist_id'])
+
+
+def downgrade():
+    op.drop_index('ix_price_list_item_pricelist_id', table_name='price_list_item')
+    op.drop_index('ix_price_list_restaurant_id', table_name='price_list')
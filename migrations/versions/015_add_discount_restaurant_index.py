@@ -0,0 +1,25 @@
+"""Add discount restaurant index
+
+Revision ID: 015_add_discount_restaurant_index
+Revises: 014_add_pricelist_indexes
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '015_add_discount_restaurant_index'
+down_revision = '014_add_pricelist_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The promotions index loads a restaurant's discounts in one pass
+    op.create_index('ix_discount_restaurant_id', 'discount', ['restaurant_id'])
+
+
+def downgrade():
+    op.drop_index('ix_discount_restaurant_id', table_name='discount')
@@ -0,0 +1,49 @@
+"""Add recipes, fractional stock and low-stock thresholds
+
+Revision ID: 016_add_recipes
+Revises: 015_add_discount_restaurant_index
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '016_add_recipes'
+down_revision = '015_add_discount_restaurant_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create RecipeIngredient table
+    op.create_table(
+        'recipe_ingredient',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('inventory_item_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['inventory_item_id'], ['inventory_item.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('product_id', 'inventory_item_id', name='uix_recipe_ingredient')
+    )
+    op.create_index('ix_recipe_ingredient_product_id', 'recipe_ingredient', ['product_id'])
+
+    # Recipes take fractional amounts (0.25 kg), so stock levels are no longer whole numbers
+    with op.batch_alter_table('inventory_item') as batch_op:
+        batch_op.alter_column('quantity', existing_type=sa.Integer(), type_=sa.Float())
+        batch_op.add_column(sa.Column('low_stock_threshold', sa.Float(), nullable=True))
+
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.add_column(sa.Column('stock_depleted_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.drop_column('stock_depleted_at')
+    with op.batch_alter_table('inventory_item') as batch_op:
+        batch_op.drop_column('low_stock_threshold')
+        batch_op.alter_column('quantity', existing_type=sa.Float(), type_=sa.Integer())
+    op.drop_index('ix_recipe_ingredient_product_id', table_name='recipe_ingredient')
+    op.drop_table('recipe_ingredient')
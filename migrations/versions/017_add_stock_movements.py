@@ -0,0 +1,63 @@
+"""Add stock movement ledger and daily stock snapshots
+
+Revision ID: 017_add_stock_movements
+Revises: 016_add_recipes
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '017_add_stock_movements'
+down_revision = '016_add_recipes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create StockMovement table
+    op.create_table(
+        'stock_movement',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('inventory_item_id', sa.Integer(), nullable=False),
+        sa.Column('movement_type', sa.String(20), nullable=False),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.Column('reference', sa.String(64), nullable=True),
+        sa.Column('note', sa.String(255), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['inventory_item_id'], ['inventory_item.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_movement_created_at', 'stock_movement', ['created_at'])
+    op.create_index('ix_stock_movement_item_created', 'stock_movement', ['inventory_item_id', 'created_at'])
+
+    # Create StockSnapshot table
+    op.create_table(
+        'stock_snapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('inventory_item_id', sa.Integer(), nullable=False),
+        sa.Column('taken_at', sa.DateTime(), nullable=False),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['inventory_item_id'], ['inventory_item.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('inventory_item_id', 'taken_at', name='uix_stock_snapshot')
+    )
+    op.create_index('ix_stock_snapshot_taken_at', 'stock_snapshot', ['taken_at'])
+
+    # Opening balances, so the ledger adds up to the current levels
+    op.execute(
+        "INSERT INTO stock_movement (inventory_item_id, movement_type, quantity, note, created_at) "
+        "SELECT id, 'count', quantity, 'opening balance', CURRENT_TIMESTAMP FROM inventory_item "
+        "WHERE quantity IS NOT NULL AND quantity <> 0"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_stock_snapshot_taken_at', table_name='stock_snapshot')
+    op.drop_table('stock_snapshot')
+    op.drop_index('ix_stock_movement_item_created', table_name='stock_movement')
+    op.drop_index('ix_stock_movement_created_at', table_name='stock_movement')
+    op.drop_table('stock_movement')
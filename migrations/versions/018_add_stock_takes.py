@@ -0,0 +1,74 @@
+"""Add stock takes and inventory item barcodes
+
+Revision ID: 018_add_stock_takes
+Revises: 017_add_stock_movements
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '018_add_stock_takes'
+down_revision = '017_add_stock_movements'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('inventory_item') as batch_op:
+        batch_op.add_column(sa.Column('barcode', sa.String(64), nullable=True))
+        batch_op.create_unique_constraint('uq_inventory_item_barcode', ['barcode'])
+
+    # Create StockTake table
+    op.create_table(
+        'stock_take',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(128), nullable=True),
+        sa.Column('status', sa.String(20), nullable=False, server_default='open'),
+        sa.Column('full_count', sa.Boolean(), nullable=True),
+        sa.Column('started_by', sa.Integer(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create StockTakeScan table (staging)
+    op.create_table(
+        'stock_take_scan',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('stock_take_id', sa.Integer(), nullable=False),
+        sa.Column('barcode', sa.String(64), nullable=False),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.Column('scans', sa.Integer(), nullable=False, server_default='1'),
+        sa.ForeignKeyConstraint(['stock_take_id'], ['stock_take.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_take_scan_stock_take_id', 'stock_take_scan', ['stock_take_id'])
+
+    # Create StockTakeLine table
+    op.create_table(
+        'stock_take_line',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('stock_take_id', sa.Integer(), nullable=False),
+        sa.Column('inventory_item_id', sa.Integer(), nullable=False),
+        sa.Column('expected', sa.Float(), nullable=False),
+        sa.Column('counted', sa.Float(), nullable=False),
+        sa.Column('variance', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['stock_take_id'], ['stock_take.id']),
+        sa.ForeignKeyConstraint(['inventory_item_id'], ['inventory_item.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_take_line_stock_take_id', 'stock_take_line', ['stock_take_id'])
+
+
+def downgrade():
+    op.drop_index('ix_stock_take_line_stock_take_id', table_name='stock_take_line')
+    op.drop_table('stock_take_line')
+    op.drop_index('ix_stock_take_scan_stock_take_id', table_name='stock_take_scan')
+    op.drop_table('stock_take_scan')
+    op.drop_table('stock_take')
+    with op.batch_alter_table('inventory_item') as batch_op:
+        batch_op.drop_constraint('uq_inventory_item_barcode', type_='unique')
+        batch_op.drop_column('barcode')
@@ -0,0 +1,54 @@
+"""Add per-state order timestamps and hourly prep-time statistics
+
+Revision ID: 019_add_order_state_times
+Revises: 018_add_stock_takes
+Create Date: 2026-10-19 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '019_add_order_state_times'
+down_revision = '018_add_stock_takes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.add_column(sa.Column('cooking_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('ready_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('served_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('completed_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('cancelled_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_order_ready_at', ['ready_at'])
+
+    # Create PrepTimeStat table
+    op.create_table(
+        'prep_time_stat',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('prep_seconds', sa.Float(), nullable=False),
+        sa.Column('max_prep_seconds', sa.Float(), nullable=False),
+        sa.Column('queued', sa.Integer(), nullable=False),
+        sa.Column('queue_seconds', sa.Float(), nullable=False),
+        sa.Column('served', sa.Integer(), nullable=False),
+        sa.Column('pass_seconds', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('prep_time_stat')
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.drop_index('ix_order_ready_at')
+        batch_op.drop_column('cancelled_at')
+        batch_op.drop_column('completed_at')
+        batch_op.drop_column('served_at')
+        batch_op.drop_column('ready_at')
+        batch_op.drop_column('cooking_at')
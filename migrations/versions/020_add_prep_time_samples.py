@@ -0,0 +1,37 @@
+"""Add per-product prep-time samples for kitchen analytics
+
+Revision ID: 020_add_prep_time_samples
+Revises: 019_add_order_state_times
+Create Date: 2026-10-20 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '020_add_prep_time_samples'
+down_revision = '019_add_order_state_times'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create PrepTimeSample table
+    op.create_table(
+        'prep_time_sample',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('station', sa.String(length=64), nullable=False),
+        sa.Column('seconds', sa.Float(), nullable=False),
+        sa.Column('ready_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['order_id'], ['order.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_prep_time_sample_ready_at', 'prep_time_sample', ['ready_at'])
+
+
+def downgrade():
+    op.drop_index('ix_prep_time_sample_ready_at', table_name='prep_time_sample')
+    op.drop_table('prep_time_sample')
@@ -0,0 +1,26 @@
+"""Add a version counter to floor plans for pushed table state diffs
+
+Revision ID: 021_add_floor_plan_version
+Revises: 020_add_prep_time_samples
+Create Date: 2026-10-20 02:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '021_add_floor_plan_version'
+down_revision = '020_add_prep_time_samples'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('restaurant_floor_plan') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('restaurant_floor_plan') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,71 @@
+"""Add booking durations and table combinations for availability search
+
+Revision ID: 022_add_booking_availability
+Revises: 021_add_floor_plan_version
+Create Date: 2026-10-20 03:00:00.000000
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '022_add_booking_availability'
+down_revision = '021_add_floor_plan_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create TableCombination tables
+    op.create_table(
+        'table_combination',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('restaurant_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('seats', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['restaurant_id'], ['restaurant.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_table_combination_restaurant_id', 'table_combination', ['restaurant_id'])
+    op.create_table(
+        'table_combination_member',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('combination_id', sa.Integer(), nullable=False),
+        sa.Column('table_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['combination_id'], ['table_combination.id']),
+        sa.ForeignKeyConstraint(['table_id'], ['table.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('combination_id', 'table_id', name='uix_table_combination_member')
+    )
+
+    with op.batch_alter_table('table_booking') as batch_op:
+        batch_op.add_column(sa.Column('duration_minutes', sa.Integer(), nullable=False, server_default='90'))
+        batch_op.add_column(sa.Column('ends_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('combination_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_table_booking_combination', 'table_combination', ['combination_id'], ['id'])
+        batch_op.create_index('ix_table_booking_restaurant_start', ['restaurant_id', 'booking_date'])
+
+    # Existing bookings get the default 90 minutes
+    bookings = sa.table('table_booking', sa.column('id', sa.Integer), sa.column('booking_date', sa.DateTime),
+                        sa.column('ends_at', sa.DateTime))
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(bookings.c.id, bookings.c.booking_date)).fetchall()
+    for booking_id, booking_date in rows:
+        conn.execute(bookings.update().where(bookings.c.id == booking_id)
+                     .values(ends_at=booking_date + timedelta(minutes=90)))
+
+
+def downgrade():
+    with op.batch_alter_table('table_booking') as batch_op:
+        batch_op.drop_index('ix_table_booking_restaurant_start')
+        batch_op.drop_constraint('fk_table_booking_combination', type_='foreignkey')
+        batch_op.drop_column('combination_id')
+        batch_op.drop_column('ends_at')
+        batch_op.drop_column('duration_minutes')
+    op.drop_table('table_combination_member')
+    op.drop_index('ix_table_combination_restaurant_id', table_name='table_combination')
+    op.drop_table('table_combination')
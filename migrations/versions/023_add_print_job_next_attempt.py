@@ -0,0 +1,26 @@
+"""Add next_attempt_at to print jobs for claimed delivery across workers
+
+Revision ID: 023_add_print_job_next_attempt
+Revises: 022_add_booking_availability
+Create Date: 2026-10-20 06:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '023_add_print_job_next_attempt'
+down_revision = '022_add_booking_availability'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('print_job') as batch_op:
+        batch_op.add_column(sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('print_job') as batch_op:
+        batch_op.drop_column('next_attempt_at')
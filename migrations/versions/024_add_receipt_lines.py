@@ -0,0 +1,26 @@
+"""Add a line snapshot to receipts so lazy rendering never reads live prices
+
+Revision ID: 024_add_receipt_lines
+Revises: 023_add_print_job_next_attempt
+Create Date: 2026-10-21 06:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '024_add_receipt_lines'
+down_revision = '023_add_print_job_next_attempt'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('receipt') as batch_op:
+        batch_op.add_column(sa.Column('lines', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('receipt') as batch_op:
+        batch_op.drop_column('lines')
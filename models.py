@@ -1,6 +1,6 @@
 from extensions import db
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, timedelta
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -27,8 +27,15 @@ class MenuItem(db.Model):
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    status = db.Column(db.String(20), default="pending")  # pending, cooking, ready, served
+    status = db.Column(db.String(20), default="pending")  # see services/order_lifecycle.TRANSITIONS
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    stock_depleted_at = db.Column(db.DateTime, nullable=True)  # set once recipe usage is taken from stock
+    # When the order last entered each state; feed the prep-time rollup
+    cooking_at = db.Column(db.DateTime, nullable=True)
+    ready_at = db.Column(db.DateTime, nullable=True, index=True)
+    served_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    cancelled_at = db.Column(db.DateTime, nullable=True)
     items = db.relationship("OrderItem", backref="order", lazy=True)
 
 class OrderItem(db.Model):
@@ -39,14 +46,111 @@ class OrderItem(db.Model):
     menu_item = db.relationship("MenuItem")
 
 
+class PrepTimeSample(db.Model):
+    """Prep time of one product on a ticket that became ready; feeds the kitchen sketches"""
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)  # OrderItem.menu_item_id
+    station = db.Column(db.String(64), nullable=False)  # kitchen printer name, or "kitchen"
+    seconds = db.Column(db.Float, nullable=False)
+    ready_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class PrepTimeStat(db.Model):
+    """Kitchen timings of the orders that became ready in one hour; sums, so hours add up"""
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False, unique=True)  # start of the hour
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    prep_seconds = db.Column(db.Float, nullable=False, default=0)  # started (or placed) to ready
+    max_prep_seconds = db.Column(db.Float, nullable=False, default=0)
+    queued = db.Column(db.Integer, nullable=False, default=0)  # orders with a cooking_at
+    queue_seconds = db.Column(db.Float, nullable=False, default=0)  # placed to cooking
+    served = db.Column(db.Integer, nullable=False, default=0)
+    pass_seconds = db.Column(db.Float, nullable=False, default=0)  # ready to served
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class InventoryItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
-    quantity = db.Column(db.Integer, default=0)
+    quantity = db.Column(db.Float, default=0)  # fractional: recipes use e.g. 0.25 kg
     unit = db.Column(db.String(32), default="unit")
+    low_stock_threshold = db.Column(db.Float, nullable=True)  # low_stock event when quantity drops to this
+    barcode = db.Column(db.String(64), unique=True, nullable=True)  # matched by stock-take scans
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class StockMovement(db.Model):
+    """Append-only stock ledger; ``InventoryItem.quantity`` is the running total of these"""
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False)
+    movement_type = db.Column(db.String(20), nullable=False)  # receipt, sale, waste, count, adjustment
+    quantity = db.Column(db.Float, nullable=False)  # signed change; for a count, counted minus expected
+    reference = db.Column(db.String(64), nullable=True)  # e.g. order:42
+    note = db.Column(db.String(255), nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_stock_movement_item_created', 'inventory_item_id', 'created_at'),
+    )
+
+
+class StockSnapshot(db.Model):
+    """Stock on hand of every item at a (daily) point in time, so history reads stay short"""
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)  # covers movements created at or before
+    quantity = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('inventory_item_id', 'taken_at', name='uix_stock_snapshot'),
+    )
+
+
+class StockTake(db.Model):
+    """A physical count session; scans are staged until it is reconciled in one pass"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), nullable=True)
+    status = db.Column(db.String(20), default='open', nullable=False)  # open, reconciled, cancelled
+    full_count = db.Column(db.Boolean, default=False)  # unscanned barcoded items count as zero
+    started_by = db.Column(db.Integer, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reconciled_at = db.Column(db.DateTime, nullable=True)
+
+
+class StockTakeScan(db.Model):
+    """Staged scans, pre-summed per barcode within each uploaded batch"""
+    id = db.Column(db.Integer, primary_key=True)
+    stock_take_id = db.Column(db.Integer, db.ForeignKey('stock_take.id'), nullable=False, index=True)
+    barcode = db.Column(db.String(64), nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    scans = db.Column(db.Integer, nullable=False, default=1)  # raw scans folded into this row
+
+
+class StockTakeLine(db.Model):
+    """Variance row written when a stock take is reconciled"""
+    id = db.Column(db.Integer, primary_key=True)
+    stock_take_id = db.Column(db.Integer, db.ForeignKey('stock_take.id'), nullable=False, index=True)
+    inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False)
+    expected = db.Column(db.Float, nullable=False)
+    counted = db.Column(db.Float, nullable=False)
+    variance = db.Column(db.Float, nullable=False)  # counted - expected
+
+
+class RecipeIngredient(db.Model):
+    """Bill of materials: how much of an inventory item one unit of a product uses"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False, index=True)  # as in OrderItem.menu_item_id (MenuItem or Product)
+    inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False)
+    quantity = db.Column(db.Float, nullable=False)  # in the inventory item's unit, per product unit
+    inventory_item = db.relationship('InventoryItem')
+
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'inventory_item_id', name='uix_recipe_ingredient'),
+    )
+
+
 class PriceHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), nullable=False)
@@ -128,6 +232,7 @@ class Invoice(db.Model):
     """Simple invoice model linking to orders or collections"""
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(64), unique=True, index=True)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=True, index=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True)
     collection_id = db.Column(db.Integer, db.ForeignKey('collection.id'), nullable=True)
     customer_name = db.Column(db.String(128))
@@ -295,7 +400,7 @@ class PaymentTransaction(db.Model):
 class Discount(db.Model):
     """Discounts: product-level or order-level"""
     id = db.Column(db.Integer, primary_key=True)
-    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False, index=True)
     name = db.Column(db.String(128), nullable=False)
     discount_type = db.Column(db.String(20), nullable=False)  # percentage, fixed_amount
     value = db.Column(db.Float, nullable=False)
@@ -328,10 +433,12 @@ class Receipt(db.Model):
     """Receipt printing and customization"""
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=True, index=True)
     receipt_number = db.Column(db.String(64), unique=True, nullable=True)
     header_text = db.Column(db.Text)  # Store promotions, hours, events
     footer_text = db.Column(db.Text)
-    content = db.Column(db.Text)  # Full receipt content
+    content = db.Column(db.Text)  # Rendered text receipt; filled on first fetch/print (services/receipts.py)
+    lines = db.Column(db.Text)  # JSON [[name, quantity, unit_price], ...] as charged at checkout
     printed = db.Column(db.Boolean, default=False)
     printed_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -347,6 +454,7 @@ class RestaurantFloorPlan(db.Model):
     restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False, unique=True)
     name = db.Column(db.String(128), default='Main Floor')
     layout_data = db.Column(db.Text)  # JSON: table positions, zones, etc.
+    version = db.Column(db.Integer, default=0, nullable=False)  # bumped by every table state change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     restaurant = db.relationship('Restaurant', backref='floor_plan', uselist=False)
@@ -379,6 +487,12 @@ class Table(db.Model):
     current_order = db.relationship('Order', backref='table', uselist=False, foreign_keys=[current_order_id])
 
 
+def _booking_ends_at(context):
+    """``TableBooking.ends_at`` on insert when not given"""
+    params = context.get_current_parameters()
+    return params['booking_date'] + timedelta(minutes=params.get('duration_minutes') or 90)
+
+
 class TableBooking(db.Model):
     """Online table booking via Appointments"""
     id = db.Column(db.Integer, primary_key=True)
@@ -387,13 +501,40 @@ class TableBooking(db.Model):
     customer_name = db.Column(db.String(128), nullable=False)
     customer_email = db.Column(db.String(128))
     customer_phone = db.Column(db.String(20))
-    booking_date = db.Column(db.DateTime, nullable=False)
+    booking_date = db.Column(db.DateTime, nullable=False)  # start
+    duration_minutes = db.Column(db.Integer, nullable=False, default=90)
+    ends_at = db.Column(db.DateTime, nullable=True, default=_booking_ends_at)  # start + duration, for overlap queries
+    combination_id = db.Column(db.Integer, db.ForeignKey('table_combination.id'), nullable=True)  # books every member; table_id is the first
     party_size = db.Column(db.Integer, nullable=False)
     notes = db.Column(db.Text)
     status = db.Column(db.String(20), default='confirmed')  # confirmed, cancelled, completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     table = db.relationship('Table', backref='bookings')
 
+    __table_args__ = (
+        db.Index('ix_table_booking_restaurant_start', 'restaurant_id', 'booking_date'),
+    )
+
+
+class TableCombination(db.Model):
+    """Tables that can be pushed together for one larger party"""
+    id = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False, index=True)
+    name = db.Column(db.String(64), nullable=False)  # "Patio 1+2"
+    seats = db.Column(db.Integer, nullable=True)  # when joining loses or adds seats; else the members' sum
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    members = db.relationship('TableCombinationMember', backref='combination', cascade='all, delete-orphan')
+
+
+class TableCombinationMember(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    combination_id = db.Column(db.Integer, db.ForeignKey('table_combination.id'), nullable=False)
+    table_id = db.Column(db.Integer, db.ForeignKey('table.id'), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('combination_id', 'table_id', name='uix_table_combination_member'),
+    )
+
 
 class KitchenPrinter(db.Model):
     """Kitchen and bar printers"""
@@ -402,11 +543,43 @@ class KitchenPrinter(db.Model):
     name = db.Column(db.String(64), nullable=False)  # "Kitchen Printer 1", "Bar Printer"
     printer_type = db.Column(db.String(20), nullable=False)  # kitchen, bar
     ip_address = db.Column(db.String(15), nullable=True)  # Network printer IP
+    port = db.Column(db.Integer, default=9100)  # Raw TCP (JetDirect) port
     device_name = db.Column(db.String(128), nullable=True)  # USB printer device
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class PrinterRoute(db.Model):
+    """Send order lines of a product category to a specific kitchen/bar printer"""
+    id = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False, index=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('product_category.id'), nullable=False)
+    printer_id = db.Column(db.Integer, db.ForeignKey('kitchen_printer.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    printer = db.relationship('KitchenPrinter', backref='routes')
+
+    __table_args__ = (
+        db.UniqueConstraint('category_id', 'printer_id', name='uix_printer_route'),
+    )
+
+
+class PrintJob(db.Model):
+    """Rendered ESC/POS job waiting for (or done with) delivery by the print spooler"""
+    id = db.Column(db.Integer, primary_key=True)
+    printer_id = db.Column(db.Integer, db.ForeignKey('kitchen_printer.id'), nullable=False, index=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True, index=True)
+    job_type = db.Column(db.String(20), default='kitchen_ticket')  # kitchen_ticket, receipt
+    payload = db.Column(db.LargeBinary, nullable=False)  # ESC/POS byte stream
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, printing, printed, failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    # queued: not before this time (retry backoff); printing: the claim lapses at this time
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    printed_at = db.Column(db.DateTime, nullable=True)
+    printer = db.relationship('KitchenPrinter', backref='print_jobs')
+
+
 class OrderNote(db.Model):
     """Notes for orders: customer preferences, allergies, special requests"""
     id = db.Column(db.Integer, primary_key=True)
@@ -423,7 +596,7 @@ class DelayedOrder(db.Model):
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     course_number = db.Column(db.Integer, default=1)  # 1st course, 2nd course, etc.
     delay_minutes = db.Column(db.Integer, default=0)  # Delay before sending to kitchen
-    sent_to_kitchen = db.Column(db.Boolean, default=False)
+    sent_to_kitchen = db.Column(db.Boolean, default=False, index=True)
     sent_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     order = db.relationship('Order', backref='delayed_orders')
@@ -468,6 +641,7 @@ class LoyaltyCard(db.Model):
     card_number = db.Column(db.String(64), unique=True, nullable=False)
     points_balance = db.Column(db.Integer, default=0)
     tier = db.Column(db.String(20), default='standard')  # standard, silver, gold, platinum
+    window_points = db.Column(db.Integer, default=0)  # earned in the tier window (services/loyalty_tiers.py)
     points_earned_total = db.Column(db.Integer, default=0)
     points_redeemed_total = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -478,12 +652,12 @@ class LoyaltyCard(db.Model):
 class LoyaltyPoints(db.Model):
     """Points transaction history"""
     id = db.Column(db.Integer, primary_key=True)
-    loyalty_card_id = db.Column(db.Integer, db.ForeignKey('loyalty_card.id'), nullable=False)
+    loyalty_card_id = db.Column(db.Integer, db.ForeignKey('loyalty_card.id'), nullable=False, index=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True)
     points = db.Column(db.Integer, nullable=False)  # Positive for earned, negative for redeemed
     earn_method = db.Column(db.String(20), nullable=False)  # product, order, amount
     description = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     loyalty_card = db.relationship('LoyaltyCard', backref='points_history')
 
 
@@ -517,7 +691,7 @@ class eWallet(db.Model):
 class eWalletTransaction(db.Model):
     """e-Wallet transaction history"""
     id = db.Column(db.Integer, primary_key=True)
-    ewallet_id = db.Column(db.Integer, db.ForeignKey('e_wallet.id'), nullable=False)
+    ewallet_id = db.Column(db.Integer, db.ForeignKey('e_wallet.id'), nullable=False, index=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True)
     amount = db.Column(db.Float, nullable=False)  # Positive for top-up, negative for spending
     transaction_type = db.Column(db.String(20), nullable=False)  # topup, purchase, refund
@@ -526,10 +700,24 @@ class eWalletTransaction(db.Model):
     ewallet = db.relationship('eWallet', backref='transactions')
 
 
+class LedgerSnapshot(db.Model):
+    """Rolled-up loyalty/e-wallet balance up to a ledger entry (services/ledger.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    account_type = db.Column(db.String(20), nullable=False)  # loyalty, ewallet
+    account_id = db.Column(db.Integer, nullable=False)  # loyalty_card.id or e_wallet.id
+    balance = db.Column(db.Float, nullable=False, default=0)
+    last_entry_id = db.Column(db.Integer, nullable=False, default=0)  # newest ledger row included
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('account_type', 'account_id', name='uix_ledger_snapshot_account'),
+    )
+
+
 class PriceList(db.Model):
     """Dynamic pricing for products based on POS or customer type"""
     id = db.Column(db.Integer, primary_key=True)
-    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False, index=True)
     name = db.Column(db.String(128), nullable=False)  # "Dine-in", "Takeaway", "VIP Customers"
     pricelist_type = db.Column(db.String(20), nullable=False)  # dine_in, takeaway, customer_specific
     valid_from = db.Column(db.DateTime, nullable=True)
@@ -543,7 +731,7 @@ class PriceList(db.Model):
 class PriceListItem(db.Model):
     """Price for a product in a specific pricelist"""
     id = db.Column(db.Integer, primary_key=True)
-    pricelist_id = db.Column(db.Integer, db.ForeignKey('price_list.id'), nullable=False)
+    pricelist_id = db.Column(db.Integer, db.ForeignKey('price_list.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     price = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -613,3 +801,57 @@ class HardwareDevice(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     restaurant = db.relationship('Restaurant', backref='hardware_devices')
 
+
+
+# ============================================================================
+# BACKGROUND COORDINATION
+# ============================================================================
+class StreamEvent(db.Model):
+    """Append-only event log behind the server-sent event streams (KDS, floor)"""
+    id = db.Column(db.Integer, primary_key=True)  # doubles as the SSE event id
+    channel = db.Column(db.String(32), nullable=False, index=True)  # kds, floor, inventory
+    event_type = db.Column(db.String(32), nullable=False)  # course_fired, order_created, ...
+    payload = db.Column(db.Text)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class SchedulerLease(db.Model):
+    """Time-limited lease so only one worker process runs a given background job"""
+    name = db.Column(db.String(64), primary_key=True)  # course_scheduler, ...
+    holder = db.Column(db.String(64), nullable=False)  # host:pid:token of the leader
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class BatchWatermark(db.Model):
+    """How far an incremental batch job has got, e.g. the loyalty tier window edge"""
+    name = db.Column(db.String(64), primary_key=True)  # loyalty_tier_window, ...
+    position = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DocumentSequence(db.Model):
+    """Per-restaurant counter for receipt/invoice numbers (services/sequences.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = not tied to a restaurant
+    doc_type = db.Column(db.String(20), nullable=False)  # receipt, invoice
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('restaurant_id', 'doc_type', name='uix_document_sequence'),
+    )
+
+
+class SequenceBlock(db.Model):
+    """Log of number blocks reserved by worker processes, used by the gap audit"""
+    id = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.Integer, nullable=False, default=0)
+    doc_type = db.Column(db.String(20), nullable=False)
+    start_value = db.Column(db.Integer, nullable=False)  # first number in the block
+    end_value = db.Column(db.Integer, nullable=False)  # one past the last number; lowered when the tail is returned
+    holder = db.Column(db.String(64), nullable=False)  # host:pid:token of the reserving worker
+    reserved_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_sequence_block_lookup', 'restaurant_id', 'doc_type', 'start_value'),
+    )
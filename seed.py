@@ -1,13 +1,13 @@
+import argparse
+
 from app import create_app
 from extensions import db
 from models import User, MenuItem, Restaurant, StoreSettings
 from werkzeug.security import generate_password_hash
 
-app = create_app()
-
-with app.app_context():
-    db.create_all()
 
+def seed_defaults():
+    """Create the platform accounts, demo restaurant and sample menu if missing."""
     # Create platform super admin
     if not User.query.filter_by(username='superadmin').first():
         superadmin = User(
@@ -43,7 +43,7 @@ with app.app_context():
         )
         db.session.add(restaurant_admin_user)
         db.session.flush()  # Flush to get the ID without committing
-        
+
         # Create a sample restaurant
         restaurant = Restaurant(
             name="Demo Restaurant",
@@ -58,7 +58,7 @@ with app.app_context():
         )
         db.session.add(restaurant)
         db.session.flush()
-        
+
         # Create default store settings
         store_settings = StoreSettings(
             restaurant_id=restaurant.id,
@@ -84,8 +84,30 @@ with app.app_context():
         db.session.commit()
         print("✓ Sample menu items added")
 
-    print("\n📋 Seed data loaded successfully!")
-    print("Platform accounts:")
-    print("  - superadmin/superadmin123 (super admin - owns platform)")
-    print("  - rest_admin/rest_admin123 (restaurant admin - manages Demo Restaurant)")
-    print("  - admin/admin (legacy admin account)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the ServeoPOS database")
+    parser.add_argument("--restaurants", type=int, default=0, help="also seed N benchmark restaurants")
+    parser.add_argument("--products", type=int, default=100, help="products per benchmark restaurant")
+    parser.add_argument("--years", type=float, default=1, help="years of order history per restaurant")
+    parser.add_argument("--orders-per-day", type=int, default=20, help="average orders per restaurant per day")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for reproducible data")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        seed_defaults()
+        if args.restaurants:
+            from services.datagen import generate, PASSWORD
+            counts = generate(restaurants=args.restaurants, products=args.products, days=max(1, int(365 * args.years)),
+                              orders_per_day=args.orders_per_day, seed=args.seed)
+            print(f"✓ Seeded {args.restaurants} benchmark restaurants "
+                  f"({sum(counts.values()):,} rows, staff password: {PASSWORD})")
+
+        print("\n📋 Seed data loaded successfully!")
+        print("Platform accounts:")
+        print("  - superadmin/superadmin123 (super admin - owns platform)")
+        print("  - rest_admin/rest_admin123 (restaurant admin - manages Demo Restaurant)")
+        print("  - admin/admin (legacy admin account)")
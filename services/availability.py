@@ -0,0 +1,363 @@
+"""Table availability for reservations, answered from per-table sorted interval lists.
+
+A restaurant's bookable options are its tables and its ``TableCombination`` groups
+(tables pushed together; a combination booking holds every member table). They are
+loaded once into a ``Layout`` kept in an ``IndexCache`` for ``BOOKING_LAYOUT_CACHE_TTL``
+seconds, and ORM edits to tables or combinations drop it.
+
+Bookings are indexed per restaurant and day (of their start): every table gets an
+``Intervals`` list of ``(start, end, booking)`` sorted by start, plus the running maximum
+of the ends, so "is this table free for ``[start, end)``" is one bisection per day
+consulted (the day before, for bookings running past midnight, and the days the window
+covers). Looking for the next free time jumps straight to the end of the blocking
+booking instead of stepping through the day.
+
+Days are loaded on first use (one indexed range query) and kept for
+``BOOKING_INDEX_TTL`` seconds, at most ``BOOKING_INDEX_DAYS`` of them. Committed ORM
+changes to ``TableBooking`` rows update the loaded days in place: the booking is taken
+out of its old interval lists and put back into the new ones. Other processes see such a
+change when their copy of the day expires; ``book`` therefore re-checks overlaps in the
+database under row locks on the tables, so a stale index can offer a slot but never
+double-book it.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import RestaurantFloorPlan, TableSection, Table, TableBooking, TableCombination, TableCombinationMember
+from services.index_cache import IndexCache
+
+Option = namedtuple('Option', 'table_ids combination_id seats')
+
+
+class Unavailable(ValueError):
+    """No table (or the requested one) is free for the party at that time."""
+
+
+def _members(restaurant_id, session=None):
+    rows = (session or db.session).query(TableCombinationMember.combination_id, TableCombinationMember.table_id) \
+        .join(TableCombination, TableCombination.id == TableCombinationMember.combination_id) \
+        .filter(TableCombination.restaurant_id == restaurant_id) \
+        .order_by(TableCombinationMember.combination_id, TableCombinationMember.table_id)
+    members = defaultdict(list)
+    for combination_id, table_id in rows:
+        members[combination_id].append(table_id)
+    return {combination_id: tuple(table_ids) for combination_id, table_ids in members.items()}
+
+
+class Layout:
+
+    def __init__(self, restaurant_id, session):
+        self.restaurant_id = restaurant_id
+        self.loaded_at = time.monotonic()
+        self.seats = dict(session.query(Table.id, Table.seats)
+                          .join(TableSection, TableSection.id == Table.section_id)
+                          .join(RestaurantFloorPlan, RestaurantFloorPlan.id == TableSection.floor_plan_id)
+                          .filter(RestaurantFloorPlan.restaurant_id == restaurant_id))
+        options = [Option((table_id,), None, seats or 0) for table_id, seats in self.seats.items()]
+        seats_override = dict(session.query(TableCombination.id, TableCombination.seats)
+                              .filter(TableCombination.restaurant_id == restaurant_id))
+        self.combinations = {}
+        for combination_id, table_ids in _members(restaurant_id, session).items():
+            if all(table_id in self.seats for table_id in table_ids):
+                seats = seats_override.get(combination_id) or sum(self.seats[t] or 0 for t in table_ids)
+                self.combinations[combination_id] = Option(table_ids, combination_id, seats)
+        # Smallest fit first, single tables before combinations of the same size
+        self.options = sorted(options + list(self.combinations.values()),
+                              key=lambda option: (option.seats, len(option.table_ids), option.table_ids))
+
+    def option(self, table_id=None, combination_id=None):
+        if combination_id is not None:
+            if combination_id not in self.combinations:
+                raise LookupError(f"Table combination {combination_id} not found")
+            return self.combinations[combination_id]
+        if table_id not in self.seats:
+            raise LookupError(f"Table {table_id} not found")
+        return Option((table_id,), None, self.seats[table_id] or 0)
+
+
+def _layout_restaurant(obj):
+    return obj.restaurant_id if isinstance(obj, TableCombination) else None
+
+
+_layouts = IndexCache(Layout, (Table, TableSection, RestaurantFloorPlan, TableCombination, TableCombinationMember),
+                      _layout_restaurant, 'BOOKING_LAYOUT_CACHE_TTL', 'BOOKING_LAYOUT_CACHE_SIZE')
+get_layout = _layouts.get
+
+
+# ----------------------------------------------------------------------------------
+# Interval index
+# ----------------------------------------------------------------------------------
+class Intervals:
+    """One table's bookings on one day, sorted by start, with the running maximum end."""
+
+    __slots__ = ('starts', 'ends', 'ids', 'reach')
+
+    def __init__(self):
+        self.starts, self.ends, self.ids, self.reach = [], [], [], []
+
+    def _reindex(self, start_at=0):
+        reach = self.reach[start_at - 1] if start_at else None
+        del self.reach[start_at:]
+        for end in self.ends[start_at:]:
+            reach = end if reach is None or end > reach else reach
+            self.reach.append(reach)
+
+    def add(self, start, end, booking_id):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, booking_id)
+        self._reindex(i)
+
+    def remove(self, booking_id):
+        i = self.ids.index(booking_id)
+        for values in (self.starts, self.ends, self.ids):
+            del values[i]
+        self._reindex(i)
+
+    def blocked_until(self, start, end):
+        """End of the latest booking overlapping ``[start, end)``, or None when free."""
+        i = bisect_left(self.starts, end) - 1
+        if i >= 0 and self.reach[i] > start:
+            return self.reach[i]
+        return None
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _booking_end(booking_date, ends_at, duration_minutes):
+    return ends_at or booking_date + timedelta(minutes=duration_minutes or 0)
+
+
+class DaySchedule:
+
+    def __init__(self, restaurant_id, day):
+        self.restaurant_id, self.day = restaurant_id, day
+        self.loaded_at = time.monotonic()
+        self.members = _members(restaurant_id)
+        self.tables = defaultdict(Intervals)
+        self.bookings = {}  # booking id -> table ids
+        start = datetime.combine(day, datetime.min.time())
+        for booking_id, table_id, combination_id, booking_date, ends_at, duration in db.session.query(
+                TableBooking.id, TableBooking.table_id, TableBooking.combination_id, TableBooking.booking_date,
+                TableBooking.ends_at, TableBooking.duration_minutes) \
+                .filter(TableBooking.restaurant_id == restaurant_id, TableBooking.status == 'confirmed',
+                        TableBooking.booking_date >= start, TableBooking.booking_date < start + timedelta(days=1)):
+            self.add(booking_id, self.members.get(combination_id, (table_id,)),
+                     booking_date, _booking_end(booking_date, ends_at, duration))
+
+    def add(self, booking_id, table_ids, start, end):
+        for table_id in table_ids:
+            self.tables[table_id].add(start, end, booking_id)
+        self.bookings[booking_id] = tuple(table_ids)
+
+    def remove(self, booking_id):
+        for table_id in self.bookings.pop(booking_id, ()):
+            self.tables[table_id].remove(booking_id)
+
+
+class BookingIndex:
+    """Loaded ``DaySchedule``s by ``(restaurant_id, day)``, kept in step with committed bookings."""
+
+    def __init__(self):
+        self._days = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        event.listen(Session, 'after_flush', self._collect)
+        event.listen(Session, 'after_commit', self._committed)
+        event.listen(Session, 'after_rollback', self._rolled_back)
+
+    def get(self, restaurant_id, day):
+        key = (restaurant_id, day)
+        ttl = current_app.config.get('BOOKING_INDEX_TTL', 30)
+        with self._lock:
+            schedule = self._days.get(key)
+            if schedule is not None and time.monotonic() - schedule.loaded_at < ttl:
+                self._days.move_to_end(key)
+                return schedule
+            generation = self._generation
+        schedule = DaySchedule(restaurant_id, day)
+        with self._lock:
+            if generation == self._generation:  # no commit raced the load
+                self._days[key] = schedule
+                self._days.move_to_end(key)
+                while len(self._days) > current_app.config.get('BOOKING_INDEX_DAYS', 256):
+                    self._days.popitem(last=False)
+        return schedule
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._days.clear()
+
+    def _collect(self, session, flush_context):
+        changes = session.info.setdefault('_booking_changes', {})
+        for obj in (*session.new, *session.dirty):
+            if isinstance(obj, TableBooking):
+                changes[obj.id] = (obj.restaurant_id, obj.table_id, obj.combination_id, obj.booking_date,
+                                   _booking_end(obj.booking_date, obj.ends_at, obj.duration_minutes),
+                                   obj.status in (None, 'confirmed'))
+        for obj in session.deleted:
+            if isinstance(obj, TableBooking):
+                changes[obj.id] = (obj.restaurant_id, None, None, None, None, False)
+        if not changes:
+            session.info.pop('_booking_changes')
+
+    def _committed(self, session):
+        changes = session.info.pop('_booking_changes', None)
+        if not changes:
+            return
+        with self._lock:
+            self._generation += 1
+            for booking_id, (restaurant_id, table_id, combination_id, start, end, active) in changes.items():
+                for (cached_restaurant, _), schedule in list(self._days.items()):
+                    if cached_restaurant == restaurant_id:
+                        schedule.remove(booking_id)
+                if not active:
+                    continue
+                key = (restaurant_id, start.date())
+                schedule = self._days.get(key)
+                if schedule is None:
+                    continue  # loaded with the booking when first needed
+                if combination_id is not None and combination_id not in schedule.members:
+                    del self._days[key]  # combination created after the day was loaded
+                    continue
+                schedule.add(booking_id, schedule.members.get(combination_id, (table_id,)), start, end)
+
+    def _rolled_back(self, session):
+        session.info.pop('_booking_changes', None)
+
+
+_index = BookingIndex()
+clear = _index.clear
+
+
+# ----------------------------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------------------------
+def _duration(minutes):
+    minutes = int(minutes or current_app.config.get('BOOKING_DEFAULT_DURATION', 90))
+    if not 0 < minutes <= current_app.config.get('BOOKING_MAX_DURATION', 720):
+        raise ValueError("Booking duration out of range")
+    return timedelta(minutes=minutes)
+
+
+class _Window:
+    """Day schedules touched by one search, fetched once each."""
+
+    def __init__(self, restaurant_id):
+        self.restaurant_id = restaurant_id
+        self.days = {}
+
+    def _day(self, day):
+        if day not in self.days:
+            self.days[day] = _index.get(self.restaurant_id, day)
+        return self.days[day]
+
+    def blocked_until(self, table_ids, start, end):
+        """Latest end among bookings blocking any of ``table_ids`` in ``[start, end)``."""
+        blocked = None
+        day = (start - timedelta(days=1)).date()  # bookings started the day before (max duration < 1 day)
+        while day <= end.date():
+            schedule = self._day(day)
+            for table_id in table_ids:
+                intervals = schedule.tables.get(table_id)
+                until = intervals.blocked_until(start, end) if intervals else None
+                if until is not None and (blocked is None or until > blocked):
+                    blocked = until
+            day += timedelta(days=1)
+        return blocked
+
+
+def _align(at, step):
+    """``at`` rounded up to the next ``step`` boundary of its day."""
+    midnight = datetime.combine(at.date(), datetime.min.time())
+    steps = -(-(at - midnight) // step)
+    return midnight + steps * step
+
+
+def find_tables(restaurant_id, party_size, start, duration_minutes=None):
+    """Options (``Option``) free for ``party_size`` at ``[start, start + duration)``, best fit first."""
+    duration = _duration(duration_minutes)
+    window = _Window(restaurant_id)
+    return [option for option in get_layout(restaurant_id).options
+            if option.seats >= party_size and window.blocked_until(option.table_ids, start, start + duration) is None]
+
+
+def next_slots(restaurant_id, party_size, after, duration_minutes=None, limit=5, until=None):
+    """Earliest start times from ``after`` with a free option: ``[(start, [Option, ...])]``."""
+    duration = _duration(duration_minutes)
+    step = timedelta(minutes=current_app.config.get('BOOKING_SLOT_MINUTES', 15))
+    until = until or after + timedelta(days=1)
+    window = _Window(restaurant_id)
+    candidates = [option for option in get_layout(restaurant_id).options if option.seats >= party_size]
+    earliest = {}
+
+    def next_free(option, at):
+        while at <= until:
+            blocked = window.blocked_until(option.table_ids, at, at + duration)
+            if blocked is None:
+                return at
+            at = _align(blocked, step)
+        return None
+
+    slots, at = [], _align(after, step)
+    while candidates and len(slots) < limit and at <= until:
+        for option in candidates:
+            if option not in earliest or earliest[option] < at:
+                earliest[option] = next_free(option, at)
+        candidates = [option for option in candidates if earliest[option] is not None]
+        if not candidates:
+            break
+        start = min(earliest[option] for option in candidates)
+        slots.append((start, [option for option in candidates if earliest[option] == start]))
+        at = start + step
+    return slots
+
+
+def book(restaurant_id, party_size, start, customer_name, duration_minutes=None, table_id=None,
+         combination_id=None, **details):
+    """Create a confirmed booking on the given table/combination, or the best free one.
+
+    Overlaps are re-checked in the database with the tables locked; raises
+    ``Unavailable`` when taken. Nothing is committed.
+    """
+    duration = _duration(duration_minutes)
+    end = start + duration
+    layout = get_layout(restaurant_id)
+    if table_id is not None or combination_id is not None:
+        option = layout.option(table_id, combination_id)
+        if option.seats < party_size:
+            raise Unavailable(f"{option.seats} seats are too few for a party of {party_size}")
+        options = [option]
+    else:
+        options = find_tables(restaurant_id, party_size, start, duration_minutes)
+
+    for option in options:
+        db.session.query(Table.id).filter(Table.id.in_(option.table_ids)).order_by(Table.id) \
+            .with_for_update().all()
+        members = _members(restaurant_id)
+        taken = set()
+        for other_table, other_combination in db.session.query(TableBooking.table_id, TableBooking.combination_id) \
+                .filter(TableBooking.restaurant_id == restaurant_id, TableBooking.status == 'confirmed',
+                        TableBooking.booking_date < end, TableBooking.ends_at > start):
+            taken.update(members.get(other_combination, (other_table,)))
+        if taken.intersection(option.table_ids):
+            continue
+        booking = TableBooking(restaurant_id=restaurant_id, table_id=option.table_ids[0],
+                               combination_id=option.combination_id, booking_date=start,
+                               duration_minutes=int(duration.total_seconds() // 60), ends_at=end,
+                               party_size=party_size, customer_name=customer_name, status='confirmed', **details)
+        db.session.add(booking)
+        db.session.flush()
+        return booking
+    raise Unavailable(f"No table for {party_size} at {start.isoformat()}")
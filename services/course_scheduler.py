@@ -0,0 +1,205 @@
+"""Fires delayed courses (``DelayedOrder``) to the kitchen when they fall due.
+
+A course is due at ``created_at + delay_minutes``. The scheduler keeps pending courses
+in a min-heap keyed on that time, so each tick only looks at the heap top:
+
+* the heap is rebuilt from the (indexed) ``sent_to_kitchen = false`` rows when this
+  process becomes leader, and afterwards only unsent rows in a primary-key range are
+  read, which picks up courses created by other worker processes without a table scan.
+  Ids can commit out of order (a transaction holding a lower id may commit after a
+  higher one), so the range starts at the highest id seen
+  ``COURSE_SCHEDULER_SCAN_OVERLAP`` seconds ago rather than the latest one; rows read
+  twice are de-duplicated against the heap;
+* firing is a conditional ``UPDATE ... WHERE sent_to_kitchen = false``, so a course is
+  sent exactly once even across a leader hand-over, and a ``course_fired`` event is
+  published on the ``kds`` channel in the same transaction;
+* due times are absolute wall-clock (UTC) values, like the ``created_at`` they derive
+  from. Sleeps are capped at ``COURSE_SCHEDULER_INTERVAL``, so a clock change in either
+  direction is picked up within one interval: a forward jump fires everything now due,
+  a backward jump holds courses until their time comes round again.
+
+Only the process holding the ``course_scheduler`` lease fires courses (see
+``services/leases.py``); periodic housekeeping runs separately under its own leases
+(``services/housekeeping.py``), so a slow job never delays a course. ``clock`` is
+injectable and ``tick()`` can be called directly, which is how the tests drive it.
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import DelayedOrder
+from services import events, leases
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'course_scheduler'
+
+
+def due_at(created_at, delay_minutes):
+    return created_at + timedelta(minutes=delay_minutes or 0)
+
+
+class CourseScheduler:
+
+    def __init__(self, app=None, clock=None):
+        self.clock = clock or datetime.utcnow
+        self.holder = leases.holder_id()
+        self._heap = []
+        self._scheduled = set()
+        self._last_seen_id = 0
+        self._scan_marks = deque()  # (monotonic time, highest id seen by then)
+        self._is_leader = False
+        self._last_now = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('COURSE_SCHEDULER_INTERVAL', 5)
+        self.lease_ttl = app.config.get('COURSE_SCHEDULER_LEASE_TTL', 30)
+        self.scan_overlap = app.config.get('COURSE_SCHEDULER_SCAN_OVERLAP', 60)
+        app.extensions['course_scheduler'] = self
+
+    @property
+    def is_leader(self):
+        return self._is_leader
+
+    # -- heap ------------------------------------------------------------------------
+    def _push(self, delayed_id, created_at, delay_minutes):
+        if delayed_id in self._scheduled:
+            return
+        self._scheduled.add(delayed_id)
+        heapq.heappush(self._heap, (due_at(created_at, delay_minutes), delayed_id))
+        self._last_seen_id = max(self._last_seen_id, delayed_id)
+
+    def schedule(self, delayed):
+        """Add a just-created course; other processes pick it up on their next tick."""
+        with self._lock:
+            if self._is_leader and not delayed.sent_to_kitchen:
+                self._push(delayed.id, delayed.created_at, delayed.delay_minutes)
+        self._wake.set()
+
+    def rebuild(self):
+        """Reload every unsent course from the database."""
+        rows = db.session.query(DelayedOrder.id, DelayedOrder.created_at, DelayedOrder.delay_minutes) \
+            .filter(DelayedOrder.sent_to_kitchen.is_(False)).all()
+        max_id = db.session.query(db.func.max(DelayedOrder.id)).scalar() or 0
+        with self._lock:
+            self._heap, self._scheduled = [], set()
+            for row in rows:
+                self._push(*row)
+            self._last_seen_id = max(self._last_seen_id, max_id)
+            # Lower ids still uncommitted during the rebuild are read by the next scans
+            self._scan_marks = deque([(time.monotonic(), 0)])
+
+    def _scan_floor(self, now):
+        """Highest id seen at least ``scan_overlap`` seconds ago (0 until there is one)."""
+        marks = self._scan_marks
+        while len(marks) > 1 and marks[1][0] <= now - self.scan_overlap:
+            marks.popleft()
+        return marks[0][1] if marks and marks[0][0] <= now - self.scan_overlap else 0
+
+    def _pick_up_new(self):
+        now = time.monotonic()
+        with self._lock:
+            floor = self._scan_floor(now)
+        rows = db.session.query(DelayedOrder.id, DelayedOrder.created_at, DelayedOrder.delay_minutes) \
+            .filter(DelayedOrder.id > floor, DelayedOrder.sent_to_kitchen.is_(False)) \
+            .order_by(DelayedOrder.id).all()
+        with self._lock:
+            for row in rows:
+                self._push(*row)  # already scheduled ones are skipped
+            self._scan_marks.append((now, self._last_seen_id))
+
+    def next_due(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def pending(self):
+        with self._lock:
+            return len(self._heap)
+
+    # -- firing ----------------------------------------------------------------------
+    def fire_due(self, now):
+        """Send every course due at ``now``; returns the fired ``DelayedOrder`` ids."""
+        fired = []
+        table = DelayedOrder.__table__
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, delayed_id = heapq.heappop(self._heap)
+                self._scheduled.discard(delayed_id)
+            result = db.session.execute(
+                table.update()
+                .where(table.c.id == delayed_id)
+                .where(table.c.sent_to_kitchen.is_(False))
+                .values(sent_to_kitchen=True, sent_at=now))
+            if not result.rowcount:
+                db.session.rollback()  # already sent (or deleted) elsewhere
+                continue
+            order_id, course_number = db.session.query(DelayedOrder.order_id, DelayedOrder.course_number) \
+                .filter(DelayedOrder.id == delayed_id).one()
+            events.publish('kds', 'course_fired', {
+                "delayed_order_id": delayed_id,
+                "order_id": order_id,
+                "course_number": course_number,
+                "sent_at": now.isoformat(),
+            }, commit=False)
+            db.session.commit()
+            fired.append(delayed_id)
+        if fired:
+            events.notify()
+        return fired
+
+    def tick(self):
+        """One scheduling pass; returns seconds until the next course is due (or None)."""
+        now = self.clock()
+        if self._last_now is not None and now < self._last_now - timedelta(seconds=1):
+            logger.warning("Wall clock moved back by %s; pending courses keep their due times",
+                           self._last_now - now)
+        self._last_now = now
+
+        if not leases.acquire(LEASE_NAME, self.holder, self.lease_ttl, now):
+            if self._is_leader:
+                logger.info("Lost the course scheduler lease")
+            with self._lock:
+                self._is_leader = False
+                self._heap, self._scheduled = [], set()
+            return None
+        if not self._is_leader:
+            self.rebuild()
+            with self._lock:
+                self._is_leader = True
+        else:
+            self._pick_up_new()
+
+        self.fire_due(now)
+        upcoming = self.next_due()
+        return max(0.0, (upcoming - now).total_seconds()) if upcoming else None
+
+    # -- thread ----------------------------------------------------------------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='course-scheduler')
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    delay = self.tick()
+            except Exception:
+                logger.exception("Course scheduler tick failed")
+                delay = None
+            # Followers re-check the lease every interval; the leader also wakes early for
+            # the next due course or when a new course is scheduled in this process
+            self._wake.wait(self.interval if delay is None else min(delay, self.interval))
+            self._wake.clear()
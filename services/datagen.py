@@ -0,0 +1,300 @@
+"""Synthetic multi-tenant data generator for scale testing.
+
+Generates restaurants, staff, products, customers, loyalty cards and ledgers, orders,
+payments and invoices with Core ``executemany`` inserts and pre-assigned primary keys,
+so millions of rows load in minutes on a laptop. All randomness flows from a single
+``random.Random(seed)``: the same arguments against an empty database always produce
+the same rows.
+
+Distributions are chosen to look like production rather than uniform noise:
+
+* restaurant volume follows a Zipf curve (a few busy sites, a long tail of quiet ones)
+* order times cluster around lunch and dinner and weekends are busier
+* product popularity within a restaurant is Zipf-distributed
+* a minority of orders belong to loyalty members, a few percent are invoiced
+
+Exposed on the command line as ``flask datagen`` (see commands.py).
+"""
+import bisect
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, select
+from werkzeug.security import generate_password_hash
+
+from extensions import db
+from models import (
+    User, Restaurant, StoreSettings, ProductCategory, Product, BarcodeMapping, PaymentMethod,
+    Customer, LoyaltyCard, LoyaltyPoints, Order, OrderItem, PaymentTransaction, Invoice
+)
+from services import loyalty_tiers
+
+CATEGORY_NAMES = ("Starters", "Salads", "Pasta", "Pizza", "Mains", "Desserts", "Hot Drinks", "Bar")
+CITIES = (("Dublin", "Ireland", "EUR"), ("Cork", "Ireland", "EUR"), ("London", "United Kingdom", "GBP"),
+          ("Bucharest", "Romania", "RON"), ("New York", "United States", "USD"), ("Mumbai", "India", "INR"))
+FIRST_NAMES = ("Aoife", "Liam", "Maria", "Ion", "Priya", "James", "Sofia", "Noah", "Elena", "Omar", "Chen", "Ava")
+LAST_NAMES = ("Murphy", "Kelly", "Popescu", "Sharma", "Smith", "Garcia", "Ionescu", "Byrne", "Khan", "Walsh")
+
+# Relative order volume per hour of day (lunch and dinner peaks) and per weekday (Mon=0)
+HOUR_WEIGHTS = {8: 2, 9: 3, 10: 3, 11: 6, 12: 14, 13: 15, 14: 8, 15: 4, 16: 4,
+                17: 7, 18: 11, 19: 15, 20: 14, 21: 9, 22: 4}
+WEEKDAY_FACTORS = (0.8, 0.85, 0.9, 1.0, 1.3, 1.45, 1.1)
+ITEMS_PER_ORDER = ((1, 2, 3, 4, 5, 6), (28, 32, 20, 10, 6, 4))
+
+PASSWORD = "datagen"  # every generated account
+LOYALTY_ORDER_SHARE = 0.25  # orders placed by a loyalty member
+INVOICE_SHARE = 0.03  # orders that get a B2B invoice
+class BulkWriter:
+    """Buffers rows per table and writes them with Core executemany in FK-safe order."""
+
+    def __init__(self, tables, batch_size=5000):
+        self.tables = list(tables)  # parents before children
+        self.batch_size = batch_size
+        self.buffers = {t: [] for t in self.tables}
+        self.counts = {t.name: 0 for t in self.tables}
+
+    def add(self, table, row):
+        buf = self.buffers[table]
+        buf.append(row)
+        if len(buf) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in self.tables:
+            rows = self.buffers[table]
+            if rows:
+                db.session.execute(table.insert(), rows)
+                self.counts[table.name] += len(rows)
+                self.buffers[table] = []
+        db.session.commit()
+
+
+class IdAllocator:
+    """Hands out primary keys above the current maximum so rows can reference each other before insert."""
+
+    def __init__(self):
+        self._next = {}
+
+    def __call__(self, model):
+        table = model.__table__
+        if table not in self._next:
+            current = db.session.execute(select(func.max(table.c.id))).scalar() or 0
+            self._next[table] = itertools.count(current + 1)
+        return next(self._next[table])
+
+    def sync_sequences(self):
+        """Move PostgreSQL id sequences past the explicitly inserted keys.
+
+        Rows written with pre-assigned ids never advance the column's sequence, so the
+        next ordinary insert would collide with a generated row. SQLite needs nothing:
+        its rowids continue from the table's maximum.
+        """
+        if db.engine.dialect.name != 'postgresql':
+            return
+        preparer = db.engine.dialect.identifier_preparer
+        for table in self._next:
+            sequence = func.pg_get_serial_sequence(preparer.format_table(table), 'id')
+            db.session.execute(select(func.setval(sequence, select(func.max(table.c.id)).scalar_subquery())))
+        db.session.commit()
+
+
+def zipf_weights(n, s=1.1):
+    return [1.0 / (k + 1) ** s for k in range(n)]
+
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def generate(restaurants=10, products=100, customers=200, days=90, orders_per_day=40, seed=42,
+             batch_size=5000, end_date=None, progress=None):
+    """Generate a synthetic multi-tenant dataset and return row counts per table.
+
+    ``orders_per_day`` is the average across restaurants; individual restaurants get a
+    Zipf-distributed share of the total. ``days`` of history end at ``end_date``
+    (default: today). ``progress`` is an optional ``callable(message)``.
+    """
+    rng = random.Random(seed)
+    next_id = IdAllocator()
+    end_date = (end_date or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = end_date - timedelta(days=days)
+    say = progress or (lambda message: None)
+
+    writer = BulkWriter([
+        User.__table__, Restaurant.__table__, StoreSettings.__table__, PaymentMethod.__table__,
+        ProductCategory.__table__, Product.__table__, BarcodeMapping.__table__,
+        Customer.__table__, LoyaltyCard.__table__,
+        Order.__table__, OrderItem.__table__, PaymentTransaction.__table__,
+        LoyaltyPoints.__table__, Invoice.__table__,
+    ], batch_size=batch_size)
+
+    password_hash = generate_password_hash(PASSWORD)
+    hours = sorted(HOUR_WEIGHTS)
+    hour_cum = _cumulative(HOUR_WEIGHTS[h] for h in hours)
+    item_counts, item_weights = ITEMS_PER_ORDER
+    item_cum = _cumulative(item_weights)
+
+    # Busy restaurants are spread randomly over the id range rather than being the first ones
+    volume = zipf_weights(restaurants)
+    rng.shuffle(volume)
+    scale = orders_per_day * restaurants / sum(volume)
+    card_totals = {}
+
+    for r in range(restaurants):
+        restaurant_id, owner_id = next_id(Restaurant), next_id(User)
+        city, country, currency = rng.choice(CITIES)
+        writer.add(User.__table__, {
+            'id': owner_id, 'username': f"owner_{restaurant_id}", 'password_hash': password_hash,
+            'role': 'restaurant_admin', 'restaurant_id': None, 'currency': currency, 'is_super_admin': False,
+            'created_at': start_date,
+        })
+        writer.add(Restaurant.__table__, {
+            'id': restaurant_id, 'name': f"Restaurant {restaurant_id}", 'email': f"restaurant{restaurant_id}@datagen.test",
+            'city': city, 'country': country, 'owner_id': owner_id, 'active': True, 'created_at': start_date,
+        })
+        writer.add(StoreSettings.__table__, {
+            'id': next_id(StoreSettings), 'restaurant_id': restaurant_id, 'currency': currency,
+            'invoice_prefix': 'INV', 'created_at': start_date,
+        })
+        for role in ('manager', 'waiter', 'waiter', 'kitchen'):
+            staff_id = next_id(User)
+            writer.add(User.__table__, {
+                'id': staff_id, 'username': f"{role}_{restaurant_id}_{staff_id}", 'password_hash': password_hash,
+                'role': role, 'restaurant_id': restaurant_id, 'currency': currency, 'is_super_admin': False,
+                'created_at': start_date,
+            })
+        methods = []
+        for name, kind in (("Cash", "cash"), ("Card", "card")):
+            method_id = next_id(PaymentMethod)
+            methods.append(method_id)
+            writer.add(PaymentMethod.__table__, {
+                'id': method_id, 'restaurant_id': restaurant_id, 'name': name, 'payment_type': kind,
+                'active': True, 'created_at': start_date,
+            })
+
+        category_ids = []
+        for position, name in enumerate(CATEGORY_NAMES):
+            category_id = next_id(ProductCategory)
+            category_ids.append(category_id)
+            writer.add(ProductCategory.__table__, {
+                'id': category_id, 'restaurant_id': restaurant_id, 'name': name, 'display_order': position,
+                'active': True, 'created_at': start_date,
+            })
+        product_ids, prices = [], []
+        for p in range(products):
+            product_id = next_id(Product)
+            price = round(rng.lognormvariate(2.4, 0.5), 2)
+            product_ids.append(product_id)
+            prices.append(price)
+            writer.add(Product.__table__, {
+                'id': product_id, 'restaurant_id': restaurant_id, 'category_id': rng.choice(category_ids),
+                'name': f"Item {restaurant_id}-{p}", 'sku': f"R{restaurant_id}-P{p}", 'base_price': price,
+                'cost': round(price * rng.uniform(0.25, 0.4), 2), 'available': True, 'active': True,
+                'unit_of_measure': 'unit', 'created_at': start_date,
+            })
+            writer.add(BarcodeMapping.__table__, {
+                'id': next_id(BarcodeMapping), 'product_id': product_id, 'barcode': f"2{product_id:011d}",
+                'created_at': start_date,
+            })
+        product_cum = _cumulative(zipf_weights(products))
+
+        card_ids = []
+        customer_rows = []
+        for c in range(customers):
+            customer_id = next_id(Customer)
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            customer_rows.append((customer_id, name))
+            writer.add(Customer.__table__, {
+                'id': customer_id, 'restaurant_id': restaurant_id, 'name': name,
+                'email': f"customer{customer_id}@datagen.test", 'phone': f"+353{customer_id:09d}",
+                'registered_at': start_date, 'created_at': start_date,
+            })
+            if rng.random() < 0.6:
+                card_id = next_id(LoyaltyCard)
+                card_ids.append(card_id)
+                card_totals[card_id] = [0, 0]  # earned, redeemed
+                writer.add(LoyaltyCard.__table__, {
+                    'id': card_id, 'customer_id': customer_id, 'card_number': f"LC{card_id:010d}",
+                    'points_balance': 0, 'tier': 'standard', 'points_earned_total': 0,
+                    'points_redeemed_total': 0, 'created_at': start_date,
+                })
+
+        daily_mean = volume[r] * scale
+        invoice_seq = 0
+        for day in range(days):
+            date = start_date + timedelta(days=day)
+            mean = daily_mean * WEEKDAY_FACTORS[date.weekday()]
+            n_orders = max(0, int(rng.gauss(mean, mean * 0.15) + 0.5))
+            for _ in range(n_orders):
+                hour = hours[bisect.bisect(hour_cum, rng.random() * hour_cum[-1])]
+                created_at = date + timedelta(hours=hour, seconds=rng.randrange(3600))
+                order_id = next_id(Order)
+                writer.add(Order.__table__, {'id': order_id, 'status': 'completed', 'created_at': created_at})
+                total = 0.0
+                for _ in range(item_counts[bisect.bisect(item_cum, rng.random() * item_cum[-1])]):
+                    idx = bisect.bisect(product_cum, rng.random() * product_cum[-1])
+                    quantity = 1 if rng.random() < 0.8 else 2
+                    total += prices[idx] * quantity
+                    # Product ids go in menu_item_id, matching pos.create_order
+                    writer.add(OrderItem.__table__, {
+                        'id': next_id(OrderItem), 'order_id': order_id, 'menu_item_id': product_ids[idx],
+                        'quantity': quantity,
+                    })
+                total = round(total, 2)
+                tip = round(total * rng.choice((0, 0, 0, 0.05, 0.1, 0.12)), 2)
+                writer.add(PaymentTransaction.__table__, {
+                    'id': next_id(PaymentTransaction), 'order_id': order_id,
+                    'payment_method_id': methods[0] if rng.random() < 0.35 else methods[1],
+                    'amount': total, 'currency': currency, 'status': 'completed', 'is_offline': False,
+                    'synchronization_status': 'synced', 'tip_amount': tip, 'tip_type': 'amount',
+                    'change_to_tip': False, 'processed_at': created_at, 'created_at': created_at,
+                })
+
+                if card_ids and rng.random() < LOYALTY_ORDER_SHARE:
+                    card_id = card_ids[min(len(card_ids) - 1, int(rng.paretovariate(1.2)) - 1)]
+                    earned, redeemed = card_totals[card_id]
+                    points = int(total)
+                    writer.add(LoyaltyPoints.__table__, {
+                        'id': next_id(LoyaltyPoints), 'loyalty_card_id': card_id, 'order_id': order_id,
+                        'points': points, 'earn_method': 'purchase',
+                        'description': f"Points earned from order #{order_id}", 'created_at': created_at,
+                    })
+                    earned += points
+                    if earned - redeemed >= 500 and rng.random() < 0.3:
+                        writer.add(LoyaltyPoints.__table__, {
+                            'id': next_id(LoyaltyPoints), 'loyalty_card_id': card_id, 'order_id': None,
+                            'points': -500, 'earn_method': 'redemption', 'description': "Redeemed 500 points",
+                            'created_at': created_at,
+                        })
+                        redeemed += 500
+                    card_totals[card_id] = [earned, redeemed]
+
+                if customer_rows and rng.random() < INVOICE_SHARE:
+                    invoice_seq += 1
+                    _, name = rng.choice(customer_rows)
+                    writer.add(Invoice.__table__, {
+                        'id': next_id(Invoice), 'invoice_number': f"INV-{restaurant_id}-{invoice_seq:07d}",
+                        'order_id': order_id, 'customer_name': name, 'items': f"Order #{order_id}",
+                        'total': total, 'status': 'paid', 'issued_at': created_at, 'paid_at': created_at,
+                        'created_at': created_at,
+                    })
+        say(f"restaurant {r + 1}/{restaurants} (id {restaurant_id}): ~{daily_mean:.1f} orders/day")
+
+    writer.flush()
+    next_id.sync_sequences()
+
+    if card_totals:
+        card_table = LoyaltyCard.__table__
+        stmt = card_table.update().where(card_table.c.id == bindparam('card_id')).values(
+            points_balance=bindparam('balance'), points_earned_total=bindparam('earned'),
+            points_redeemed_total=bindparam('redeemed'))
+        rows = [{'card_id': card_id, 'balance': earned - redeemed, 'earned': earned, 'redeemed': redeemed}
+                for card_id, (earned, redeemed) in card_totals.items()]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(stmt, rows[start:start + batch_size])
+        db.session.commit()
+        # Window points and tiers from the generated ledger
+        loyalty_tiers.rebuild(batch_size=batch_size)
+
+    return writer.counts
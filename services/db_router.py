@@ -0,0 +1,103 @@
+"""Read-replica routing for reporting and listing endpoints.
+
+Views decorated with ``decorators.use_replica`` flag the request so that plain reads
+issued through ``db.session`` go to the ``replica`` bind (configured through
+``SQLALCHEMY_REPLICA_URI``). Writes, flushes and anything issued after the session
+picked up pending changes stay on the primary, and the router falls back to the
+primary whenever the replica is unreachable or lags more than
+``REPLICA_MAX_LAG_SECONDS`` behind.
+"""
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+REPLICA_BIND = 'replica'
+
+_lag_cache = {}
+_lag_lock = threading.Lock()
+
+
+def replica_lag_seconds(engine):
+    """Return the replication lag of ``engine`` in seconds, or None if it is unreachable.
+
+    Postgres standbys report the age of the last replayed transaction. Other backends
+    (e.g. a second SQLite file used as a local stand-in) have no lag to report.
+    """
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                lag = conn.execute(text(
+                    "SELECT CASE WHEN pg_is_in_recovery() "
+                    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+                    "ELSE 0 END"
+                )).scalar()
+                return float(lag or 0)
+            conn.execute(text("SELECT 1"))
+            return 0.0
+    except Exception:
+        return None
+
+
+def replica_is_usable(engine, max_lag, check_interval):
+    """Cached health/lag check so the probe runs at most once per ``check_interval``."""
+    key = str(engine.url)
+    now = time.monotonic()
+    with _lag_lock:
+        cached = _lag_cache.get(key)
+    if cached is None or now - cached[0] >= check_interval:
+        cached = (now, replica_lag_seconds(engine))
+        with _lag_lock:
+            _lag_cache[key] = cached
+    lag = cached[1]
+    return lag is not None and lag <= max_lag
+
+
+def reset_replica_status():
+    """Forget cached lag probes (used by tests and after failover)."""
+    with _lag_lock:
+        _lag_cache.clear()
+
+
+def replica_requested():
+    """True while a ``use_replica`` view is running."""
+    return has_app_context() and bool(g.get('_use_replica'))
+
+
+def get_replica_engine():
+    """Return the replica engine if one is configured and currently usable."""
+    from extensions import db
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is None:
+        return None
+    config = current_app.config
+    if not replica_is_usable(engine,
+                             config.get('REPLICA_MAX_LAG_SECONDS', 5),
+                             config.get('REPLICA_LAG_CHECK_INTERVAL', 10)):
+        return None
+    return engine
+
+
+class RoutingSession(Session):
+    """Session that sends reads from replica-flagged requests to the replica bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and replica_requested() and not self._flushing \
+                and not getattr(clause, 'is_dml', False) \
+                and not (self.new or self.dirty or self.deleted):
+            engine = get_replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def configure_replica(app):
+    """Register the ``replica`` bind from ``SQLALCHEMY_REPLICA_URI`` before db.init_app."""
+    uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if not uri:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[REPLICA_BIND] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
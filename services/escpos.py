@@ -0,0 +1,75 @@
+"""Minimal ESC/POS byte-stream builder for kitchen tickets and receipts.
+
+Only the commands every thermal printer supports are used (initialise, alignment,
+bold, character size, feed and partial cut), so output works on Epson TM-series and
+the usual clones without per-model configuration.
+"""
+ESC = b'\x1b'
+GS = b'\x1d'
+
+INIT = ESC + b'@'
+ALIGN_LEFT = ESC + b'a\x00'
+ALIGN_CENTER = ESC + b'a\x01'
+BOLD_ON = ESC + b'E\x01'
+BOLD_OFF = ESC + b'E\x00'
+SIZE_NORMAL = GS + b'!\x00'
+SIZE_DOUBLE_HEIGHT = GS + b'!\x01'
+SIZE_DOUBLE = GS + b'!\x11'
+CUT = GS + b'V\x42\x00'  # feed to cutter and partial cut
+
+LINE_WIDTH = 42  # characters per line on 80mm paper with font A
+
+
+class Ticket:
+    """Accumulates ESC/POS commands; ``bytes(ticket)`` gives the stream to send."""
+
+    def __init__(self, encoding='cp437'):
+        self.encoding = encoding
+        self._parts = [INIT]
+
+    def raw(self, data):
+        self._parts.append(data)
+        return self
+
+    def text(self, value=''):
+        self._parts.append(value.encode(self.encoding, errors='replace') + b'\n')
+        return self
+
+    def title(self, value):
+        return self.raw(ALIGN_CENTER + BOLD_ON + SIZE_DOUBLE).text(value).raw(SIZE_NORMAL + BOLD_OFF + ALIGN_LEFT)
+
+    def rule(self, char='-'):
+        return self.text(char * LINE_WIDTH)
+
+    def columns(self, left, right):
+        gap = max(1, LINE_WIDTH - len(left) - len(right))
+        return self.text(f"{left}{' ' * gap}{right}")
+
+    def feed(self, lines=1):
+        return self.raw(ESC + b'd' + bytes([max(0, min(lines, 255))]))
+
+    def cut(self):
+        return self.feed(3).raw(CUT)
+
+    def __bytes__(self):
+        return b''.join(self._parts)
+
+
+def render_kitchen_ticket(station, order_id, lines, created_at=None, table=None):
+    """Render one kitchen/bar ticket.
+
+    ``lines`` are dicts with ``name``, ``quantity`` and optional ``notes`` (list of
+    ``{"type", "content"}``). Quantities and names are printed double height so they can
+    be read from across the pass.
+    """
+    ticket = Ticket().title(station.upper())
+    ticket.columns(f"Order #{order_id}", created_at.strftime('%H:%M') if created_at else '')
+    if table:
+        ticket.text(f"Table {table}")
+    ticket.rule()
+    for line in lines:
+        ticket.raw(SIZE_DOUBLE_HEIGHT + BOLD_ON).text(f"{line['quantity']} x {line['name']}").raw(BOLD_OFF + SIZE_NORMAL)
+        for note in line.get('notes') or ():
+            ticket.text(f"   ! {note.get('type', 'note')}: {note.get('content', '')}")
+    ticket.rule()
+    return bytes(ticket.cut())
@@ -0,0 +1,99 @@
+"""Publish/subscribe for live screens (kitchen display, floor plan) over server-sent events.
+
+Events are appended to the ``StreamEvent`` table, so every worker process sees them and a
+reconnecting browser resumes from its ``Last-Event-ID``. Subscribers read with an
+indexed ``id > last_id`` range query; publishers in the same process wake local streams
+immediately, and streams fed by another process pick events up within
+``SSE_POLL_INTERVAL`` seconds.
+
+Each open stream holds a worker (a thread under gunicorn's ``gthread`` worker, or a
+whole process under the default ``sync`` one), so deployments with many screens should
+run threaded or async workers. Streams also end after ``SSE_MAX_STREAM_SECONDS``; the
+browser reconnects on its own, resuming from its ``Last-Event-ID``, which releases the
+worker periodically and bounds what a sync worker can be tied up for.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import StreamEvent
+
+_new_event = threading.Condition()
+
+
+def publish(channel, event_type, data, commit=True):
+    """Append an event to ``channel``; returns its id (None until flushed when commit=False)."""
+    event = StreamEvent(channel=channel, event_type=event_type, payload=json.dumps(data, default=str))
+    db.session.add(event)
+    if commit:
+        db.session.commit()
+        notify()
+    return event.id
+
+
+def notify():
+    with _new_event:
+        _new_event.notify_all()
+
+
+def events_since(channel, last_id, limit=100):
+    """Events on ``channel`` newer than ``last_id``, oldest first."""
+    rows = db.session.query(StreamEvent.id, StreamEvent.event_type, StreamEvent.payload) \
+        .filter(StreamEvent.channel == channel, StreamEvent.id > last_id) \
+        .order_by(StreamEvent.id).limit(limit).all()
+    db.session.rollback()  # end the read transaction so the next poll sees new commits
+    return rows
+
+
+def latest_id(channel):
+    last = db.session.query(db.func.max(StreamEvent.id)).filter(StreamEvent.channel == channel).scalar()
+    db.session.rollback()
+    return last or 0
+
+
+def format_sse(event_id, event_type, payload):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+def parse_last_id(value):
+    """The event id a client resumes from, or None to start live if it is missing or malformed."""
+    try:
+        last_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return last_id if last_id >= 0 else None
+
+
+def stream(channel, last_id=None, poll_interval=1.0, keepalive=15.0, max_duration=None):
+    """Generator of SSE frames for ``channel``; runs until the client disconnects.
+
+    Without ``last_id`` the stream starts at the current end of the log. With
+    ``max_duration`` it ends after that many seconds so the client reconnects.
+    """
+    if last_id is None:
+        last_id = latest_id(channel)
+    yield "retry: 3000\n\n"
+    started = idle_since = time.monotonic()
+    while max_duration is None or time.monotonic() - started < max_duration:
+        rows = events_since(channel, last_id)
+        for event_id, event_type, payload in rows:
+            last_id = event_id
+            yield format_sse(event_id, event_type, payload)
+        if rows:
+            idle_since = time.monotonic()
+            continue
+        if time.monotonic() - idle_since >= keepalive:
+            idle_since = time.monotonic()
+            yield ": keepalive\n\n"
+        with _new_event:
+            _new_event.wait(poll_interval)
+
+
+def prune(older_than_hours=24, now=None):
+    """Delete events older than the retention window; returns the number removed."""
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=older_than_hours)
+    removed = StreamEvent.query.filter(StreamEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -1,4 +1,3 @@
-import requests
 from datetime import datetime
 
 EXCHANGE_API = "https://api.exchangerate.host/latest"
@@ -9,6 +8,7 @@ def fetch_exchange_rates(base='USD', symbols=None, timeout=10):
 
     Returns dict of currency->rate or raises requests.RequestException.
     """
+    import requests  # deferred: only the background updater needs an HTTP client
     params = {'base': base}
     if symbols:
         params['symbols'] = ','.join(symbols)
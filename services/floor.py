@@ -0,0 +1,188 @@
+"""Floor plan state: cached per-restaurant table snapshots, versioned, with pushed diffs.
+
+Every change to table state (assign, transfer, free, reserve) goes through
+``set_tables``: one ``UPDATE`` of all the tables it touches (``CASE id WHEN ...`` per
+column), a relative bump of ``RestaurantFloorPlan.version`` and a ``tables_changed``
+event on the restaurant's ``floor:<restaurant_id>`` stream carrying the new version and
+the changed rows, all in the caller's transaction. Terminals load a snapshot once and
+then apply the diffs from the stream, ignoring any with a version they already have.
+
+Snapshots are cached per process in an ``IndexCache`` (``FLOOR_CACHE_TTL``,
+``FLOOR_CACHE_SIZE``). A cached snapshot is served only while the floor plan's version
+(one primary-key read) still matches, so a change made by another worker is seen on the
+next request; ORM edits to the layout (tables, sections, the plan) drop the cache.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import case
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models import RestaurantFloorPlan, TableSection, Table
+from services.events import publish
+from services.index_cache import IndexCache
+
+STATUSES = ('available', 'occupied', 'reserved')
+
+
+class TableOccupied(ValueError):
+    """The table is occupied by another order."""
+
+
+def channel(restaurant_id):
+    return f"floor:{restaurant_id}"
+
+
+def table_row(row):
+    return {
+        "id": row.id,
+        "number": row.table_number,
+        "seats": row.seats,
+        "section": row.section,
+        "status": row.status,
+        "current_order_id": row.current_order_id,
+        "reserved_by": row.reserved_by,
+        "reserved_until": row.reserved_until.isoformat() if row.reserved_until else None,
+        "pos_x": row.pos_x,
+        "pos_y": row.pos_y,
+    }
+
+
+def _table_rows(query):
+    return query.with_entities(
+        Table.id, Table.table_number, Table.seats, TableSection.name.label('section'), Table.status,
+        Table.current_order_id, Table.reserved_by, Table.reserved_until, Table.pos_x, Table.pos_y,
+        RestaurantFloorPlan.restaurant_id) \
+        .join(TableSection, TableSection.id == Table.section_id) \
+        .join(RestaurantFloorPlan, RestaurantFloorPlan.id == TableSection.floor_plan_id)
+
+
+def current_version(restaurant_id, session=None):
+    return (session or db.session).query(RestaurantFloorPlan.version) \
+        .filter(RestaurantFloorPlan.restaurant_id == restaurant_id).scalar()
+
+
+class FloorState:
+
+    def __init__(self, restaurant_id, session):
+        self.restaurant_id = restaurant_id
+        self.loaded_at = time.monotonic()
+        # Version first: tables read afterwards are at least that new, never older
+        self.version = current_version(restaurant_id, session)
+        rows = _table_rows(session.query(Table)).filter(RestaurantFloorPlan.restaurant_id == restaurant_id) \
+            .order_by(TableSection.id, Table.id) if self.version is not None else []
+        self.tables = [table_row(row) for row in rows]
+
+    def snapshot(self):
+        return {"version": self.version or 0, "tables": self.tables}
+
+
+def _restaurant_of(obj):
+    return obj.restaurant_id if isinstance(obj, RestaurantFloorPlan) else None
+
+
+_cache = IndexCache(FloorState, (RestaurantFloorPlan, TableSection, Table), _restaurant_of,
+                    'FLOOR_CACHE_TTL', 'FLOOR_CACHE_SIZE')
+invalidate = _cache.invalidate
+
+
+def get_state(restaurant_id):
+    """This restaurant's floor state, reloaded when its version moved on."""
+    state = _cache.get(restaurant_id)
+    if state.version != current_version(restaurant_id):
+        _cache.invalidate(restaurant_id)
+        state = _cache.get(restaurant_id)
+    return state
+
+
+# ----------------------------------------------------------------------------------
+# Changes
+# ----------------------------------------------------------------------------------
+def _locked(table_ids):
+    """``{table_id: (status, current_order_id)}``, row-locked where the database supports it."""
+    rows = db.session.query(Table.id, Table.status, Table.current_order_id) \
+        .filter(Table.id.in_(table_ids)).with_for_update()
+    found = {table_id: (status, order_id) for table_id, status, order_id in rows}
+    for table_id in table_ids:
+        if table_id not in found:
+            raise LookupError(f"Table {table_id} not found")
+    return found
+
+
+def set_tables(changes, now=None):
+    """Apply ``{table_id: {column: value}}`` in one statement and push the diff.
+
+    Returns ``{restaurant_id: new version}``. Nothing is committed.
+    """
+    if not changes:
+        return {}
+    table = Table.__table__
+    ids = sorted(changes)
+    columns = sorted({column for values in changes.values() for column in values})
+    values = {}
+    for column in columns:
+        whens = {table_id: changes[table_id][column] for table_id in ids if column in changes[table_id]}
+        values[column] = case(whens, value=table.c.id, else_=table.c[column])
+    db.session.execute(table.update().where(table.c.id.in_(ids)).values(**values))
+    for table_id in ids:
+        instance = db.session.identity_map.get(identity_key(Table, table_id))
+        if instance is not None:
+            db.session.expire(instance, columns)
+
+    changed = {}
+    for row in _table_rows(Table.query).filter(Table.id.in_(ids)).order_by(Table.id):
+        changed.setdefault(row.restaurant_id, []).append(table_row(row))
+    plans = RestaurantFloorPlan.__table__
+    versions = {}
+    for restaurant_id, rows in changed.items():
+        db.session.execute(plans.update().where(plans.c.restaurant_id == restaurant_id)
+                           .values(version=plans.c.version + 1))
+        versions[restaurant_id] = current_version(restaurant_id)
+        publish(channel(restaurant_id), 'tables_changed', {
+            "restaurant_id": restaurant_id,
+            "version": versions[restaurant_id],
+            "changed_at": (now or datetime.utcnow()).isoformat(),
+            "tables": rows,
+        }, commit=False)
+    return versions
+
+
+def _check_free(table_id, state, order_id):
+    status, current = state
+    if status == 'occupied' and current is not None and current != order_id:
+        raise TableOccupied(f"Table {table_id} is occupied by order {current}")
+
+
+def assign(table_id, order_id, now=None):
+    tables = _locked([table_id])
+    _check_free(table_id, tables[table_id], order_id)
+    return set_tables({table_id: {"status": "occupied", "current_order_id": order_id}}, now)
+
+
+def transfer(source_id, destination_id, now=None):
+    """Move the source table's order to the destination; the source becomes available."""
+    if source_id == destination_id:
+        raise ValueError("Source and destination are the same table")
+    tables = _locked([source_id, destination_id])
+    order_id = tables[source_id][1]
+    if order_id is None:
+        raise ValueError("Source table has no order to transfer")
+    _check_free(destination_id, tables[destination_id], order_id)
+    return set_tables({
+        destination_id: {"status": "occupied", "current_order_id": order_id},
+        source_id: {"status": "available", "current_order_id": None, "reserved_by": None, "reserved_until": None},
+    }, now)
+
+
+def set_status(table_id, status, reserved_by=None, reserved_until=None, now=None):
+    """Free, occupy or reserve a table; freeing also clears its order and reservation."""
+    if status not in STATUSES:
+        raise ValueError(f"Invalid status. Must be one of {list(STATUSES)}")
+    _locked([table_id])
+    values = {"status": status}
+    if status == 'available':
+        values.update(current_order_id=None, reserved_by=None, reserved_until=None)
+    elif status == 'reserved':
+        values.update(reserved_by=reserved_by, reserved_until=reserved_until)
+    return set_tables({table_id: values}, now)
@@ -0,0 +1,176 @@
+"""Password and secret hashing off the request thread.
+
+Argon2/PBKDF2 verification costs tens of milliseconds of pure CPU and holds the GIL,
+so running it inline stalls every other request served by the same worker. Here hashing
+and verification run on a small process pool instead. The pool is bounded: when more
+than ``HASHING_MAX_QUEUE`` operations are in flight, callers get ``HashingBusy`` right
+away (login answers 503) instead of piling up behind the pool.
+
+New hashes use Argon2id. Werkzeug hashes (``pbkdf2:``/``scrypt:``) still verify, and
+``needs_rehash`` tells the login view to upgrade them transparently.
+
+Configuration (read by ``configure(app)``):
+    HASHING_POOL_WORKERS  processes in the pool; 0 hashes inline on the calling thread
+    HASHING_MAX_QUEUE     maximum in-flight operations before ``HashingBusy``
+    HASHING_TIMEOUT       seconds to wait for a single operation
+
+This module is imported by the pool's worker processes, so it must stay free of Flask
+and database imports.
+"""
+import hashlib
+import hmac
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from werkzeug.security import check_password_hash
+
+ARGON2_PREFIX = '$argon2'
+
+_hasher = PasswordHasher()
+_settings = {'workers': 2, 'max_queue': 32, 'timeout': 5.0}
+_pool = None
+_slots = threading.BoundedSemaphore(_settings['max_queue'])
+_pool_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool already has ``HASHING_MAX_QUEUE`` operations in flight."""
+
+
+def configure(app):
+    """Apply pool settings from the Flask config; the pool itself starts on first use."""
+    global _slots
+    workers = app.config.get('HASHING_POOL_WORKERS', _settings['workers'])
+    max_queue = app.config.get('HASHING_MAX_QUEUE', _settings['max_queue'])
+    timeout = app.config.get('HASHING_TIMEOUT', _settings['timeout'])
+    with _pool_lock:
+        if workers != _settings['workers']:
+            _shutdown_locked()
+        if max_queue != _settings['max_queue']:
+            _slots = threading.BoundedSemaphore(max_queue)
+        _settings.update(workers=workers, max_queue=max_queue, timeout=timeout)
+
+
+def shutdown():
+    with _pool_lock:
+        _shutdown_locked()
+
+
+def _shutdown_locked():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None and _settings['workers'] > 0:
+            # spawn: forking a process that runs threads (exchange updater, sampler) is unsafe
+            _pool = ProcessPoolExecutor(max_workers=_settings['workers'],
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _run(fn, *args):
+    pool = _get_pool()
+    if pool is None:
+        return fn(*args)
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy("Too many hashing operations in flight")
+    try:
+        future = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        slots.release()
+        shutdown()
+        return fn(*args)
+    except BaseException:
+        slots.release()
+        raise
+    # The slot is held until the work really finishes (or is cancelled), so a timed-out
+    # caller does not free room in the pool while its operation is still running there
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=_settings['timeout'])
+    except TimeoutError:
+        future.cancel()
+        raise HashingBusy("Hashing operation timed out")
+    except BrokenProcessPool:
+        shutdown()
+        return fn(*args)
+
+
+# -- worker functions (executed in the pool) ---------------------------------------
+def _hash(secret):
+    return _hasher.hash(secret)
+
+
+def _hash_many(secrets):
+    return [_hasher.hash(s) for s in secrets]
+
+
+def _verify(stored_hash, secret):
+    if not stored_hash or secret is None:
+        return False
+    if stored_hash.startswith(ARGON2_PREFIX):
+        try:
+            return _hasher.verify(stored_hash, secret)
+        except (VerificationError, InvalidHashError):
+            return False
+    try:
+        return check_password_hash(stored_hash, secret)
+    except (ValueError, TypeError):
+        return False
+
+
+def _verify_any(stored_hashes, secret):
+    for idx, stored_hash in enumerate(stored_hashes):
+        if _verify(stored_hash, secret):
+            return idx
+    return None
+
+
+# -- public API --------------------------------------------------------------------
+def hash_password(password):
+    """Return an Argon2id hash of ``password``."""
+    return _run(_hash, password)
+
+
+def hash_passwords(passwords):
+    """Hash several secrets in a single pool round-trip (e.g. a batch of backup codes)."""
+    return _run(_hash_many, list(passwords))
+
+
+def verify_password(stored_hash, password):
+    """Check ``password`` against an Argon2 or Werkzeug hash."""
+    return _run(_verify, stored_hash, password)
+
+
+def verify_any(stored_hashes, secret):
+    """Return the index of the first hash matching ``secret``, or None."""
+    return _run(_verify_any, list(stored_hashes), secret)
+
+
+def needs_rehash(stored_hash):
+    """True for legacy Werkzeug hashes and Argon2 hashes with outdated parameters."""
+    if not stored_hash or not stored_hash.startswith(ARGON2_PREFIX):
+        return True
+    try:
+        return _hasher.check_needs_rehash(stored_hash)
+    except InvalidHashError:
+        return True
+
+
+def lookup_key(secret, length=4):
+    """Short, non-secret digest used to find the one stored hash worth verifying."""
+    return hashlib.sha256(secret.encode()).hexdigest()[:length]
+
+
+def lookup_matches(key, secret):
+    return hmac.compare_digest(key, lookup_key(secret, len(key)))
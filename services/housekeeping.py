@@ -0,0 +1,98 @@
+"""Periodic housekeeping jobs, run on their own thread with a lease per job.
+
+Each job (pruning old stream events, rolling up loyalty/e-wallet ledger snapshots, the
+daily loyalty tier window expiry, the daily stock snapshot and the hourly prep-time
+rollup) has its own ``housekeeping:<job>`` lease (see ``services/leases.py``), so only
+one worker process runs a given job, and a slow job never holds up the course scheduler
+or the other jobs' leaders. ``HOUSEKEEPING_LEASE_TTL`` must exceed the longest run of any
+job; leases are renewed on every pass and again after each run.
+
+A job counts as done only when it returns; one that raises is retried on the next pass
+(every ``HOUSEKEEPING_INTERVAL`` seconds) rather than waiting for its next period.
+``clock`` is injectable and ``run_due()`` can be called directly, which is how the tests
+drive it.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from extensions import db
+from services import events, inventory, leases, ledger, loyalty_tiers, order_lifecycle
+
+logger = logging.getLogger(__name__)
+
+Job = namedtuple('Job', 'name period run')
+
+
+def default_jobs(app):
+    retention_hours = app.config.get('EVENT_RETENTION_HOURS', 24)
+    return [
+        Job('prune_events', timedelta(hours=1), lambda now: events.prune(retention_hours, now=now)),
+        Job('ledger_rollup', timedelta(hours=app.config.get('LEDGER_ROLLUP_INTERVAL_HOURS', 1)),
+            lambda now: ledger.rollup(now=now)),
+        Job('loyalty_tier_expiry', timedelta(days=1), lambda now: loyalty_tiers.expire(now=now)),
+        # Hourly check; a no-op once the last midnight has been snapshotted
+        Job('stock_snapshot', timedelta(hours=1), lambda now: inventory.snapshot(now=now)),
+        Job('prep_time_rollup', timedelta(hours=1), lambda now: order_lifecycle.rollup(now=now)),
+    ]
+
+
+class Housekeeping:
+
+    def __init__(self, app=None, clock=None, jobs=None):
+        self.clock = clock or datetime.utcnow
+        self.holder = leases.holder_id()
+        self.jobs = jobs
+        self._last_run = {}
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('HOUSEKEEPING_INTERVAL', 60)
+        self.lease_ttl = app.config.get('HOUSEKEEPING_LEASE_TTL', 900)
+        if self.jobs is None:
+            self.jobs = default_jobs(app)
+        app.extensions['housekeeping'] = self
+
+    def run_due(self):
+        """Run every job that is due and whose lease this process holds; returns their names."""
+        ran = []
+        for job in self.jobs:
+            now = self.clock()
+            lease = f'housekeeping:{job.name}'
+            # Renewed on every pass, due or not, so the job stays with one worker
+            if not leases.acquire(lease, self.holder, self.lease_ttl, now):
+                self._last_run.pop(job.name, None)  # another worker runs it
+                continue
+            last = self._last_run.get(job.name)
+            if last is not None and now - last < job.period:
+                continue
+            try:
+                job.run(now)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Housekeeping job %s failed; retrying on the next pass", job.name)
+                continue
+            self._last_run[job.name] = now
+            leases.acquire(lease, self.holder, self.lease_ttl, self.clock())
+            ran.append(job.name)
+        return ran
+
+    # -- thread ----------------------------------------------------------------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='housekeeping')
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.run_due()
+            except Exception:
+                logger.exception("Housekeeping pass failed")
+            time.sleep(self.interval)
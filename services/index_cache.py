@@ -0,0 +1,86 @@
+"""Per-restaurant in-process index cache shared by the pricing, promotions, floor and
+booking availability services.
+
+Each service builds a read-optimised index of one restaurant's rows (``loader``) and
+keeps it in its own ``IndexCache``, with its own TTL and size settings. Indexes are
+loaded through a short-lived session of their own, never the caller's, so uncommitted
+edits of the request that happens to trigger a load (later rolled back, perhaps) are
+never cached for everyone else. Committed ORM
+edits to the models a cache watches drop the affected restaurant's index in this
+process; other worker processes reload theirs when the TTL runs out.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+
+
+class IndexCache:
+    """LRU of per-restaurant indexes built by ``loader(restaurant_id, session)``.
+
+    Entries expire after ``app.config[ttl_setting]`` seconds and at most
+    ``app.config[size_setting]`` restaurants are kept. Committed ORM changes to any of
+    ``watched`` models drop the index of the restaurant ``restaurant_of(obj)`` names, or
+    every index when it returns None.
+    """
+
+    def __init__(self, loader, watched, restaurant_of, ttl_setting, size_setting, ttl=30, size=128):
+        self.loader = loader
+        self.watched = tuple(watched)
+        self.restaurant_of = restaurant_of
+        self.ttl_setting, self.size_setting = ttl_setting, size_setting
+        self.default_ttl, self.default_size = ttl, size
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by invalidate() so a load that raced an edit is not cached
+        self._info_key = f'_index_changes_{id(self)}'
+        event.listen(Session, 'after_flush', self._collect)
+        event.listen(Session, 'after_commit', self._committed)
+        event.listen(Session, 'after_rollback', self._rolled_back)
+
+    def get(self, restaurant_id):
+        ttl = current_app.config.get(self.ttl_setting, self.default_ttl)
+        with self._lock:
+            index = self._indexes.get(restaurant_id)
+            if index is not None and time.monotonic() - index.loaded_at < ttl:
+                self._indexes.move_to_end(restaurant_id)
+                return index
+            generation = self._generation
+        with Session(db.engine) as session:
+            index = self.loader(restaurant_id, session)
+        with self._lock:
+            if generation != self._generation:
+                return index
+            self._indexes[restaurant_id] = index
+            self._indexes.move_to_end(restaurant_id)
+            while len(self._indexes) > current_app.config.get(self.size_setting, self.default_size):
+                self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, restaurant_id=None):
+        """Drop one restaurant's index, or all of them."""
+        with self._lock:
+            self._generation += 1
+            if restaurant_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(restaurant_id, None)
+
+    def _collect(self, session, flush_context):
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, self.watched):
+                session.info.setdefault(self._info_key, set()).add(self.restaurant_of(obj))
+
+    def _committed(self, session):
+        changed = session.info.pop(self._info_key, None)
+        if changed:
+            for restaurant_id in ([None] if None in changed else changed):
+                self.invalidate(restaurant_id)
+
+    def _rolled_back(self, session):
+        session.info.pop(self._info_key, None)
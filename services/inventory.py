@@ -0,0 +1,226 @@
+"""Stock levels: an append-only movement ledger, recipe depletion and history queries.
+
+Every change to ``InventoryItem.quantity`` goes through a ``StockMovement`` row
+(receipt, sale, waste, count, adjustment) written in the same transaction as a relative
+SQL update of the cached level (``quantity = quantity + :change``), so concurrent
+changes serialise on the item row instead of overwriting each other. A count records
+the difference between the counted and the expected level.
+
+Checkout depletion folds an order's lines into ingredient usage first: quantities of
+the same product are summed, the recipes of all its products are read in one query, and
+usage of the same inventory item across products is summed too. The usage is applied in
+a single ``UPDATE`` (``quantity = quantity - CASE id WHEN ... END``) plus one batched
+insert of its ``sale`` movements, however many lines the order has. Stock may go
+negative: a sale that happened is recorded even when the count was wrong. Items that
+the decrement takes to or below their ``low_stock_threshold`` emit one ``low_stock``
+event on the ``inventory`` stream, and ``Order.stock_depleted_at`` is claimed with a
+conditional update so a retried checkout does not take stock twice.
+
+History: ``snapshot`` stores every item's level at midnight (run by housekeeping, only
+once the day is older than ``STOCK_SNAPSHOT_LAG`` seconds so no open transaction can
+still add a movement before it). The level at any time is then the
+latest snapshot before it plus the movements since, at most a day of them per item.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models import Order, OrderItem, InventoryItem, RecipeIngredient, StockMovement, StockSnapshot
+from services.events import publish
+
+MOVEMENT_TYPES = ('receipt', 'sale', 'waste', 'count', 'adjustment')
+
+
+def _expire_items(item_ids):
+    # Loaded instances still hold the pre-update quantities
+    for item_id in item_ids:
+        instance = db.session.identity_map.get(identity_key(InventoryItem, item_id))
+        if instance is not None:
+            db.session.expire(instance, ['quantity', 'updated_at'])
+
+
+def record(item_id, movement_type, quantity, reference=None, note=None, user_id=None, now=None):
+    """Apply a signed stock change and append its movement; returns the new level.
+
+    Nothing is committed.
+    """
+    if movement_type not in MOVEMENT_TYPES:
+        raise ValueError(f"Unknown movement type {movement_type}")
+    now = now or datetime.utcnow()
+    table = InventoryItem.__table__
+    if not db.session.execute(table.update().where(table.c.id == item_id).values(
+            quantity=func.coalesce(table.c.quantity, 0) + quantity, updated_at=now)).rowcount:
+        raise LookupError(f"Inventory item {item_id} not found")
+    db.session.execute(StockMovement.__table__.insert().values(
+        inventory_item_id=item_id, movement_type=movement_type, quantity=quantity, reference=reference,
+        note=note, user_id=user_id, created_at=now))
+    _expire_items([item_id])
+    return db.session.query(table.c.quantity).filter(table.c.id == item_id).scalar()
+
+
+def count(item_id, counted, reference=None, note=None, user_id=None, now=None):
+    """Set an item to a counted level, recording the difference as a ``count`` movement."""
+    expected = db.session.query(InventoryItem.quantity).filter(InventoryItem.id == item_id) \
+        .with_for_update().scalar()
+    if expected is None and not db.session.query(InventoryItem.id).filter(InventoryItem.id == item_id).scalar():
+        raise LookupError(f"Inventory item {item_id} not found")
+    record(item_id, 'count', round(counted - (expected or 0), 6), reference, note, user_id, now)
+    return counted
+
+
+# ----------------------------------------------------------------------------------
+# Recipe depletion
+# ----------------------------------------------------------------------------------
+def usage(lines):
+    """Ingredient usage ``{inventory_item_id: quantity}`` for ``(product_id, quantity)`` lines."""
+    per_product = defaultdict(float)
+    for product_id, quantity in lines:
+        per_product[product_id] += quantity or 0
+    totals = defaultdict(float)
+    if per_product:
+        for product_id, item_id, amount in db.session.query(
+                RecipeIngredient.product_id, RecipeIngredient.inventory_item_id, RecipeIngredient.quantity) \
+                .filter(RecipeIngredient.product_id.in_(per_product)):
+            totals[item_id] += amount * per_product[product_id]
+    return {item_id: round(quantity, 6) for item_id, quantity in totals.items() if quantity}
+
+
+def apply_usage(used, reference=None, now=None):
+    """Subtract ``used`` from stock in one statement; returns the low_stock alerts raised.
+
+    Nothing is committed; alerts are published with the caller's transaction.
+    """
+    if not used:
+        return []
+    now = now or datetime.utcnow()
+    table = InventoryItem.__table__
+    ids = sorted(used)
+    db.session.execute(table.update().where(table.c.id.in_(ids)).values(
+        quantity=func.coalesce(table.c.quantity, 0) - case(used, value=table.c.id, else_=0),
+        updated_at=now))
+    db.session.execute(StockMovement.__table__.insert(), [
+        {"inventory_item_id": item_id, "movement_type": "sale", "quantity": -used[item_id],
+         "reference": reference, "note": None, "user_id": None, "created_at": now} for item_id in ids])
+    _expire_items(ids)
+
+    alerts = []
+    for row in db.session.query(InventoryItem.id, InventoryItem.name, InventoryItem.quantity,
+                                InventoryItem.unit, InventoryItem.low_stock_threshold) \
+            .filter(InventoryItem.id.in_(ids), InventoryItem.low_stock_threshold.isnot(None),
+                    InventoryItem.quantity <= InventoryItem.low_stock_threshold) \
+            .order_by(InventoryItem.id):
+        if row.quantity + used[row.id] > row.low_stock_threshold:  # crossed by this decrement
+            alert = {"inventory_item_id": row.id, "name": row.name, "quantity": row.quantity,
+                     "unit": row.unit, "threshold": row.low_stock_threshold}
+            publish('inventory', 'low_stock', alert, commit=False)
+            alerts.append(alert)
+    return alerts
+
+
+def deplete_order(order, now=None):
+    """Take ``order``'s recipe usage from stock once; returns the low_stock alerts.
+
+    Nothing is committed, so the decrement succeeds or fails with the checkout.
+    """
+    now = now or datetime.utcnow()
+    orders = Order.__table__
+    claimed = db.session.execute(orders.update().where(
+        orders.c.id == order.id, orders.c.stock_depleted_at.is_(None)
+    ).values(stock_depleted_at=now)).rowcount
+    db.session.expire(order, ['stock_depleted_at'])
+    if not claimed:
+        return []
+    lines = db.session.query(OrderItem.menu_item_id, OrderItem.quantity).filter(OrderItem.order_id == order.id)
+    return apply_usage(usage(lines), reference=f"order:{order.id}", now=now)
+
+
+# ----------------------------------------------------------------------------------
+# History
+# ----------------------------------------------------------------------------------
+def on_hand_at(at, item_ids=None):
+    """Stock level ``{inventory_item_id: quantity}`` of every item (or ``item_ids``) at ``at``.
+
+    From the latest snapshot at or before ``at`` plus the movements after it; items with
+    no such snapshot are worked back from the current level instead.
+    """
+    snapshots, movements, items = StockSnapshot.__table__, StockMovement.__table__, InventoryItem.__table__
+    latest = db.session.query(snapshots.c.inventory_item_id.label('item_id'),
+                              func.max(snapshots.c.taken_at).label('taken_at')) \
+        .filter(snapshots.c.taken_at <= at)
+    if item_ids is not None:
+        latest = latest.filter(snapshots.c.inventory_item_id.in_(item_ids))
+    latest = latest.group_by(snapshots.c.inventory_item_id).subquery()
+
+    levels = dict(db.session.query(snapshots.c.inventory_item_id, snapshots.c.quantity)
+                  .join(latest, (latest.c.item_id == snapshots.c.inventory_item_id)
+                        & (latest.c.taken_at == snapshots.c.taken_at)))
+    for item_id, change in db.session.query(movements.c.inventory_item_id, func.sum(movements.c.quantity)) \
+            .join(latest, latest.c.item_id == movements.c.inventory_item_id) \
+            .filter(movements.c.created_at > latest.c.taken_at, movements.c.created_at <= at) \
+            .group_by(movements.c.inventory_item_id):
+        levels[item_id] += change
+
+    later = db.session.query(movements.c.inventory_item_id.label('item_id'),
+                             func.sum(movements.c.quantity).label('change')) \
+        .filter(movements.c.created_at > at).group_by(movements.c.inventory_item_id).subquery()
+    rest = db.session.query(items.c.id, items.c.quantity, later.c.change) \
+        .outerjoin(later, later.c.item_id == items.c.id) \
+        .outerjoin(latest, latest.c.item_id == items.c.id).filter(latest.c.item_id.is_(None))
+    if item_ids is not None:
+        rest = rest.filter(items.c.id.in_(item_ids))
+    for item_id, quantity, change in rest:
+        levels[item_id] = (quantity or 0) - (change or 0)
+    return {item_id: round(quantity, 6) for item_id, quantity in levels.items()}
+
+
+def snapshot(now=None):
+    """Snapshot every item at the last settled midnight; returns rows written (0 if done)."""
+    lag = current_app.config.get('STOCK_SNAPSHOT_LAG', 300)
+    taken_at = datetime.combine(((now or datetime.utcnow()) - timedelta(seconds=lag)).date(), time.min)
+    if db.session.query(StockSnapshot.id).filter(StockSnapshot.taken_at == taken_at).first():
+        return 0
+    levels = on_hand_at(taken_at)
+    if not levels:
+        return 0
+    try:
+        db.session.execute(StockSnapshot.__table__.insert(), [
+            {"inventory_item_id": item_id, "taken_at": taken_at, "quantity": quantity}
+            for item_id, quantity in sorted(levels.items())])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # another worker took it first
+        return 0
+    return len(levels)
+
+
+def variance(start, end):
+    """Per-item stock movement summary for ``(start, end]``.
+
+    ``expected`` is the opening level plus receipts, sales, waste and adjustments;
+    ``variance`` is what counts found on top of that, so ``closing = expected + variance``.
+    """
+    movements = StockMovement.__table__
+    opening, closing = on_hand_at(start), on_hand_at(end)
+    totals = defaultdict(dict)
+    for item_id, movement_type, change in db.session.query(
+            movements.c.inventory_item_id, movements.c.movement_type, func.sum(movements.c.quantity)) \
+            .filter(movements.c.created_at > start, movements.c.created_at <= end) \
+            .group_by(movements.c.inventory_item_id, movements.c.movement_type):
+        totals[item_id][movement_type] = change
+    report = []
+    for item_id, name, unit in db.session.query(InventoryItem.id, InventoryItem.name, InventoryItem.unit) \
+            .order_by(InventoryItem.name, InventoryItem.id):
+        moved = totals.get(item_id, {})
+        row = {"inventory_item_id": item_id, "name": name, "unit": unit, "opening": opening.get(item_id, 0)}
+        row.update({movement_type: round(moved.get(movement_type, 0), 6)
+                    for movement_type in MOVEMENT_TYPES if movement_type != 'count'})
+        row["expected"] = round(row["opening"] + sum(row[t] for t in MOVEMENT_TYPES if t != 'count'), 6)
+        row["variance"] = round(moved.get('count', 0), 6)
+        row["closing"] = closing.get(item_id, 0)
+        report.append(row)
+    return report
@@ -0,0 +1,309 @@
+"""Invoice rendering: HTML (and PDF when WeasyPrint is installed), cached by content hash.
+
+``templates/invoices/invoice.html`` is compiled once by Flask's Jinja environment and
+rendered from a context that applies the restaurant's ``StoreSettings``: amounts are
+formatted for its locale and currency, the address follows its ``address_format`` and
+the VAT/registration numbers are printed when set.
+
+Issued and paid invoices do not change, so their rendered output is kept in an LRU
+cache keyed on a SHA-256 of the render context (``INVOICE_CACHE_SIZE`` entries). Any
+edit to the invoice or the store settings changes the hash, so stale output is never
+served, and the hash doubles as the HTTP ETag.
+
+``build_month_archive`` renders every invoice of a restaurant issued in one month into a
+single zip with an index.csv; ``InvoiceArchiver`` runs it on a background thread. Job
+state is a small JSON file next to the zip, so a status or download request served by
+another worker of the host finds the job as well. Finished jobs (state and zip) are
+deleted ``INVOICE_ARCHIVE_RETENTION`` seconds after their last update, checked whenever a
+new archive is submitted.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from babel.dates import format_date
+from babel.numbers import format_currency
+from flask import current_app
+
+from extensions import db
+from models import Invoice, Restaurant, StoreSettings
+
+TEMPLATE = 'invoices/invoice.html'
+CACHED_STATUSES = ('issued', 'paid')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def pdf_available():
+    try:
+        import weasyprint  # noqa: F401  deferred: optional dependency
+    except ImportError:
+        return False
+    return True
+
+
+def address_lines(store, address_format):
+    """Postal address lines in the order the store's address format expects."""
+    if store is None:
+        return []
+    city, postal = store.city or '', store.postal_code or ''
+    if address_format == 'european':
+        lines = [store.address, f"{postal} {city}".strip(), store.country]
+    elif address_format == 'asian':
+        lines = [store.country, f"{postal} {city}".strip(), store.address]
+    else:
+        lines = [store.address, f"{city} {postal}".strip(), store.country]
+    return [line for line in lines if line]
+
+
+def parse_items(raw, total):
+    """Invoice.items holds either a JSON list of lines or free text."""
+    try:
+        items = json.loads(raw) if raw else None
+    except ValueError:
+        items = None
+    if isinstance(items, list) and items and all(isinstance(i, dict) for i in items):
+        return [{
+            "description": str(i.get("description") or i.get("name") or ''),
+            "quantity": i.get("quantity", 1),
+            "amount": float(i.get("amount", i.get("price", 0) * i.get("quantity", 1)) or 0),
+        } for i in items]
+    return [{"description": raw or 'Services', "quantity": None, "amount": total or 0.0}]
+
+
+def _store(restaurant_id):
+    if not restaurant_id:
+        return None
+    return db.session.query(
+        Restaurant.name, Restaurant.email, Restaurant.phone, Restaurant.address, Restaurant.city,
+        Restaurant.postal_code, Restaurant.country, StoreSettings.locale, StoreSettings.currency,
+        StoreSettings.address_format, StoreSettings.vat_number, StoreSettings.business_registration,
+        StoreSettings.payment_terms
+    ).outerjoin(StoreSettings, StoreSettings.restaurant_id == Restaurant.id) \
+        .filter(Restaurant.id == restaurant_id).first()
+
+
+def invoice_context(invoice, store=None):
+    """Template context for ``invoice``; pass ``store`` to reuse one lookup in bulk runs."""
+    if store is None:
+        store = _store(invoice.restaurant_id)
+    locale = (store and store.locale) or 'en'
+    currency = (store and store.currency) or 'USD'
+
+    def money(amount):
+        try:
+            return format_currency(amount, currency, locale=locale)
+        except Exception:
+            return f"{currency} {amount:.2f}"
+
+    def date(value):
+        if value is None:
+            return None
+        try:
+            return format_date(value, format='medium', locale=locale)
+        except Exception:
+            return value.strftime('%Y-%m-%d')
+
+    items = parse_items(invoice.items, invoice.total)
+    return {
+        "invoice_number": invoice.invoice_number,
+        "status": invoice.status or 'draft',
+        "customer_name": invoice.customer_name,
+        "customer_phone": invoice.customer_phone,
+        "issued": date(invoice.issued_at),
+        "paid": date(invoice.paid_at),
+        "store_name": store.name if store else 'ServeoPOS',
+        "store_email": store.email if store else None,
+        "store_phone": store.phone if store else None,
+        "address": address_lines(store, (store and store.address_format) or 'standard'),
+        "vat_number": store.vat_number if store else None,
+        "registration": store.business_registration if store else None,
+        "payment_terms": store.payment_terms if store else None,
+        "lang": locale.split('_')[0],
+        "items": [dict(item, amount=money(item["amount"])) for item in items],
+        "total": money(invoice.total or 0.0),
+    }
+
+
+def content_hash(context):
+    payload = json.dumps(context, sort_keys=True, default=str).encode()
+    return hashlib.sha256(TEMPLATE.encode() + b'\0' + payload).hexdigest()
+
+
+def _cached(key, build):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    value = build()
+    with _cache_lock:
+        _cache[key] = value
+        while len(_cache) > current_app.config.get('INVOICE_CACHE_SIZE', 256):
+            _cache.popitem(last=False)
+    return value
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def render_html(context):
+    return current_app.jinja_env.get_template(TEMPLATE).render(**context)
+
+
+def render_pdf(html):
+    from weasyprint import HTML  # deferred: optional dependency
+    return HTML(string=html).write_pdf()
+
+
+def render_invoice(invoice, fmt='html', store=None):
+    """Return ``(body, etag)`` for ``invoice`` as ``html`` (str) or ``pdf`` (bytes)."""
+    if fmt not in ('html', 'pdf'):
+        raise ValueError(f"Unsupported invoice format: {fmt}")
+    context = invoice_context(invoice, store)
+    digest = content_hash(context)
+
+    def build():
+        html = render_html(context)
+        return html if fmt == 'html' else render_pdf(html)
+
+    if invoice.status not in CACHED_STATUSES:
+        return build(), digest
+    return _cached((digest, fmt), build), digest
+
+
+def build_month_archive(restaurant_id, year, month, path, fmt='html'):
+    """Render all invoices of ``restaurant_id`` issued in ``year``/``month`` into a zip.
+
+    Returns the number of invoices written.
+    """
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    store = _store(restaurant_id)
+    query = Invoice.query.filter(Invoice.issued_at >= start, Invoice.issued_at < end) \
+        .filter(Invoice.restaurant_id == restaurant_id if restaurant_id else Invoice.restaurant_id.is_(None)) \
+        .order_by(Invoice.issued_at, Invoice.id)
+
+    index = io.StringIO()
+    writer = csv.writer(index)
+    writer.writerow(['invoice_number', 'issued_at', 'status', 'customer', 'total', 'file', 'sha256'])
+    count = 0
+    tmp_path = f"{path}.part"
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for invoice in query.yield_per(200):
+                body, digest = render_invoice(invoice, fmt, store=store)
+                name = f"{invoice.invoice_number or invoice.id}.{fmt}"
+                archive.writestr(name, body)
+                writer.writerow([invoice.invoice_number, invoice.issued_at.isoformat(), invoice.status,
+                                 invoice.customer_name or '', f"{invoice.total or 0:.2f}", name, digest])
+                count += 1
+            archive.writestr('index.csv', index.getvalue())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)  # rendering failed part-way
+    return count
+
+
+class InvoiceArchiver:
+    """Runs month archives on a single background thread; job state lives in ``INVOICE_ARCHIVE_DIR``."""
+
+    JOB_ID = re.compile(r'^[0-9a-f]{12}$')
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config.get('INVOICE_ARCHIVE_DIR') or os.path.join(app.instance_path, 'invoice_archives')
+        self.retention = app.config.get('INVOICE_ARCHIVE_RETENTION', 7 * 24 * 3600)
+        app.extensions['invoice_archiver'] = self
+
+    def submit(self, restaurant_id, year, month, fmt='html'):
+        """Queue an archive build; returns the job id."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='invoice-archive')
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        path = os.path.join(self.directory, f"invoices-{restaurant_id or 0}-{year}-{month:02d}-{job_id}.zip")
+        self._write({"id": job_id, "status": "queued", "restaurant_id": restaurant_id,
+                     "month": f"{year}-{month:02d}", "path": path, "count": None, "error": None})
+        self._executor.submit(self._run, job_id, restaurant_id, year, month, fmt)
+        return job_id
+
+    def _run(self, job_id, restaurant_id, year, month, fmt):
+        self._update(job_id, status="running")
+        try:
+            with self.app.app_context():
+                count = build_month_archive(restaurant_id, year, month, self.get(job_id)["path"], fmt)
+                db.session.remove()
+            self._update(job_id, status="done", count=count)
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e))
+
+    def expire(self, now=None):
+        """Delete jobs last updated more than ``retention`` seconds ago, with their zips."""
+        cutoff = (now or time.time()) - self.retention
+        removed = 0
+        for name in os.listdir(self.directory):
+            job_id, ext = os.path.splitext(name)
+            if ext != '.json' or not self.JOB_ID.match(job_id):
+                continue
+            path = self._state_path(job_id)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                job = self.get(job_id) or {}
+            except (OSError, ValueError):
+                continue
+            for stale in (job.get("path"), f"{job.get('path')}.part" if job.get("path") else None, path):
+                if stale and os.path.dirname(stale) == self.directory:
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+            removed += 1
+        return removed
+
+    def _state_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job):
+        path = self._state_path(job["id"])
+        with open(f"{path}.tmp", 'w') as fh:
+            json.dump(job, fh)
+        os.replace(f"{path}.tmp", path)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self.get(job_id)
+            job.update(fields)
+            self._write(job)
+
+    def get(self, job_id):
+        if not self.JOB_ID.match(job_id or ''):
+            return None
+        try:
+            with open(self._state_path(job_id)) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
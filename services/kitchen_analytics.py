@@ -0,0 +1,292 @@
+"""Kitchen prep-time distributions per item and per station, and ticket ETAs.
+
+Every time orders become ready, ``record_ready`` appends one ``PrepTimeSample`` per
+product on the ticket (prep = ready minus cooking start, or minus placement when the
+ticket skipped cooking), tagged with the station its category prints to (the kitchen
+printer from ``PrinterRoute``, ``"kitchen"`` otherwise). A ticket is ready when its
+slowest dish is, so each product is credited with the ticket's time.
+
+Each process keeps one ``QuantileSketch`` per item and per station over the last
+``KDS_STATS_WINDOW_DAYS``. ``stats()`` folds in only what changed since the previous
+call: new samples are added, and samples that left the window (an indexed ``ready_at``
+range) are subtracted, so the cost follows the number of tickets bumped, not the history.
+Ids can commit out of order, so new samples are read from the highest id seen
+``KDS_STATS_SCAN_OVERLAP`` seconds ago, and the ids added since then are remembered:
+a sample is added once, and only samples that were added are ever subtracted.
+
+The sketch keeps counts in logarithmic buckets (DDSketch-style): a quantile is within
+``SKETCH_ACCURACY`` (relative) of the true value, memory is a few hundred buckets
+whatever the sample count, and because buckets hold exact counts, samples can be
+removed again when they age out.
+
+``etas`` predicts when each open ticket will be ready. Each station works on up to
+``KDS_STATION_CAPACITY`` tickets at once; cooking tickets hold a slot until their
+expected prep (``KDS_ETA_QUANTILE`` of the item's distribution, falling back to the
+station's and then ``KDS_DEFAULT_PREP_SECONDS``) runs out, and pending tickets take the
+next free slot in arrival order. A ticket's ETA is its latest station finish.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from extensions import db
+from models import (
+    Order, OrderItem, Product, MenuItem, PrinterRoute, KitchenPrinter, PrepTimeSample
+)
+
+SKETCH_ACCURACY = 0.02
+DEFAULT_STATION = 'kitchen'
+OPEN_STATES = ('pending', 'cooking')
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch over positive values (seconds) with exact counts."""
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+
+    def _index(self, value):
+        return math.ceil(math.log(max(value, 1.0)) / self.log_gamma)
+
+    def add(self, value, weight=1):
+        index = self._index(value)
+        self.buckets[index] += weight
+        if not self.buckets[index]:
+            del self.buckets[index]
+        self.count += weight
+        self.total += value * weight
+
+    def remove(self, value):
+        self.add(value, -1)
+
+    def quantile(self, q):
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else None
+
+
+# ----------------------------------------------------------------------------------
+# Samples
+# ----------------------------------------------------------------------------------
+def stations(product_ids):
+    """``{product_id: station name}``; products without a printer route go to the kitchen."""
+    product_ids = list(product_ids)
+    routed = {}
+    if product_ids:
+        for product_id, name in db.session.query(Product.id, KitchenPrinter.name) \
+                .join(PrinterRoute, (PrinterRoute.category_id == Product.category_id)
+                      & (PrinterRoute.restaurant_id == Product.restaurant_id)) \
+                .join(KitchenPrinter, KitchenPrinter.id == PrinterRoute.printer_id) \
+                .filter(Product.id.in_(product_ids), KitchenPrinter.active.isnot(False)) \
+                .order_by(KitchenPrinter.id.desc()):
+            routed[product_id] = name  # lowest printer id wins
+    return {product_id: routed.get(product_id, DEFAULT_STATION) for product_id in product_ids}
+
+
+def record_ready(order_ids, now):
+    """Append the prep-time samples of orders that just became ready. Nothing is committed."""
+    rows = db.session.query(Order.id, Order.created_at, Order.cooking_at, OrderItem.menu_item_id) \
+        .join(OrderItem, OrderItem.order_id == Order.id) \
+        .filter(Order.id.in_(order_ids)).distinct().all()
+    station_of = stations({product_id for *_, product_id in rows})
+    samples = []
+    for order_id, created_at, cooking_at, product_id in rows:
+        started = cooking_at if cooking_at and cooking_at <= now else created_at
+        if started is None:
+            continue
+        samples.append({"order_id": order_id, "product_id": product_id, "station": station_of[product_id],
+                        "seconds": max(0.0, (now - started).total_seconds()), "ready_at": now})
+    if samples:
+        db.session.execute(PrepTimeSample.__table__.insert(), samples)
+    return len(samples)
+
+
+# ----------------------------------------------------------------------------------
+# Incremental distributions
+# ----------------------------------------------------------------------------------
+class KitchenStats:
+
+    def __init__(self):
+        self.items = defaultdict(QuantileSketch)
+        self.stations = defaultdict(QuantileSketch)
+        self.last_id = 0
+        self.settled_id = 0  # every sample up to this id has been read
+        self.recent = set()  # ids above settled_id that were added
+        self.marks = deque()  # (monotonic time, last_id then)
+        self.window_start = None
+        self.lock = threading.Lock()
+
+    def _apply(self, rows, weight):
+        for product_id, station, seconds in rows:
+            self.items[product_id].add(seconds, weight)
+            self.stations[station].add(seconds, weight)
+        for sketches in (self.items, self.stations):
+            for key in [key for key, sketch in sketches.items() if sketch.count <= 0]:
+                del sketches[key]
+
+    def _settle(self, overlap):
+        cutoff = time.monotonic() - overlap
+        while self.marks and self.marks[0][0] <= cutoff:
+            self.settled_id = self.marks.popleft()[1]
+        self.recent = {sample_id for sample_id in self.recent if sample_id > self.settled_id}
+
+    def _was_added(self, sample_id):
+        return sample_id <= self.settled_id or sample_id in self.recent
+
+    def refresh(self, now):
+        """Fold in new samples and drop those that left the window."""
+        days = current_app.config.get('KDS_STATS_WINDOW_DAYS', 14)
+        window_start = now - timedelta(days=days)
+        samples = PrepTimeSample.__table__
+        columns = (samples.c.product_id, samples.c.station, samples.c.seconds)
+        with self.lock:
+            self._settle(current_app.config.get('KDS_STATS_SCAN_OVERLAP', 60))
+            if self.window_start is not None and window_start > self.window_start:
+                aged = [row for row in db.session.query(samples.c.id, *columns).filter(
+                    samples.c.ready_at >= self.window_start, samples.c.ready_at < window_start,
+                    samples.c.id <= self.last_id) if self._was_added(row[0])]
+                self._apply([row[1:] for row in aged], -1)
+                self.recent.difference_update(row[0] for row in aged)
+            if self.window_start is None or window_start > self.window_start:
+                self.window_start = window_start
+            # Samples already older than the window never enter it
+            new = [row for row in db.session.query(samples.c.id, samples.c.ready_at, *columns)
+                   .filter(samples.c.id > self.settled_id, samples.c.ready_at >= self.window_start)
+                   .order_by(samples.c.id) if row[0] not in self.recent]
+            if new:
+                self.last_id = max(self.last_id, new[-1][0])
+                self.recent.update(row[0] for row in new)
+                self._apply([row[2:] for row in new], 1)
+            self.marks.append((time.monotonic(), self.last_id))
+            return self
+
+    def _summary(self, sketches, quantiles):
+        return {key: {"count": sketch.count,
+                      "mean": round(sketch.mean, 1),
+                      **{f"p{round(q * 100)}": round(sketch.quantile(q), 1) for q in quantiles}}
+                for key, sketch in sketches.items()}
+
+    def summary(self, quantiles=(0.5, 0.9, 0.95)):
+        with self.lock:
+            return {"items": self._summary(self.items, quantiles),
+                    "stations": self._summary(self.stations, quantiles)}
+
+    def expected(self, product_id, station, q, min_samples, default):
+        with self.lock:
+            for sketch in (self.items.get(product_id), self.stations.get(station)):
+                if sketch is not None and sketch.count >= min_samples:
+                    return sketch.quantile(q)
+        return default
+
+
+
+def stats(now=None):
+    """This app's sketches, brought up to date."""
+    kitchen = current_app.extensions.get('kitchen_stats')
+    if kitchen is None:
+        kitchen = current_app.extensions.setdefault('kitchen_stats', KitchenStats())
+    return kitchen.refresh(now or datetime.utcnow())
+
+
+def names(product_ids):
+    """Display names for product ids (``Product``, else the legacy ``MenuItem``)."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    found = dict(db.session.query(MenuItem.id, MenuItem.name).filter(MenuItem.id.in_(product_ids)))
+    found.update(db.session.query(Product.id, Product.name).filter(Product.id.in_(product_ids)))
+    return found
+
+
+# ----------------------------------------------------------------------------------
+# ETAs
+# ----------------------------------------------------------------------------------
+def _capacity(station):
+    capacity = current_app.config.get('KDS_STATION_CAPACITY', 4)
+    if isinstance(capacity, dict):
+        capacity = capacity.get(station, capacity.get('default', 4))
+    return max(1, int(capacity))
+
+
+def etas(now=None):
+    """Predicted ready time of every open ticket: ``{order_id: {...}}``.
+
+    Each entry has ``eta`` (datetime), ``seconds_left``, ``stations`` and the ticket's
+    ``queue_position`` at its busiest station (0 when it is being cooked).
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    quantile = config.get('KDS_ETA_QUANTILE', 0.5)
+    min_samples = config.get('KDS_MIN_SAMPLES', 5)
+    default = config.get('KDS_DEFAULT_PREP_SECONDS', 600)
+    kitchen = stats(now)
+
+    tickets = db.session.query(Order.id, Order.status, Order.created_at, Order.cooking_at) \
+        .filter(Order.status.in_(OPEN_STATES)).order_by(Order.created_at, Order.id).all()
+    if not tickets:
+        return {}
+    lines = defaultdict(set)
+    for order_id, product_id in db.session.query(OrderItem.order_id, OrderItem.menu_item_id) \
+            .filter(OrderItem.order_id.in_([ticket.id for ticket in tickets])):
+        lines[order_id].add(product_id)
+    station_of = stations({product_id for products in lines.values() for product_id in products})
+
+    # Expected prep per ticket and station: its slowest product there
+    work = defaultdict(dict)
+    for order_id, products in lines.items():
+        for product_id in products:
+            station = station_of[product_id]
+            seconds = kitchen.expected(product_id, station, quantile, min_samples, default)
+            work[order_id][station] = max(seconds, work[order_id].get(station, 0))
+
+    finish = defaultdict(dict)
+    for station in {station for per_ticket in work.values() for station in per_ticket}:
+        queue = [ticket for ticket in tickets if station in work[ticket.id]]
+        cooking = [ticket for ticket in queue if ticket.status == 'cooking']
+        # Tickets already on the line hold a slot until their expected prep runs out
+        slots = []
+        for ticket in cooking:
+            started = ticket.cooking_at or ticket.created_at or now
+            done = max(now, started + timedelta(seconds=work[ticket.id][station]))
+            finish[ticket.id][station] = (done, 0)
+            slots.append(done)
+        slots.extend([now] * max(0, _capacity(station) - len(slots)))
+        heapq.heapify(slots)
+        for position, ticket in enumerate((t for t in queue if t.status != 'cooking'), 1):
+            start = heapq.heappop(slots)
+            done = start + timedelta(seconds=work[ticket.id][station])
+            finish[ticket.id][station] = (done, position)
+            heapq.heappush(slots, done)
+
+    result = {}
+    for ticket in tickets:
+        if not finish[ticket.id]:
+            continue  # nothing the kitchen makes
+        eta = max(done for done, _ in finish[ticket.id].values())
+        result[ticket.id] = {
+            "status": ticket.status,
+            "eta": eta,
+            "seconds_left": round((eta - now).total_seconds()),
+            "stations": sorted(finish[ticket.id]),
+            "queue_position": max(position for _, position in finish[ticket.id].values()),
+        }
+    return result
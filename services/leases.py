@@ -0,0 +1,49 @@
+"""Database-backed leader leases for background jobs.
+
+Every worker process runs the same background threads; a lease row per job decides
+which one actually does the work. The holder renews well inside ``ttl`` and another
+process takes over once the lease has expired, e.g. after the leader was killed.
+"""
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import SchedulerLease
+
+
+def holder_id():
+    """Identity for this process: ``host:pid:random`` (unique across restarts)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire(name, holder, ttl, now):
+    """Take or renew lease ``name`` for ``ttl`` seconds; True when ``holder`` owns it."""
+    expires_at = now + timedelta(seconds=ttl)
+    table = SchedulerLease.__table__
+    result = db.session.execute(
+        table.update()
+        .where(table.c.name == name)
+        .where((table.c.holder == holder) | (table.c.expires_at < now))
+        .values(holder=holder, expires_at=expires_at))
+    if result.rowcount:
+        db.session.commit()
+        return True
+    try:
+        db.session.execute(table.insert().values(name=name, holder=holder, expires_at=expires_at))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Someone else holds a live lease
+        db.session.rollback()
+        return False
+
+
+def release(name, holder):
+    """Give up the lease early so another process can take over without waiting."""
+    table = SchedulerLease.__table__
+    db.session.execute(table.delete().where(table.c.name == name).where(table.c.holder == holder))
+    db.session.commit()
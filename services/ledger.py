@@ -0,0 +1,177 @@
+"""Loyalty point and e-wallet balances, changed only through atomic ledger postings.
+
+A posting is one conditional ``UPDATE`` that increments the cached balance column in SQL
+(``balance = balance + :amount``), guarded by ``balance >= :amount`` for debits, followed
+by the ledger row insert in the same transaction. Two concurrent postings therefore
+serialise on the account row instead of overwriting each other's read-modify-write,
+and a debit that would overdraw the account matches no row and raises
+``InsufficientBalance`` without writing anything.
+
+The ledger (``LoyaltyPoints``, ``eWalletTransaction``) is the source of truth.
+``rollup`` folds entries into one ``LedgerSnapshot`` row per account, so recomputing a
+balance reads the snapshot plus the few entries posted since, never the full history.
+It only folds entries older than ``LEDGER_ROLLUP_LAG`` seconds, so a transaction that is
+still open when the rollup runs cannot have its entry skipped. ``reconcile`` compares
+the recomputed balances with the cached columns and can repair drift.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models import LoyaltyCard, LoyaltyPoints, eWallet, eWalletTransaction, LedgerSnapshot
+from services import loyalty_tiers
+
+Ledger = namedtuple('Ledger', 'account balance entries account_fk amount')
+
+LEDGERS = {
+    'loyalty': Ledger(LoyaltyCard, 'points_balance', LoyaltyPoints, 'loyalty_card_id', 'points'),
+    'ewallet': Ledger(eWallet, 'balance', eWalletTransaction, 'ewallet_id', 'amount'),
+}
+
+
+class InsufficientBalance(ValueError):
+    """A debit larger than the account balance."""
+
+
+def post(kind, account_id, amount, entry, totals=None):
+    """Apply ``amount`` to an account and append its ledger entry; returns the new balance.
+
+    ``entry`` holds the remaining ledger row columns, ``totals`` extra counter columns to
+    increment alongside the balance (e.g. ``points_earned_total``). Negative amounts are
+    refused when they exceed the balance. Nothing is committed.
+    """
+    ledger = LEDGERS[kind]
+    account = ledger.account.__table__
+    balance = account.c[ledger.balance]
+    values = {ledger.balance: balance + amount, 'updated_at': datetime.utcnow()}
+    for column, increment in (totals or {}).items():
+        values[column] = func.coalesce(account.c[column], 0) + increment
+    stmt = account.update().where(account.c.id == account_id).values(**values)
+    if amount < 0:
+        stmt = stmt.where(balance >= -amount)
+
+    if not db.session.execute(stmt).rowcount:
+        if db.session.query(account.c.id).filter(account.c.id == account_id).scalar() is None:
+            raise LookupError(f"{kind} account {account_id} not found")
+        raise InsufficientBalance(f"Insufficient {kind} balance")
+    db.session.execute(ledger.entries.__table__.insert().values(
+        **{ledger.account_fk: account_id, ledger.amount: amount, 'created_at': datetime.utcnow()}, **entry))
+
+    # Loaded instances still hold the pre-update values
+    instance = db.session.identity_map.get(identity_key(ledger.account, account_id))
+    if instance is not None:
+        db.session.expire(instance, [ledger.balance, 'updated_at', *(totals or {})])
+    return db.session.query(balance).filter(account.c.id == account_id).scalar()
+
+
+def earn_points(card_id, points, order_id=None, earn_method='purchase', description=None):
+    balance = post('loyalty', card_id, points,
+                   {'order_id': order_id, 'earn_method': earn_method, 'description': description},
+                   totals={'points_earned_total': points, 'window_points': points})
+    loyalty_tiers.evaluate(card_id)
+    return balance
+
+
+def redeem_points(card_id, points, order_id=None, description=None):
+    return post('loyalty', card_id, -points,
+                {'order_id': order_id, 'earn_method': 'redemption',
+                 'description': description or f"Redeemed {points} points"},
+                totals={'points_redeemed_total': points})
+
+
+def wallet_credit(wallet_id, amount, transaction_type='topup', order_id=None, reference_id=None):
+    return post('ewallet', wallet_id, amount, {'transaction_type': transaction_type,
+                                               'order_id': order_id, 'reference_id': reference_id})
+
+
+def wallet_debit(wallet_id, amount, transaction_type='purchase', order_id=None, reference_id=None):
+    return post('ewallet', wallet_id, -amount, {'transaction_type': transaction_type,
+                                                'order_id': order_id, 'reference_id': reference_id})
+
+
+# -- snapshots ---------------------------------------------------------------------------
+def _pending_totals(ledger, kind, upto_id=None, account_id=None):
+    """Per-account sum of the entries not yet folded into a snapshot."""
+    entries = ledger.entries.__table__
+    snapshot = LedgerSnapshot.__table__
+    account_col, amount_col = entries.c[ledger.account_fk], entries.c[ledger.amount]
+    query = db.session.query(account_col, func.sum(amount_col), func.max(entries.c.id)) \
+        .outerjoin(snapshot, (snapshot.c.account_type == kind) & (snapshot.c.account_id == account_col)) \
+        .filter(entries.c.id > func.coalesce(snapshot.c.last_entry_id, 0))
+    if upto_id is not None:
+        query = query.filter(entries.c.id <= upto_id)
+    if account_id is not None:
+        query = query.filter(account_col == account_id)
+    return {account: (total or 0, last_id) for account, total, last_id in query.group_by(account_col)}
+
+
+def rollup(kind=None, now=None):
+    """Fold settled ledger entries into the per-account snapshots; returns accounts updated."""
+    lag = current_app.config.get('LEDGER_ROLLUP_LAG', 300)
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=lag)
+    snapshot = LedgerSnapshot.__table__
+    updated = 0
+    for name in ([kind] if kind else LEDGERS):
+        ledger = LEDGERS[name]
+        entries = ledger.entries.__table__
+        upto_id = db.session.query(func.max(entries.c.id)).filter(entries.c.created_at <= cutoff).scalar()
+        if upto_id is None:
+            continue
+        pending = _pending_totals(ledger, name, upto_id=upto_id)
+        existing = {account_id: last_id for account_id, last_id in db.session.query(
+            snapshot.c.account_id, snapshot.c.last_entry_id).filter(
+            snapshot.c.account_type == name, snapshot.c.account_id.in_(list(pending)))} if pending else {}
+        stamp = datetime.utcnow()
+        for account_id, (total, last_id) in pending.items():
+            if account_id in existing:
+                # Guarded on last_entry_id so two overlapping rollups cannot both add
+                db.session.execute(snapshot.update().where(snapshot.c.account_type == name)
+                                   .where(snapshot.c.account_id == account_id)
+                                   .where(snapshot.c.last_entry_id == existing[account_id])
+                                   .values(balance=snapshot.c.balance + total, last_entry_id=last_id,
+                                           updated_at=stamp))
+            else:
+                db.session.execute(snapshot.insert().values(account_type=name, account_id=account_id,
+                                                            balance=total, last_entry_id=last_id,
+                                                            updated_at=stamp))
+            updated += 1
+        db.session.commit()
+    return updated
+
+
+def ledger_balance(kind, account_id):
+    """Balance recomputed from the ledger: the snapshot plus the entries posted since."""
+    ledger = LEDGERS[kind]
+    base = db.session.query(LedgerSnapshot.balance) \
+        .filter_by(account_type=kind, account_id=account_id).scalar() or 0
+    pending = _pending_totals(ledger, kind, account_id=account_id).get(account_id, (0, None))[0]
+    return base + pending
+
+
+def reconcile(kind, fix=False, tolerance=0.005):
+    """Accounts whose cached balance differs from the ledger; ``fix`` rewrites the cache.
+
+    Returns ``[{"account_id", "cached", "ledger"}]``.
+    """
+    ledger = LEDGERS[kind]
+    account = ledger.account.__table__
+    snapshots = dict(db.session.query(LedgerSnapshot.account_id, LedgerSnapshot.balance)
+                     .filter_by(account_type=kind))
+    pending = _pending_totals(ledger, kind)
+    drift = []
+    for account_id, cached in db.session.query(account.c.id, account.c[ledger.balance]).order_by(account.c.id):
+        expected = snapshots.get(account_id, 0) + pending.get(account_id, (0, None))[0]
+        if abs((cached or 0) - expected) > tolerance:
+            drift.append({"account_id": account_id, "cached": cached, "ledger": expected})
+    if fix and drift:
+        for row in drift:
+            # Relative to the value we read, so a concurrent posting is kept
+            db.session.execute(account.update().where(account.c.id == row["account_id"])
+                               .values(**{ledger.balance: account.c[ledger.balance]
+                                          + (row["ledger"] - (row["cached"] or 0))}))
+        db.session.commit()
+    return drift
@@ -0,0 +1,150 @@
+"""Loyalty tiers from the points a card earned over a rolling window.
+
+``LoyaltyCard.window_points`` holds the points earned in the last
+``LOYALTY_TIER_WINDOW_DAYS`` days and the tier follows from it through
+``LOYALTY_TIER_THRESHOLDS``. Both are maintained incrementally, never by summing a
+card's history:
+
+* when points are earned, ``evaluate`` re-derives the tier inside the same transaction
+  with a single ``UPDATE ... SET tier = CASE ...`` on the already locked card row;
+* once a day ``expire`` subtracts the points that slid out of the window since its last
+  run. That is one grouped query over a day's worth of ``LoyaltyPoints`` (by
+  ``created_at``) and a batched ``UPDATE`` of only the cards concerned, so its cost
+  follows the day's activity rather than the number of cards. The window edge it has
+  reached is kept in a ``BatchWatermark`` row, advanced in the same transaction.
+
+``rebuild`` recomputes every card from the window in one aggregate and creates the
+watermark. It only runs from ``flask loyalty-tiers --rebuild``: once after deploying, and
+again after changing the window length or the thresholds. Until the watermark exists,
+``expire`` does nothing but log a warning.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, case, func
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models import LoyaltyCard, LoyaltyPoints, BatchWatermark
+
+WATERMARK = 'loyalty_tier_window'
+DEFAULT_THRESHOLDS = {'silver': 500, 'gold': 2000, 'platinum': 5000}
+BASE_TIER = 'standard'
+
+logger = logging.getLogger(__name__)
+
+
+def thresholds():
+    """``[(points, tier)]`` from the highest threshold down."""
+    configured = current_app.config.get('LOYALTY_TIER_THRESHOLDS') or DEFAULT_THRESHOLDS
+    return sorted(((points, tier) for tier, points in configured.items()), reverse=True)
+
+
+def tier_for(points):
+    for threshold, tier in thresholds():
+        if (points or 0) >= threshold:
+            return tier
+    return BASE_TIER
+
+
+def tier_case(points_expr):
+    """SQL expression mapping ``points_expr`` to a tier name."""
+    return case(*((points_expr >= threshold, tier) for threshold, tier in thresholds()), else_=BASE_TIER)
+
+
+def window_start(now=None):
+    days = current_app.config.get('LOYALTY_TIER_WINDOW_DAYS', 365)
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+
+def _earned():
+    """Ledger entries that count towards tiers: earned points, not redemptions or refunds."""
+    return (LoyaltyPoints.points > 0, LoyaltyPoints.earn_method != 'redemption')
+
+
+def evaluate(card_id):
+    """Bring ``card_id``'s tier in line with its window points; returns True if it changed."""
+    cards = LoyaltyCard.__table__
+    tier = tier_case(func.coalesce(cards.c.window_points, 0))
+    changed = db.session.execute(cards.update().where(cards.c.id == card_id)
+                                 .where(func.coalesce(cards.c.tier, '') != tier).values(tier=tier)).rowcount
+    instance = db.session.identity_map.get(identity_key(LoyaltyCard, card_id))
+    if changed and instance is not None:
+        db.session.expire(instance, ['tier'])
+    return bool(changed)
+
+
+def expire(now=None, batch_size=5000):
+    """Drop points that left the window since the last run and re-tier those cards.
+
+    Returns the number of cards updated. Commits. Does nothing until ``rebuild`` has
+    created the watermark.
+    """
+    start = window_start(now)
+    mark = db.session.get(BatchWatermark, WATERMARK)
+    if mark is None:
+        logger.warning("No loyalty tier watermark yet; run 'flask loyalty-tiers --rebuild' off-peak")
+        return 0
+    if start <= mark.position:
+        return 0
+
+    expired = db.session.query(LoyaltyPoints.loyalty_card_id, func.sum(LoyaltyPoints.points)) \
+        .filter(*_earned()) \
+        .filter(LoyaltyPoints.created_at >= mark.position, LoyaltyPoints.created_at < start) \
+        .group_by(LoyaltyPoints.loyalty_card_id).all()
+
+    cards = LoyaltyCard.__table__
+    # SQLite spells GREATEST as the two-argument max()
+    greatest = func.max if db.engine.dialect.name == 'sqlite' else func.greatest
+    remaining = greatest(func.coalesce(cards.c.window_points, 0) - bindparam('expired'), 0)
+    stmt = cards.update().where(cards.c.id == bindparam('card_id')) \
+        .values(window_points=remaining, tier=tier_case(remaining))
+    rows = [{'card_id': card_id, 'expired': points} for card_id, points in expired]
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(stmt, rows[offset:offset + batch_size])
+
+    # Another worker that advanced the watermark first has already applied this slice
+    watermarks = BatchWatermark.__table__
+    advanced = db.session.execute(watermarks.update()
+                                  .where(watermarks.c.name == WATERMARK)
+                                  .where(watermarks.c.position == mark.position)
+                                  .values(position=start, updated_at=datetime.utcnow())).rowcount
+    if not advanced:
+        db.session.rollback()
+        return 0
+    db.session.commit()
+    return len(rows)
+
+
+def rebuild(now=None, batch_size=5000):
+    """Recompute window points and tiers for every card; returns the number of cards.
+
+    Writes absolute values, so points earned while it runs can be missed until the next
+    rebuild; run it off-peak.
+    """
+    start = window_start(now)
+    earned = dict(db.session.query(LoyaltyPoints.loyalty_card_id, func.sum(LoyaltyPoints.points))
+                  .filter(*_earned(), LoyaltyPoints.created_at >= start)
+                  .group_by(LoyaltyPoints.loyalty_card_id).all())
+
+    cards = LoyaltyCard.__table__
+    stmt = cards.update().where(cards.c.id == bindparam('card_id')) \
+        .values(window_points=bindparam('points'), tier=bindparam('card_tier'))
+    count, last_id = 0, 0
+    while True:
+        ids = [card_id for (card_id,) in db.session.query(cards.c.id).filter(cards.c.id > last_id)
+               .order_by(cards.c.id).limit(batch_size)]
+        if not ids:
+            break
+        db.session.execute(stmt, [{'card_id': card_id, 'points': earned.get(card_id, 0),
+                                   'card_tier': tier_for(earned.get(card_id, 0))} for card_id in ids])
+        count, last_id = count + len(ids), ids[-1]
+
+    mark = db.session.get(BatchWatermark, WATERMARK)
+    if mark is None:
+        db.session.add(BatchWatermark(name=WATERMARK, position=start))
+    else:
+        mark.position = start
+    db.session.commit()
+    return count
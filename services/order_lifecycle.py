@@ -0,0 +1,192 @@
+"""Order states, the transitions between them, and kitchen prep-time statistics.
+
+``TRANSITIONS`` lists the states an order may move to from each state; ``completed``
+and ``cancelled`` are final. Entering ``cooking``, ``ready``, ``served``, ``completed``
+or ``cancelled`` stamps the matching ``Order.<state>_at`` column (a re-fire overwrites
+it), so prep times come straight from the order row.
+
+``transition`` moves any number of orders to one state with a single ``UPDATE ... WHERE
+id IN (...) AND status IN (<allowed sources>)``: the status guard makes a concurrent
+change win cleanly instead of being overwritten, and orders that cannot make the move
+are reported back rather than failing the batch. One ``order_status`` event per call
+goes to the ``kds`` stream, listing every order that moved. Orders that become ready
+also leave their prep-time samples for ``services/kitchen_analytics.py``.
+
+``rollup`` folds ready orders into one ``PrepTimeStat`` row per hour (sums and counts,
+so hours add up to days). Housekeeping runs it hourly over the last
+``PREP_TIME_ROLLUP_HOURS``, which also picks up orders served after their hour was
+first rolled up.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models import Order, PrepTimeStat
+from services import kitchen_analytics
+from services.events import publish
+
+TRANSITIONS = {
+    'pending': ('cooking', 'ready', 'hold', 'completed', 'cancelled'),
+    'cooking': ('ready', 'hold', 'completed', 'cancelled'),
+    'ready': ('cooking', 'served', 'completed', 'cancelled'),
+    'served': ('completed',),
+    'hold': ('pending', 'cooking', 'completed', 'cancelled'),
+    'completed': (),
+    'cancelled': (),
+}
+STATES = tuple(TRANSITIONS)
+STAMPED = ('cooking', 'ready', 'served', 'completed', 'cancelled')
+
+
+class InvalidTransition(ValueError):
+    """An order that cannot move from its current state to the requested one."""
+
+
+def sources(status):
+    """States an order may be in to move to ``status``."""
+    if status not in TRANSITIONS:
+        raise ValueError(f"Invalid status. Must be one of {list(STATES)}")
+    return [state for state, targets in TRANSITIONS.items() if status in targets]
+
+
+def transition(order_ids, status, user_id=None, now=None):
+    """Move ``order_ids`` to ``status`` in one statement; returns ``(moved, rejected)``.
+
+    ``moved`` is ``[{"order_id", "from"}]``, ``rejected`` is ``[{"order_id", "status",
+    "error"}]`` for unknown orders and those whose state does not allow the move.
+    Nothing is committed; the event is published with the caller's transaction.
+    """
+    allowed = sources(status)
+    now = now or datetime.utcnow()
+    order_ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))
+    if not order_ids:
+        return [], []
+    orders = Order.__table__
+    current = dict(db.session.query(orders.c.id, orders.c.status).filter(orders.c.id.in_(order_ids)))
+
+    candidates = [order_id for order_id in order_ids if current.get(order_id) in allowed]
+    values = {'status': status}
+    if status in STAMPED:
+        values[f'{status}_at'] = now
+    if candidates:
+        updated = db.session.execute(orders.update().where(
+            orders.c.id.in_(candidates), orders.c.status.in_(allowed)).values(**values)).rowcount
+        if updated != len(candidates):
+            # Some changed state since they were read; see where they ended up
+            current.update(db.session.query(orders.c.id, orders.c.status).filter(orders.c.id.in_(candidates)))
+            lost = {order_id for order_id in candidates if current[order_id] != status}
+            candidates = [order_id for order_id in candidates if order_id not in lost]
+
+    moved, rejected = [], []
+    for order_id in order_ids:
+        if order_id in candidates:
+            moved.append({"order_id": order_id, "from": current[order_id]})
+        elif order_id not in current:
+            rejected.append({"order_id": order_id, "status": None, "error": "Order not found"})
+        else:
+            rejected.append({"order_id": order_id, "status": current[order_id],
+                             "error": f"Cannot move a {current[order_id]} order to {status}"})
+
+    for order_id in candidates:
+        instance = db.session.identity_map.get(identity_key(Order, order_id))
+        if instance is not None:
+            db.session.expire(instance, list(values))
+    if moved and status == 'ready':
+        kitchen_analytics.record_ready(candidates, now)
+    if moved:
+        publish('kds', 'order_status', {
+            "status": status,
+            "changed_at": now.isoformat(),
+            "user_id": user_id,
+            "orders": moved,
+        }, commit=False)
+    return moved, rejected
+
+
+def transition_one(order_id, status, user_id=None, now=None):
+    """``transition`` for a single order; raises ``LookupError`` / ``InvalidTransition``."""
+    moved, rejected = transition([order_id], status, user_id, now)
+    if rejected:
+        if rejected[0]["status"] is None:
+            raise LookupError(rejected[0]["error"])
+        raise InvalidTransition(rejected[0]["error"])
+    return moved[0]
+
+
+# ----------------------------------------------------------------------------------
+# Prep-time statistics
+# ----------------------------------------------------------------------------------
+def _hour(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup(now=None, hours=None):
+    """Recompute the ``PrepTimeStat`` rows of the last ``hours``; returns the rows written."""
+    now = now or datetime.utcnow()
+    hours = hours or current_app.config.get('PREP_TIME_ROLLUP_HOURS', 24)
+    start, end = _hour(now) - timedelta(hours=hours - 1), _hour(now) + timedelta(hours=1)
+    buckets = defaultdict(lambda: {"orders": 0, "prep_seconds": 0.0, "max_prep_seconds": 0.0, "queued": 0,
+                                   "queue_seconds": 0.0, "served": 0, "pass_seconds": 0.0})
+    for created_at, cooking_at, ready_at, served_at in db.session.query(
+            Order.created_at, Order.cooking_at, Order.ready_at, Order.served_at) \
+            .filter(Order.ready_at >= start, Order.ready_at < end):
+        stat = buckets[_hour(ready_at)]
+        started = cooking_at if cooking_at and cooking_at <= ready_at else created_at
+        prep = max(0.0, (ready_at - started).total_seconds()) if started else 0.0
+        stat["orders"] += 1
+        stat["prep_seconds"] += prep
+        stat["max_prep_seconds"] = max(stat["max_prep_seconds"], prep)
+        if cooking_at and created_at:
+            stat["queued"] += 1
+            stat["queue_seconds"] += max(0.0, (cooking_at - created_at).total_seconds())
+        if served_at and served_at >= ready_at:
+            stat["served"] += 1
+            stat["pass_seconds"] += (served_at - ready_at).total_seconds()
+
+    table = PrepTimeStat.__table__
+    rows = [dict(stat, bucket=bucket, updated_at=now) for bucket, stat in sorted(buckets.items())]
+    for attempt in range(3):
+        try:
+            db.session.execute(table.delete().where(table.c.bucket >= start, table.c.bucket < end))
+            if rows:
+                db.session.execute(table.insert(), rows)
+            db.session.commit()
+            return len(rows)
+        except IntegrityError:
+            # Another writer (e.g. a manual --rollup) inserted the same hours after our delete;
+            # its rows are committed now, so deleting again replaces them
+            db.session.rollback()
+            if attempt == 2:
+                raise
+
+
+def prep_times(start, end, group='day'):
+    """Prep-time summary per hour or day for buckets in ``[start, end)``."""
+    if group not in ('hour', 'day'):
+        raise ValueError("group must be hour or day")
+    totals = {}
+    for stat in PrepTimeStat.query.filter(PrepTimeStat.bucket >= start, PrepTimeStat.bucket < end) \
+            .order_by(PrepTimeStat.bucket):
+        key = stat.bucket if group == 'hour' else datetime.combine(stat.bucket.date(), datetime.min.time())
+        row = totals.setdefault(key, {"orders": 0, "prep_seconds": 0.0, "max_prep_seconds": 0.0, "queued": 0,
+                                      "queue_seconds": 0.0, "served": 0, "pass_seconds": 0.0})
+        for column in ("orders", "prep_seconds", "queued", "queue_seconds", "served", "pass_seconds"):
+            row[column] += getattr(stat, column)
+        row["max_prep_seconds"] = max(row["max_prep_seconds"], stat.max_prep_seconds)
+
+    def average(total, count):
+        return round(total / count, 1) if count else None
+
+    return [{
+        "period": key.isoformat(),
+        "orders": row["orders"],
+        "avg_prep_seconds": average(row["prep_seconds"], row["orders"]),
+        "max_prep_seconds": round(row["max_prep_seconds"], 1),
+        "avg_queue_seconds": average(row["queue_seconds"], row["queued"]),
+        "served": row["served"],
+        "avg_pass_seconds": average(row["pass_seconds"], row["served"]),
+    } for key, row in totals.items()]
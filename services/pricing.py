@@ -0,0 +1,139 @@
+"""Price list resolution from an in-memory per-restaurant index.
+
+A restaurant's products, variants, price lists and price list items are loaded in four
+queries into a ``PriceIndex`` of plain dicts, so pricing a basket of any size is
+dictionary lookups. Resolution for one line:
+
+* with ``pricelist_id``, that list's price if the list is valid at ``at`` (an unknown or
+  inactive list is a ``PricingError``, not a silent fall back to the base price);
+* with ``pricelist_type`` (dine_in, takeaway, ...), the first list of that type valid at
+  ``at`` that prices the product, the most recently started validity window first, so a
+  seasonal list overrides the standing one;
+* otherwise, or when no list prices the product, ``Product.base_price``;
+* a variant's ``price_adjustment`` is added on top.
+
+Indexes are kept in an LRU of ``PRICING_CACHE_SIZE`` restaurants. Committed edits to
+price lists, their items, products or variants through the ORM drop the affected
+restaurant's index in this process; other worker processes reload theirs after
+``PRICING_CACHE_TTL`` seconds. Indexes are loaded outside the caller's transaction, so
+only committed prices are ever cached.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import inspect
+
+from models import Product, ProductVariant, PriceList, PriceListItem
+from services.index_cache import IndexCache
+
+ProductPrice = namedtuple('ProductPrice', 'name base_price')
+VariantPrice = namedtuple('VariantPrice', 'product_id price_adjustment')
+ListPrices = namedtuple('ListPrices', 'id pricelist_type valid_from valid_until active prices')
+
+
+class PricingError(ValueError):
+    """A basket line that cannot be priced (unknown product, variant or price list)."""
+
+
+class PriceIndex:
+
+    def __init__(self, restaurant_id, session):
+        self.restaurant_id = restaurant_id
+        self.loaded_at = time.monotonic()
+        self.products = {row.id: ProductPrice(row.name, row.base_price) for row in
+                         session.query(Product.id, Product.name, Product.base_price)
+                         .filter(Product.restaurant_id == restaurant_id)}
+        self.variants = {row.id: VariantPrice(row.product_id, row.price_adjustment or 0.0) for row in
+                         session.query(ProductVariant.id, ProductVariant.product_id,
+                                          ProductVariant.price_adjustment)
+                         .join(Product, Product.id == ProductVariant.product_id)
+                         .filter(Product.restaurant_id == restaurant_id)}
+        self.lists = {row.id: ListPrices(row.id, row.pricelist_type, row.valid_from, row.valid_until,
+                                         row.active, {})
+                      for row in session.query(PriceList.id, PriceList.pricelist_type, PriceList.valid_from,
+                                                  PriceList.valid_until, PriceList.active)
+                      .filter(PriceList.restaurant_id == restaurant_id)}
+        for pricelist_id, product_id, price in session.query(
+                PriceListItem.pricelist_id, PriceListItem.product_id, PriceListItem.price) \
+                .join(PriceList, PriceList.id == PriceListItem.pricelist_id) \
+                .filter(PriceList.restaurant_id == restaurant_id):
+            self.lists[pricelist_id].prices[product_id] = price
+        self.by_type = {}
+        for pricelist in sorted(self.lists.values(),
+                                key=lambda p: (p.valid_from or datetime.min, p.id), reverse=True):
+            self.by_type.setdefault(pricelist.pricelist_type, []).append(pricelist)
+
+    @staticmethod
+    def is_valid(pricelist, at):
+        return (pricelist.active is not False
+                and (pricelist.valid_from is None or pricelist.valid_from <= at)
+                and (pricelist.valid_until is None or at < pricelist.valid_until))
+
+    def resolve(self, product_id, variant_id=None, pricelist_id=None, pricelist_type=None, at=None):
+        """Return ``(unit_price, pricelist_id or None)`` for one product/variant."""
+        product = self.products.get(product_id)
+        if product is None:
+            raise PricingError(f"Unknown product {product_id}")
+        adjustment = 0.0
+        if variant_id is not None:
+            variant = self.variants.get(variant_id)
+            if variant is None or variant.product_id != product_id:
+                raise PricingError(f"Unknown variant {variant_id} for product {product_id}")
+            adjustment = variant.price_adjustment
+
+        at = at or datetime.utcnow()
+        if pricelist_id is not None:
+            pricelist = self.lists.get(pricelist_id)
+            if pricelist is None or pricelist.active is False:
+                raise PricingError(f"Unknown or inactive price list {pricelist_id}")
+            candidates = [pricelist]
+        else:
+            candidates = self.by_type.get(pricelist_type, ()) if pricelist_type else ()
+        for pricelist in candidates:
+            if product_id in pricelist.prices and self.is_valid(pricelist, at):
+                return round(pricelist.prices[product_id] + adjustment, 2), pricelist.id
+        return round(product.base_price + adjustment, 2), None
+
+
+def _restaurant_of(obj):
+    """Restaurant whose index ``obj`` belongs to; None when it cannot be told cheaply."""
+    if isinstance(obj, (Product, PriceList)):
+        return obj.restaurant_id
+    # Read already-loaded parents only: no lazy loads inside the flush
+    parent = inspect(obj).attrs.pricelist.loaded_value if isinstance(obj, PriceListItem) else None
+    if parent is not None and hasattr(parent, 'restaurant_id'):
+        return parent.restaurant_id
+    return None
+
+
+_cache = IndexCache(PriceIndex, (Product, ProductVariant, PriceList, PriceListItem), _restaurant_of,
+                    'PRICING_CACHE_TTL', 'PRICING_CACHE_SIZE')
+get_index = _cache.get
+invalidate = _cache.invalidate
+
+
+def unit_price(restaurant_id, product_id, variant_id=None, pricelist_id=None, pricelist_type=None, at=None):
+    return get_index(restaurant_id).resolve(product_id, variant_id, pricelist_id, pricelist_type, at)[0]
+
+
+def price_basket(restaurant_id, items, pricelist_id=None, pricelist_type=None, at=None):
+    """Price every line of ``items`` (``product_id``, optional ``variant_id``, ``quantity``).
+
+    Returns ``{"lines": [...], "total": float}``; raises ``PricingError`` for a line that
+    cannot be priced.
+    """
+    index = get_index(restaurant_id)
+    at = at or datetime.utcnow()
+    lines, total = [], 0.0
+    for item in items:
+        product_id = int(item["product_id"])
+        variant_id = int(item["variant_id"]) if item.get("variant_id") is not None else None
+        quantity = float(item.get("quantity", 1))
+        price, applied = index.resolve(product_id, variant_id, pricelist_id, pricelist_type, at)
+        line_total = round(price * quantity, 2)
+        total += line_total
+        lines.append({"product_id": product_id, "variant_id": variant_id, "name": index.products[product_id].name,
+                      "quantity": quantity, "unit_price": price, "pricelist_id": applied,
+                      "line_total": line_total})
+    return {"lines": lines, "total": round(total, 2)}
@@ -0,0 +1,277 @@
+"""Kitchen ticket routing and background print spooling.
+
+``spool_order_tickets`` splits an order's lines across the restaurant's kitchen/bar
+printers (``PrinterRoute`` maps product categories to printers; unrouted lines go to
+the first active ``kitchen`` printer), renders one ESC/POS ticket per printer and
+stores it as a ``PrintJob``. Delivery happens on the spooler's worker threads, so the
+request that created the order never waits on a printer.
+
+Workers retry failed deliveries with exponential backoff (``PRINT_RETRY_BACKOFF`` *
+2**attempt) up to ``PRINT_MAX_ATTEMPTS`` and never send more than
+``PRINTER_MAX_CONCURRENT_JOBS`` jobs to the same printer at once; a job for a busy
+printer waits until one of that printer's deliveries finishes. Jobs live in the
+database, and every spooler re-scans it every ``PRINT_RECOVERY_INTERVAL`` seconds, so
+jobs orphaned by a worker process that died are picked up by the ones still running.
+
+Every web worker runs its own spooler, so a job is delivered only by the worker that
+claims it: ``UPDATE ... SET status='printing' WHERE id=:id AND status='queued'`` with
+the retry time reached, checked by rowcount. The claim stamps ``next_attempt_at`` with a
+``PRINT_CLAIM_TIMEOUT`` lease; recovery re-queues only ``printing`` jobs whose lease has
+lapsed, and queued jobs keep their backoff however many spoolers pick them up.
+"""
+import heapq
+import logging
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from extensions import db
+from models import KitchenPrinter, PrinterRoute, PrintJob
+from services.escpos import render_kitchen_ticket
+
+logger = logging.getLogger(__name__)
+
+
+def deliver(printer, payload, timeout):
+    """Send ``payload`` to a network (raw TCP) or locally attached printer."""
+    if printer.ip_address:
+        with socket.create_connection((printer.ip_address, printer.port or 9100), timeout=timeout) as conn:
+            conn.sendall(payload)
+    elif printer.device_name:
+        with open(printer.device_name, 'wb') as device:
+            device.write(payload)
+    else:
+        raise OSError(f"Printer {printer.id} has no address or device configured")
+
+
+class PrintSpooler:
+    """Flask extension owning the delivery queue and worker threads."""
+
+    def __init__(self, app=None):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._queued = set()
+        self._inflight = 0
+        self._threads = []
+        self._slots = {}
+        self._parked = {}  # printer id -> jobs waiting for one of its slots
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('PRINT_SPOOLER_WORKERS', 2)
+        self.max_per_printer = app.config.get('PRINTER_MAX_CONCURRENT_JOBS', 1)
+        self.max_attempts = app.config.get('PRINT_MAX_ATTEMPTS', 5)
+        self.retry_backoff = app.config.get('PRINT_RETRY_BACKOFF', 2.0)
+        self.timeout = app.config.get('PRINTER_TIMEOUT', 5.0)
+        self.claim_timeout = app.config.get('PRINT_CLAIM_TIMEOUT', 60)
+        self.recovery_interval = app.config.get('PRINT_RECOVERY_INTERVAL', 30)
+        app.extensions['print_spooler'] = self
+
+    # -- queue -----------------------------------------------------------------------
+    def submit(self, job_ids, delay=0.0):
+        """Queue jobs for delivery after ``delay`` seconds; starts the workers on first use."""
+        self._ensure_started()
+        ready_at = time.monotonic() + delay
+        with self._cond:
+            for job_id in job_ids:
+                if job_id not in self._queued:
+                    self._queued.add(job_id)
+                    heapq.heappush(self._heap, (ready_at, job_id))
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout=10.0):
+        """Block until no job is queued or being delivered; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._inflight or any(self._parked.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap) + self._inflight + sum(len(jobs) for jobs in self._parked.values())
+
+    def start(self):
+        """Start the workers and the periodic recovery scan (idempotent)."""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(max(1, self.workers)):
+                thread = threading.Thread(target=self._worker, daemon=True, name=f'print-spooler-{i}')
+                self._threads.append(thread)
+                thread.start()
+            thread = threading.Thread(target=self._recovery_loop, daemon=True, name='print-spooler-recovery')
+            self._threads.append(thread)
+            thread.start()
+
+    def _recovery_loop(self):
+        while True:
+            self._recover()
+            time.sleep(self.recovery_interval)
+
+    def _recover(self):
+        # Jobs left queued by any process, and printing ones whose claim has lapsed
+        jobs = PrintJob.__table__
+        now = datetime.utcnow()
+        try:
+            with self.app.app_context():
+                db.session.execute(jobs.update().where(
+                    jobs.c.status == 'printing',
+                    or_(jobs.c.next_attempt_at.is_(None), jobs.c.next_attempt_at < now)).values(status='queued'))
+                pending = db.session.query(PrintJob.id, PrintJob.next_attempt_at) \
+                    .filter(PrintJob.status == 'queued').all()
+                db.session.commit()
+        except Exception:
+            logger.exception("Could not recover pending print jobs")
+            return
+        for job_id, next_attempt_at in pending:
+            self.submit([job_id], delay=max(0.0, (next_attempt_at - now).total_seconds()) if next_attempt_at else 0.0)
+
+    def _claim(self, job_id):
+        """Mark a due, queued job as printing by this worker; False if it is not ours to send."""
+        jobs = PrintJob.__table__
+        now = datetime.utcnow()
+        claimed = db.session.execute(jobs.update().where(
+            jobs.c.id == job_id, jobs.c.status == 'queued',
+            or_(jobs.c.next_attempt_at.is_(None), jobs.c.next_attempt_at <= now)).values(
+            status='printing', attempts=db.func.coalesce(jobs.c.attempts, 0) + 1,
+            next_attempt_at=now + timedelta(seconds=self.claim_timeout))).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _slot(self, printer_id):
+        with self._cond:
+            slot = self._slots.get(printer_id)
+            if slot is None:
+                slot = self._slots[printer_id] = threading.BoundedSemaphore(max(1, self.max_per_printer))
+            return slot
+
+    def _acquire_or_park(self, printer_id, slot, job_id):
+        """Take a slot on the printer, or hold ``job_id`` until one of its deliveries finishes."""
+        with self._cond:
+            if slot.acquire(blocking=False):
+                return True
+            parked = self._parked.setdefault(printer_id, [])
+            if job_id not in parked:
+                parked.append(job_id)
+            return False
+
+    def _release(self, printer_id, slot):
+        # Every waiting job gets another go; those that find the printer busy again re-park
+        with self._cond:
+            slot.release()
+            parked = self._parked.pop(printer_id, None)
+        if parked:
+            self.submit(parked)
+
+    # -- workers ---------------------------------------------------------------------
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, job_id = heapq.heappop(self._heap)
+                self._queued.discard(job_id)
+                self._inflight += 1
+            try:
+                retry_in = self._process(job_id)
+                if retry_in is not None:
+                    self.submit([job_id], delay=retry_in)
+            except Exception:
+                logger.exception("Print job %s crashed the spooler worker", job_id)
+            finally:
+                with self._cond:
+                    self._inflight -= 1
+                    self._cond.notify_all()
+
+    def _process(self, job_id):
+        """Deliver one job; returns a delay in seconds if it should be retried."""
+        with self.app.app_context():
+            job = db.session.get(PrintJob, job_id)
+            if job is None or job.status != 'queued':
+                return None  # done, or being delivered by another worker
+            if job.next_attempt_at and job.next_attempt_at > datetime.utcnow():
+                return (job.next_attempt_at - datetime.utcnow()).total_seconds()
+            printer = job.printer
+            slot = self._slot(printer.id)
+            if not self._acquire_or_park(printer.id, slot, job_id):
+                return None  # resubmitted when the printer frees up
+            try:
+                if not self._claim(job_id):
+                    return None
+                db.session.refresh(job)
+                try:
+                    deliver(printer, job.payload, self.timeout)
+                except OSError as e:
+                    job.last_error = str(e)[:255]
+                    if job.attempts >= self.max_attempts or not printer.active:
+                        job.status = 'failed'
+                        job.next_attempt_at = None
+                        logger.warning("Print job %s to %s failed: %s", job.id, printer.name, e)
+                        db.session.commit()
+                        return None
+                    retry_in = self.retry_backoff * 2 ** (job.attempts - 1)
+                    job.status = 'queued'
+                    job.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_in)
+                    db.session.commit()
+                    return retry_in
+                job.status = 'printed'
+                job.printed_at = datetime.utcnow()
+                job.last_error = None
+                job.next_attempt_at = None
+                db.session.commit()
+                return None
+            finally:
+                self._release(printer.id, slot)
+
+
+def route_lines(restaurant_id, lines):
+    """Group ticket lines by destination printer: ``[(printer, [lines]), ...]``."""
+    printers = KitchenPrinter.query.filter_by(restaurant_id=restaurant_id, active=True) \
+        .order_by(KitchenPrinter.id).all()
+    if not printers:
+        return []
+    by_id = {p.id: p for p in printers}
+    routes = {}
+    for route in PrinterRoute.query.filter_by(restaurant_id=restaurant_id):
+        if route.printer_id in by_id:
+            routes.setdefault(route.category_id, []).append(by_id[route.printer_id])
+    default = next((p for p in printers if p.printer_type == 'kitchen'), printers[0])
+
+    grouped = {}
+    for line in lines:
+        for printer in routes.get(line.get('category_id')) or [default]:
+            grouped.setdefault(printer.id, (printer, []))[1].append(line)
+    return list(grouped.values())
+
+
+def spool_order_tickets(order, lines, restaurant_id, spooler):
+    """Render and queue kitchen tickets for ``order``; returns the created PrintJob ids.
+
+    ``lines`` are dicts with ``name``, ``quantity``, optional ``category_id`` and ``notes``.
+    """
+    if not restaurant_id or not lines:
+        return []
+    jobs = []
+    for printer, printer_lines in route_lines(restaurant_id, lines):
+        payload = render_kitchen_ticket(printer.name, order.id, printer_lines, created_at=order.created_at)
+        job = PrintJob(printer_id=printer.id, order_id=order.id, job_type='kitchen_ticket', payload=payload)
+        db.session.add(job)
+        jobs.append(job)
+    if not jobs:
+        return []
+    db.session.commit()
+    ids = [job.id for job in jobs]
+    spooler.submit(ids)
+    return ids
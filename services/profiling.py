@@ -0,0 +1,273 @@
+"""Opt-in request profiling middleware.
+
+Records per-route wall time, SQL statement count and SQL time (via SQLAlchemy engine
+events) for every request. Aggregates are kept as fixed-bucket histograms so memory
+stays constant regardless of traffic, and can be exported as JSON or in Prometheus
+text format.
+
+With ``PROFILING_TRACE_ALLOCATIONS`` tracemalloc runs for the whole process and its
+current and peak traced memory are exported as process-level figures. They are not
+split per route: tracemalloc's counters are process-global, so under threaded workers a
+per-request peak would include whatever concurrent requests allocated.
+
+With ``PROFILING_SAMPLER`` enabled a background thread samples the stacks of in-flight
+request threads; requests slower than ``PROFILING_SLOW_THRESHOLD`` have their samples
+written to ``PROFILING_DUMP_DIR`` in collapsed-stack format (flamegraph.pl / speedscope).
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Fixed-bucket histogram; the last slot counts values above the highest bound."""
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs ending with ('+Inf', count)."""
+        out, running = [], 0
+        for bound, n in zip(self.bounds, self.counts):
+            running += n
+            out.append((bound, running))
+        out.append(('+Inf', self.count))
+        return out
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 6),
+            'avg': round(self.total / self.count, 6) if self.count else 0,
+            'buckets': {str(b): n for b, n in self.cumulative()},
+        }
+
+
+class RouteStats:
+    __slots__ = ('wall', 'sql_count', 'sql_time', 'errors')
+
+    def __init__(self):
+        self.wall = Histogram(DURATION_BUCKETS)
+        self.sql_count = Histogram(SQL_COUNT_BUCKETS)
+        self.sql_time = Histogram(DURATION_BUCKETS)
+        self.errors = 0
+
+
+class RequestProfiler:
+    """Flask extension collecting per-route request statistics."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._active_samples = {}
+        self._sampler = None
+        self.trace_allocations = False
+        self.sampling = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from extensions import db
+        app.extensions['request_profiler'] = self
+        self.trace_allocations = app.config.get('PROFILING_TRACE_ALLOCATIONS', False)
+        self.sampling = app.config.get('PROFILING_SAMPLER', False)
+        self.sample_interval = app.config.get('PROFILING_SAMPLE_INTERVAL', 0.005)
+        self.slow_threshold = app.config.get('PROFILING_SLOW_THRESHOLD', 0.5)
+        self.dump_dir = app.config.get('PROFILING_DUMP_DIR') or os.path.join(app.instance_path, 'profiles')
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # -- request hooks -------------------------------------------------------------
+    def _before_request(self):
+        g._profile = {'start': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0}
+        if self.sampling:
+            self._ensure_sampler()
+            with self._lock:
+                self._active_samples[threading.get_ident()] = Counter()
+
+    def _after_request(self, response):
+        prof = g.get('_profile')
+        if prof is not None:
+            prof['status'] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        # Runs for every request, including those that raised, unlike after_request
+        prof = g.pop('_profile', None)
+        if self.sampling:
+            with self._lock:
+                samples = self._active_samples.pop(threading.get_ident(), None)
+        if prof is None:
+            return
+        wall = time.perf_counter() - prof['start']
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        route = f"{request.method} {rule}"
+        error = exc is not None or prof.get('status', 500) >= 500
+        self.record(route, wall, prof['sql_count'], prof['sql_time'], error)
+        if self.sampling and samples and wall >= self.slow_threshold:
+            self._dump_stacks(route, wall, samples)
+
+    def record(self, route, wall, sql_count, sql_time, error=False):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            stats.wall.observe(wall)
+            stats.sql_count.observe(sql_count)
+            stats.sql_time.observe(sql_time)
+            if error:
+                stats.errors += 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+        if self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    # -- exports -----------------------------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            out = {}
+            for route, s in sorted(self._routes.items()):
+                entry = {
+                    'requests': s.wall.count,
+                    'errors': s.errors,
+                    'wall_seconds': s.wall.to_dict(),
+                    'sql_statements': s.sql_count.to_dict(),
+                    'sql_seconds': s.sql_time.to_dict(),
+                }
+                out[route] = entry
+            return out
+
+    def process_memory(self):
+        """Process-wide traced bytes now and at peak since start or the last reset; None when not tracing."""
+        if not (self.trace_allocations and tracemalloc.is_tracing()):
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        return {'traced_bytes': current, 'peak_bytes': peak}
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            routes = sorted(self._routes.items())
+            for name, attr, help_text in (
+                ('serveopos_request_duration_seconds', 'wall', 'Request wall time per route'),
+                ('serveopos_request_sql_statements', 'sql_count', 'SQL statements per request'),
+                ('serveopos_request_sql_seconds', 'sql_time', 'SQL time per request'),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for route, stats in routes:
+                    hist = getattr(stats, attr)
+                    label = _label(route)
+                    for bound, n in hist.cumulative():
+                        lines.append(f'{name}_bucket{{route="{label}",le="{bound}"}} {n}')
+                    lines.append(f'{name}_sum{{route="{label}"}} {hist.total:.6f}')
+                    lines.append(f'{name}_count{{route="{label}"}} {hist.count}')
+            lines.append("# HELP serveopos_request_errors_total Requests answered with a 5xx status")
+            lines.append("# TYPE serveopos_request_errors_total counter")
+            for route, stats in routes:
+                lines.append(f'serveopos_request_errors_total{{route="{_label(route)}"}} {stats.errors}')
+        memory = self.process_memory()
+        if memory is not None:
+            lines.append("# HELP serveopos_process_traced_bytes Bytes currently traced by tracemalloc in this process")
+            lines.append("# TYPE serveopos_process_traced_bytes gauge")
+            lines.append(f"serveopos_process_traced_bytes {memory['traced_bytes']}")
+            lines.append("# HELP serveopos_process_traced_peak_bytes Peak traced bytes in this process since the last reset")
+            lines.append("# TYPE serveopos_process_traced_peak_bytes gauge")
+            lines.append(f"serveopos_process_traced_peak_bytes {memory['peak_bytes']}")
+        return "\n".join(lines) + "\n"
+
+    # -- sampling profiler -------------------------------------------------------
+    def _ensure_sampler(self):
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, daemon=True, name='request-sampler')
+                self._sampler.start()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.sample_interval)
+            with self._lock:
+                active = dict(self._active_samples)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for tid, counter in active.items():
+                frame = frames.get(tid)
+                if frame is None or tid == own:
+                    continue
+                counter[_fold(frame)] += 1
+
+    def _dump_stacks(self, route, wall, samples):
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            safe = ''.join(c if c.isalnum() else '_' for c in route).strip('_')[:80]
+            name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{safe}-{int(wall * 1000)}ms.folded"
+            with open(os.path.join(self.dump_dir, name), 'w') as fh:
+                for stack, count in samples.most_common():
+                    fh.write(f"{stack} {count}\n")
+        except OSError:
+            pass
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('_profile_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    starts = conn.info.get('_profile_query_start')
+    prof = g.get('_profile')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if prof is not None:
+        prof['sql_count'] += 1
+        prof['sql_time'] += elapsed
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
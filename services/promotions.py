@@ -0,0 +1,175 @@
+"""Promotions: evaluates a restaurant's ``Discount`` rows against a priced basket.
+
+A restaurant's active discounts are compiled once into ``Rule`` tuples and indexed by
+what they can match:
+
+* product discounts by ``product_id``, and by ``(customer_id, product_id)`` when they are
+  customer-specific;
+* order discounts in an "everyone" list and by ``customer_id``.
+
+Evaluating a basket looks up only the rules of the products in it (and of its customer),
+so the cost per basket follows the basket size, not the number of promotions. Validity
+windows (``start_date``/``end_date``) and ``min_quantity`` are checked per candidate.
+
+Combination policy: each product gets its single best product discount (quantities of
+the same product across lines count together), and the best order discount applies on
+top of what is left. Every rule that matched is listed in the explanation, with why it
+was or was not applied.
+
+Indexes are kept in an ``IndexCache`` of ``PROMOTIONS_CACHE_SIZE`` restaurants for
+``PROMOTIONS_CACHE_TTL`` seconds; committed edits to ``Discount`` rows drop the
+restaurant's index.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from models import Discount
+from services.index_cache import IndexCache
+
+Rule = namedtuple('Rule', 'id name discount_type value applies_to product_id customer_id '
+                          'start_date end_date min_quantity')
+
+
+def compile_rule(row):
+    return Rule(row.id, row.name, row.discount_type, float(row.value or 0), row.applies_to or 'product',
+                row.product_id, row.customer_id, row.start_date, row.end_date, max(1, row.min_quantity or 1))
+
+
+class PromotionIndex:
+
+    def __init__(self, restaurant_id, session):
+        self.restaurant_id = restaurant_id
+        self.loaded_at = time.monotonic()
+        self.by_product, self.by_customer_product = {}, {}
+        self.order_rules, self.order_rules_by_customer = [], {}
+        rows = session.query(
+            Discount.id, Discount.name, Discount.discount_type, Discount.value, Discount.applies_to,
+            Discount.product_id, Discount.customer_id, Discount.start_date, Discount.end_date,
+            Discount.min_quantity
+        ).filter(Discount.restaurant_id == restaurant_id, Discount.active.isnot(False))
+        for rule in map(compile_rule, rows):
+            if rule.applies_to == 'order' or rule.product_id is None:
+                target = self.order_rules_by_customer.setdefault(rule.customer_id, []) \
+                    if rule.customer_id else self.order_rules
+            elif rule.customer_id:
+                target = self.by_customer_product.setdefault((rule.customer_id, rule.product_id), [])
+            else:
+                target = self.by_product.setdefault(rule.product_id, [])
+            target.append(rule)
+        self.size = sum(len(rules) for group in (self.by_product, self.by_customer_product,
+                                                  self.order_rules_by_customer) for rules in group.values()) \
+            + len(self.order_rules)
+
+    def product_rules(self, product_id, customer_id=None):
+        rules = self.by_product.get(product_id, [])
+        if customer_id:
+            rules = rules + self.by_customer_product.get((customer_id, product_id), [])
+        return rules
+
+    def basket_rules(self, customer_id=None):
+        if customer_id:
+            return self.order_rules + self.order_rules_by_customer.get(customer_id, [])
+        return self.order_rules
+
+
+_cache = IndexCache(PromotionIndex, (Discount,), lambda obj: obj.restaurant_id,
+                    'PROMOTIONS_CACHE_TTL', 'PROMOTIONS_CACHE_SIZE')
+get_index = _cache.get
+invalidate = _cache.invalidate
+
+
+def _in_window(rule, at):
+    return (rule.start_date is None or rule.start_date <= at) and (rule.end_date is None or at < rule.end_date)
+
+
+def _amount(rule, base, quantity):
+    """Saving from ``rule`` on ``base`` money for ``quantity`` units, never more than ``base``."""
+    if rule.discount_type == 'percentage':
+        saving = base * min(rule.value, 100.0) / 100.0
+    elif rule.applies_to == 'order' or rule.product_id is None:
+        saving = rule.value
+    else:
+        saving = rule.value * quantity  # fixed amount off each unit
+    return round(max(0.0, min(saving, base)), 2)
+
+
+def _check(rule, at, quantity, unit, entry):
+    """Eligibility of ``rule``; sets ``entry["reason"]`` and returns False when it does not apply."""
+    if not _in_window(rule, at):
+        entry["reason"] = "outside its validity window"
+    elif quantity < rule.min_quantity:
+        entry["reason"] = f"needs {rule.min_quantity} {unit}, basket has {quantity:g}"
+    else:
+        return True
+    return False
+
+
+def evaluate(restaurant_id, lines, customer_id=None, at=None):
+    """Best discounts for priced ``lines`` (``product_id``, ``quantity``, ``line_total``).
+
+    Returns ``{"subtotal", "discount", "total", "applied": [...], "considered": [...]}``
+    where ``considered`` explains every matching rule.
+    """
+    index = get_index(restaurant_id)
+    at = at or datetime.utcnow()
+    subtotal = round(sum(line["line_total"] for line in lines), 2)
+    item_count = sum(line["quantity"] for line in lines)
+
+    per_product = {}
+    for line in lines:
+        quantity, total = per_product.get(line["product_id"], (0, 0.0))
+        per_product[line["product_id"]] = (quantity + line["quantity"], total + line["line_total"])
+
+    considered = []
+    best_per_product = {}  # product_id -> (amount, entry)
+    for product_id, (quantity, total) in per_product.items():
+        for rule in index.product_rules(product_id, customer_id):
+            entry = {"discount_id": rule.id, "name": rule.name, "applies_to": "product", "product_id": product_id}
+            considered.append(entry)
+            if _check(rule, at, quantity, "units", entry):
+                entry["amount"] = _amount(rule, total, quantity)
+                if product_id not in best_per_product or entry["amount"] > best_per_product[product_id][0]:
+                    best_per_product[product_id] = (entry["amount"], entry)
+
+    order_entries = []
+    for rule in index.basket_rules(customer_id):
+        entry = {"discount_id": rule.id, "name": rule.name, "applies_to": "order"}
+        considered.append(entry)
+        if _check(rule, at, item_count, "items", entry):
+            order_entries.append((rule, entry))
+
+    # Best product discounts, then the best order discount on what is left. Taking the
+    # product discounts never lowers the total saving: an order discount alone on the full
+    # subtotal saves at most what it saves on the remainder plus the product discounts.
+    line_saving = round(sum(amount for amount, _ in best_per_product.values()), 2)
+    remaining = round(subtotal - line_saving, 2)
+    for rule, entry in order_entries:
+        entry["amount"] = _amount(rule, remaining, item_count)
+    best_order = max((entry for _, entry in order_entries), key=lambda entry: entry["amount"], default=None)
+    chosen = [entry for _, entry in best_per_product.values()] + ([best_order] if best_order else [])
+    chosen = [entry for entry in chosen if entry["amount"] > 0]
+
+    chosen_ids = {id(entry) for entry in chosen}
+    applied = []
+    for entry in considered:
+        if id(entry) in chosen_ids:
+            entry["applied"] = True
+            applied.append({key: entry.get(key)
+                            for key in ("discount_id", "name", "applies_to", "product_id", "amount")})
+        elif "reason" not in entry:
+            if not entry["amount"]:
+                entry["reason"] = "saves nothing on this basket"
+            elif entry["applies_to"] == "product":
+                entry["reason"] = f"beaten by discount {best_per_product[entry['product_id']][1]['discount_id']}"
+            else:
+                entry["reason"] = f"beaten by discount {best_order['discount_id']}"
+    discount = round(sum(a["amount"] for a in applied), 2)
+    return {
+        "subtotal": subtotal,
+        "discount": discount,
+        "total": round(subtotal - discount, 2),
+        "applied": applied,
+        "considered": considered,
+        "rules_loaded": index.size,
+    }
@@ -0,0 +1,79 @@
+"""QR code rendering shared by 2FA setup, kiosks and receipts.
+
+The ``qrcode`` package (and Pillow, for PNG output) is imported on first render rather
+than at module import, so workers that never draw a QR code never load it. SVG output
+is built directly from the module matrix and needs neither Pillow nor an XML library.
+Renders are memoised: kiosk and receipt codes encode stable strings and are requested
+repeatedly. Secrets and one-off payloads, such as TOTP provisioning URIs, are rendered
+with ``cached=False`` so they neither stay in process memory nor evict useful entries.
+"""
+import base64
+from functools import lru_cache
+
+MIME_TYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+
+def _matrix(data, border):
+    import qrcode  # deferred: only loaded when a code is actually rendered
+    qr = qrcode.QRCode(border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _svg(matrix, box_size):
+    size = len(matrix)
+    # One horizontal run per path segment keeps the document small
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                runs.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    px = size * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{px}" height="{px}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(runs)}" fill="#000"/></svg>'
+    ).encode()
+
+
+def _png(data, box_size, border):
+    import qrcode
+    from io import BytesIO
+    qr = qrcode.QRCode(box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer)
+    return buffer.getvalue()
+
+
+def _render(data, fmt, box_size, border):
+    if fmt == 'svg':
+        return _svg(_matrix(data, border), box_size)
+    if fmt == 'png':
+        return _png(data, box_size, border)
+    raise ValueError(f"Unsupported QR format: {fmt}")
+
+
+@lru_cache(maxsize=256)
+def render_qr(data, fmt='svg', box_size=10, border=4):
+    """Render ``data`` as a QR code and return the image bytes (``svg`` or ``png``)."""
+    return _render(data, fmt, box_size, border)
+
+
+def qr_data_uri(data, fmt='svg', box_size=10, border=4, cached=True):
+    """Render ``data`` and wrap it in a ``data:`` URI for embedding in JSON or HTML.
+
+    Pass ``cached=False`` for payloads that carry secrets or are never requested twice.
+    """
+    image = render_qr(data, fmt, box_size, border) if cached else _render(data, fmt, box_size, border)
+    encoded = base64.b64encode(image).decode()
+    return f"data:{MIME_TYPES[fmt]};base64,{encoded}"
@@ -0,0 +1,252 @@
+"""Tenant- and terminal-aware rate limiting on top of Flask-Limiter.
+
+Keys: a signed-in caller is limited per terminal within its restaurant
+(``r<restaurant>:t<X-Terminal-ID>``, or ``r<restaurant>:u<user>`` without the header),
+and every restaurant also shares one ceiling (``RATELIMIT_TENANT_LIMIT``) so terminal ids
+cannot be multiplied to escape it. Anonymous callers (login, kiosks) stay keyed by
+remote address. Credential checks (login, 2FA) use ``account_key`` instead: the user id,
+or the address when signed out, so rotating ``X-Terminal-ID`` buys no extra password
+guesses. The caller is worked out once per request from ``current_user`` (served
+by the user cache) and kept on ``g``, so the key functions cost a dict lookup.
+
+Budgets: ``RATELIMIT_ANONYMOUS_DEFAULT`` / ``RATELIMIT_TERMINAL_DEFAULT`` apply to every
+route, ``RATELIMIT_ROUTE_LIMITS`` (``{endpoint: "120 per minute"}``) replaces them on
+the routes it names.
+
+Storage is shared between workers: ``RATELIMIT_STORAGE_URI`` takes any ``limits``
+backend (``redis://``, ``memcached://``, ...) plus the ``sqlite:///path`` backend below
+for single-host deployments. The default strategy is the sliding window counter: two
+counters per key and window, so a hit is one read and one upsert.
+
+Rejections are counted per endpoint and per key (``rejections()``), served at
+``/admin/api/rate-limits``; counts are per process.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from math import floor
+
+from flask import current_app, g, request
+from flask_login import current_user
+from limits.storage.base import SlidingWindowCounterSupport, Storage, TimestampedSlidingWindow
+
+_TERMINAL_ID = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+
+# ----------------------------------------------------------------------------------
+# Keys and budgets
+# ----------------------------------------------------------------------------------
+def _caller():
+    """``(tenant key or None, client key)`` for this request, computed once."""
+    caller = g.get('_rate_limit_caller')
+    if caller is None:
+        user = current_user if getattr(current_user, 'is_authenticated', False) else None
+        if user is None:
+            caller = (None, f"ip:{request.remote_addr or 'unknown'}")
+        else:
+            tenant = f"r{user.restaurant_id or 0}"
+            terminal = request.headers.get('X-Terminal-ID', '')
+            client = f"t{terminal}" if _TERMINAL_ID.match(terminal) else f"u{user.id}"
+            caller = (tenant, f"{tenant}:{client}")
+        g._rate_limit_caller = caller
+    return caller
+
+
+def client_key():
+    return _caller()[1]
+
+
+def account_key():
+    """Per-account key for brute-force budgets; ignores the client-chosen terminal header."""
+    if getattr(current_user, 'is_authenticated', False):
+        return f"user:{current_user.id}"
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+def tenant_key():
+    return _caller()[0] or _caller()[1]
+
+
+def is_anonymous():
+    return _caller()[0] is None
+
+
+def was_served(response):
+    """Requests rejected by a terminal budget do not use up the restaurant's ceiling."""
+    return response.status_code != 429
+
+
+def default_budget():
+    config = current_app.config
+    if is_anonymous():
+        return config.get('RATELIMIT_ANONYMOUS_DEFAULT', '200 per day;50 per hour')
+    return config.get('RATELIMIT_TERMINAL_DEFAULT', '300 per minute')
+
+
+def tenant_budget():
+    return current_app.config.get('RATELIMIT_TENANT_LIMIT', '3000 per minute')
+
+
+def apply_route_limits(app, limiter):
+    """Wrap the endpoints named in ``RATELIMIT_ROUTE_LIMITS`` with their budgets."""
+    for endpoint, value in (app.config.get('RATELIMIT_ROUTE_LIMITS') or {}).items():
+        view = app.view_functions.get(endpoint)
+        if view is None:
+            raise KeyError(f"RATELIMIT_ROUTE_LIMITS: unknown endpoint {endpoint}")
+        # The limiter is a process-wide singleton and blueprint views are shared by every
+        # app, so each (view, budget) is wrapped once and the wrapper reused
+        marker = (view, value)
+        if marker not in _wrapped:
+            _wrapped[marker] = limiter.limit(value)(view)
+        app.view_functions[endpoint] = _wrapped[marker]
+
+
+_wrapped = {}
+
+
+# ----------------------------------------------------------------------------------
+# Rejection metrics
+# ----------------------------------------------------------------------------------
+_lock = threading.Lock()
+_by_endpoint = Counter()
+_by_key = Counter()
+
+
+def on_breach(request_limit):
+    with _lock:
+        _by_endpoint[request.endpoint or request.path] += 1
+        _by_key[request_limit.key] += 1
+    return None  # keep Flask-Limiter's default 429 response
+
+
+def rejections(top=20):
+    with _lock:
+        return {
+            "total": sum(_by_endpoint.values()),
+            "by_endpoint": dict(_by_endpoint.most_common()),
+            "top_keys": [{"key": key, "count": count} for key, count in _by_key.most_common(top)],
+        }
+
+
+def reset_rejections():
+    with _lock:
+        _by_endpoint.clear()
+        _by_key.clear()
+
+
+# ----------------------------------------------------------------------------------
+# SQLite storage
+# ----------------------------------------------------------------------------------
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """``limits`` storage in a SQLite file shared by the workers of one host.
+
+    ``sqlite:///relative/path.db`` or ``sqlite:////absolute/path.db``. Counters live in one
+    table keyed by window; a sliding-window hit runs in a ``BEGIN IMMEDIATE``
+    transaction, so concurrent workers cannot both take the last slot. Expired rows are
+    pruned every ``prune_every`` writes.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, timeout=5.0, prune_every=1000, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.split('://', 1)[1][1:] or ':memory:'
+        self.timeout = float(timeout)
+        self.prune_every = int(prune_every)
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_counter ("
+                         "key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _upsert(self, conn, key, expiry, amount, now):
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            conn.execute("DELETE FROM rate_limit_counter WHERE expires_at <= ?", (now,))
+        return conn.execute(
+            "INSERT INTO rate_limit_counter (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+            "RETURNING value", (key, amount, now + expiry, now, now)).fetchone()[0]
+
+    def _values(self, conn, keys, now):
+        placeholders = ','.join('?' * len(keys))
+        return dict(conn.execute(f"SELECT key, value FROM rate_limit_counter WHERE key IN ({placeholders}) "
+                                 f"AND expires_at > ?", (*keys, now)))
+
+    def incr(self, key, expiry, amount=1):
+        return self._upsert(self._connection(), key, expiry, amount, time.time())
+
+    def get(self, key):
+        return self._values(self._connection(), [key], time.time()).get(key, 0)
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expires_at FROM rate_limit_counter WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute("DELETE FROM rate_limit_counter").rowcount
+
+    def clear(self, key):
+        self._connection().execute("DELETE FROM rate_limit_counter WHERE key = ?", (key,))
+
+    def _window(self, conn, key, expiry, now):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        counts = self._values(conn, [previous_key, current_key], now)
+        previous, current = counts.get(previous_key, 0), counts.get(current_key, 0)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous, previous_ttl, current, current_ttl, current_key
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            previous, previous_ttl, current, _, current_key = self._window(conn, key, expiry, now)
+            if floor(previous * previous_ttl / expiry + current) + amount > limit:
+                acquired = False
+            else:
+                self._upsert(conn, current_key, 2 * expiry, amount, now)
+                acquired = True
+            conn.execute("COMMIT")
+            return acquired
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_sliding_window(self, key, expiry):
+        return self._window(self._connection(), key, expiry, time.time())[:4]
+
+    def clear_sliding_window(self, key, expiry):
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
@@ -0,0 +1,171 @@
+"""Receipt numbering and rendering.
+
+Checkout reserves a receipt number (``REC-<restaurant>-<n>`` from the restaurant's
+sequence) and stores a ``Receipt`` holding a snapshot of the order lines (name, quantity,
+unit price) as charged. The content is rendered the first time the receipt is fetched or
+printed and cached in ``Receipt.content``; later fetches are a single row read. Rendering
+reads the snapshot, never the live catalog, so a price edit after checkout does not
+change an issued receipt.
+
+Rendering loads the payment and the store details with one query each and feeds the
+same context to the compiled Jinja templates under ``templates/receipts/`` (text, HTML)
+or to the ESC/POS builder.
+"""
+import json
+from datetime import datetime
+
+from babel.numbers import format_currency
+from flask import current_app
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models import (
+    OrderItem, MenuItem, Product, PaymentTransaction, PaymentMethod, Receipt, Restaurant, StoreSettings
+)
+from services.escpos import Ticket, LINE_WIDTH, ALIGN_CENTER, ALIGN_LEFT, BOLD_ON, BOLD_OFF
+from services.sequences import next_value, format_number
+
+RECEIPT_PREFIX = 'REC'
+FORMATS = ('text', 'html', 'escpos')
+MIME_TYPES = {
+    'text': 'text/plain; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'escpos': 'application/octet-stream',
+}
+
+
+def order_lines(order_id):
+    """``(name, quantity, unit_price)`` of an order's lines at the current catalog prices."""
+    product = aliased(Product)
+    rows = db.session.query(
+        OrderItem.quantity, MenuItem.name, MenuItem.price, product.name, product.base_price
+    ).outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id) \
+        .outerjoin(product, product.id == OrderItem.menu_item_id) \
+        .filter(OrderItem.order_id == order_id).order_by(OrderItem.id).all()
+    lines = []
+    for quantity, menu_name, menu_price, product_name, product_price in rows:
+        # Legacy rows store a Product id in menu_item_id; prefer the MenuItem when both exist
+        name = menu_name or product_name or 'Item'
+        unit_price = (menu_price if menu_name is not None else product_price) or 0.0
+        lines.append((name, quantity, unit_price))
+    return lines
+
+
+def create_receipt(order, restaurant_id=None, header_text=None, footer_text=None):
+    """Add an unrendered receipt for ``order`` with the restaurant's next receipt number
+    and a snapshot of its lines as charged."""
+    receipt = Receipt(
+        order_id=order.id,
+        restaurant_id=restaurant_id,
+        receipt_number=format_number(RECEIPT_PREFIX, next_value('receipt', restaurant_id), restaurant_id),
+        header_text=header_text,
+        footer_text=footer_text,
+        lines=json.dumps(order_lines(order.id))
+    )
+    db.session.add(receipt)
+    return receipt
+
+
+def receipt_context(receipt):
+    """Everything the templates need, gathered in a fixed number of queries."""
+    if receipt.lines is not None:
+        rows = json.loads(receipt.lines)
+    else:
+        # Receipts issued before line snapshots existed: the catalog is all there is
+        rows = order_lines(receipt.order_id)
+
+    payment = db.session.query(PaymentTransaction.tip_amount, PaymentTransaction.currency, PaymentMethod.name) \
+        .join(PaymentMethod, PaymentMethod.id == PaymentTransaction.payment_method_id) \
+        .filter(PaymentTransaction.order_id == receipt.order_id) \
+        .order_by(PaymentTransaction.id.desc()).first()
+
+    store = None
+    if receipt.restaurant_id:
+        store = db.session.query(Restaurant.name, Restaurant.address, Restaurant.city, Restaurant.phone,
+                                 StoreSettings.currency, StoreSettings.locale, StoreSettings.vat_number) \
+            .outerjoin(StoreSettings, StoreSettings.restaurant_id == Restaurant.id) \
+            .filter(Restaurant.id == receipt.restaurant_id).first()
+
+    currency = (store and store.currency) or (payment and payment.currency) or 'USD'
+    locale = (store and store.locale) or 'en'
+
+    def money(amount):
+        try:
+            return format_currency(amount, currency, locale=locale)
+        except Exception:
+            return f"{currency} {amount:.2f}"
+
+    lines = []
+    subtotal = 0.0
+    for name, quantity, unit_price in rows:
+        line_total = unit_price * quantity
+        subtotal += line_total
+        lines.append({"name": name, "quantity": quantity, "unit_price": money(unit_price),
+                      "total": money(line_total)})
+
+    tip = (payment.tip_amount or 0.0) if payment else 0.0
+    return {
+        "receipt_number": receipt.receipt_number,
+        "order_id": receipt.order_id,
+        "date": (receipt.created_at or datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S'),
+        "store": store,
+        "header": receipt.header_text,
+        "footer": receipt.footer_text,
+        "lines": lines,
+        "subtotal": money(subtotal),
+        "tip": money(tip) if tip > 0 else None,
+        "total": money(subtotal + tip),
+        "payment_method": payment.name if payment else 'N/A',
+        "width": LINE_WIDTH,
+    }
+
+
+def render_escpos(context):
+    ticket = Ticket()
+    if context["store"]:
+        ticket.title(context["store"].name)
+        for value in (context["store"].address, context["store"].city, context["store"].phone):
+            if value:
+                ticket.raw(ALIGN_CENTER).text(value).raw(ALIGN_LEFT)
+    else:
+        ticket.title("RECEIPT")
+    if context["header"]:
+        ticket.text(context["header"])
+    ticket.rule('=')
+    ticket.columns(context["receipt_number"] or '', context["date"])
+    ticket.text(f"Order #: {context['order_id']}")
+    ticket.rule()
+    for line in context["lines"]:
+        ticket.text(line["name"])
+        ticket.columns(f"  {line['quantity']} x {line['unit_price']}", line["total"])
+    ticket.rule()
+    ticket.columns("Subtotal", context["subtotal"])
+    if context["tip"]:
+        ticket.columns("Tip", context["tip"])
+    ticket.raw(BOLD_ON).columns("TOTAL", context["total"]).raw(BOLD_OFF)
+    ticket.columns("Payment", context["payment_method"])
+    if context["footer"]:
+        ticket.rule().text(context["footer"])
+    return bytes(ticket.cut())
+
+
+def render(receipt, fmt='text'):
+    """Render ``receipt`` as ``text`` (str), ``html`` (str) or ``escpos`` (bytes)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported receipt format: {fmt}")
+    if fmt == 'text' and receipt.content is not None:
+        return receipt.content
+    context = receipt_context(receipt)
+    if fmt == 'escpos':
+        return render_escpos(context)
+    # Flask's Jinja environment compiles each template once and caches it
+    return current_app.jinja_env.get_template(f'receipts/receipt.{"txt" if fmt == "text" else "html"}') \
+        .render(**context)
+
+
+def ensure_content(receipt):
+    """Render and store the text receipt if it has not been built yet; returns it."""
+    if receipt.content is None:
+        receipt.content = render(receipt, 'text')
+        db.session.commit()
+    return receipt.content
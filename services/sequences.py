@@ -0,0 +1,235 @@
+"""Per-restaurant document number sequences (receipts, invoices).
+
+Each (restaurant, document type) pair has one ``DocumentSequence`` row holding the next
+unreserved number. Incrementing that row inside every checkout transaction would make
+all checkouts of a restaurant queue on one row lock, so on databases with row-level
+locking (Postgres) each worker process reserves a block of numbers
+(``DOCUMENT_SEQUENCE_BLOCK_SIZE``) in a short transaction of its own and hands them out
+from memory. Numbers stay as close to gap-free as blocks allow:
+
+* a number whose transaction rolls back goes back to the worker's pool and is reused
+  before the rest of the block;
+* on shutdown a worker gives the unused tail of its block back if nobody reserved after
+  it;
+* every reservation is logged in ``SequenceBlock``, so ``gap_report`` can say which
+  worker reserved a missing number and never used it.
+
+SQLite allows a single writer at a time, so blocks buy nothing there and a second
+connection would wait on the caller's own write lock: numbers are allocated one at a
+time inside the caller's transaction instead, which is strictly gap-free.
+``DOCUMENT_SEQUENCE_MODE`` ('auto', 'block', 'transaction') overrides the choice.
+"""
+import atexit
+import heapq
+import re
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import DocumentSequence, SequenceBlock, Receipt, Invoice
+from services.leases import holder_id
+
+DEFAULT_BLOCK_SIZE = 20
+
+
+def format_number(prefix, value, restaurant_id=None):
+    """``REC-7-000042`` style numbers; unique across restaurants sharing a database."""
+    if restaurant_id:
+        return f"{prefix}-{restaurant_id}-{value:06d}"
+    return f"{prefix}-{value:06d}"
+
+
+def _ensure_row(conn, restaurant_id, doc_type):
+    table = DocumentSequence.__table__
+    values = dict(restaurant_id=restaurant_id, doc_type=doc_type, next_value=1, updated_at=datetime.utcnow())
+    if conn.dialect.name in ('postgresql', 'sqlite'):
+        if conn.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        conn.execute(insert(table).values(**values)
+                     .on_conflict_do_nothing(index_elements=['restaurant_id', 'doc_type']))
+    elif conn.execute(db.select(table.c.id).where(table.c.restaurant_id == restaurant_id)
+                      .where(table.c.doc_type == doc_type)).first() is None:
+        conn.execute(table.insert().values(**values))
+
+
+def _advance(conn, restaurant_id, doc_type, count):
+    """Move the counter forward by ``count``; returns the first number taken."""
+    table = DocumentSequence.__table__
+    match = (table.c.restaurant_id == restaurant_id) & (table.c.doc_type == doc_type)
+    bump = table.update().where(match).values(next_value=table.c.next_value + count, updated_at=datetime.utcnow())
+    if not conn.execute(bump).rowcount:
+        _ensure_row(conn, restaurant_id, doc_type)
+        conn.execute(bump)
+    # The UPDATE holds the row lock, so this sees our own increment
+    return conn.execute(db.select(table.c.next_value).where(match)).scalar() - count
+
+
+class SequenceAllocator:
+    """Process-wide pool of reserved number blocks."""
+
+    def __init__(self):
+        self.holder = holder_id()
+        self._lock = threading.Lock()
+        self._blocks = {}  # (url, restaurant_id, doc_type) -> [next, end, block_id, engine]
+        self._returned = {}  # same key -> heap of numbers given back by rolled-back transactions
+
+    def allocate(self, engine, restaurant_id, doc_type, block_size):
+        key = (str(engine.url), restaurant_id, doc_type)
+        with self._lock:
+            returned = self._returned.get(key)
+            if returned:
+                return key, heapq.heappop(returned)
+            block = self._blocks.get(key)
+            if block is None or block[0] >= block[1]:
+                block = self._blocks[key] = self._reserve(engine, restaurant_id, doc_type, block_size)
+            value = block[0]
+            block[0] += 1
+            return key, value
+
+    def _reserve(self, engine, restaurant_id, doc_type, block_size):
+        with engine.begin() as conn:
+            start = _advance(conn, restaurant_id, doc_type, block_size)
+            block_id = conn.execute(SequenceBlock.__table__.insert().values(
+                restaurant_id=restaurant_id, doc_type=doc_type, start_value=start,
+                end_value=start + block_size, holder=self.holder, reserved_at=datetime.utcnow())
+            ).inserted_primary_key[0]
+        return [start, start + block_size, block_id, engine]
+
+    def give_back(self, key, value):
+        with self._lock:
+            heapq.heappush(self._returned.setdefault(key, []), value)
+
+    def release(self):
+        """Return the unused tail of every block, where no later block was reserved."""
+        with self._lock:
+            blocks, self._blocks = self._blocks, {}
+        sequences, log = DocumentSequence.__table__, SequenceBlock.__table__
+        for (_, restaurant_id, doc_type), (next_value, end, block_id, engine) in blocks.items():
+            if next_value >= end:
+                continue
+            try:
+                with engine.begin() as conn:
+                    result = conn.execute(
+                        sequences.update()
+                        .where(sequences.c.restaurant_id == restaurant_id)
+                        .where(sequences.c.doc_type == doc_type)
+                        .where(sequences.c.next_value == end)
+                        .values(next_value=next_value))
+                    if result.rowcount:
+                        conn.execute(log.update().where(log.c.id == block_id).values(end_value=next_value))
+            except Exception:
+                pass  # the database may already be gone at interpreter exit
+
+
+_allocator = SequenceAllocator()
+atexit.register(_allocator.release)
+
+
+def _use_blocks():
+    mode = current_app.config.get('DOCUMENT_SEQUENCE_MODE', 'auto')
+    if mode == 'auto':
+        return db.engine.dialect.name != 'sqlite'
+    return mode == 'block'
+
+
+def next_value(doc_type, restaurant_id=None):
+    """Allocate the next number of ``doc_type`` for ``restaurant_id`` (None = unscoped).
+
+    The number counts as used once the caller's transaction commits; if it rolls back,
+    the number is handed out again.
+    """
+    restaurant_id = restaurant_id or 0
+    if not _use_blocks():
+        return _advance(db.session.connection(), restaurant_id, doc_type, 1)
+    sizes = current_app.config.get('DOCUMENT_SEQUENCE_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+    block_size = sizes.get(doc_type, DEFAULT_BLOCK_SIZE) if isinstance(sizes, dict) else sizes
+    key, value = _allocator.allocate(db.engine, restaurant_id, doc_type, max(1, int(block_size)))
+    # Tie the number to the caller's transaction so commit/rollback below see it
+    db.session.connection()
+    db.session.info.setdefault('_sequence_numbers', []).append((key, value))
+    return value
+
+
+@event.listens_for(Session, 'after_commit')
+def _numbers_used(session):
+    session.info.pop('_sequence_numbers', None)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _numbers_unused(session, transaction):
+    # Runs after after_commit, so anything left was rolled back or discarded with the session
+    if transaction.parent is None:
+        for key, value in session.info.pop('_sequence_numbers', ()):
+            _allocator.give_back(key, value)
+
+
+# -- gap audit -------------------------------------------------------------------------
+def issued_numbers(doc_type, restaurant_id=None):
+    """Sequence values of the documents that exist, sorted."""
+    model, column = {'receipt': (Receipt, Receipt.receipt_number),
+                     'invoice': (Invoice, Invoice.invoice_number)}[doc_type]
+    query = db.session.query(column).filter(column.isnot(None))
+    # Anchored on the end: prefixes may contain '-' ("INV-EU") and may have changed over time.
+    # format_number pads to at least six digits, which also keeps out legacy
+    # "INV-<timestamp>-<ms>" numbers (at most four digits after the last dash)
+    if restaurant_id:
+        query = query.filter(model.restaurant_id == restaurant_id)
+        pattern = re.compile(rf'^.+-{restaurant_id}-(\d{{6,}})$')
+    else:
+        query = query.filter(model.restaurant_id.is_(None))
+        pattern = re.compile(r'^.+-(\d{6,})$')
+    values = []
+    for (number,) in query.yield_per(5000):
+        match = pattern.match(number)
+        if match:
+            values.append(int(match.group(1)))
+    values.sort()
+    return values
+
+
+def gap_report(doc_type, restaurant_id=None):
+    """Missing and duplicated numbers of ``doc_type`` for one restaurant.
+
+    Each gap lists the workers whose reserved blocks covered it, i.e. numbers that were
+    handed to a worker that stopped before using them.
+    """
+    restaurant_id = restaurant_id or 0
+    values = issued_numbers(doc_type, restaurant_id)
+    counter = db.session.query(DocumentSequence.next_value) \
+        .filter_by(restaurant_id=restaurant_id, doc_type=doc_type).scalar()
+
+    gaps, duplicates, expected = [], [], 1
+    previous = None
+    for value in values:
+        if value == previous:
+            duplicates.append(value)
+            continue
+        if value > expected:
+            gaps.append({"from": expected, "to": value - 1, "count": value - expected})
+        expected, previous = value + 1, value
+
+    blocks = SequenceBlock.query.filter_by(restaurant_id=restaurant_id, doc_type=doc_type) \
+        .order_by(SequenceBlock.start_value).all() if gaps else []
+    for gap in gaps:
+        gap["reserved_by"] = sorted({b.holder for b in blocks
+                                     if b.start_value <= gap["to"] and b.end_value > gap["from"]})
+
+    last = values[-1] if values else 0
+    return {
+        "restaurant_id": restaurant_id or None,
+        "doc_type": doc_type,
+        "issued": len(values),
+        "first": values[0] if values else None,
+        "last": last or None,
+        "missing": sum(g["count"] for g in gaps),
+        "gaps": gaps,
+        "duplicates": duplicates,
+        # Reserved by running workers (or lost by stopped ones) past the last issued number
+        "reserved_unused": max(0, (counter or 1) - 1 - last),
+    }
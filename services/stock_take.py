@@ -0,0 +1,172 @@
+"""Physical stock counts: scans are staged in bulk and reconciled in one set-based pass.
+
+Scanner uploads (thousands of ``barcode[,quantity]`` lines per request) are summed per
+barcode in memory and written to ``StockTakeScan`` with batched inserts, so a 20k-scan
+count is a handful of requests and statements instead of one round trip per scan.
+
+``reconcile`` then works entirely in SQL inside one transaction:
+
+* ``INSERT ... SELECT`` of one ``StockTakeLine`` per counted item, joining the summed
+  scans to ``InventoryItem.barcode`` (with ``full=True`` every barcoded item is included
+  and unscanned ones count as zero);
+* one relative ``UPDATE`` of the stock levels by each line's variance, so sales that
+  happen while the count is reconciled are kept;
+* ``INSERT ... SELECT`` of the matching ``count`` movements into the stock ledger
+  (``services/inventory.py``).
+
+A stock take is claimed for reconciliation with a conditional status update, and scan
+uploads lock its row, so scans cannot slip in after the count was reconciled.
+"""
+from datetime import datetime
+
+from sqlalchemy import func, literal, null, select
+from sqlalchemy.types import DateTime, Integer, String
+
+from extensions import db
+from models import InventoryItem, StockMovement, StockTake, StockTakeScan, StockTakeLine
+
+
+class StockTakeClosed(ValueError):
+    """Scans or reconciliation for a stock take that is no longer open."""
+
+
+def parse_lines(lines):
+    """``(barcode, quantity)`` from ``barcode[,quantity]`` text lines; quantity defaults to 1."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        barcode, _, quantity = line.partition(',')
+        barcode = barcode.strip()
+        if number == 1 and barcode.lower() == 'barcode':
+            continue  # header row
+        try:
+            yield barcode, float(quantity) if quantity.strip() else 1.0
+        except ValueError:
+            raise ValueError(f"Line {number}: invalid quantity {quantity.strip()!r}")
+
+
+def _open_for_update(stock_take_id):
+    status = db.session.query(StockTake.status).filter(StockTake.id == stock_take_id).with_for_update().scalar()
+    if status is None:
+        raise LookupError(f"Stock take {stock_take_id} not found")
+    if status != 'open':
+        raise StockTakeClosed(f"Stock take {stock_take_id} is {status}")
+
+
+def add_scans(stock_take_id, scans, batch_size=5000):
+    """Stage ``(barcode, quantity)`` scans; returns how many were accepted. Nothing is committed."""
+    _open_for_update(stock_take_id)
+    table = StockTakeScan.__table__
+    accepted, pending = 0, {}
+
+    def flush():
+        if pending:
+            db.session.execute(table.insert(), [
+                {"stock_take_id": stock_take_id, "barcode": barcode, "quantity": quantity, "scans": count}
+                for barcode, (quantity, count) in pending.items()])
+            pending.clear()
+
+    for barcode, quantity in scans:
+        barcode = str(barcode or '').strip()
+        if not barcode:
+            raise ValueError(f"Scan {accepted + 1}: barcode is required")
+        if len(barcode) > 64:
+            raise ValueError(f"Scan {accepted + 1}: barcode is too long")
+        total, count = pending.get(barcode, (0.0, 0))
+        pending[barcode] = (total + float(quantity), count + 1)
+        accepted += 1
+        if len(pending) >= batch_size:
+            flush()
+    flush()
+    return accepted
+
+
+def discard_scans(stock_take_id):
+    StockTakeScan.query.filter_by(stock_take_id=stock_take_id).delete(synchronize_session=False)
+
+
+def _counted(stock_take_id):
+    scans = StockTakeScan.__table__
+    return select(scans.c.barcode, func.sum(scans.c.quantity).label('counted'),
+                  func.sum(scans.c.scans).label('scans')) \
+        .where(scans.c.stock_take_id == stock_take_id).group_by(scans.c.barcode).subquery()
+
+
+def unknown_barcodes(stock_take_id):
+    """Scanned barcodes that match no inventory item: ``[{"barcode", "quantity", "scans"}]``."""
+    items, counted = InventoryItem.__table__, _counted(stock_take_id)
+    rows = db.session.execute(
+        select(counted.c.barcode, counted.c.counted, counted.c.scans)
+        .select_from(counted.outerjoin(items, items.c.barcode == counted.c.barcode))
+        .where(items.c.id.is_(None)).order_by(counted.c.barcode))
+    return [{"barcode": barcode, "quantity": quantity, "scans": scans} for barcode, quantity, scans in rows]
+
+
+def reconcile(stock_take_id, full=False, user_id=None, now=None):
+    """Write variance lines and apply them to stock in one transaction; returns the line count."""
+    now = now or datetime.utcnow()
+    takes = StockTake.__table__
+    if not db.session.execute(takes.update().where(takes.c.id == stock_take_id, takes.c.status == 'open')
+                              .values(status='reconciled', reconciled_at=now, full_count=full)).rowcount:
+        _open_for_update(stock_take_id)  # raises the right error
+    items, lines = InventoryItem.__table__, StockTakeLine.__table__
+    counted = _counted(stock_take_id)
+    expected = func.coalesce(items.c.quantity, 0)
+    quantity = func.coalesce(counted.c.counted, 0)
+    source = select(literal(stock_take_id, Integer), items.c.id, expected, quantity, quantity - expected)
+    if full:
+        source = source.select_from(items.outerjoin(counted, counted.c.barcode == items.c.barcode)) \
+            .where(items.c.barcode.isnot(None))
+    else:
+        source = source.select_from(items.join(counted, counted.c.barcode == items.c.barcode))
+    written = db.session.execute(lines.insert().from_select(
+        ['stock_take_id', 'inventory_item_id', 'expected', 'counted', 'variance'], source)).rowcount
+
+    this_take = lines.c.stock_take_id == stock_take_id
+    variance = select(lines.c.variance).where(this_take, lines.c.inventory_item_id == items.c.id).scalar_subquery()
+    db.session.execute(items.update()
+                       .where(items.c.id.in_(select(lines.c.inventory_item_id).where(this_take, lines.c.variance != 0)))
+                       .values(quantity=func.coalesce(items.c.quantity, 0) + variance, updated_at=now))
+    db.session.execute(StockMovement.__table__.insert().from_select(
+        ['inventory_item_id', 'movement_type', 'quantity', 'reference', 'note', 'user_id', 'created_at'],
+        select(lines.c.inventory_item_id, literal('count', String), lines.c.variance,
+               literal(f'stocktake:{stock_take_id}', String), null(), literal(user_id, Integer),
+               literal(now, DateTime)).where(this_take)))
+    db.session.expire_all()  # stock levels changed under any loaded InventoryItem
+    return written
+
+
+def summary(stock_take_id):
+    take = db.session.get(StockTake, stock_take_id)
+    if take is None:
+        raise LookupError(f"Stock take {stock_take_id} not found")
+    scans = db.session.query(func.count(func.distinct(StockTakeScan.barcode)), func.sum(StockTakeScan.scans)) \
+        .filter(StockTakeScan.stock_take_id == stock_take_id).one()
+    result = {
+        "id": take.id,
+        "name": take.name,
+        "status": take.status,
+        "full_count": bool(take.full_count),
+        "started_at": take.started_at.isoformat() if take.started_at else None,
+        "reconciled_at": take.reconciled_at.isoformat() if take.reconciled_at else None,
+        "barcodes": scans[0] or 0,
+        "scans": int(scans[1] or 0),
+        "unknown_barcodes": unknown_barcodes(stock_take_id),
+    }
+    if take.status == 'reconciled':
+        rows = db.session.query(StockTakeLine, InventoryItem.name, InventoryItem.barcode) \
+            .join(InventoryItem, InventoryItem.id == StockTakeLine.inventory_item_id) \
+            .filter(StockTakeLine.stock_take_id == stock_take_id) \
+            .order_by(func.abs(StockTakeLine.variance).desc(), InventoryItem.name)
+        result["lines"] = [{
+            "inventory_item_id": line.inventory_item_id,
+            "name": name,
+            "barcode": barcode,
+            "expected": line.expected,
+            "counted": line.counted,
+            "variance": line.variance,
+        } for line, name, barcode in rows]
+    return result
@@ -1,24 +1,23 @@
 """Two-Factor Authentication (TOTP) Service using Time-based One-Time Passwords"""
-import pyotp
-import qrcode
-from io import BytesIO
-import base64
 import json
-from werkzeug.security import generate_password_hash, check_password_hash
+from services.hashing import hash_passwords, verify_any, lookup_key, lookup_matches
+from services.qr import qr_data_uri
 import secrets
 import string
 
 
-def generate_totp_secret(username, issuer='ServeoPOS'):
+def generate_totp_secret(username, issuer='ServeoPOS', qr_format='png'):
     """Generate a new TOTP secret for a user.
     
     Args:
         username: The user's username
         issuer: Organization/app name (shown in authenticator apps)
+        qr_format: 'png' or 'svg' (SVG needs no Pillow and is much cheaper to render)
     
     Returns:
         dict with 'secret', 'qr_code_data_uri', and 'backup_codes'
     """
+    import pyotp  # deferred: only needed by the 2FA endpoints
     secret = pyotp.random_base32()
     totp = pyotp.TOTP(secret)
     provisioning_uri = totp.provisioning_uri(
@@ -26,21 +25,13 @@ def generate_totp_secret(username, issuer='ServeoPOS'):
         issuer_name=issuer
     )
     
-    # Generate QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(provisioning_uri)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to data URI
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    qr_code_data_uri = f"data:image/png;base64,{img_str}"
+    # Generate QR code as a data URI
+    qr_code_data_uri = qr_data_uri(provisioning_uri, fmt=qr_format, border=5, cached=False)
     
     # Generate backup codes (10 codes, 8 chars each)
     backup_codes = [generate_backup_code() for _ in range(10)]
-    hashed_codes = [generate_password_hash(code) for code in backup_codes]
+    hashed_codes = [{'lookup': lookup_key(code), 'hash': code_hash}
+                    for code, code_hash in zip(backup_codes, hash_passwords(backup_codes))]
     
     return {
         'secret': secret,
@@ -71,6 +62,7 @@ def verify_totp_token(secret, token, valid_window=1):
         return False
     
     try:
+        import pyotp
         totp = pyotp.TOTP(secret)
         # Check current time window and adjacent windows for clock skew
         return totp.verify(token, valid_window=valid_window)
@@ -81,12 +73,19 @@ def verify_totp_token(secret, token, valid_window=1):
 def use_backup_code(backup_codes_json, code):
     """Consume a backup code.
     
+    Codes are stored as ``{"lookup": ..., "hash": ...}`` objects so only the hash whose
+    lookup prefix matches has to be verified; plain hash strings from older setups are
+    still accepted and checked one by one.
+    
     Args:
         backup_codes_json: JSON array of hashed backup codes stored in DB
         code: The plaintext backup code provided by user
     
     Returns:
         dict with 'valid' (bool), 'codes_remaining' (int), 'remaining_codes_json' (str or None)
+    
+    Raises:
+        services.hashing.HashingBusy: if the hashing pool is saturated
     """
     if not backup_codes_json or not code:
         return {'valid': False, 'codes_remaining': 0, 'remaining_codes_json': None}
@@ -96,12 +95,11 @@ def use_backup_code(backup_codes_json, code):
     except (json.JSONDecodeError, TypeError):
         return {'valid': False, 'codes_remaining': 0, 'remaining_codes_json': None}
     
-    # Find matching code
-    matched_idx = None
-    for idx, hashed_code in enumerate(hashed_codes):
-        if check_password_hash(hashed_code, code):
-            matched_idx = idx
-            break
+    # Only verify the hashes whose lookup prefix matches (legacy entries have none)
+    candidates = [idx for idx, entry in enumerate(hashed_codes)
+                  if not isinstance(entry, dict) or lookup_matches(entry.get('lookup', ''), code)]
+    found = verify_any([_code_hash(hashed_codes[idx]) for idx in candidates], code) if candidates else None
+    matched_idx = candidates[found] if found is not None else None
     
     if matched_idx is None:
         return {'valid': False, 'codes_remaining': len(hashed_codes), 'remaining_codes_json': backup_codes_json}
@@ -117,6 +115,10 @@ def use_backup_code(backup_codes_json, code):
     }
 
 
+def _code_hash(entry):
+    return entry.get('hash') if isinstance(entry, dict) else entry
+
+
 def get_totp_current_token(secret):
     """Get the current valid TOTP token (for testing/debugging only).
     
@@ -128,5 +130,6 @@ def get_totp_current_token(secret):
     """
     if not secret:
         return None
+    import pyotp
     totp = pyotp.TOTP(secret)
     return totp.now()
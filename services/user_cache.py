@@ -0,0 +1,89 @@
+"""Per-process identity cache for ``login_manager.user_loader``.
+
+Flask-Login resolves ``current_user`` on every authenticated request. Instead of a
+``SELECT`` per request we keep a short-lived snapshot of each user's column values and
+rebuild a session-attached ``User`` from it without touching the database.
+
+Entries expire after ``USER_CACHE_TTL`` seconds (0 disables the cache), which bounds
+staleness across worker processes. Within a process, any ORM update or delete of a
+``User`` and any bulk UPDATE/DELETE against the ``user`` table drops the affected
+entries immediately, so role, currency, locale and password changes made through the
+admin endpoints take effect on the very next request.
+"""
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from extensions import db
+from models import User
+
+_cache = {}
+_lock = threading.Lock()
+_columns = ()
+
+
+def load_user_cached(user_id, ttl):
+    """Return the ``User`` for ``user_id``, from the cache when a fresh snapshot exists."""
+    if ttl <= 0:
+        return db.session.get(User, user_id)
+
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        user = User(**entry[1])
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        snapshot = {key: getattr(user, key) for key in _column_keys()}
+        with _lock:
+            _cache[user_id] = (now + ttl, snapshot)
+    return user
+
+
+def _column_keys():
+    # Resolved lazily: inspecting the mapper configures every model, which is too
+    # expensive to do at import time
+    global _columns
+    if not _columns:
+        _columns = tuple(attr.key for attr in inspect(User).column_attrs)
+    return _columns
+
+
+def invalidate_user(user_id=None):
+    """Drop one cached user, or all of them when ``user_id`` is None."""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    invalidate_user(target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('_stale_users', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    # A concurrent request may have re-cached the pre-commit row between flush and commit
+    for user_id in session.info.pop('_stale_users', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_user_changes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    statement = orm_execute_state.statement
+    mapper = orm_execute_state.bind_mapper
+    if (mapper is not None and mapper.class_ is User) or getattr(statement, 'table', None) is User.__table__:
+        invalidate_user()
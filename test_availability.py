@@ -0,0 +1,133 @@
+"""Tests for the table availability engine (services/availability.py)"""
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import Restaurant, RestaurantFloorPlan, TableSection, Table, User
+from services import availability
+from services.availability import Intervals
+
+EVENING = datetime(2026, 3, 6, 19, 0)
+
+
+class TestIntervals(unittest.TestCase):
+
+    def test_matches_a_linear_scan(self):
+        rng = random.Random(3)
+        base = datetime(2026, 3, 6)
+        intervals, booked = Intervals(), {}
+        for booking_id in range(300):
+            start = base + timedelta(minutes=rng.randrange(0, 1440, 15))
+            booked[booking_id] = (start, start + timedelta(minutes=rng.choice((30, 90, 240))))
+            intervals.add(*booked[booking_id], booking_id)
+            if rng.random() < 0.3:
+                removed = rng.choice(list(booked))
+                intervals.remove(removed)
+                del booked[removed]
+        for _ in range(500):
+            start = base + timedelta(minutes=rng.randrange(0, 1500, 5))
+            end = start + timedelta(minutes=rng.choice((15, 90)))
+            overlapping = [e for s, e in booked.values() if s < end and e > start]
+            self.assertEqual(intervals.blocked_until(start, end), max(overlapping) if overlapping else None)
+
+
+class TestAvailability(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        availability.clear()
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Booking Bistro', email='book@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            plan = RestaurantFloorPlan(restaurant_id=restaurant.id)
+            db.session.add(plan)
+            db.session.flush()
+            section = TableSection(floor_plan_id=plan.id, name='Main')
+            db.session.add(section)
+            db.session.flush()
+            tables = [Table(section_id=section.id, table_number=str(n), seats=seats)
+                      for n, seats in enumerate((2, 2, 4), 1)]
+            db.session.add_all(tables)
+            db.session.add(User(username='host', password_hash=owner.password_hash, role='admin',
+                                restaurant_id=restaurant.id))
+            db.session.commit()
+            self.restaurant_id = restaurant.id
+            self.two_a, self.two_b, self.four = (table.id for table in tables)
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'host', 'password': 'admin'})
+        response = self.client.post('/pos/tables/combinations',
+                                    json={'name': '1+2', 'table_ids': [self.two_a, self.two_b]})
+        self.assertEqual(response.status_code, 201)
+        self.combination = response.get_json()['id']
+
+    def _book(self, party_size, at, **extra):
+        return self.client.post('/pos/bookings', json={
+            'party_size': party_size, 'booking_date': at.isoformat(), 'customer_name': 'Ionescu', **extra})
+
+    def _options(self, party_size, at):
+        response = self.client.get(f'/pos/tables/availability?party_size={party_size}&at={at.isoformat()}')
+        self.assertEqual(response.status_code, 200)
+        return [(o['table_ids'], o['combination_id']) for o in response.get_json()['options']]
+
+    def test_best_fit_then_combination_then_full(self):
+        self.assertEqual(self._options(4, EVENING), [([self.four], None),
+                                                     ([self.two_a, self.two_b], self.combination)])
+        first = self._book(4, EVENING)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.get_json()['table_id'], self.four)
+        second = self._book(3, EVENING + timedelta(minutes=30))
+        self.assertEqual(second.get_json()['combination_id'], self.combination)
+        self.assertEqual(self._book(2, EVENING + timedelta(minutes=45)).status_code, 409)
+        # A specific table that is free for the time, and one that is not
+        self.assertEqual(self._book(2, EVENING + timedelta(hours=2), table_id=self.two_a).status_code, 201)
+        self.assertEqual(self._book(2, EVENING + timedelta(hours=2), table_id=self.two_a).status_code, 409)
+
+        self.assertEqual(self._options(2, EVENING + timedelta(minutes=89)), [])
+        self.assertEqual(self._options(4, EVENING + timedelta(minutes=90)), [([self.four], None)])
+
+        response = self.client.get('/pos/tables/availability/slots?party_size=4&limit=3'
+                                   f'&after={EVENING.isoformat()}')
+        slots = response.get_json()['slots']
+        self.assertEqual([slot['start'] for slot in slots],
+                         ['2026-03-06T20:30:00', '2026-03-06T20:45:00', '2026-03-06T21:00:00'])
+        self.assertEqual(slots[0]['options'][0]['table_ids'], [self.four])
+
+    def test_cancel_updates_the_loaded_index_in_place(self):
+        booking = self._book(4, EVENING, combination_id=self.combination).get_json()
+        self.assertEqual(self._options(2, EVENING), [([self.four], None)])
+
+        with self.app.app_context():
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement) \
+                if 'table_booking.booking_date >=' in statement else None
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                self.assertEqual(self.client.delete(f"/pos/bookings/{booking['id']}").status_code, 200)
+                options = self._options(2, EVENING)
+                new = self._book(2, EVENING + timedelta(hours=3), table_id=self.two_b).get_json()
+                later = self._options(2, EVENING + timedelta(hours=3))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(options, [([self.two_a], None), ([self.two_b], None), ([self.four], None),
+                                   ([self.two_a, self.two_b], self.combination)])
+        self.assertEqual(later, [([self.two_a], None), ([self.four], None)])
+        self.assertTrue(new['id'])
+        # The day was not reloaded: cancel and booking updated the loaded index in place
+        self.assertEqual(statements, [])
+
+    def test_bookings_running_past_midnight(self):
+        late = datetime(2026, 3, 6, 23, 30)
+        self.assertEqual(self._book(4, late, table_id=self.four, duration_minutes=120).status_code, 201)
+        self.assertNotIn(([self.four], None), self._options(4, datetime(2026, 3, 7, 1, 0)))
+        self.assertIn(([self.four], None), self._options(4, datetime(2026, 3, 7, 1, 30)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+"""Tests for delayed course release, scheduler leases and the KDS event stream"""
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from extensions import db
+from models import Order, DelayedOrder, StreamEvent
+from services.course_scheduler import CourseScheduler
+from services.events import publish
+
+T0 = datetime(2026, 3, 1, 19, 0, 0)
+
+
+class FakeClock:
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+
+
+class TestCourseScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.clock = FakeClock(T0)
+        with self.app.app_context():
+            order = Order()
+            db.session.add(order)
+            db.session.flush()
+            courses = [DelayedOrder(order_id=order.id, course_number=n, delay_minutes=delay, created_at=T0)
+                       for n, delay in ((1, 0), (2, 10), (3, 20))]
+            db.session.add_all(courses)
+            db.session.commit()
+            self.order_id = order.id
+            self.course_ids = [c.id for c in courses]
+
+    def _scheduler(self):
+        return CourseScheduler(self.app, clock=self.clock)
+
+    def _sent(self):
+        with self.app.app_context():
+            return [c.id for c in DelayedOrder.query.filter_by(sent_to_kitchen=True).order_by(DelayedOrder.id)]
+
+    def test_fires_courses_when_due(self):
+        scheduler = self._scheduler()
+        with self.app.app_context():
+            self.assertEqual(scheduler.tick(), 600.0)
+            self.assertEqual(self._sent(), self.course_ids[:1])
+
+            self.clock.advance(minutes=9, seconds=59)
+            scheduler.tick()
+            self.assertEqual(self._sent(), self.course_ids[:1])
+
+            self.clock.advance(seconds=1)
+            self.assertEqual(scheduler.tick(), 600.0)
+            self.assertEqual(self._sent(), self.course_ids[:2])
+
+            events = StreamEvent.query.filter_by(channel='kds', event_type='course_fired').all()
+            self.assertEqual([json.loads(e.payload)['course_number'] for e in events], [1, 2])
+            self.assertEqual(DelayedOrder.query.get(self.course_ids[1]).sent_at, T0 + timedelta(minutes=10))
+
+    def test_only_the_lease_holder_fires(self):
+        leader, follower = self._scheduler(), self._scheduler()
+        with self.app.app_context():
+            leader.tick()
+            self.assertIsNone(follower.tick())
+            self.assertTrue(leader.is_leader)
+            self.assertFalse(follower.is_leader)
+
+            # The leader stops renewing (e.g. its process died): the follower takes over
+            # after the lease expires, rebuilds from the database and fires what is due
+            self.clock.advance(minutes=21)
+            follower.tick()
+            self.assertTrue(follower.is_leader)
+            self.assertEqual(self._sent(), self.course_ids)
+            self.assertEqual(StreamEvent.query.filter_by(event_type='course_fired').count(), 3)
+
+            leader.tick()
+            self.assertFalse(leader.is_leader)
+
+    def test_picks_up_courses_created_elsewhere(self):
+        scheduler = self._scheduler()
+        with self.app.app_context():
+            scheduler.tick()
+            self.assertEqual(scheduler.pending(), 2)
+
+        client = self.app.test_client()
+        client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+        res = client.post('/pos/delayed-orders', json={'order_id': self.order_id, 'course_number': 4,
+                                                       'delay_minutes': 0})
+        self.assertEqual(res.status_code, 201)
+
+        with self.app.app_context():
+            # Created "now" by the real clock, so it is long overdue for the fake one
+            self.clock.now = datetime.utcnow()
+            scheduler.tick()
+            self.assertIn(res.get_json()['id'], self._sent())
+
+    def test_picks_up_ids_committed_out_of_order(self):
+        scheduler = self._scheduler()
+        with self.app.app_context():
+            scheduler.tick()
+            late_id = self.course_ids[-1] + 1
+            # A higher id commits first; the transaction holding the lower id commits later
+            db.session.add(DelayedOrder(id=late_id + 1, order_id=self.order_id, course_number=5,
+                                        delay_minutes=0, created_at=T0))
+            db.session.commit()
+            scheduler.tick()
+            db.session.add(DelayedOrder(id=late_id, order_id=self.order_id, course_number=4,
+                                        delay_minutes=0, created_at=T0))
+            db.session.commit()
+            scheduler.tick()
+            self.assertIn(late_id, self._sent())
+            self.assertEqual(StreamEvent.query.filter_by(event_type='course_fired').count(), 3)
+
+    def test_clock_moving_back_holds_courses(self):
+        scheduler = self._scheduler()
+        with self.app.app_context():
+            scheduler.tick()
+            self.clock.now = T0 - timedelta(hours=1)
+            with self.assertLogs('services.course_scheduler', 'WARNING'):
+                scheduler.tick()
+            self.assertEqual(self._sent(), self.course_ids[:1])
+            self.clock.now = T0 + timedelta(minutes=20)
+            scheduler.tick()
+            self.assertEqual(self._sent(), self.course_ids)
+
+    def test_rebuild_skips_sent_courses(self):
+        with self.app.app_context():
+            DelayedOrder.query.get(self.course_ids[0]).sent_to_kitchen = True
+            db.session.commit()
+            scheduler = self._scheduler()
+            scheduler.tick()
+            self.assertEqual(scheduler.pending(), 2)
+            self.assertEqual(StreamEvent.query.count(), 0)
+
+
+class TestKdsEventStream(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+
+    def _frames(self, response, count):
+        frames = []
+        for chunk in response.response:
+            frames.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            if len(frames) == count:
+                break
+        response.close()
+        return frames
+
+    def test_resume_from_last_event_id(self):
+        with self.app.app_context():
+            first = publish('kds', 'course_fired', {'order_id': 1})
+            second = publish('kds', 'course_fired', {'order_id': 2})
+            publish('floor', 'table_seated', {'table_id': 3})
+
+        res = self.client.get('/kds/events', headers={'Last-Event-ID': str(first)}, buffered=False)
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        retry, frame = self._frames(res, 2)
+        self.assertTrue(retry.startswith('retry:'))
+        self.assertEqual(frame, f'id: {second}\nevent: course_fired\ndata: {{"order_id": 2}}\n\n')
+
+    def test_malformed_last_event_id_starts_live(self):
+        with self.app.app_context():
+            publish('kds', 'course_fired', {'order_id': 1})
+        res = self.client.get('/kds/events', headers={'Last-Event-ID': 'abc'}, buffered=False)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            latest = publish('kds', 'course_fired', {'order_id': 2})
+        _, frame = self._frames(res, 2)
+        self.assertTrue(frame.startswith(f'id: {latest}\n'))
+
+    def test_stream_ends_after_max_duration(self):
+        self.app.config['SSE_MAX_STREAM_SECONDS'] = 0.2
+        self.app.config['SSE_POLL_INTERVAL'] = 0.05
+        res = self.client.get('/kds/events?last_id=0', buffered=False)
+        frames = list(res.response)
+        res.close()
+        self.assertTrue(frames[0].decode().startswith('retry:'))
+
+    def test_order_creation_is_published(self):
+        res = self.client.post('/pos/orders', json={'items': [{'menu_item_id': 1, 'quantity': 2}]})
+        self.assertEqual(res.status_code, 201)
+        stream = self.client.get('/kds/events?last_id=0', buffered=False)
+        _, frame = self._frames(stream, 2)
+        self.assertIn('event: order_created', frame)
+        self.assertIn(f'"order_id": {res.get_json()["id"]}', frame)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Tests for the synthetic data generator (services/datagen.py)"""
+import unittest
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import create_app
+from extensions import db
+from models import Restaurant, Order, OrderItem, PaymentTransaction, LoyaltyCard, LoyaltyPoints, Invoice
+from services.datagen import generate
+
+END = datetime(2025, 6, 30)
+
+
+def _generated_tables():
+    return [t for t in reversed(db.metadata.sorted_tables) if t.name not in ('user', 'menu_item', 'inventory_item')]
+
+
+class TestDataGen(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def _run(self):
+        return generate(restaurants=4, products=15, customers=20, days=14, orders_per_day=10,
+                        seed=7, batch_size=100, end_date=END)
+
+    def _fingerprint(self):
+        return (
+            db.session.query(func.count(Order.id), func.min(Order.created_at), func.max(Order.created_at)).one(),
+            db.session.query(func.sum(PaymentTransaction.amount)).scalar(),
+            db.session.query(func.sum(OrderItem.quantity * OrderItem.menu_item_id)).scalar(),
+        )
+
+    def test_counts_and_relationships(self):
+        counts = self._run()
+        self.assertEqual(counts['restaurant'], Restaurant.query.count())
+        self.assertEqual(counts['order'], Order.query.count())
+        self.assertEqual(counts['order'], counts['payment_transaction'])
+        self.assertGreater(counts['order_item'], counts['order'])
+        self.assertGreater(counts['loyalty_points'], 0)
+        self.assertEqual(counts['invoice'], Invoice.query.count())
+        self.assertTrue(all(o.created_at < END for o in Order.query.limit(50)))
+
+        # Card totals are back-filled from the generated ledger
+        for card in LoyaltyCard.query.all():
+            ledger = db.session.query(func.coalesce(func.sum(LoyaltyPoints.points), 0)) \
+                .filter_by(loyalty_card_id=card.id).scalar()
+            self.assertEqual(card.points_balance, ledger)
+
+    def test_same_seed_same_data(self):
+        self._run()
+        first = self._fingerprint()
+        for table in _generated_tables():
+            db.session.execute(table.delete())
+        db.session.execute(db.metadata.tables['user'].delete().where(
+            db.metadata.tables['user'].c.username.notin_(['admin', 'waiter', 'kitchen', 'manager'])))
+        db.session.commit()
+        self._run()
+        self.assertEqual(first, self._fingerprint())
+
+
+if __name__ == '__main__':
+    unittest.main()
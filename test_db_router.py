@@ -0,0 +1,66 @@
+"""Tests for read-replica routing of reporting/listing endpoints"""
+import os
+import tempfile
+import unittest
+
+from config import Config
+from app import create_app
+from extensions import db
+from models import MenuItem
+from services.db_router import REPLICA_BIND, reset_replica_status
+
+
+class TestReplicaRouting(unittest.TestCase):
+    """A second SQLite file stands in for the replica"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self._orig_uri = Config.SQLALCHEMY_REPLICA_URI
+        Config.SQLALCHEMY_REPLICA_URI = 'sqlite:///' + os.path.join(self.tmpdir.name, 'replica.db')
+        try:
+            self.app = create_app()
+        finally:
+            Config.SQLALCHEMY_REPLICA_URI = self._orig_uri
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+        reset_replica_status()
+
+        with self.app.app_context():
+            replica = db.engines[REPLICA_BIND]
+            db.metadata.create_all(replica)
+            with replica.begin() as conn:
+                conn.execute(MenuItem.__table__.insert(), [{'name': 'Replica Only', 'price': 1.0, 'available': True}])
+
+    def tearDown(self):
+        reset_replica_status()
+        with self.app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        self.tmpdir.cleanup()
+
+    def _menu_names(self):
+        res = self.client.get('/api/menu')
+        self.assertEqual(res.status_code, 200)
+        return {m['name'] for m in res.get_json()}
+
+    def test_reads_go_to_replica(self):
+        names = self._menu_names()
+        self.assertIn('Replica Only', names)
+        self.assertNotIn('Chicken Sizzler', names)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        self.app.config['REPLICA_MAX_LAG_SECONDS'] = -1
+        names = self._menu_names()
+        self.assertIn('Chicken Sizzler', names)
+        self.assertNotIn('Replica Only', names)
+
+    def test_unflagged_endpoints_use_primary(self):
+        with self.app.app_context():
+            names = {m.name for m in MenuItem.query.all()}
+        self.assertIn('Chicken Sizzler', names)
+        self.assertNotIn('Replica Only', names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""Tests for the cached floor state and pushed table diffs (services/floor.py)"""
+import json
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import (
+    Order, Restaurant, RestaurantFloorPlan, TableSection, Table, StreamEvent, User
+)
+from services import floor
+
+
+class TestFloorState(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Floor Bistro', email='floor@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            plan = RestaurantFloorPlan(restaurant_id=restaurant.id)
+            db.session.add(plan)
+            db.session.flush()
+            section = TableSection(floor_plan_id=plan.id, name='Patio')
+            db.session.add(section)
+            db.session.flush()
+            tables = [Table(section_id=section.id, table_number=str(n), seats=4) for n in range(1, 4)]
+            orders = [Order(), Order()]
+            db.session.add_all(tables + orders)
+            db.session.add(User(username='floorwaiter', password_hash=owner.password_hash, role='admin',
+                                restaurant_id=restaurant.id))
+            db.session.commit()
+            self.restaurant_id = restaurant.id
+            self.table_ids = [table.id for table in tables]
+            self.order_ids = [order.id for order in orders]
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'floorwaiter', 'password': 'admin'})
+
+    def _events(self, after=0):
+        with self.app.app_context():
+            return [json.loads(e.payload) for e in StreamEvent.query.filter(
+                StreamEvent.channel == floor.channel(self.restaurant_id), StreamEvent.id > after)
+                .order_by(StreamEvent.id)]
+
+    def test_snapshot_is_cached_until_the_version_moves(self):
+        first = self.client.get('/pos/tables')
+        self.assertEqual(first.status_code, 200)
+        body = first.get_json()
+        self.assertEqual((body['version'], len(body['tables'])), (0, 3))
+
+        with self.app.app_context():
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                again = self.client.get('/pos/tables', headers={'If-None-Match': first.headers['ETag']})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(again.status_code, 304)
+        self.assertFalse([s for s in statements if 'table_section' in s])  # no join re-run
+
+        response = self.client.post(f'/pos/tables/{self.table_ids[0]}/assign', json={'order_id': self.order_ids[0]})
+        self.assertEqual(response.status_code, 200)
+        after = self.client.get('/pos/tables', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(after.status_code, 200)
+        body = after.get_json()
+        self.assertEqual(body['version'], 1)
+        self.assertEqual(body['tables'][0]['status'], 'occupied')
+        self.assertEqual(body['tables'][0]['current_order_id'], self.order_ids[0])
+
+    def test_changes_push_versioned_diffs(self):
+        start = self.client.get('/pos/tables').get_json()['last_event_id']
+        first, second, third = self.table_ids
+        self.assertEqual(self.client.post(f'/pos/tables/{first}/assign',
+                                          json={'order_id': self.order_ids[0]}).status_code, 200)
+        # Occupied by another order
+        self.assertEqual(self.client.post(f'/pos/tables/{first}/assign',
+                                          json={'order_id': self.order_ids[1]}).status_code, 409)
+        self.assertEqual(self.client.post(f'/pos/tables/{first}/transfer',
+                                          json={'destination_table_id': second}).status_code, 200)
+        self.assertEqual(self.client.put(f'/pos/tables/{third}/status', json={
+            'status': 'reserved', 'reserved_by': 'Popescu', 'reserved_until': '2026-03-02T20:00:00'}).status_code, 200)
+
+        diffs = self._events(start)
+        self.assertEqual([diff['version'] for diff in diffs], [1, 2, 3])
+        self.assertEqual([[t['id'] for t in diff['tables']] for diff in diffs], [[first], [first, second], [third]])
+        moved = {t['id']: t for t in diffs[1]['tables']}
+        self.assertEqual((moved[first]['status'], moved[first]['current_order_id']), ('available', None))
+        self.assertEqual((moved[second]['status'], moved[second]['current_order_id']), ('occupied', self.order_ids[0]))
+        self.assertEqual(diffs[2]['tables'][0]['reserved_by'], 'Popescu')
+
+        # Replaying the diffs over the first snapshot gives the current snapshot
+        snapshot = {t['id']: t for t in self.client.get('/pos/tables').get_json()['tables']}
+        replayed = {}
+        for diff in diffs:
+            replayed.update({t['id']: t for t in diff['tables']})
+        for table_id, row in replayed.items():
+            self.assertEqual(snapshot[table_id], row)
+
+    def test_transfer_from_an_empty_table(self):
+        first, second, _ = self.table_ids
+        response = self.client.post(f'/pos/tables/{first}/transfer', json={'destination_table_id': second})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._events(), [])
+        tables = {t['id']: t for t in self.client.get('/pos/tables').get_json()['tables']}
+        self.assertEqual(tables[second]['status'], 'available')
+
+    def test_unknown_table(self):
+        response = self.client.post('/pos/tables/999999/assign', json={'order_id': self.order_ids[0]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self._events(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
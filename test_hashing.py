@@ -0,0 +1,133 @@
+"""Tests for pooled password / backup-code hashing (services/hashing.py)"""
+import json
+import time
+import unittest
+from unittest import mock
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from config import Config
+from extensions import db
+from models import User
+from services import hashing
+from services.totp import generate_totp_secret, use_backup_code
+
+
+class TestHashing(unittest.TestCase):
+
+    def test_argon2_and_legacy_hashes_verify(self):
+        new = hashing.hash_password('s3cret')
+        self.assertTrue(new.startswith('$argon2id$'))
+        self.assertTrue(hashing.verify_password(new, 's3cret'))
+        self.assertFalse(hashing.verify_password(new, 'wrong'))
+        self.assertFalse(hashing.needs_rehash(new))
+
+        legacy = generate_password_hash('s3cret')
+        self.assertTrue(hashing.verify_password(legacy, 's3cret'))
+        self.assertTrue(hashing.needs_rehash(legacy))
+        self.assertFalse(hashing.verify_password('not-a-hash', 's3cret'))
+
+    def test_backup_codes_use_lookup_prefix(self):
+        result = generate_totp_secret('alice')
+        stored = json.loads(result['backup_codes_hashed'])
+        self.assertTrue(all(set(entry) == {'lookup', 'hash'} for entry in stored))
+
+        code = result['backup_codes'][3]
+        consumed = use_backup_code(result['backup_codes_hashed'], code)
+        self.assertTrue(consumed['valid'])
+        self.assertEqual(consumed['codes_remaining'], 9)
+        self.assertFalse(use_backup_code(consumed['remaining_codes_json'], code)['valid'])
+
+    def test_legacy_backup_codes_still_accepted(self):
+        legacy = json.dumps([generate_password_hash('AAAA1111'), generate_password_hash('BBBB2222')])
+        consumed = use_backup_code(legacy, 'BBBB2222')
+        self.assertTrue(consumed['valid'])
+        self.assertEqual(consumed['codes_remaining'], 1)
+
+
+class TestPoolSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+
+    def tearDown(self):
+        hashing.configure(self.app)
+
+    def test_timed_out_work_keeps_its_slot(self):
+        self.app.config.update(HASHING_MAX_QUEUE=1, HASHING_TIMEOUT=0.2)
+        hashing.configure(self.app)
+        self.assertEqual(hashing._run(abs, -1), 1)  # pool started
+        with self.assertRaises(hashing.HashingBusy):
+            hashing._run(time.sleep, 1)
+        # Still sleeping in the pool: no room for more work until it finishes
+        with self.assertRaisesRegex(hashing.HashingBusy, 'in flight'):
+            hashing._run(abs, -2)
+        time.sleep(1.2)
+        self.assertEqual(hashing._run(abs, -3), 3)
+
+
+class TestLoginHashing(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        hashing.configure(self.app)
+
+    def test_login_upgrades_legacy_hash(self):
+        res = self.client.post('/auth/login', data={'username': 'waiter', 'password': 'waiter'})
+        self.assertEqual(res.status_code, 302)
+        with self.app.app_context():
+            stored = User.query.filter_by(username='waiter').first().password_hash
+        self.assertTrue(stored.startswith('$argon2id$'))
+
+        self.client.get('/auth/logout')
+        res = self.client.post('/auth/login', data={'username': 'waiter', 'password': 'waiter'})
+        self.assertEqual(res.status_code, 302)
+
+    def test_saturated_pool_returns_503(self):
+        saved = Config.HASHING_MAX_QUEUE
+        Config.HASHING_MAX_QUEUE = 0
+        try:
+            busy_app = create_app()
+        finally:
+            Config.HASHING_MAX_QUEUE = saved
+        busy_app.config['WTF_CSRF_ENABLED'] = False
+        res = busy_app.test_client().post('/auth/login', data={'username': 'waiter', 'password': 'waiter'})
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers.get('Retry-After'), '1')
+        with self.app.app_context():
+            self.assertFalse(db.session.query(User.password_hash).filter_by(username='waiter').scalar()
+                             .startswith('$argon2'))
+
+    def test_busy_rehash_still_logs_in(self):
+        with mock.patch('blueprints.auth.routes.hash_password', side_effect=hashing.HashingBusy):
+            res = self.client.post('/auth/login', data={'username': 'waiter', 'password': 'waiter'})
+        self.assertEqual(res.status_code, 302)
+        with self.app.app_context():
+            self.assertFalse(db.session.query(User.password_hash).filter_by(username='waiter').scalar()
+                             .startswith('$argon2'))
+
+    def test_2fa_disable_checks_argon2_password(self):
+        self.client.post('/auth/login', data={'username': 'manager', 'password': 'manager'})
+        with self.app.app_context():
+            user = User.query.filter_by(username='manager').first()
+            self.assertTrue(user.password_hash.startswith('$argon2id$'))  # upgraded by the login
+            user.totp_enabled = True
+            user.totp_secret = 'JBSWY3DPEHPK3PXP'
+            db.session.commit()
+        with mock.patch('blueprints.auth.routes.verify_password', side_effect=hashing.HashingBusy):
+            self.assertEqual(self.client.post('/auth/api/2fa-disable', json={'password': 'manager'}).status_code, 503)
+        res = self.client.post('/auth/api/2fa-disable', json={'password': 'wrong'})
+        self.assertEqual(res.status_code, 401)
+        res = self.client.post('/auth/api/2fa-disable', json={'password': 'manager'})
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            self.assertFalse(User.query.filter_by(username='manager').first().totp_enabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
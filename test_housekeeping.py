@@ -0,0 +1,77 @@
+"""Tests for the leased housekeeping jobs (services/housekeeping.py)"""
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from services.housekeeping import Housekeeping, Job
+
+T0 = datetime(2026, 3, 1, 3, 0, 0)
+
+
+class FakeClock:
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+
+
+class TestHousekeeping(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.clock = FakeClock(T0)
+        self.runs = []
+        self.failures = 0
+
+    def _job(self, now):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("snapshot failed")
+        self.runs.append(now)
+
+    def _housekeeping(self):
+        return Housekeeping(self.app, clock=self.clock, jobs=[Job('test_job', timedelta(hours=1), self._job)])
+
+    def test_runs_once_per_period(self):
+        housekeeping = self._housekeeping()
+        with self.app.app_context():
+            self.assertEqual(housekeeping.run_due(), ['test_job'])
+            self.clock.advance(minutes=59)
+            self.assertEqual(housekeeping.run_due(), [])
+            self.clock.advance(minutes=1)
+            self.assertEqual(housekeeping.run_due(), ['test_job'])
+        self.assertEqual(self.runs, [T0, T0 + timedelta(hours=1)])
+
+    def test_failed_job_is_retried_on_the_next_pass(self):
+        housekeeping = self._housekeeping()
+        self.failures = 1
+        with self.app.app_context():
+            with self.assertLogs('services.housekeeping', 'ERROR'):
+                self.assertEqual(housekeeping.run_due(), [])
+            self.clock.advance(minutes=1)
+            self.assertEqual(housekeeping.run_due(), ['test_job'])
+        self.assertEqual(self.runs, [T0 + timedelta(minutes=1)])
+
+    def test_one_worker_per_job(self):
+        leader, follower = self._housekeeping(), self._housekeeping()
+        with self.app.app_context():
+            leader.run_due()
+            for _ in range(18):  # three hours of passes
+                self.clock.advance(minutes=10)
+                follower.run_due()
+                leader.run_due()
+            self.assertEqual(len(self.runs), 4)
+
+            # The leader stops renewing; the follower takes over once the lease expires
+            self.clock.advance(seconds=self.app.config['HOUSEKEEPING_LEASE_TTL'] + 1)
+            self.assertEqual(follower.run_due(), ['test_job'])
+            self.assertEqual(leader.run_due(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Tests for recipe-based stock depletion at checkout (services/inventory.py)"""
+import json
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import User, Restaurant, PaymentMethod, Product, InventoryItem, Order, StreamEvent
+from services import inventory
+
+
+class TestInventoryDepletion(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Stock Bistro', email='stock@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            method = PaymentMethod(restaurant_id=restaurant.id, name='Cash', payment_type='cash')
+            burger = Product(restaurant_id=restaurant.id, name='Burger', base_price=12.0)
+            fries = Product(restaurant_id=restaurant.id, name='Fries', base_price=4.0)
+            beef = InventoryItem(name='Beef', quantity=10.4, unit='kg', low_stock_threshold=10)
+            potatoes = InventoryItem(name='Potatoes', quantity=50, unit='kg')
+            oil = InventoryItem(name='Frying oil', quantity=20, unit='liters', low_stock_threshold=2)
+            db.session.add_all([method, burger, fries, beef, potatoes, oil])
+            db.session.commit()
+            self.method_id, self.burger_id, self.fries_id = method.id, burger.id, fries.id
+            self.beef_id, self.potatoes_id, self.oil_id = beef.id, potatoes.id, oil.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+        for product_id, ingredients in ((self.burger_id, [(self.beef_id, 0.25), (self.oil_id, 0.05)]),
+                                        (self.fries_id, [(self.potatoes_id, 0.3), (self.oil_id, 0.02)])):
+            res = self.client.put(f'/inventory/recipes/{product_id}', json={'ingredients': [
+                {'inventory_item_id': item_id, 'quantity': quantity} for item_id, quantity in ingredients]})
+            self.assertEqual(res.status_code, 200, res.get_json())
+
+    def _order(self, *lines):
+        return self.client.post('/pos/orders', json={'items': [
+            {'product_id': product_id, 'quantity': quantity} for product_id, quantity in lines
+        ]}).get_json()['id']
+
+    def _checkout(self, order_id):
+        return self.client.post(f'/pos/orders/{order_id}/checkout', json={
+            'payment_method_id': self.method_id, 'amount': 50.0})
+
+    def _stock(self):
+        with self.app.app_context():
+            return {item.id: round(item.quantity, 4) for item in
+                    InventoryItem.query.filter(InventoryItem.id.in_([self.beef_id, self.potatoes_id, self.oil_id]))}
+
+    def _low_stock_events(self):
+        with self.app.app_context():
+            return [json.loads(e.payload)['inventory_item_id']
+                    for e in StreamEvent.query.filter_by(channel='inventory', event_type='low_stock')]
+
+    def test_checkout_depletes_aggregated_usage_in_one_statement(self):
+        order_id = self._order((self.burger_id, 1), (self.fries_id, 3), (self.burger_id, 1))
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                res = self._checkout(order_id)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(res.status_code, 200, res.get_json())
+        self.assertEqual(len([s for s in statements if s.startswith('UPDATE inventory_item')]), 1)
+        self.assertEqual(self._stock(), {self.beef_id: 9.9, self.potatoes_id: 49.1, self.oil_id: 19.84})
+
+        # A retried depletion for the same order takes nothing
+        with self.app.app_context():
+            self.assertEqual(inventory.deplete_order(db.session.get(Order, order_id)), [])
+            db.session.commit()
+        self.assertEqual(self._stock()[self.beef_id], 9.9)
+
+    def test_low_stock_event_once_when_threshold_is_crossed(self):
+        before = self._low_stock_events().count(self.beef_id)
+        self._checkout(self._order((self.burger_id, 1)))  # 10.4 -> 10.15
+        self.assertEqual(self._low_stock_events().count(self.beef_id), before)
+        self._checkout(self._order((self.burger_id, 1)))  # -> 9.9, crosses 10
+        self.assertEqual(self._low_stock_events().count(self.beef_id), before + 1)
+        self._checkout(self._order((self.burger_id, 1)))  # already below
+        self.assertEqual(self._low_stock_events().count(self.beef_id), before + 1)
+
+        low = {item['id'] for item in self.client.get('/inventory/low-stock').get_json()}
+        self.assertIn(self.beef_id, low)
+        self.assertNotIn(self.oil_id, low)
+
+    def test_recipe_validation(self):
+        res = self.client.put(f'/inventory/recipes/{self.burger_id}', json={
+            'ingredients': [{'inventory_item_id': 999999, 'quantity': 1}]})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.put(f'/inventory/recipes/{self.burger_id}', json={
+            'ingredients': [{'inventory_item_id': self.beef_id, 'quantity': -1}]})
+        self.assertEqual(res.status_code, 400)
+        recipe = self.client.get(f'/inventory/recipes/{self.burger_id}').get_json()
+        self.assertEqual({i['inventory_item_id']: i['quantity'] for i in recipe['ingredients']},
+                         {self.beef_id: 0.25, self.oil_id: 0.05})
+
+
+if __name__ == '__main__':
+    unittest.main()
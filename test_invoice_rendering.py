@@ -0,0 +1,158 @@
+"""Tests for template-based invoice rendering, its cache and monthly archives"""
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest import mock
+from datetime import datetime
+
+from app import create_app
+from extensions import db
+from models import User, Restaurant, StoreSettings, Invoice
+from services import invoices
+from services.invoices import address_lines, build_month_archive, InvoiceArchiver
+
+
+class TestInvoiceRendering(unittest.TestCase):
+
+    def setUp(self):
+        self.archives = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archives.cleanup)
+        self.app = create_app()
+        self.app.config.update(WTF_CSRF_ENABLED=False, INVOICE_ARCHIVE_DIR=self.archives.name)
+        self.app.extensions['invoice_archiver'].init_app(self.app)
+        invoices.clear_cache()
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Bistro Roma', email='roma@bistro.test', owner_id=owner.id,
+                                    address='Via Roma 1', city='Milano', postal_code='20121', country='Italy')
+            db.session.add(restaurant)
+            db.session.flush()
+            db.session.add(StoreSettings(restaurant_id=restaurant.id, locale='it', currency='EUR',
+                                         address_format='european', vat_number='IT01234567890',
+                                         invoice_prefix='BR'))
+            db.session.add(User(username='roma', password_hash=owner.password_hash, role='admin',
+                                restaurant_id=restaurant.id))
+            items = json.dumps([{'description': 'Catering', 'quantity': 2, 'price': 600.25}])
+            issued = Invoice(invoice_number='BR-1-000001', restaurant_id=restaurant.id, customer_name='ACME',
+                             items=items, total=1200.5, status='issued', issued_at=datetime(2026, 9, 3, 12))
+            later = Invoice(invoice_number='BR-1-000002', restaurant_id=restaurant.id, customer_name='Globex',
+                            items='Room hire', total=80.0, status='paid', issued_at=datetime(2026, 9, 28, 9))
+            other_month = Invoice(invoice_number='BR-1-000003', restaurant_id=restaurant.id, total=5.0,
+                                  status='issued', issued_at=datetime(2026, 10, 1, 0, 0))
+            db.session.add_all([issued, later, other_month])
+            db.session.commit()
+            self.restaurant_id, self.invoice_id = restaurant.id, issued.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'roma', 'password': 'admin'})
+
+    def test_store_settings_applied(self):
+        res = self.client.get(f'/admin/invoices/{self.invoice_id}/print')
+        self.assertEqual(res.status_code, 200)
+        html = res.get_data(as_text=True)
+        self.assertIn('Bistro Roma', html)
+        self.assertIn('20121 Milano', html)  # european address format
+        self.assertIn('VAT: IT01234567890', html)
+        self.assertIn('1.200,50', html)  # Italian number formatting
+        self.assertIn('€', html)
+        self.assertIn('Catering', html)
+        self.assertIn('lang="it"', html)
+
+        if not invoices.pdf_available():
+            self.assertEqual(self.client.get(f'/admin/invoices/{self.invoice_id}/print?format=pdf').status_code, 501)
+        self.assertEqual(self.client.get(f'/admin/invoices/{self.invoice_id}/print?format=doc').status_code, 400)
+
+    def test_issued_invoice_served_from_cache(self):
+        first = self.client.get(f'/admin/invoices/{self.invoice_id}/print')
+        self.assertTrue(first.headers.get('ETag'))
+        with self.app.app_context():
+            self.assertEqual(len(invoices._cache), 1)
+            calls = []
+            original = invoices.render_html
+            invoices.render_html = lambda context: calls.append(1) or original(context)
+            try:
+                again = self.client.get(f'/admin/invoices/{self.invoice_id}/print')
+                self.assertEqual(again.data, first.data)
+                self.assertEqual(calls, [])
+
+                # A browser revalidating gets 304
+                cached = self.client.get(f'/admin/invoices/{self.invoice_id}/print',
+                                         headers={'If-None-Match': first.headers['ETag']})
+                self.assertEqual(cached.status_code, 304)
+
+                # Any change to what is printed changes the hash
+                db.session.get(Invoice, self.invoice_id).customer_name = 'ACME Corp'
+                db.session.commit()
+                changed = self.client.get(f'/admin/invoices/{self.invoice_id}/print')
+                self.assertIn(b'ACME Corp', changed.data)
+                self.assertNotEqual(changed.headers['ETag'], first.headers['ETag'])
+                self.assertEqual(calls, [1])
+            finally:
+                invoices.render_html = original
+
+    def test_address_formats(self):
+        class Store:
+            address, city, postal_code, country = '1 Main St', 'Springfield', '12345', 'USA'
+        self.assertEqual(address_lines(Store, 'standard'), ['1 Main St', 'Springfield 12345', 'USA'])
+        self.assertEqual(address_lines(Store, 'european'), ['1 Main St', '12345 Springfield', 'USA'])
+        self.assertEqual(address_lines(Store, 'asian'), ['USA', '12345 Springfield', '1 Main St'])
+
+    def test_month_archive(self):
+        path = os.path.join(self.archives.name, 'test-archive.zip')
+        with self.app.app_context():
+            self.assertEqual(build_month_archive(self.restaurant_id, 2026, 9, path), 2)
+        with zipfile.ZipFile(path) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['BR-1-000001.html', 'BR-1-000002.html', 'index.csv'])
+            rows = list(csv.DictReader(io.StringIO(archive.read('index.csv').decode())))
+            self.assertEqual([r['invoice_number'] for r in rows], ['BR-1-000001', 'BR-1-000002'])
+            self.assertIn(b'Room hire', archive.read('BR-1-000002.html'))
+
+    def test_failed_archive_leaves_no_partial_file(self):
+        path = os.path.join(self.archives.name, 'broken.zip')
+        with self.app.app_context(), mock.patch.object(invoices, 'render_invoice', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                build_month_archive(self.restaurant_id, 2026, 9, path)
+        self.assertEqual(os.listdir(self.archives.name), [])
+
+    def test_old_jobs_expire(self):
+        archiver = self.app.extensions['invoice_archiver']
+        old = {"id": "0123456789ab", "status": "done", "path": os.path.join(self.archives.name, 'old.zip')}
+        archiver._write(old)
+        open(old["path"], 'wb').close()
+        week_ago = time.time() - archiver.retention - 60
+        os.utime(archiver._state_path(old["id"]), (week_ago, week_ago))
+        self.assertEqual(archiver.expire(), 1)
+        self.assertIsNone(archiver.get(old["id"]))
+        self.assertEqual(os.listdir(self.archives.name), [])
+
+    def test_background_archive_job(self):
+        res = self.client.post('/admin/api/invoices/archive', json={'month': '2026-09'})
+        self.assertEqual(res.status_code, 202)
+        job_id = res.get_json()['id']
+        for _ in range(100):
+            job = self.client.get(f'/admin/api/invoices/archive/{job_id}').get_json()
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['status'], 'done', job)
+        self.assertEqual(job['count'], 2)
+        # Another worker process sees the job through the archive directory
+        other = InvoiceArchiver()
+        other.directory = self.archives.name
+        self.assertEqual(other.get(job_id)['status'], 'done')
+        self.assertIsNone(other.get('../' + job_id))
+        download = self.client.get(f'/admin/api/invoices/archive/{job_id}?download=1')
+        self.assertEqual(download.mimetype, 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(download.data)) as archive:
+            self.assertIn('index.csv', archive.namelist())
+        download.close()
+
+        self.assertEqual(self.client.post('/admin/api/invoices/archive', json={'month': 'Sept'}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""Tests for kitchen prep-time sketches and ticket ETAs (services/kitchen_analytics.py)"""
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from extensions import db
+from models import (
+    Order, OrderItem, MenuItem, Product, ProductCategory, Restaurant, KitchenPrinter, PrinterRoute,
+    PrepTimeSample, User
+)
+from services import kitchen_analytics, order_lifecycle
+from services.kitchen_analytics import QuantileSketch
+
+T0 = datetime(2026, 3, 2, 12, 0)
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(6, 0.6) for _ in range(20000)]
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        ordered = sorted(values)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            exact = ordered[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1, delta=0.03)
+        self.assertLess(len(sketch.buckets), 400)
+
+        for value in values[:10000]:
+            sketch.remove(value)
+        ordered = sorted(values[10000:])
+        self.assertEqual(sketch.count, 10000)
+        self.assertAlmostEqual(sketch.quantile(0.5) / ordered[4999], 1, delta=0.03)
+
+
+class TestKitchenAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Kitchen Analytics Bistro', email='kitchen@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            drinks = ProductCategory(restaurant_id=restaurant.id, name='Drinks')
+            bar = KitchenPrinter(restaurant_id=restaurant.id, name='Bar', printer_type='bar')
+            db.session.add_all([drinks, bar])
+            db.session.flush()
+            db.session.add(PrinterRoute(restaurant_id=restaurant.id, category_id=drinks.id, printer_id=bar.id))
+            lemonade = Product(restaurant_id=restaurant.id, category_id=drinks.id, name='Lemonade', base_price=9)
+            db.session.add(lemonade)
+            db.session.flush()
+            self.lemonade = lemonade.id
+            # Order lines hold product or legacy menu item ids; pick one no product shares
+            self.burger = MenuItem.query.filter(MenuItem.id != lemonade.id).first().id
+            db.session.commit()
+
+    def _order(self, products, created_at=T0):
+        order = Order(status='pending', created_at=created_at)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([OrderItem(order_id=order.id, menu_item_id=product_id, quantity=1)
+                            for product_id in products])
+        db.session.commit()
+        return order.id
+
+    def _cook(self, products, started, minutes):
+        order_id = self._order(products, created_at=started - timedelta(minutes=1))
+        order_lifecycle.transition([order_id], 'cooking', now=started)
+        order_lifecycle.transition([order_id], 'ready', now=started + timedelta(minutes=minutes))
+        db.session.commit()
+        return order_id
+
+    def test_distributions_update_incrementally_and_age_out(self):
+        with self.app.app_context():
+            for minutes in (4, 6, 8, 10, 12):
+                self._cook([self.burger], T0, minutes)
+            self._cook([self.lemonade], T0, 2)
+            self.assertEqual(PrepTimeSample.query.count(), 6)
+
+            summary = kitchen_analytics.stats(T0 + timedelta(hours=1)).summary()
+            self.assertEqual(summary["items"][self.burger]["count"], 5)
+            self.assertAlmostEqual(summary["items"][self.burger]["p50"], 480, delta=480 * 0.02)
+            self.assertEqual(summary["stations"]["Bar"]["count"], 1)
+            self.assertEqual(summary["stations"]["kitchen"]["count"], 5)
+
+            later = T0 + timedelta(days=10)
+            self._cook([self.burger], later, 20)
+            summary = kitchen_analytics.stats(later + timedelta(hours=1)).summary()
+            self.assertEqual(summary["items"][self.burger]["count"], 6)
+
+            # Two weeks after the first batch only the late burger is left in the window
+            summary = kitchen_analytics.stats(T0 + timedelta(days=14, hours=2)).summary()
+            self.assertEqual(summary["items"][self.burger]["count"], 1)
+            self.assertNotIn("Bar", summary["stations"])
+
+        client = self.app.test_client()
+        client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+        response = client.get('/analytics/kitchen')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stations', response.get_json())
+
+    def test_samples_committed_out_of_order(self):
+        with self.app.app_context():
+            order_id = self._cook([self.burger], T0, 5)
+            kitchen_analytics.stats(T0 + timedelta(hours=1))
+            first = PrepTimeSample.query.one().id
+
+            def sample(sample_id, seconds):
+                db.session.add(PrepTimeSample(id=sample_id, order_id=order_id, product_id=self.burger,
+                                              station='kitchen', seconds=seconds, ready_at=T0))
+                db.session.commit()
+
+            # A higher id commits first; the lower one becomes visible after the next read
+            sample(first + 2, 400)
+            self.assertEqual(kitchen_analytics.stats(T0 + timedelta(hours=1)).summary()
+                             ["items"][self.burger]["count"], 2)
+            sample(first + 1, 500)
+            self.assertEqual(kitchen_analytics.stats(T0 + timedelta(hours=2)).summary()
+                             ["items"][self.burger]["count"], 3)
+            # Ageing out subtracts each sample exactly once
+            self.assertEqual(kitchen_analytics.stats(T0 + timedelta(days=15)).summary()["items"], {})
+            sample(first + 3, 300)  # too old to enter the window
+            self.assertEqual(kitchen_analytics.stats(T0 + timedelta(days=15)).summary()["items"], {})
+
+    def test_etas_follow_queue_depth(self):
+        self.app.config['KDS_STATION_CAPACITY'] = {'kitchen': 2, 'default': 1}
+        with self.app.app_context():
+            for _ in range(5):
+                self._cook([self.burger], T0 - timedelta(days=1), 10)
+            now = T0 + timedelta(minutes=30)
+            cooking = self._order([self.burger], created_at=now - timedelta(minutes=6))
+            order_lifecycle.transition([cooking], 'cooking', now=now - timedelta(minutes=4))
+            db.session.commit()
+            queued = [self._order([self.burger], created_at=now - timedelta(minutes=3 - n)) for n in range(3)]
+            drink = self._order([self.lemonade], created_at=now)
+
+            etas = kitchen_analytics.etas(now)
+            expected = {cooking: 6, queued[0]: 10, queued[1]: 16, queued[2]: 20}  # minutes; 2 burger slots
+            for order_id, minutes in expected.items():
+                self.assertAlmostEqual(etas[order_id]["seconds_left"], minutes * 60, delta=minutes * 60 * 0.03)
+            self.assertEqual([etas[order_id]["queue_position"] for order_id in expected], [0, 1, 2, 3])
+            # No bar history yet: the default prep time on the bar's own queue
+            self.assertEqual(etas[drink]["seconds_left"], 600)
+            self.assertEqual(etas[drink]["stations"], ["Bar"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Tests for atomic loyalty/e-wallet postings and ledger snapshots (services/ledger.py)"""
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from extensions import db
+from models import Restaurant, User, Customer, LoyaltyCard, LoyaltyPoints, eWallet, eWalletTransaction, \
+    LedgerSnapshot
+from services import ledger
+
+
+class TestLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Ledger Bistro', email='ledger@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            customer = Customer(restaurant_id=restaurant.id, name='Ada')
+            db.session.add(customer)
+            db.session.flush()
+            card = LoyaltyCard(customer_id=customer.id, card_number='LC-LEDGER')
+            wallet = eWallet(customer_id=customer.id, currency='EUR')
+            db.session.add_all([card, wallet])
+            db.session.commit()
+            self.customer_id, self.card_id, self.wallet_id = customer.id, card.id, wallet.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+
+    def _run_concurrently(self, work, threads=4):
+        errors = []
+
+        def worker():
+            try:
+                with self.app.app_context():
+                    work()
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_postings_lose_no_updates(self):
+        def earn():
+            for _ in range(25):
+                ledger.earn_points(self.card_id, 2)
+                db.session.commit()
+
+        self._run_concurrently(earn)
+        with self.app.app_context():
+            card = db.session.get(LoyaltyCard, self.card_id)
+            self.assertEqual(card.points_balance, 200)
+            self.assertEqual(card.points_earned_total, 200)
+            self.assertEqual(LoyaltyPoints.query.filter_by(loyalty_card_id=self.card_id).count(), 100)
+
+    def test_debits_never_overdraw(self):
+        with self.app.app_context():
+            ledger.wallet_credit(self.wallet_id, 50.0)
+            db.session.commit()
+        taken = []
+
+        def spend():
+            for _ in range(10):
+                try:
+                    ledger.wallet_debit(self.wallet_id, 5.0)
+                    db.session.commit()
+                    taken.append(5.0)
+                except ledger.InsufficientBalance:
+                    db.session.rollback()
+
+        self._run_concurrently(spend)
+        self.assertEqual(sum(taken), 50.0)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(eWallet, self.wallet_id).balance, 0.0)
+            self.assertEqual(eWalletTransaction.query.filter_by(ewallet_id=self.wallet_id).count(), 11)
+            self.assertEqual(ledger.reconcile('ewallet'), [])
+
+    def test_redeem_and_topup_endpoints(self):
+        with self.app.app_context():
+            ledger.earn_points(self.card_id, 30)
+            db.session.commit()
+        res = self.client.post(f'/pos/customers/{self.customer_id}/loyalty/redeem', json={'points': 50})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post(f'/pos/customers/{self.customer_id}/loyalty/redeem', json={'points': 20})
+        self.assertEqual(res.get_json()['remaining_points'], 10)
+
+        res = self.client.post(f'/pos/customers/{self.customer_id}/ewallet/topup', json={'amount': 12.5})
+        self.assertEqual(res.get_json()['new_balance'], 12.5)
+        with self.app.app_context():
+            card = db.session.get(LoyaltyCard, self.card_id)
+            self.assertEqual((card.points_balance, card.points_redeemed_total), (10, 20))
+            # The refused redemption wrote no ledger row
+            self.assertEqual([p.points for p in LoyaltyPoints.query.order_by(LoyaltyPoints.id)], [30, -20])
+
+    def test_rollup_and_reconcile(self):
+        with self.app.app_context():
+            for points in (10, 20, -5):
+                ledger.post('loyalty', self.card_id, points, {'earn_method': 'manual'})
+            db.session.commit()
+            # Entries younger than LEDGER_ROLLUP_LAG are left for the next run
+            self.assertEqual(ledger.rollup('loyalty'), 0)
+            self.assertEqual(ledger.rollup('loyalty', now=datetime.utcnow() + timedelta(hours=1)), 1)
+            snapshot = LedgerSnapshot.query.filter_by(account_type='loyalty', account_id=self.card_id).one()
+            self.assertEqual(snapshot.balance, 25)
+
+            ledger.earn_points(self.card_id, 7)
+            db.session.commit()
+            self.assertEqual(ledger.ledger_balance('loyalty', self.card_id), 32)
+
+            # A balance changed behind the ledger's back is reported and repaired
+            db.session.get(LoyaltyCard, self.card_id).points_balance = 99
+            db.session.commit()
+            self.assertEqual(ledger.reconcile('loyalty'),
+                             [{'account_id': self.card_id, 'cached': 99, 'ledger': 32}])
+            ledger.reconcile('loyalty', fix=True)
+            self.assertEqual(db.session.get(LoyaltyCard, self.card_id).points_balance, 32)
+
+        result = self.app.test_cli_runner().invoke(args=['ledger-rollup', '--reconcile'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('loyalty: 0 drifted', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Tests for rolling-window loyalty tiers (services/loyalty_tiers.py)"""
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from extensions import db
+from models import Restaurant, User, Customer, LoyaltyCard, LoyaltyPoints, BatchWatermark
+from services import ledger, loyalty_tiers
+
+
+class TestLoyaltyTiers(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.now = datetime(2026, 6, 1, 3, 0)
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Tier Bistro', email='tier@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            customers = [Customer(restaurant_id=restaurant.id, name=f'Guest {n}') for n in range(3)]
+            db.session.add_all(customers)
+            db.session.flush()
+            cards = [LoyaltyCard(customer_id=c.id, card_number=f'LC-TIER-{n}') for n, c in enumerate(customers)]
+            db.session.add_all(cards)
+            db.session.commit()
+            self.card_ids = [card.id for card in cards]
+
+    def _history(self, card_id, points, days_ago):
+        db.session.add(LoyaltyPoints(loyalty_card_id=card_id, points=points, earn_method='purchase',
+                                     created_at=self.now - timedelta(days=days_ago)))
+
+    def test_earning_updates_tier_in_place(self):
+        with self.app.app_context():
+            card_id = self.card_ids[0]
+            ledger.earn_points(card_id, 400)
+            db.session.commit()
+            self.assertEqual(db.session.get(LoyaltyCard, card_id).tier, 'standard')
+            ledger.earn_points(card_id, 150)
+            self.assertEqual(db.session.get(LoyaltyCard, card_id).tier, 'silver')
+            db.session.commit()
+
+            # Redemptions spend the balance but do not lower the tier
+            ledger.redeem_points(card_id, 500)
+            db.session.commit()
+            card = db.session.get(LoyaltyCard, card_id)
+            self.assertEqual((card.tier, card.window_points, card.points_balance), ('silver', 550, 50))
+
+    def test_rebuild_then_incremental_expiry(self):
+        with self.app.app_context():
+            first, second, third = self.card_ids
+            self._history(first, 1500, days_ago=400)  # already outside the window
+            self._history(first, 600, days_ago=300)
+            self._history(second, 2500, days_ago=364)
+            self._history(second, 100, days_ago=10)
+            self._history(third, -50, days_ago=200)
+            db.session.commit()
+
+            # No watermark yet: expiry waits for an explicit rebuild
+            with self.assertLogs('services.loyalty_tiers', 'WARNING'):
+                self.assertEqual(loyalty_tiers.expire(now=self.now), 0)
+            self.assertIsNone(db.session.get(BatchWatermark, 'loyalty_tier_window'))
+            self.assertEqual(loyalty_tiers.rebuild(now=self.now), 3)
+            tiers = {c.id: (c.window_points, c.tier) for c in LoyaltyCard.query}
+            self.assertEqual(tiers[first], (600, 'silver'))
+            self.assertEqual(tiers[second], (2600, 'gold'))
+            self.assertEqual(tiers[third], (0, 'standard'))
+            self.assertEqual(db.session.get(BatchWatermark, 'loyalty_tier_window').position,
+                             self.now - timedelta(days=365))
+
+            # Same night again: nothing to do
+            self.assertEqual(loyalty_tiers.expire(now=self.now), 0)
+
+            # Two days later only the card whose points slid out is touched
+            self.assertEqual(loyalty_tiers.expire(now=self.now + timedelta(days=2)), 1)
+            db.session.expire_all()
+            self.assertEqual(db.session.get(LoyaltyCard, second).window_points, 100)
+            self.assertEqual(db.session.get(LoyaltyCard, second).tier, 'standard')
+            self.assertEqual(db.session.get(LoyaltyCard, first).tier, 'silver')
+
+    def test_thresholds_are_configurable(self):
+        self.app.config['LOYALTY_TIER_THRESHOLDS'] = {'vip': 100}
+        with self.app.app_context():
+            self.assertEqual(loyalty_tiers.tier_for(99), 'standard')
+            self.assertEqual(loyalty_tiers.tier_for(100), 'vip')
+            ledger.earn_points(self.card_ids[0], 120)
+            db.session.commit()
+            self.assertEqual(db.session.get(LoyaltyCard, self.card_ids[0]).tier, 'vip')
+
+        result = self.app.test_cli_runner().invoke(args=['loyalty-tiers', '--rebuild'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('3 card(s) updated', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""Tests for the order state machine and bulk kitchen bumps (services/order_lifecycle.py)"""
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from extensions import db
+from models import Order, StreamEvent, PrepTimeStat, PaymentMethod, PaymentTransaction, Restaurant, User
+from services import order_lifecycle
+
+
+class TestOrderLifecycle(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            orders = [Order(status='pending') for _ in range(50)]
+            db.session.add_all(orders)
+            db.session.commit()
+            self.order_ids = [order.id for order in orders]
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+
+    def test_transitions_are_validated(self):
+        order_id = self.order_ids[0]
+        response = self.client.put(f'/pos/orders/{order_id}/status', json={'status': 'served'})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.put(f'/pos/orders/{order_id}/status', json={'status': 'boiling'})
+        self.assertEqual(response.status_code, 400)
+        for status in ('cooking', 'ready', 'served', 'completed'):
+            response = self.client.put(f'/pos/orders/{order_id}/status', json={'status': status})
+            self.assertEqual(response.status_code, 200, response.get_json())
+        response = self.client.put(f'/pos/orders/{order_id}/status', json={'status': 'cancelled'})
+        self.assertEqual(response.status_code, 409)
+        with self.app.app_context():
+            order = db.session.get(Order, order_id)
+            self.assertEqual(order.status, 'completed')
+            self.assertTrue(order.cooking_at <= order.ready_at <= order.served_at <= order.completed_at)
+
+    def test_checkout_validates_the_move_before_payment(self):
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Checkout Bistro', email='checkout@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            method = PaymentMethod(restaurant_id=restaurant.id, name='Card', payment_type='card')
+            db.session.add(method)
+            db.session.commit()
+            method_id = method.id
+        cancelled, held = self.order_ids[:2]
+        self.assertEqual(self.client.put(f'/pos/orders/{cancelled}/status', json={'status': 'cancelled'}).status_code, 200)
+        self.assertEqual(self.client.put(f'/pos/orders/{held}/status', json={'status': 'hold'}).status_code, 200)
+        payment = {'payment_method_id': method_id, 'amount': 20.0}
+
+        self.assertEqual(self.client.post(f'/pos/orders/{cancelled}/checkout', json=payment).status_code, 409)
+        self.assertEqual(self.client.post(f'/pos/orders/{held}/checkout', json=payment).status_code, 200)
+        # A repeated checkout takes no second payment
+        self.assertEqual(self.client.post(f'/pos/orders/{held}/checkout', json=payment).status_code, 409)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Order, cancelled).status, 'cancelled')
+            self.assertEqual(db.session.get(Order, held).status, 'completed')
+            self.assertEqual(PaymentTransaction.query.filter_by(order_id=cancelled).count(), 0)
+            self.assertEqual(PaymentTransaction.query.filter_by(order_id=held).count(), 1)
+
+    def test_bulk_bump_is_one_update_and_one_event(self):
+        with self.app.app_context():
+            order_lifecycle.transition(self.order_ids[:40], 'cooking')
+            order_lifecycle.transition(self.order_ids[:5], 'cancelled')
+            db.session.commit()
+            before = StreamEvent.query.filter_by(channel='kds').count()
+
+            updates = []
+            listener = lambda conn, cursor, statement, *args: updates.append(statement) \
+                if statement.lstrip().upper().startswith('UPDATE') else None
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                response = self.client.post('/kds/orders/status', json={
+                    'order_ids': self.order_ids + [999999], 'status': 'ready'})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            self.assertEqual(sorted(m['order_id'] for m in body['moved']), sorted(self.order_ids[5:]))
+            self.assertEqual({r['order_id']: r['status'] for r in body['rejected']},
+                             {**{order_id: 'cancelled' for order_id in self.order_ids[:5]}, 999999: None})
+            self.assertEqual(len([s for s in updates if 'UPDATE "order"' in s or 'UPDATE order' in s]), 1)
+
+            events = StreamEvent.query.filter_by(channel='kds').order_by(StreamEvent.id).all()[before:]
+            self.assertEqual([e.event_type for e in events], ['order_status'])
+            self.assertEqual(len(json.loads(events[0].payload)['orders']), 45)
+            self.assertEqual(Order.query.filter(Order.id.in_(self.order_ids), Order.status == 'ready').count(), 45)
+
+    def _cook_three_orders(self, now):
+        placed = now - timedelta(minutes=20)
+        for order in Order.query.filter(Order.id.in_(self.order_ids[:3])):
+            order.created_at = placed
+        db.session.commit()
+        for minutes, order_id in zip((5, 10, 15), self.order_ids[:3]):
+            order_lifecycle.transition([order_id], 'cooking', now=placed + timedelta(minutes=2))
+            order_lifecycle.transition([order_id], 'ready', now=placed + timedelta(minutes=2 + minutes))
+        order_lifecycle.transition(self.order_ids[:1], 'served', now=placed + timedelta(minutes=8))
+        db.session.commit()
+
+    def test_prep_time_rollup(self):
+        now = datetime(2026, 3, 2, 14, 30)
+        with self.app.app_context():
+            self._cook_three_orders(now)
+
+            self.assertEqual(order_lifecycle.rollup(now=now), 1)
+            self.assertEqual(order_lifecycle.rollup(now=now), 1)  # recomputed, not doubled
+            stat = PrepTimeStat.query.one()
+            self.assertEqual((stat.orders, stat.queued, stat.served), (3, 3, 1))
+            self.assertEqual(stat.prep_seconds, 30 * 60)
+            self.assertEqual(stat.max_prep_seconds, 15 * 60)
+
+        response = self.client.get('/analytics/prep-times?start=2026-03-01&end=2026-03-03&group=day')
+        self.assertEqual(response.status_code, 200)
+        period, = response.get_json()['periods']
+        self.assertEqual(period['period'], '2026-03-02T00:00:00')
+        self.assertEqual((period['avg_prep_seconds'], period['avg_queue_seconds'], period['avg_pass_seconds']),
+                         (600.0, 120.0, 60.0))
+
+    def test_prep_time_rollup_retries_a_conflicting_write(self):
+        now = datetime(2026, 3, 2, 14, 30)
+        with self.app.app_context():
+            self._cook_three_orders(now)
+            execute, conflicts = db.session.execute, []
+
+            def racing_execute(statement, *args, **kwargs):
+                if statement.is_insert and not conflicts:
+                    conflicts.append(statement)  # another writer got the same hours in first
+                    raise IntegrityError(str(statement), {}, Exception("UNIQUE constraint failed"))
+                return execute(statement, *args, **kwargs)
+
+            with mock.patch.object(db.session, 'execute', side_effect=racing_execute):
+                self.assertEqual(order_lifecycle.rollup(now=now), 1)
+            self.assertEqual(len(conflicts), 1)
+            self.assertEqual(PrepTimeStat.query.one().orders, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
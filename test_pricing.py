@@ -0,0 +1,147 @@
+"""Tests for cached price list resolution and basket pricing (services/pricing.py)"""
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import User, Restaurant, Product, ProductVariant, PriceList, PriceListItem
+from services import pricing
+
+
+class TestPricing(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        pricing.invalidate()
+        now = datetime.utcnow()
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Price Bistro', email='price@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            db.session.add(User(username='pricer', password_hash=owner.password_hash, role='admin',
+                                restaurant_id=restaurant.id))
+            products = [Product(restaurant_id=restaurant.id, name=f'Dish {n}', base_price=10.0 + n)
+                        for n in range(40)]
+            db.session.add_all(products)
+            db.session.flush()
+            large = ProductVariant(product_id=products[0].id, name='Large', price_adjustment=2.5)
+            takeaway = PriceList(restaurant_id=restaurant.id, name='Takeaway', pricelist_type='takeaway',
+                                 prices=[PriceListItem(product_id=p.id, price=p.base_price - 1) for p in products])
+            happy_hour = PriceList(restaurant_id=restaurant.id, name='Happy hour', pricelist_type='takeaway',
+                                   valid_from=now - timedelta(hours=1), valid_until=now + timedelta(hours=1),
+                                   prices=[PriceListItem(product_id=products[1].id, price=5.0)])
+            expired = PriceList(restaurant_id=restaurant.id, name='Last summer', pricelist_type='dine_in',
+                                valid_until=now - timedelta(days=30),
+                                prices=[PriceListItem(product_id=products[0].id, price=1.0)])
+            db.session.add_all([large, takeaway, happy_hour, expired])
+            db.session.commit()
+            self.restaurant_id = restaurant.id
+            self.product_ids = [p.id for p in products]
+            self.variant_id, self.takeaway_id, self.expired_id = large.id, takeaway.id, expired.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'pricer', 'password': 'admin'})
+
+    def _count_queries(self, fn):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                result = fn()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+        return result, statements
+
+    def test_basket_priced_from_one_index_load(self):
+        basket = [{'product_id': pid, 'quantity': 1} for pid in self.product_ids]
+        quote, statements = self._count_queries(
+            lambda: pricing.price_basket(self.restaurant_id, basket, pricelist_type='takeaway'))
+        self.assertEqual(len(statements), 4)
+        self.assertEqual(len(quote['lines']), 40)
+
+        # Warm: no queries at all
+        again, statements = self._count_queries(
+            lambda: pricing.price_basket(self.restaurant_id, basket, pricelist_type='takeaway'))
+        self.assertEqual(statements, [])
+        self.assertEqual(again, quote)
+
+    def test_resolution_rules(self):
+        first, second, third = self.product_ids[:3]
+        quote = self.client.post('/pos/pricing/quote', json={'pricelist_type': 'takeaway', 'items': [
+            {'product_id': first, 'variant_id': self.variant_id, 'quantity': 2},
+            {'product_id': second, 'quantity': 1},
+            {'product_id': third, 'quantity': 3},
+        ]}).get_json()
+        lines = quote['lines']
+        self.assertEqual((lines[0]['unit_price'], lines[0]['line_total']), (11.5, 23.0))  # 9.0 + 2.5 variant
+        self.assertEqual(lines[1]['unit_price'], 5.0)  # happy hour overrides the standing list
+        self.assertEqual(lines[2]['unit_price'], 11.0)
+        self.assertEqual(quote['total'], 23.0 + 5.0 + 33.0)
+
+        # After happy hour the standing takeaway price applies again
+        later = (datetime.utcnow() + timedelta(hours=2)).isoformat()
+        quote = self.client.post('/pos/pricing/quote', json={
+            'pricelist_type': 'takeaway', 'at': later, 'items': [{'product_id': second}]}).get_json()
+        self.assertEqual(quote['lines'][0]['unit_price'], 10.0)
+
+        # An expired list falls back to the base price
+        quote = self.client.post('/pos/pricing/quote', json={
+            'pricelist_id': self.expired_id, 'items': [{'product_id': first}]}).get_json()
+        self.assertEqual((quote['lines'][0]['unit_price'], quote['lines'][0]['pricelist_id']), (10.0, None))
+
+        res = self.client.post('/pos/pricing/quote', json={'items': [{'product_id': first, 'variant_id': 999999}]})
+        self.assertEqual(res.status_code, 404)
+        res = self.client.post('/pos/pricing/quote', json={'pricelist_id': 999999, 'items': [{'product_id': first}]})
+        self.assertEqual(res.status_code, 404)
+        res = self.client.post('/pos/pricing/quote', json={'pricelist_id': 'x', 'items': [{'product_id': first}]})
+        self.assertEqual(res.status_code, 400)
+
+    def test_uncommitted_edits_are_not_cached(self):
+        first = self.product_ids[0]
+        with self.app.app_context():
+            pricing.invalidate()
+            db.session.get(Product, first).base_price = 99.0
+            db.session.flush()
+            self.assertEqual(pricing.unit_price(self.restaurant_id, first), 10.0)
+            db.session.rollback()
+            self.assertEqual(pricing.unit_price(self.restaurant_id, first), 10.0)
+
+    def test_edits_invalidate_the_index(self):
+        first = self.product_ids[0]
+
+        def takeaway_price():
+            return self.client.post('/pos/pricing/quote', json={
+                'pricelist_id': self.takeaway_id, 'items': [{'product_id': first}]}).get_json()['lines'][0]['unit_price']
+
+        self.assertEqual(takeaway_price(), 9.0)
+        res = self.client.put(f'/admin/api/pricelists/{self.takeaway_id}', json={
+            'items': [{'product_id': first, 'price': 7.25}]})
+        self.assertEqual(res.status_code, 200, res.get_json())
+        self.assertEqual(takeaway_price(), 7.25)
+
+        with self.app.app_context():
+            db.session.get(Product, first).base_price = 12.0
+            db.session.commit()
+        self.assertEqual(self.client.post('/pos/pricing/quote', json={
+            'items': [{'product_id': first}]}).get_json()['lines'][0]['unit_price'], 12.0)
+
+        # An inactive list is refused rather than quoted at the base price
+        self.client.put(f'/admin/api/pricelists/{self.takeaway_id}', json={'active': False})
+        res = self.client.post('/pos/pricing/quote', json={
+            'pricelist_id': self.takeaway_id, 'items': [{'product_id': first}]})
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client.post('/admin/api/pricelists', json={
+            'name': 'Bad', 'pricelist_type': 'dine_in', 'items': [{'product_id': 999999, 'price': 1}]})
+        self.assertEqual(res.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
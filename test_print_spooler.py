@@ -0,0 +1,210 @@
+"""Tests for kitchen ticket routing and the background print spooler"""
+import socket
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from config import Config
+from extensions import db
+from models import User, Restaurant, ProductCategory, Product, KitchenPrinter, PrinterRoute, PrintJob
+from services.escpos import CUT, INIT, render_kitchen_ticket
+from services.print_spooler import PrintSpooler
+
+
+class TcpSink:
+    """Local stand-in for a raw-TCP (port 9100) printer that records what it receives."""
+
+    def __init__(self, port=0):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', port))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.received = []
+        self._got = threading.Condition()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                chunks = []
+                while True:
+                    chunk = conn.recv(4096)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                with self._got:
+                    self.received.append(b''.join(chunks))
+                    self._got.notify_all()
+
+    def wait_for(self, count, timeout=5):
+        with self._got:
+            return self._got.wait_for(lambda: len(self.received) >= count, timeout)
+
+    def close(self):
+        self.server.close()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestEscpos(unittest.TestCase):
+
+    def test_render_kitchen_ticket(self):
+        payload = render_kitchen_ticket('Bar', 17, [
+            {'name': 'Mojito', 'quantity': 2, 'notes': [{'type': 'special_request', 'content': 'no mint'}]},
+        ])
+        self.assertTrue(payload.startswith(INIT))
+        self.assertTrue(payload.endswith(CUT))
+        self.assertIn(b'BAR', payload)
+        self.assertIn(b'Order #17', payload)
+        self.assertIn(b'2 x Mojito', payload)
+        self.assertIn(b'no mint', payload)
+
+
+class TestPrintSpooler(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = {name: getattr(Config, name) for name in ('PRINT_RETRY_BACKOFF', 'PRINT_MAX_ATTEMPTS')}
+        Config.PRINT_RETRY_BACKOFF = 0.01
+        Config.PRINT_MAX_ATTEMPTS = 2
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.spooler = self.app.extensions['print_spooler']
+        self.kitchen_sink = TcpSink()
+        self.bar_sink = TcpSink()
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Print Bistro', email='print@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            food = ProductCategory(restaurant_id=restaurant.id, name='Food')
+            drinks = ProductCategory(restaurant_id=restaurant.id, name='Drinks')
+            db.session.add_all([food, drinks])
+            db.session.flush()
+            kitchen = KitchenPrinter(restaurant_id=restaurant.id, name='Kitchen', printer_type='kitchen',
+                                     ip_address='127.0.0.1', port=self.kitchen_sink.port)
+            bar = KitchenPrinter(restaurant_id=restaurant.id, name='Bar', printer_type='bar',
+                                 ip_address='127.0.0.1', port=self.bar_sink.port)
+            db.session.add_all([kitchen, bar])
+            db.session.flush()
+            db.session.add(PrinterRoute(restaurant_id=restaurant.id, category_id=drinks.id, printer_id=bar.id))
+            burger = Product(restaurant_id=restaurant.id, category_id=food.id, name='Burger', base_price=9.0)
+            beer = Product(restaurant_id=restaurant.id, category_id=drinks.id, name='Lager', base_price=4.0)
+            db.session.add_all([burger, beer])
+            db.session.commit()
+            self.burger_id, self.beer_id = burger.id, beer.id
+            self.kitchen_id = kitchen.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+
+    def tearDown(self):
+        self.kitchen_sink.close()
+        self.bar_sink.close()
+        for name, value in self._saved.items():
+            setattr(Config, name, value)
+
+    def _order(self, *items):
+        res = self.client.post('/pos/orders', json={'items': list(items)})
+        self.assertEqual(res.status_code, 201, res.get_json())
+        return res.get_json()['id']
+
+    def test_lines_routed_by_category(self):
+        order_id = self._order({'product_id': self.burger_id, 'quantity': 2}, {'product_id': self.beer_id})
+        self.assertTrue(self.spooler.wait_idle(10))
+        self.assertTrue(self.kitchen_sink.wait_for(1) and self.bar_sink.wait_for(1))
+
+        self.assertEqual(len(self.kitchen_sink.received), 1)
+        self.assertEqual(len(self.bar_sink.received), 1)
+        self.assertIn(b'2 x Burger', self.kitchen_sink.received[0])
+        self.assertNotIn(b'Lager', self.kitchen_sink.received[0])
+        self.assertIn(b'1 x Lager', self.bar_sink.received[0])
+        self.assertIn(f'Order #{order_id}'.encode(), self.bar_sink.received[0])
+
+        jobs = self.client.get(f'/pos/print-jobs?order_id={order_id}').get_json()
+        self.assertEqual({j['status'] for j in jobs}, {'printed'})
+        self.assertEqual({j['printer'] for j in jobs}, {'Kitchen', 'Bar'})
+
+    def test_failed_job_retried_then_reprinted(self):
+        port = _free_port()
+        with self.app.app_context():
+            db.session.get(KitchenPrinter, self.kitchen_id).port = port
+            db.session.commit()
+
+        # Nothing listening: the order still succeeds and the job fails after its retries
+        order_id = self._order({'product_id': self.burger_id})
+        self.assertTrue(self.spooler.wait_idle(10))
+        jobs = self.client.get(f'/pos/print-jobs?order_id={order_id}&status=failed').get_json()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]['attempts'], 2)
+        self.assertTrue(jobs[0]['last_error'])
+
+        sink = TcpSink(port)
+        try:
+            res = self.client.post(f"/pos/print-jobs/{jobs[0]['id']}/reprint")
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(self.spooler.wait_idle(10))
+            self.assertTrue(sink.wait_for(1))
+            self.assertEqual(len(sink.received), 1)
+            self.assertIn(b'1 x Burger', sink.received[0])
+            with self.app.app_context():
+                job = db.session.get(PrintJob, jobs[0]['id'])
+                self.assertEqual(job.status, 'printed')
+                self.assertEqual(job.attempts, 1)
+        finally:
+            sink.close()
+
+    def test_workers_claim_each_job_once(self):
+        # A second worker process's spooler over the same database
+        other = PrintSpooler(self.app)
+        self.app.extensions['print_spooler'] = self.spooler
+        now = datetime.utcnow()
+        with self.app.app_context():
+            jobs = [PrintJob(printer_id=self.kitchen_id, payload=f'job {n}'.encode()) for n in range(6)]
+            # Abandoned by a dead worker, and one another worker is still sending
+            jobs.append(PrintJob(printer_id=self.kitchen_id, payload=b'stale', status='printing',
+                                 next_attempt_at=now - timedelta(seconds=1)))
+            jobs.append(PrintJob(printer_id=self.kitchen_id, payload=b'live', status='printing',
+                                 next_attempt_at=now + timedelta(minutes=1)))
+            db.session.add_all(jobs)
+            db.session.commit()
+            ids = [job.id for job in jobs]
+        self.spooler.submit(ids)
+        other.submit(ids)  # starting it also recovers everything queued
+        self.assertTrue(self.spooler.wait_idle(10) and other.wait_idle(10))
+        self.assertTrue(self.kitchen_sink.wait_for(7))
+
+        self.assertEqual(sorted(self.kitchen_sink.received), sorted([f'job {n}'.encode() for n in range(6)] + [b'stale']))
+        with self.app.app_context():
+            statuses = [db.session.get(PrintJob, job_id).status for job_id in ids]
+        self.assertEqual(statuses, ['printed'] * 7 + ['printing'])
+
+
+    def test_recovery_runs_periodically(self):
+        self.spooler.recovery_interval = 0.05
+        self.addCleanup(setattr, self.spooler, 'recovery_interval', 30)
+        self.spooler.start()
+        self.assertEqual(self.spooler.pending(), 0)
+        with self.app.app_context():
+            # Orphaned later by a worker that died after this spooler started
+            job = PrintJob(printer_id=self.kitchen_id, payload=b'orphan', status='printing',
+                           next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+        self.assertTrue(self.kitchen_sink.wait_for(1))
+        self.assertEqual(self.kitchen_sink.received, [b'orphan'])
+        self.assertTrue(self.spooler.wait_idle(10))
+        with self.app.app_context():
+            self.assertEqual(db.session.get(PrintJob, job_id).status, 'printed')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Tests for the opt-in request profiling middleware"""
+import os
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+from config import Config
+from app import create_app
+
+
+class TestRequestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        overrides = {
+            'ENABLE_REQUEST_PROFILING': True,
+            'PROFILING_SAMPLER': True,
+            'PROFILING_SLOW_THRESHOLD': 0,
+            'PROFILING_SAMPLE_INTERVAL': 0.001,
+            'PROFILING_DUMP_DIR': self.tmpdir.name,
+        }
+        saved = {k: getattr(Config, k) for k in overrides}
+        for k, v in overrides.items():
+            setattr(Config, k, v)
+        try:
+            self.app = create_app()
+        finally:
+            for k, v in saved.items():
+                setattr(Config, k, v)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+        self.profiler = self.app.extensions['request_profiler']
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_records_sql_per_route(self):
+        self.client.get('/api/menu')
+        self.client.get('/api/menu')
+        stats = self.profiler.snapshot()['GET /api/menu']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreaterEqual(stats['sql_statements']['sum'], 2)
+        self.assertEqual(stats['wall_seconds']['buckets']['+Inf'], 2)
+
+    def test_prometheus_export_and_admin_only(self):
+        self.client.get('/api/menu')
+        anon = self.client.get('/admin/api/profiling/metrics')
+        self.assertIn(anon.status_code, (302, 401, 403))
+
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+        res = self.client.get('/admin/api/profiling/metrics')
+        self.assertEqual(res.status_code, 200)
+        body = res.get_data(as_text=True)
+        self.assertIn('# TYPE serveopos_request_duration_seconds histogram', body)
+        self.assertIn('serveopos_request_sql_statements_bucket{route="GET /api/menu",le="+Inf"} 1', body)
+
+        res = self.client.get('/admin/api/profiling')
+        self.assertIn('GET /api/menu', res.get_json()['routes'])
+
+    def test_allocations_are_reported_per_process(self):
+        saved = Config.ENABLE_REQUEST_PROFILING, Config.PROFILING_TRACE_ALLOCATIONS
+        Config.ENABLE_REQUEST_PROFILING = Config.PROFILING_TRACE_ALLOCATIONS = True
+        try:
+            app = create_app()
+        finally:
+            Config.ENABLE_REQUEST_PROFILING, Config.PROFILING_TRACE_ALLOCATIONS = saved
+        self.addCleanup(tracemalloc.stop)
+        app.config['WTF_CSRF_ENABLED'] = False
+        client = app.test_client()
+        client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+        client.get('/api/menu')
+        body = client.get('/admin/api/profiling').get_json()
+        self.assertNotIn('alloc_bytes', body['routes']['GET /api/menu'])
+        memory = body['process_memory']
+        self.assertGreaterEqual(memory['peak_bytes'], memory['traced_bytes'])
+        self.assertIn('serveopos_process_traced_peak_bytes ',
+                      client.get('/admin/api/profiling/metrics').get_data(as_text=True))
+
+    def test_failing_requests_are_recorded(self):
+        def broken_view():
+            raise RuntimeError("boom")
+        self.app.add_url_rule('/_broken', 'broken_view', broken_view)
+        # Propagated (debug/testing) errors skip after_request entirely
+        self.app.config['PROPAGATE_EXCEPTIONS'] = True
+        with self.assertRaises(RuntimeError):
+            self.client.get('/_broken')
+        stats = self.profiler.snapshot()['GET /_broken']
+        self.assertEqual((stats['requests'], stats['errors']), (1, 1))
+        self.assertEqual(self.profiler._active_samples, {})
+
+    def test_slow_requests_dump_collapsed_stacks(self):
+        def slow_view():
+            time.sleep(0.05)
+            return 'ok'
+        self.app.add_url_rule('/_slow', 'slow_view', slow_view)
+        self.client.get('/_slow')
+        dumps = [f for f in os.listdir(self.tmpdir.name) if f.endswith('.folded')]
+        self.assertEqual(len(dumps), 1)
+        with open(os.path.join(self.tmpdir.name, dumps[0])) as fh:
+            lines = fh.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn('test_profiling:slow_view', stack)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Tests for the promotions engine (services/promotions.py)"""
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from extensions import db
+from models import User, Restaurant, Customer, Product, Discount, Order, OrderItem
+from services import promotions
+
+
+class TestPromotions(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        promotions.invalidate()
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Promo Bistro', email='promo@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            rid = restaurant.id
+            db.session.add(User(username='promo', password_hash=owner.password_hash, role='admin', restaurant_id=rid))
+            customer = Customer(restaurant_id=rid, name='Regular')
+            a, b, c = (Product(restaurant_id=rid, name=name, base_price=price)
+                       for name, price in (('Pizza', 10.0), ('Wine', 20.0), ('Bread', 5.0)))
+            db.session.add_all([customer, a, b, c])
+            db.session.flush()
+            past = datetime.utcnow() - timedelta(days=1)
+            d = dict(restaurant_id=rid)
+            self.discounts = {
+                'pizza_pct': Discount(name='Pizza 10%', discount_type='percentage', value=10, product_id=a.id, **d),
+                'pizza_multi': Discount(name='Pizza 3 off each (2+)', discount_type='fixed_amount', value=3,
+                                        product_id=a.id, min_quantity=2, **d),
+                'wine_regular': Discount(name='Wine half price for regulars', discount_type='percentage', value=50,
+                                         product_id=b.id, customer_id=customer.id, **d),
+                'order_pct': Discount(name='5% off', discount_type='percentage', value=5, applies_to='order', **d),
+                'order_bulk': Discount(name='30 off 10+ items', discount_type='fixed_amount', value=30,
+                                       applies_to='order', min_quantity=10, **d),
+                'bread_expired': Discount(name='Free bread', discount_type='percentage', value=100,
+                                          product_id=c.id, end_date=past, **d),
+                'bread_inactive': Discount(name='Bread half price', discount_type='percentage', value=50,
+                                           product_id=c.id, active=False, **d),
+            }
+            db.session.add_all(self.discounts.values())
+            db.session.commit()
+            self.ids = {key: discount.id for key, discount in self.discounts.items()}
+            self.restaurant_id, self.customer_id = rid, customer.id
+            self.products = {'pizza': a.id, 'wine': b.id, 'bread': c.id}
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'promo', 'password': 'admin'})
+
+    def _evaluate(self, customer_id=None, **quantities):
+        return self.client.post('/pos/promotions/evaluate', json={
+            'customer_id': customer_id,
+            'items': [{'product_id': self.products[name], 'quantity': qty} for name, qty in quantities.items()],
+        }).get_json()
+
+    def _reasons(self, result):
+        return {entry['discount_id']: entry.get('reason', 'applied') for entry in result['considered']}
+
+    def test_best_combination_with_explanation(self):
+        result = self._evaluate(pizza=1, wine=1, bread=1)
+        self.assertEqual(result['subtotal'], 35.0)
+        self.assertEqual([(a['discount_id'], a['amount']) for a in result['applied']],
+                         [(self.ids['pizza_pct'], 1.0), (self.ids['order_pct'], 1.7)])  # 5% of 34
+        self.assertEqual(result['total'], 32.3)
+        reasons = self._reasons(result)
+        self.assertEqual(reasons[self.ids['pizza_multi']], 'needs 2 units, basket has 1')
+        self.assertEqual(reasons[self.ids['bread_expired']], 'outside its validity window')
+        self.assertEqual(reasons[self.ids['order_bulk']], 'needs 10 items, basket has 3')
+        self.assertNotIn(self.ids['bread_inactive'], reasons)
+        self.assertNotIn(self.ids['wine_regular'], reasons)  # not this customer's
+
+    def test_customer_specific_and_competing_rules(self):
+        result = self._evaluate(customer_id=self.customer_id, pizza=3, wine=2)
+        amounts = {a['discount_id']: a['amount'] for a in result['applied']}
+        self.assertEqual(amounts, {self.ids['pizza_multi']: 9.0, self.ids['wine_regular']: 20.0,
+                                   self.ids['order_pct']: 2.05})
+        self.assertEqual(self._reasons(result)[self.ids['pizza_pct']], f"beaten by discount {self.ids['pizza_multi']}")
+
+        bulk = self._evaluate(pizza=10)
+        self.assertEqual(bulk['discount'], 60.0)  # 3 x 10 off the pizzas, then 30 off the remaining 70
+        self.assertEqual(self._reasons(bulk)[self.ids['order_pct']], f"beaten by discount {self.ids['order_bulk']}")
+
+    def test_customer_id_is_cast_and_validated(self):
+        as_string = self._evaluate(customer_id=str(self.customer_id), pizza=3, wine=2)
+        self.assertIn(self.ids['wine_regular'], [a['discount_id'] for a in as_string['applied']])
+        response = self.client.post('/pos/promotions/evaluate', json={
+            'customer_id': 'regular', 'items': [{'product_id': self.products['pizza'], 'quantity': 1}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cost_does_not_grow_with_unrelated_promotions(self):
+        before = self._evaluate(pizza=2, wine=1)
+        with self.app.app_context():
+            filler = [Product(restaurant_id=self.restaurant_id, name=f'Item {n}', base_price=1.0) for n in range(50)]
+            db.session.add_all(filler)
+            db.session.flush()
+            db.session.add_all([Discount(restaurant_id=self.restaurant_id, name=f'Promo {n}',
+                                         discount_type='percentage', value=5, product_id=filler[n % 50].id)
+                                for n in range(500)])
+            db.session.commit()
+        after = self._evaluate(pizza=2, wine=1)
+        self.assertEqual(after['rules_loaded'], before['rules_loaded'] + 500)  # index was reloaded
+        self.assertEqual(len(after['considered']), len(before['considered']))
+        self.assertEqual(after['applied'], before['applied'])
+
+    def test_order_promotions(self):
+        with self.app.app_context():
+            order = Order()
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(OrderItem(order_id=order.id, menu_item_id=self.products['pizza'], quantity=2))
+            db.session.commit()
+            order_id = order.id
+        res = self.client.post(f'/pos/orders/{order_id}/discount', json={'promotions': True})
+        self.assertEqual(res.status_code, 200, res.get_json())
+        self.assertTrue(res.get_json()['preview'])
+        result = res.get_json()['promotions']
+        self.assertEqual(result['subtotal'], 20.0)
+        self.assertEqual(result['applied'][0]['discount_id'], self.ids['pizza_multi'])
+
+        # The ad-hoc discount still works as before
+        res = self.client.post(f'/pos/orders/{order_id}/discount', json={'type': 'fixed_amount', 'value': 2})
+        self.assertEqual(res.get_json()['discount']['discount_amount'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
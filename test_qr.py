@@ -0,0 +1,77 @@
+"""Tests for the shared QR render service (services/qr.py)"""
+import subprocess
+import sys
+import unittest
+
+from app import create_app
+from extensions import db
+from models import User, Restaurant, Kiosk
+from services.qr import render_qr, qr_data_uri
+from services.totp import generate_totp_secret
+
+
+class TestQrService(unittest.TestCase):
+
+    def test_svg_output(self):
+        svg = render_qr('https://example.test/kiosk/K1', 'svg', box_size=4)
+        self.assertTrue(svg.startswith(b'<svg '))
+        self.assertIn(b'<path d="M', svg)
+        self.assertTrue(qr_data_uri('hello', 'svg').startswith('data:image/svg+xml;base64,'))
+
+    def test_png_output(self):
+        self.assertTrue(render_qr('hello', 'png').startswith(b'\x89PNG'))
+        with self.assertRaises(ValueError):
+            render_qr('hello', 'gif')
+
+    def test_renders_are_cached(self):
+        render_qr.cache_clear()
+        first = render_qr('receipt-42')
+        second = render_qr('receipt-42')
+        self.assertIs(first, second)
+        self.assertEqual(render_qr.cache_info().hits, 1)
+
+    def test_totp_secrets_bypass_the_cache(self):
+        render_qr.cache_clear()
+        generate_totp_secret('alice', qr_format='svg')
+        self.assertEqual(render_qr.cache_info().currsize, 0)
+
+    def test_qr_stack_loaded_lazily(self):
+        code = ("import sys, services.totp, services.qr; "
+                "assert 'qrcode' not in sys.modules and 'PIL' not in sys.modules; "
+                "services.qr.render_qr('x', 'svg'); "
+                "assert 'qrcode' in sys.modules")
+        subprocess.run([sys.executable, '-c', code], check=True)
+
+
+class TestQrEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='QR Bistro', email='qr@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            db.session.add(Kiosk(restaurant_id=restaurant.id, name='Front', kiosk_code='QR-K1'))
+            db.session.commit()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+
+    def test_kiosk_qr(self):
+        res = self.client.get('/pos/kiosk/QR-K1/qr')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'image/svg+xml')
+        res = self.client.get('/pos/kiosk/QR-K1/qr?format=png&size=3')
+        self.assertEqual(res.mimetype, 'image/png')
+        self.assertEqual(self.client.get('/pos/kiosk/QR-K1/qr?format=bmp').status_code, 400)
+        self.assertEqual(self.client.get('/pos/kiosk/NOPE/qr').status_code, 404)
+
+    def test_2fa_setup_svg(self):
+        res = self.client.post('/auth/api/2fa-setup?format=svg')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.get_json()['qr_code'].startswith('data:image/svg+xml;base64,'))
+
+
+if __name__ == '__main__':
+    unittest.main()
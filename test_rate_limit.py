@@ -0,0 +1,117 @@
+"""Tests for tenant/terminal-aware rate limiting and the SQLite limits storage (services/rate_limit.py)"""
+import os
+import tempfile
+import threading
+import unittest
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+
+from app import create_app
+from extensions import db, configure_route_limits
+from models import User, Restaurant
+from services import rate_limit
+
+
+class TestRateLimitKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.update(WTF_CSRF_ENABLED=False, RATELIMIT_TERMINAL_DEFAULT='3 per minute',
+                               RATELIMIT_TENANT_LIMIT='5 per minute',
+                               RATELIMIT_ROUTE_LIMITS={'rate_limit_ping': '2 per minute'})
+
+        @self.app.route('/_rate_limit_ping', endpoint='rate_limit_ping')
+        def ping():
+            return 'pong'
+
+        configure_route_limits(self.app)
+        rate_limit.reset_rejections()
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            for name in ('north', 'south'):
+                restaurant = Restaurant(name=f'{name} bistro', email=f'{name}@bistro.test', owner_id=owner.id)
+                db.session.add(restaurant)
+                db.session.flush()
+                db.session.add(User(username=name, password_hash=owner.password_hash, role='admin',
+                                    restaurant_id=restaurant.id))
+            db.session.commit()
+
+    def _client(self, username):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'username': username, 'password': 'admin'})
+        return client
+
+    def _get(self, client, terminal, path='/inventory/low-stock'):
+        return client.get(path, headers={'X-Terminal-ID': terminal}).status_code
+
+    def test_terminals_share_a_restaurant_ceiling(self):
+        north, south = self._client('north'), self._client('south')
+        self.assertEqual([self._get(north, 'till-1') for _ in range(4)], [200, 200, 200, 429])
+        # Same address, other terminal: its own budget, until the restaurant's 5 are used
+        self.assertEqual([self._get(north, 'till-2') for _ in range(3)], [200, 200, 429])
+        # Another restaurant behind the same NAT is unaffected
+        self.assertEqual(self._get(south, 'till-1'), 200)
+
+        stats = self._client('admin').get('/admin/api/rate-limits').get_json()
+        self.assertEqual(stats['rejections']['total'], 2)
+        self.assertEqual(stats['rejections']['by_endpoint'], {'inventory.low_stock': 2})
+        self.assertEqual(stats['budgets']['tenant'], '5 per minute')
+
+    def test_route_budget_replaces_the_default(self):
+        north = self._client('north')
+        self.assertEqual([self._get(north, 'till-1', '/_rate_limit_ping') for _ in range(3)], [200, 200, 429])
+        self.assertEqual(self._get(north, 'till-1'), 200)  # other routes keep the terminal default
+
+    def test_credential_checks_ignore_the_terminal_header(self):
+        self.app.config['RATELIMIT_TENANT_LIMIT'] = '1000 per minute'
+        north = self._client('north')
+        codes = [north.post('/auth/api/2fa-disable', json={'password': 'guess'},
+                            headers={'X-Terminal-ID': f'till-{n}'}).status_code for n in range(12)]
+        self.assertEqual(codes, [400] * 10 + [429] * 2)
+
+
+class TestSQLiteStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.uri = f"sqlite:///{os.path.join(self.tmp.name, 'limits.db')}"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_counters_are_shared_between_workers(self):
+        first, second = storage_from_string(self.uri), storage_from_string(self.uri)
+        self.assertIsInstance(first, rate_limit.SQLiteStorage)
+        self.assertEqual(first.incr('k', 60), 1)
+        self.assertEqual(second.incr('k', 60, amount=2), 3)
+        self.assertEqual(first.get('k'), 3)
+        second.clear('k')
+        self.assertEqual(first.get('k'), 0)
+
+        item = parse('5 per minute')
+        limiters = SlidingWindowCounterRateLimiter(first), SlidingWindowCounterRateLimiter(second)
+        results = [limiters[n % 2].hit(item, 'r1', 't1') for n in range(7)]
+        self.assertEqual(results, [True] * 5 + [False] * 2)
+        self.assertFalse(limiters[0].test(item, 'r1', 't1'))
+        self.assertTrue(limiters[1].test(item, 'r1', 't2'))
+
+    def test_concurrent_hits_never_exceed_the_limit(self):
+        item = parse('20 per minute')
+        acquired = []
+
+        def worker():
+            limiter = SlidingWindowCounterRateLimiter(storage_from_string(self.uri))
+            acquired.extend(limiter.hit(item, 'busy') for _ in range(10))
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(acquired.count(True), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Tests for receipt numbering and lazy template rendering (services/receipts.py)"""
+import unittest
+
+from app import create_app
+from extensions import db
+from models import User, Restaurant, StoreSettings, PaymentMethod, Product, Receipt, MenuItem
+from services.sequences import next_value, format_number
+
+
+class TestReceipts(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Receipt Bistro', email='rec@bistro.test', owner_id=owner.id,
+                                    address='1 Main St', phone='555-0100')
+            db.session.add(restaurant)
+            db.session.flush()
+            db.session.add(StoreSettings(restaurant_id=restaurant.id, currency='EUR', locale='en',
+                                         vat_number='IE1234567X'))
+            method = PaymentMethod(restaurant_id=restaurant.id, name='Card', payment_type='card')
+            product = Product(restaurant_id=restaurant.id, name='Flat White', base_price=3.5)
+            db.session.add_all([method, product])
+            db.session.commit()
+            self.restaurant_id, self.method_id, self.product_id = restaurant.id, method.id, product.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+
+    def _checkout(self, tip=0):
+        order_id = self.client.post('/pos/orders', json={'items': [
+            {'menu_item_id': 1, 'quantity': 2},
+        ]}).get_json()['id']
+        res = self.client.post(f'/pos/orders/{order_id}/checkout', json={
+            'payment_method_id': self.method_id, 'amount': 90.0, 'tip_amount': tip})
+        self.assertEqual(res.status_code, 200, res.get_json())
+        return order_id, res.get_json()
+
+    def test_sequence_per_restaurant(self):
+        with self.app.app_context():
+            self.assertEqual([next_value('receipt', 1) for _ in range(3)], [1, 2, 3])
+            self.assertEqual(next_value('receipt', 2), 1)
+            self.assertEqual(next_value('invoice', 1), 1)
+            db.session.rollback()
+            # Nothing committed: the numbers are handed out again
+            self.assertEqual(next_value('receipt', 1), 1)
+        self.assertEqual(format_number('REC', 42, 7), 'REC-7-000042')
+
+    def test_checkout_numbers_receipts_and_defers_rendering(self):
+        _, first = self._checkout()
+        order_id, second = self._checkout()
+        self.assertEqual(first['receipt_number'], f'REC-{self.restaurant_id}-000001')
+        self.assertEqual(second['receipt_number'], f'REC-{self.restaurant_id}-000002')
+        with self.app.app_context():
+            self.assertIsNone(db.session.get(Receipt, second['receipt_id']).content)
+
+        data = self.client.get(f'/pos/orders/{order_id}/receipt').get_json()
+        self.assertIn('Receipt Bistro', data['content'])
+        self.assertIn('Chicken Sizzler', data['content'])
+        self.assertIn('€90.00', data['content'])
+        self.assertIn('VAT: IE1234567X', data['content'])
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Receipt, second['receipt_id']).content, data['content'])
+
+    def test_price_edits_after_checkout_do_not_change_the_receipt(self):
+        order_id, _ = self._checkout()
+        with self.app.app_context():
+            item = db.session.get(MenuItem, 1)
+            price = item.price
+            item.price = price + 10
+            db.session.commit()
+        try:
+            content = self.client.get(f'/pos/orders/{order_id}/receipt').get_json()['content']
+        finally:
+            with self.app.app_context():
+                db.session.get(MenuItem, 1).price = price
+                db.session.commit()
+        self.assertIn('€90.00', content)
+
+    def test_formats(self):
+        order_id, _ = self._checkout(tip=5)
+        html = self.client.get(f'/pos/orders/{order_id}/receipt?format=html')
+        self.assertEqual(html.mimetype, 'text/html')
+        self.assertIn(b'<td>Tip</td>', html.data)
+        self.assertIn('€95.00'.encode(), html.data)
+
+        escpos = self.client.get(f'/pos/orders/{order_id}/receipt?format=escpos')
+        self.assertEqual(escpos.mimetype, 'application/octet-stream')
+        self.assertTrue(escpos.data.startswith(b'\x1b@'))
+        self.assertIn(b'Receipt Bistro', escpos.data)
+
+        text = self.client.get(f'/pos/orders/{order_id}/receipt?format=text')
+        self.assertIn(b'Total:', text.data)
+        self.assertEqual(self.client.get(f'/pos/orders/{order_id}/receipt?format=pdf').status_code, 400)
+
+    def test_print_renders_content(self):
+        order_id, result = self._checkout()
+        res = self.client.post(f'/pos/orders/{order_id}/receipt/print')
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            receipt = db.session.get(Receipt, result['receipt_id'])
+            self.assertTrue(receipt.printed)
+            self.assertIn(result['receipt_number'], receipt.content)
+
+
+if __name__ == '__main__':
+    unittest.main()
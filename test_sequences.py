@@ -0,0 +1,147 @@
+"""Tests for document number allocation and the gap audit (services/sequences.py)"""
+import threading
+import unittest
+
+from app import create_app
+from config import Config
+from extensions import db
+from models import User, Restaurant, StoreSettings, Invoice, DocumentSequence, SequenceBlock
+from services import sequences
+from services.sequences import next_value, gap_report, issued_numbers, format_number
+
+
+class TestBlockAllocation(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = (Config.DOCUMENT_SEQUENCE_MODE, Config.DOCUMENT_SEQUENCE_BLOCK_SIZE)
+        Config.DOCUMENT_SEQUENCE_MODE = 'block'
+        Config.DOCUMENT_SEQUENCE_BLOCK_SIZE = {'receipt': 5}
+        self.app = create_app()
+        self._allocator = sequences._allocator
+        sequences._allocator = sequences.SequenceAllocator()
+
+    def tearDown(self):
+        Config.DOCUMENT_SEQUENCE_MODE, Config.DOCUMENT_SEQUENCE_BLOCK_SIZE = self._saved
+        sequences._allocator = self._allocator
+
+    def test_numbers_come_from_reserved_blocks(self):
+        with self.app.app_context():
+            values = [next_value('receipt', 3) for _ in range(7)]
+            db.session.commit()
+            self.assertEqual(values, list(range(1, 8)))
+            # Two reservations of 5, not one write per number
+            self.assertEqual(SequenceBlock.query.filter_by(restaurant_id=3).count(), 2)
+            self.assertEqual(DocumentSequence.query.filter_by(restaurant_id=3).one().next_value, 11)
+
+    def test_rolled_back_numbers_are_reused(self):
+        with self.app.app_context():
+            self.assertEqual(next_value('receipt', 3), 1)
+            db.session.rollback()
+            self.assertEqual(next_value('receipt', 3), 1)
+            self.assertEqual(next_value('receipt', 3), 2)
+            db.session.commit()
+
+    def test_release_returns_unused_tail(self):
+        with self.app.app_context():
+            next_value('receipt', 3), next_value('receipt', 3)
+            db.session.commit()
+            sequences._allocator.release()
+            self.assertEqual(DocumentSequence.query.filter_by(restaurant_id=3).one().next_value, 3)
+            self.assertEqual(SequenceBlock.query.one().end_value, 3)
+            self.assertEqual(next_value('receipt', 3), 3)
+            db.session.commit()
+
+    def test_concurrent_workers_never_share_a_number(self):
+        results, errors = [], []
+
+        def worker():
+            try:
+                with self.app.app_context():
+                    for _ in range(20):
+                        results.append(next_value('receipt', 4))
+                        db.session.commit()
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), list(range(1, 81)))
+
+
+class TestInvoiceNumbersAndAudit(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            owner = User.query.filter_by(username='admin').first()
+            restaurant = Restaurant(name='Seq Bistro', email='seq@bistro.test', owner_id=owner.id)
+            db.session.add(restaurant)
+            db.session.flush()
+            db.session.add(StoreSettings(restaurant_id=restaurant.id, invoice_prefix='SB'))
+            db.session.add(User(username='seqadmin', password_hash=owner.password_hash, role='admin',
+                                restaurant_id=restaurant.id))
+            db.session.commit()
+            self.restaurant_id = restaurant.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'seqadmin', 'password': 'admin'})
+
+    def test_invoice_numbers_use_prefix_and_sequence(self):
+        numbers = [self.client.post('/admin/api/invoices', json={'customer': 'A', 'total': 10}).get_json()
+                   ['invoice_number'] for _ in range(3)]
+        rid = self.restaurant_id
+        self.assertEqual(numbers, [f'SB-{rid}-000001', f'SB-{rid}-000002', f'SB-{rid}-000003'])
+
+    def test_gap_report(self):
+        ids = [self.client.post('/admin/api/invoices', json={'customer': 'A', 'total': 10}).get_json()['id']
+               for _ in range(5)]
+        self.client.delete(f'/admin/api/invoices/{ids[1]}')
+        self.client.delete(f'/admin/api/invoices/{ids[2]}')
+
+        report = self.client.get('/admin/api/sequences/audit?doc_type=invoice').get_json()
+        self.assertEqual(report['issued'], 3)
+        self.assertEqual(report['missing'], 2)
+        self.assertEqual(report['gaps'], [{'from': 2, 'to': 3, 'count': 2, 'reserved_by': []}])
+
+        with self.app.app_context():
+            self.assertEqual(gap_report('invoice', self.restaurant_id)['last'], 5)
+            self.assertEqual(Invoice.query.filter_by(restaurant_id=self.restaurant_id).count(), 3)
+
+        result = self.app.test_cli_runner().invoke(args=['audit-sequences', '--strict'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('missing 2-3', result.output)
+
+    def test_prefix_with_dashes(self):
+        with self.app.app_context():
+            StoreSettings.query.filter_by(restaurant_id=self.restaurant_id).one().invoice_prefix = 'INV-EU'
+            db.session.commit()
+        numbers = [self.client.post('/admin/api/invoices', json={'customer': 'A', 'total': 10}).get_json()
+                   ['invoice_number'] for _ in range(2)]
+        self.assertEqual(numbers[0], f'INV-EU-{self.restaurant_id}-000001')
+        report = self.client.get('/admin/api/sequences/audit?doc_type=invoice').get_json()
+        self.assertEqual((report['issued'], report['missing']), (2, 0))
+
+    def test_legacy_numbers_are_not_audited(self):
+        with self.app.app_context():
+            db.session.add_all([Invoice(invoice_number='INV-1760000000-4821', customer_name='Legacy', total=1),
+                                Invoice(invoice_number='INV-1760000001-4821', customer_name='Legacy', total=1),
+                                Invoice(invoice_number=format_number('INV', 1), customer_name='A', total=1),
+                                Invoice(invoice_number=format_number('INV', 2), customer_name='A', total=1)])
+            db.session.commit()
+            self.assertEqual(issued_numbers('invoice'), [1, 2])
+            report = gap_report('invoice')
+            self.assertEqual((report['missing'], report['duplicates']), (0, []))
+
+    def test_audit_is_scoped_to_the_callers_restaurant(self):
+        self.client.post('/admin/api/invoices', json={'customer': 'A', 'total': 10})
+        other = self.client.get(f'/admin/api/sequences/audit?restaurant_id={self.restaurant_id + 1}').get_json()
+        self.assertEqual(other['restaurant_id'], self.restaurant_id)
+        self.assertEqual(other['issued'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Tests for startup cost: deferred imports and the profile-startup command"""
+import json
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from app import create_app
+from config import Config
+from commands import parse_importtime
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_heavy_modules_not_imported_with_app(self):
+        code = ("import sys, app; "
+                "print([m for m in ('requests', 'alembic', 'flask_migrate', 'qrcode', 'pyotp') if m in sys.modules]); "
+                "print('app' in vars(app))")
+        out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+        loaded, built = out.splitlines()
+        self.assertEqual(loaded, '[]')
+        # The module-level application is only built when someone asks for it
+        self.assertEqual(built, 'False')
+
+    def test_parse_importtime(self):
+        rows = parse_importtime([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |   json.scanner',
+            'import time:       400 |        520 | json',
+        ])
+        self.assertEqual(rows, [('json.scanner', 120, 120, 1), ('json', 400, 520, 0)])
+
+    def test_profile_startup_command(self):
+        runner = create_app().test_cli_runner()
+        result = runner.invoke(args=['profile-startup', '--json', '--runs', '1', '--top', '3'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        report = json.loads(result.output)
+        self.assertEqual(len(report['create_app_ms']), 1)
+        self.assertEqual(len(report['top_modules_self_ms']), 3)
+        self.assertGreater(report['modules_imported'], 0)
+
+        result = runner.invoke(args=['profile-startup', '--runs', '1', '--max-ms', '0'])
+        self.assertNotEqual(result.exit_code, 0)
+
+    def test_background_threads_start_with_the_first_request(self):
+        saved = Config.ENABLE_COURSE_SCHEDULER, Config.ENABLE_HOUSEKEEPING, Config.ENABLE_EXCHANGE_UPDATER
+        Config.ENABLE_COURSE_SCHEDULER, Config.ENABLE_HOUSEKEEPING, Config.ENABLE_EXCHANGE_UPDATER = True, True, False
+        try:
+            app = create_app()
+        finally:
+            Config.ENABLE_COURSE_SCHEDULER, Config.ENABLE_HOUSEKEEPING, Config.ENABLE_EXCHANGE_UPDATER = saved
+        scheduler, housekeeping = app.extensions['course_scheduler'], app.extensions['housekeeping']
+        with mock.patch.object(scheduler, 'start') as start_scheduler, \
+                mock.patch.object(housekeeping, 'start') as start_housekeeping:
+            result = app.test_cli_runner().invoke(args=['db', 'heads'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            start_scheduler.assert_not_called()
+
+            client = app.test_client()
+            client.get('/')
+            client.get('/')
+            start_scheduler.assert_called_once_with()
+            start_housekeeping.assert_called_once_with()
+
+    def test_db_commands_load_on_demand(self):
+        app = create_app()
+        self.assertNotIn('migrate', app.extensions)
+        result = app.test_cli_runner().invoke(args=['db', 'heads'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('migrate', app.extensions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Tests for the stock movement ledger, snapshots and variance (services/inventory.py)"""
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from extensions import db
+from models import InventoryItem, StockMovement, StockSnapshot
+from services import inventory
+
+DAY = datetime(2025, 5, 1)
+
+
+def at(day, hour=12):
+    return DAY + timedelta(days=day - 1, hours=hour)
+
+
+class TestStockLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+
+    def _history(self, name):
+        """Flour-like item: counted 100, +50, -5 waste, -2 sold, counted 140, +10."""
+        item = InventoryItem(name=name, quantity=0, unit='kg')
+        db.session.add(item)
+        db.session.flush()
+        inventory.record(item.id, 'count', 100, note='opening balance', now=at(1))
+        inventory.record(item.id, 'receipt', 50, reference='PO-7', now=at(3))
+        inventory.record(item.id, 'waste', -5, now=at(10))
+        inventory.apply_usage({item.id: 2}, reference='order:1', now=at(15))
+        inventory.count(item.id, 140, now=at(20))
+        inventory.record(item.id, 'receipt', 10, now=at(33))
+        db.session.commit()
+        return item.id
+
+    def test_levels_over_time_with_and_without_snapshots(self):
+        with self.app.app_context():
+            item_id = self._history('Flour')
+            self.assertEqual(db.session.get(InventoryItem, item_id).quantity, 150)
+            self.assertEqual(db.session.query(db.func.sum(StockMovement.quantity))
+                             .filter_by(inventory_item_id=item_id).scalar(), 150)
+
+            # No snapshots yet: worked back from the current level
+            self.assertEqual(inventory.on_hand_at(at(2), [item_id]), {item_id: 100})
+            self.assertEqual(inventory.on_hand_at(at(16), [item_id]), {item_id: 143})
+
+            self.assertGreater(inventory.snapshot(now=at(12, hour=1)), 0)
+            self.assertEqual(inventory.snapshot(now=at(12, hour=2)), 0)  # already taken
+            snap = StockSnapshot.query.filter_by(inventory_item_id=item_id).one()
+            self.assertEqual((snap.taken_at, snap.quantity), (at(12, hour=0), 145))
+            self.assertEqual(inventory.on_hand_at(at(16), [item_id]), {item_id: 143})
+            self.assertEqual(inventory.on_hand_at(at(25), [item_id]), {item_id: 140})
+            self.assertEqual(inventory.on_hand_at(at(5), [item_id]), {item_id: 150})
+
+    def test_variance_report(self):
+        with self.app.app_context():
+            item_id = self._history('Rye flour')
+        res = self.client.get('/inventory/variance', query_string={
+            'start': at(2).isoformat(), 'end': at(31, hour=23).isoformat()})
+        self.assertEqual(res.status_code, 200, res.get_json())
+        row = next(r for r in res.get_json()['items'] if r['inventory_item_id'] == item_id)
+        self.assertEqual((row['opening'], row['receipt'], row['waste'], row['sale']), (100, 50, -5, -2))
+        self.assertEqual((row['expected'], row['variance'], row['closing']), (143, -3, 140))
+
+        stock = self.client.get('/inventory/stock', query_string={'at': at(4).isoformat()}).get_json()
+        self.assertEqual(next(i['quantity'] for i in stock['items'] if i['id'] == item_id), 150)
+        self.assertEqual(self.client.get('/inventory/variance?month=2025-13').status_code, 400)
+
+    def test_api_writes_go_through_the_ledger(self):
+        item_id = self.client.post('/admin/api/inventory', json={'name': 'Sugar', 'quantity': 20, 'unit': 'kg'}) \
+            .get_json()['id']
+        res = self.client.post('/inventory/movements', json={
+            'inventory_item_id': item_id, 'movement_type': 'receipt', 'quantity': 5, 'reference': 'PO-9'})
+        self.assertEqual(res.get_json()['quantity'], 25)
+        self.client.post('/inventory/movements', json={
+            'inventory_item_id': item_id, 'movement_type': 'waste', 'quantity': 1.5})
+        self.client.put(f'/admin/api/inventory/{item_id}', json={'quantity': 23})
+        self.assertEqual(self.client.post('/inventory/movements', json={
+            'inventory_item_id': item_id, 'movement_type': 'sale', 'quantity': 1}).status_code, 400)
+        self.assertEqual(self.client.post('/inventory/movements', json={
+            'inventory_item_id': 999999, 'movement_type': 'receipt', 'quantity': 1}).status_code, 404)
+
+        movements = self.client.get(f'/inventory/movements?inventory_item_id={item_id}').get_json()
+        self.assertEqual([(m['movement_type'], m['quantity']) for m in reversed(movements)],
+                         [('count', 20), ('receipt', 5), ('waste', -1.5), ('count', -0.5)])
+        with self.app.app_context():
+            self.assertEqual(db.session.get(InventoryItem, item_id).quantity, 23)
+
+
+if __name__ == '__main__':
+    unittest.main()
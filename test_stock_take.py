@@ -0,0 +1,93 @@
+"""Tests for stock-take sessions with bulk scan ingestion (services/stock_take.py)"""
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import InventoryItem, StockMovement
+from services import inventory
+
+
+class TestStockTake(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.prefix = f'ST{id(self)}-'
+        with self.app.app_context():
+            items = [InventoryItem(name=f'Shelf item {n}', quantity=0, unit='unit', barcode=f'{self.prefix}{n:04d}')
+                     for n in range(200)]
+            db.session.add_all(items)
+            db.session.flush()
+            for item in items:
+                inventory.record(item.id, 'receipt', 100)
+            db.session.commit()
+            self.item_ids = [item.id for item in items]
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+        self.take_id = self.client.post('/inventory/stock-takes', json={'name': 'Q3 count'}).get_json()['id']
+
+    def _upload(self, lines):
+        return self.client.post(f'/inventory/stock-takes/{self.take_id}/scans', data='\n'.join(lines),
+                                content_type='text/csv')
+
+    def test_bulk_scans_reconcile_in_one_pass(self):
+        # 20k single scans across 200 items: item n is scanned 100 times, except item 0
+        # (98 scans, so 2 short) and item 1 (one scan of a case of 105)
+        lines = [f'{self.prefix}{n:04d}' for n in range(2, 200) for _ in range(100)]
+        lines += [f'{self.prefix}0000'] * 98 + [f'{self.prefix}0001,105', 'UNKNOWN-1', 'UNKNOWN-1']
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                first = self._upload(['barcode,quantity'] + lines[:10000])
+                second = self._upload(lines[10000:])
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(first.get_json()['accepted'] + second.get_json()['accepted'], len(lines))
+        self.assertLess(len([s for s in statements if s.startswith('INSERT')]), 5)
+
+        summary = self.client.get(f'/inventory/stock-takes/{self.take_id}').get_json()
+        self.assertEqual((summary['status'], summary['scans'], summary['barcodes']), ('open', len(lines), 201))
+        self.assertEqual(summary['unknown_barcodes'], [{'barcode': 'UNKNOWN-1', 'quantity': 2.0, 'scans': 2}])
+
+        res = self.client.post(f'/inventory/stock-takes/{self.take_id}/reconcile', json={})
+        self.assertEqual(res.status_code, 200, res.get_json())
+        result = res.get_json()
+        self.assertEqual(len(result['lines']), 200)
+        self.assertEqual([(l['inventory_item_id'], l['variance']) for l in result['lines'][:2]],
+                         [(self.item_ids[1], 5.0), (self.item_ids[0], -2.0)])
+        with self.app.app_context():
+            self.assertEqual(db.session.get(InventoryItem, self.item_ids[0]).quantity, 98)
+            self.assertEqual(db.session.get(InventoryItem, self.item_ids[1]).quantity, 105)
+            movements = StockMovement.query.filter_by(reference=f'stocktake:{self.take_id}').count()
+            self.assertEqual(movements, 200)
+
+        # Closed for further scans and a second reconcile
+        self.assertEqual(self._upload([f'{self.prefix}0003']).status_code, 409)
+        self.assertEqual(self.client.post(f'/inventory/stock-takes/{self.take_id}/reconcile').status_code, 409)
+
+    def test_full_count_zeroes_unscanned_items_and_bad_batches_are_rejected(self):
+        res = self.client.post(f'/inventory/stock-takes/{self.take_id}/scans', json={'scans': [
+            {'barcode': f'{self.prefix}0005', 'quantity': 60}]})
+        self.assertEqual(res.status_code, 201)
+        res = self._upload([f'{self.prefix}0006', f'{self.prefix}0007,abc'])
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('Line 2', res.get_json()['error'])
+
+        result = self.client.post(f'/inventory/stock-takes/{self.take_id}/reconcile',
+                                  json={'full': True}).get_json()
+        variances = {l['inventory_item_id']: l['variance'] for l in result['lines']}
+        self.assertEqual(variances[self.item_ids[5]], -40.0)
+        self.assertEqual(variances[self.item_ids[6]], -100.0)  # the rejected batch staged nothing
+        with self.app.app_context():
+            self.assertEqual(db.session.get(InventoryItem, self.item_ids[9]).quantity, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
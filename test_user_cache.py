@@ -0,0 +1,75 @@
+"""Tests for the login user identity cache (services/user_cache.py)"""
+import unittest
+
+from flask_login import current_user, login_required
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import User
+from services.user_cache import invalidate_user
+
+
+class TestUserCache(unittest.TestCase):
+
+    def setUp(self):
+        invalidate_user()
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['USER_CACHE_TTL'] = 60
+
+        @login_required
+        def whoami():
+            return f"{current_user.username}:{current_user.role}:{current_user.currency}"
+        self.app.add_url_rule('/_whoami', 'whoami', whoami)
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+        with self.app.app_context():
+            self.waiter_id = User.query.filter_by(username='waiter').first().id
+            self.engine = db.engine
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+
+    def tearDown(self):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+        invalidate_user()
+
+    def _count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def _whoami(self):
+        del self.statements[:]
+        res = self.client.get('/_whoami')
+        self.assertEqual(res.status_code, 200)
+        return res.get_data(as_text=True)
+
+    def test_cache_hit_issues_no_queries(self):
+        self._whoami()
+        self.assertEqual(self._whoami(), 'admin:admin:USD')
+        self.assertEqual(self.statements, [])
+
+    def test_disabled_cache_loads_every_request(self):
+        self.app.config['USER_CACHE_TTL'] = 0
+        self._whoami()
+        self._whoami()
+        self.assertTrue(any('FROM user' in s for s in self.statements))
+
+    def test_admin_edits_invalidate(self):
+        self._whoami()
+        with self.app.app_context():
+            admin_id = User.query.filter_by(username='admin').first().id
+        res = self.client.put(f'/admin/api/users/{admin_id}/currency', json={'currency': 'EUR'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self._whoami(), 'admin:admin:EUR')
+
+    def test_bulk_update_invalidates(self):
+        self._whoami()
+        with self.app.app_context():
+            User.query.filter_by(username='admin').update({'role': 'manager'})
+            db.session.commit()
+        self.assertEqual(self._whoami(), 'admin:manager:USD')
+
+
+if __name__ == '__main__':
+    unittest.main()